@@ -0,0 +1,262 @@
+import operator
+from typing import Any, Optional
+
+from .constants import CONTRACT_OP_COSTS
+from .structs import CostAnalysis, OpCost
+
+# Loops derived to run longer than this are reported as unbounded; the budget stops them anyway
+MAX_STATIC_ITERATIONS = 100000
+
+# Cost interval of one way through a block: (lowest, highest), highest None when unbounded
+Interval = tuple[int, Optional[int]]
+
+COMPARISONS = {
+    'lt': operator.lt, 'gt': operator.gt, 'lte': operator.le, 'gte': operator.ge,
+    'eq': lambda a, b: str(a) == str(b), 'neq': lambda a, b: str(a) != str(b),
+}
+ARITHMETIC = {
+    'add': operator.add, 'sub': operator.sub, 'mul': operator.mul,
+    'div': operator.floordiv, 'mod': operator.mod,
+}
+UNKNOWN = object()
+
+def _add(a: Optional[Interval], b: Optional[Interval]) -> Optional[Interval]:
+    if a is None or b is None:
+        return None
+    return a[0] + b[0], None if a[1] is None or b[1] is None else a[1] + b[1]
+
+def _union(a: Optional[Interval], b: Optional[Interval]) -> Optional[Interval]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), None if a[1] is None or b[1] is None else max(a[1], b[1])
+
+def _assigned(block: list) -> set[str]:
+    names = set()
+    for cmd in block:
+        if cmd.get('out'):
+            names.add(cmd['out'])
+        for key in ('then', 'else', 'body'):
+            names |= _assigned(cmd.get(key, []))
+    return names
+
+def _literal(arg: Any, consts: dict[str, Any]) -> Any:
+    """The value the VM resolves ``arg`` to, or UNKNOWN when it depends on runtime state."""
+    if not isinstance(arg, dict):
+        return arg
+    t, v = arg.get('t'), arg.get('v')
+    try:
+        if t == 'int':
+            return int(v)
+        if t == 'str':
+            return str(v)
+    except (TypeError, ValueError):
+        return UNKNOWN
+    if t == 'var':
+        return consts.get(v, UNKNOWN)
+    return v
+
+def _evaluate(op: str, args: list) -> Any:
+    if any(arg is UNKNOWN for arg in args):
+        return UNKNOWN
+    try:
+        if op == 'set':
+            return args[0]
+        if op in ARITHMETIC:
+            return ARITHMETIC[op](int(args[0]), int(args[1]))
+        if op in COMPARISONS:
+            return 1 if COMPARISONS[op](*(args[:2] if op in ('eq', 'neq') else (int(args[0]), int(args[1])))) else 0
+    except (IndexError, TypeError, ValueError, ZeroDivisionError):
+        pass
+    return UNKNOWN
+
+class _Analyzer:
+    def __init__(self):
+        self.breakdown: dict[str, OpCost] = {}
+        self.unbounded_loops: list[str] = []
+        self.external_calls = 0
+
+    def _count(self, op: str, weight: Optional[int], occurrences: int = 1):
+        entry = self.breakdown.setdefault(op, OpCost(count=0, max_cost=0))
+        entry.count += occurrences
+        cost = CONTRACT_OP_COSTS.get(op, 0)
+        if weight is None:
+            entry.max_cost = None if cost else entry.max_cost
+        elif entry.max_cost is not None:
+            entry.max_cost += cost * weight
+
+    def block(self, block: list, consts: dict[str, Any], path: str, weight: Optional[int]) -> tuple[Optional[Interval], Optional[Interval]]:
+        """Costs of running ``block`` to its end and of stopping inside it (exit or cancel); ``consts`` is updated in place."""
+        cont: Optional[Interval] = (0, 0)
+        stop: Optional[Interval] = None
+        for i, cmd in enumerate(block):
+            if cont is None:
+                break  # Unreachable after an unconditional exit
+            op = cmd.get('op')
+            here = f"{path}{i}"
+            self._count(op, weight)
+            base = (CONTRACT_OP_COSTS.get(op, 0),) * 2
+
+            if op == 'if':
+                c, s = self._if(cmd, consts, here, weight)
+            elif op == 'while':
+                c, s = self._while(cmd, consts, here, weight)
+            elif op in ('exit', 'cancel'):
+                c, s = None, (0, 0)
+            else:
+                c, s = (0, 0), None
+                if op == 'execute':
+                    self.external_calls += 1
+                if cmd.get('out'):
+                    value = _evaluate(op, [_literal(arg, consts) for arg in cmd.get('args', [])])
+                    if value is UNKNOWN:
+                        consts.pop(cmd['out'], None)
+                    else:
+                        consts[cmd['out']] = value
+
+            stop = _union(stop, _add(cont, _add(base, s)))
+            cont = _add(cont, _add(base, c))
+        return cont, stop
+
+    def _if(self, cmd: dict, consts: dict[str, Any], path: str, weight: Optional[int]):
+        args = cmd.get('args', [])
+        condition = _literal(args[0], consts) if args else None
+        branches = []
+        for key, taken in (('then', True), ('else', False)):
+            if condition is UNKNOWN or bool(condition) == taken:
+                branch_consts = dict(consts)
+                branches.append((self.block(cmd.get(key, []), branch_consts, f"{path}.{key}.", weight), branch_consts))
+        # Keep only what every reachable branch agrees on
+        merged = {k: v for k, v in branches[0][1].items() if all(k in b and b[k] == v for _, b in branches[1:])}
+        consts.clear()
+        consts.update(merged)
+        cont = stop = None
+        for (c, s), _ in branches:
+            cont, stop = _union(cont, c), _union(stop, s)
+        return cont, stop
+
+    def _while(self, cmd: dict, consts: dict[str, Any], path: str, weight: Optional[int]):
+        args = cmd.get('args', [])
+        body = cmd.get('body', [])
+        assigned = _assigned(body)
+        condition = _literal(args[0], consts) if args else None
+        iterations = self._iterations(args[0] if args else None, body, consts, assigned)
+        for name in assigned:
+            consts.pop(name, None)
+
+        if iterations is None:
+            self.unbounded_loops.append(path)
+            low, high = (1 if condition is not UNKNOWN and condition else 0), None
+        else:
+            low = high = iterations
+
+        if high == 0:
+            # The body is never entered, but its ops still count towards the breakdown
+            self.block(body, dict(consts), f"{path}.body.", 0 if weight is not None else None)
+            return (0, 0), None
+
+        body_weight = None if high is None or weight is None else weight * high
+        body_cont, body_stop = self.block(body, dict(consts), f"{path}.body.", body_weight)
+        # The VM charges the loop op again after every iteration
+        self._count('while', body_weight, occurrences=0)
+        step = _add(body_cont, (CONTRACT_OP_COSTS['while'],) * 2)
+        if step is None:
+            # Every iteration stops the script, so at most one runs
+            return ((0, 0) if low == 0 else None), body_stop
+
+        cont = (low * step[0], None if high is None or step[1] is None else high * step[1])
+        stop = None
+        if body_stop is not None:
+            stop = (body_stop[0], None if high is None or step[1] is None or body_stop[1] is None else (high - 1) * step[1] + body_stop[1])
+        return cont, stop
+
+    def _iterations(self, condition: Any, body: list, consts: dict[str, Any], assigned: set[str]) -> Optional[int]:
+        """Exact iteration count of a counter loop, or None when it cannot be derived."""
+        if not (isinstance(condition, dict) and condition.get('t') == 'var'):
+            value = _literal(condition, consts)
+            return None if value is UNKNOWN or value else 0
+        name = condition.get('v')
+        entry = consts.get(name, UNKNOWN)
+        if name not in assigned:
+            return None if entry is UNKNOWN or entry else 0
+        if entry is UNKNOWN:
+            return None
+        if not entry:
+            return 0
+
+        # The recognised shape: the condition is recomputed by one top-level comparison of a
+        # counter that one top-level add/sub moves by a constant, and nothing else writes either.
+        writers = {}
+        for position, cmd in enumerate(body):
+            if cmd.get('out'):
+                writers.setdefault(cmd['out'], []).append((position, cmd))
+        nested = _assigned([c for cmd in body for key in ('then', 'else', 'body') for c in cmd.get(key, [])])
+        compare = writers.get(name, [])
+        if len(compare) != 1 or name in nested or compare[0][1].get('op') not in COMPARISONS:
+            return None
+        compare_at, compare_cmd = compare[0]
+        compare_args = compare_cmd.get('args', [])
+        counters = [i for i, arg in enumerate(compare_args[:2]) if isinstance(arg, dict) and arg.get('t') == 'var']
+        if len(compare_args) < 2 or len(counters) != 1:
+            return None
+        counter = compare_args[counters[0]]['v']
+        other = compare_args[1 - counters[0]]
+        if isinstance(other, dict) and other.get('t') == 'var' and other.get('v') in assigned:
+            return None
+        bound = _literal(other, consts)
+        update = writers.get(counter, [])
+        if bound is UNKNOWN or counter in nested or len(update) != 1 or update[0][1].get('op') not in ('add', 'sub'):
+            return None
+        update_at, update_cmd = update[0]
+        update_args = update_cmd.get('args', [])
+        if len(update_args) != 2:
+            return None
+        if update_args[0] == {'t': 'var', 'v': counter}:
+            delta = _literal(update_args[1], {})
+        elif update_args[1] == {'t': 'var', 'v': counter} and update_cmd['op'] == 'add':
+            delta = _literal(update_args[0], {})
+        else:
+            return None
+        value = consts.get(counter, UNKNOWN)
+        if not isinstance(delta, int) or not isinstance(value, int):
+            return None
+        delta = delta if update_cmd['op'] == 'add' else -delta
+
+        def check(counter_value):
+            ordered = [counter_value, bound] if counters[0] == 0 else [bound, counter_value]
+            return _evaluate(compare_cmd['op'], ordered)
+
+        count = 0
+        running = entry
+        while running:
+            count += 1
+            if count > MAX_STATIC_ITERATIONS:
+                return None
+            if update_at < compare_at:
+                value += delta
+                running = check(value)
+            else:
+                running = check(value)
+                value += delta
+            if running is UNKNOWN:
+                return None
+        return count
+
+def analyze_script(ops: list) -> CostAnalysis:
+    """Static cost bounds of a contract script, as the VM charges them per executed op.
+
+    min_cost and max_cost cover every path, including the ones an exit or cancel ends
+    early; max_cost is None when a loop has no derivable bound. Calls to other contracts
+    only count their own op cost, since the callee's cost is not known here.
+    """
+    analyzer = _Analyzer()
+    cont, stop = analyzer.block(ops, {}, "", 1)
+    low, high = _union(cont, stop) or (0, 0)
+    return CostAnalysis(
+        min_cost=low,
+        max_cost=high,
+        unbounded_loops=analyzer.unbounded_loops,
+        external_calls=analyzer.external_calls,
+        breakdown=analyzer.breakdown
+    )
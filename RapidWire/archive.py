@@ -0,0 +1,243 @@
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from typing import Iterator, Optional
+
+from .pagination import TRANSFER_SORT_KEYS, decode_cursor
+
+# Per-segment bloom filter over the users in a segment: ~1% false positives
+BLOOM_BITS_PER_USER = 10
+BLOOM_HASHES = 7
+
+def _bloom_positions(user_id: int, bits: int, hashes: int) -> list[int]:
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+class TransferArchive:
+    """Cold storage for old transfers: immutable gzip NDJSON segments on local disk.
+
+    Each segment holds a contiguous transfer_id range. ``manifest.json`` records the
+    id, timestamp and amount bounds and the currencies of every segment, and a bloom
+    filter file next to each segment records its users, so lookups and searches only
+    decompress the segments that can contain a match.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.segments: list[dict] = []
+        self._manifest_mtime = None
+        self._blooms: dict[str, bytes] = {}
+        self.refresh()
+
+    def refresh(self):
+        # The archival job usually runs in another process; pick up its new segments
+        manifest = os.path.join(self.path, self.MANIFEST)
+        try:
+            mtime = os.stat(manifest).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            with open(manifest, encoding="utf-8") as f:
+                self.segments = json.load(f)["segments"]
+            self._manifest_mtime = mtime
+
+    @property
+    def last_id(self) -> int:
+        return self.segments[-1]["last_id"] if self.segments else 0
+
+    def write_segment(self, rows: list[dict]) -> dict:
+        # rows must be ordered by transfer_id and start after last_id
+        if rows[0]["transfer_id"] <= self.last_id:
+            raise ValueError("Archive segments must be appended in transfer_id order.")
+        os.makedirs(self.path, exist_ok=True)
+        segment = {
+            "file": f"transfers-{rows[0]['transfer_id']:020d}-{rows[-1]['transfer_id']:020d}.ndjson.gz",
+            "first_id": rows[0]["transfer_id"],
+            "last_id": rows[-1]["transfer_id"],
+            "count": len(rows),
+        }
+        for key in ("timestamp", "amount"):
+            segment[f"min_{key}"] = min(row[key] for row in rows)
+            segment[f"max_{key}"] = max(row[key] for row in rows)
+        segment["currencies"] = sorted({row["currency_id"] for row in rows})
+
+        users = {row["source_id"] for row in rows} | {row["dest_id"] for row in rows}
+        bits = max(64, -(-len(users) * BLOOM_BITS_PER_USER // 8) * 8)
+        bloom = bytearray(bits // 8)
+        for user in users:
+            for position in _bloom_positions(user, bits, BLOOM_HASHES):
+                bloom[position // 8] |= 1 << (position % 8)
+        segment["users_file"] = segment["file"].replace(".ndjson.gz", ".users")
+        segment["users_bits"] = bits
+        segment["users_hashes"] = BLOOM_HASHES
+
+        # Write-then-rename so a crash never leaves a truncated segment or manifest behind
+        target = os.path.join(self.path, segment["file"])
+        with gzip.open(target + ".tmp", "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        os.replace(target + ".tmp", target)
+        users_target = os.path.join(self.path, segment["users_file"])
+        with open(users_target + ".tmp", "wb") as f:
+            f.write(bloom)
+        os.replace(users_target + ".tmp", users_target)
+
+        segments = self.segments + [segment]
+        manifest = os.path.join(self.path, self.MANIFEST)
+        with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"segments": segments}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(manifest + ".tmp", manifest)
+        self.segments = segments
+        self._manifest_mtime = os.stat(manifest).st_mtime_ns
+        return segment
+
+    def bounds(self, sort_by: str) -> tuple[int, int]:
+        if sort_by == "transfer_id":
+            return self.segments[0]["first_id"], self.last_id
+        return min(s[f"min_{sort_by}"] for s in self.segments), max(s[f"max_{sort_by}"] for s in self.segments)
+
+    def may_contain_user(self, segment: dict, user_id: int) -> bool:
+        if "users_file" not in segment:
+            return True  # Written before segments carried a user filter
+        bloom = self._blooms.get(segment["users_file"])
+        if bloom is None:
+            with open(os.path.join(self.path, segment["users_file"]), "rb") as f:
+                bloom = self._blooms[segment["users_file"]] = f.read()
+        return all(bloom[p // 8] >> (p % 8) & 1 for p in _bloom_positions(user_id, segment["users_bits"], segment["users_hashes"]))
+
+    def _read(self, segment: dict) -> Iterator[dict]:
+        with gzip.open(os.path.join(self.path, segment["file"]), "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def get(self, transfer_id: int) -> Optional[dict]:
+        self.refresh()
+        segments = self.segments
+        index = bisect.bisect_right([s["first_id"] for s in segments], transfer_id) - 1
+        if index < 0 or transfer_id > segments[index]["last_id"]:
+            return None
+        for row in self._read(segments[index]):
+            if row["transfer_id"] == transfer_id:
+                return row
+        return None
+
+    def scan(
+        self,
+        user_id: Optional[int] = None,
+        currency_id: Optional[int] = None,
+        after_id: int = 0,
+        upto_id: Optional[int] = None,
+        after_timestamp: Optional[int] = None,
+        upto_timestamp: Optional[int] = None,
+        execution_ids: Optional[set[int]] = None
+    ) -> Iterator[dict]:
+        """Yields every archived row in the id and timestamp windows (both exclusive below, inclusive above), in transfer_id order."""
+        self.refresh()
+        for segment in self.segments:
+            if segment["last_id"] <= after_id or (upto_id is not None and segment["first_id"] > upto_id):
+                continue
+            if (after_timestamp is not None and segment["max_timestamp"] <= after_timestamp) \
+                    or (upto_timestamp is not None and segment["min_timestamp"] > upto_timestamp):
+                continue
+            if currency_id is not None and "currencies" in segment and currency_id not in segment["currencies"]:
+                continue
+            if user_id is not None and not self.may_contain_user(segment, user_id):
+                continue
+            for row in self._read(segment):
+                if row["transfer_id"] <= after_id or (upto_id is not None and row["transfer_id"] > upto_id):
+                    continue
+                if (after_timestamp is not None and row["timestamp"] <= after_timestamp) \
+                        or (upto_timestamp is not None and row["timestamp"] > upto_timestamp):
+                    continue
+                if currency_id is not None and row["currency_id"] != currency_id:
+                    continue
+                if user_id is not None and user_id not in (row["source_id"], row["dest_id"]):
+                    continue
+                if execution_ids is not None and row["execution_id"] not in execution_ids:
+                    continue
+                yield row
+
+    def search(
+        self,
+        source_id: Optional[int] = None,
+        dest_id: Optional[int] = None,
+        currency_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        start_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        min_amount: Optional[int] = None,
+        max_amount: Optional[int] = None,
+        count: int = 10,
+        sort_by: str = "transfer_id",
+        sort_order: str = "desc",
+        after: Optional[str] = None
+    ) -> list[dict]:
+        """Returns the first ``count`` matching rows in the requested order."""
+        self.refresh()
+        if sort_by not in TRANSFER_SORT_KEYS:
+            sort_by = "transfer_id"
+        descending = sort_order.upper() != "ASC"
+        seek = None
+        if after is not None:
+            _, _, value, last_id = decode_cursor(after)
+            seek = (value, last_id)
+
+        def key(row):
+            return (row[sort_by], row["transfer_id"])
+
+        def matches(row):
+            if source_id is not None and row["source_id"] != source_id: return False
+            if dest_id is not None and row["dest_id"] != dest_id: return False
+            if currency_id is not None and row["currency_id"] != currency_id: return False
+            if user_id is not None and user_id not in (row["source_id"], row["dest_id"]): return False
+            if start_timestamp is not None and row["timestamp"] < start_timestamp: return False
+            if end_timestamp is not None and row["timestamp"] > end_timestamp: return False
+            if min_amount is not None and row["amount"] < min_amount: return False
+            if max_amount is not None and row["amount"] > max_amount: return False
+            if seek is not None and (key(row) >= seek if descending else key(row) <= seek): return False
+            return True
+
+        low, high = ("first_id", "last_id") if sort_by == "transfer_id" else (f"min_{sort_by}", f"max_{sort_by}")
+        users = {u for u in (source_id, dest_id, user_id) if u is not None}
+        candidates = []
+        for segment in self.segments:
+            if (start_timestamp is not None and segment["max_timestamp"] < start_timestamp) \
+                    or (end_timestamp is not None and segment["min_timestamp"] > end_timestamp) \
+                    or (min_amount is not None and segment["max_amount"] < min_amount) \
+                    or (max_amount is not None and segment["min_amount"] > max_amount):
+                continue
+            if currency_id is not None and "currencies" in segment and currency_id not in segment["currencies"]:
+                continue
+            if not all(self.may_contain_user(segment, user) for user in users):
+                continue
+            if seek is not None and (segment[low] > seek[0] if descending else segment[high] < seek[0]):
+                continue
+            candidates.append(segment)
+
+        # Visit the segments that can hold the best rows first and stop once no
+        # remaining segment can beat the worst row already collected.
+        candidates.sort(key=lambda s: s[high] if descending else s[low], reverse=descending)
+        best: list[tuple] = []
+        for segment in candidates:
+            if len(best) >= count:
+                worst = best[0][0][0]
+                if (segment[high] < worst) if descending else (segment[low] > -worst):
+                    break
+            for row in self._read(segment):
+                if not matches(row):
+                    continue
+                rank = key(row) if descending else (-row[sort_by], -row["transfer_id"])
+                if len(best) < count:
+                    heapq.heappush(best, (rank, row))
+                elif rank > best[0][0]:
+                    heapq.heapreplace(best, (rank, row))
+        return [row for _, row in sorted(best, key=lambda item: item[0], reverse=True)]
@@ -0,0 +1,163 @@
+import asyncio
+import contextvars
+from decimal import Decimal, localcontext
+from typing import Awaitable, Callable, Optional
+
+from .exceptions import TransactionError
+
+class SwapOrder:
+    def __init__(self, user_id: int, currency_in_id: int, amount_in: int, execution_id: int | None):
+        self.user_id = user_id
+        self.currency_in_id = currency_in_id
+        self.amount_in = amount_in
+        self.execution_id = execution_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+def clear_swap_batch(reserve_a: int, reserve_b: int, total_a_in: int, total_b_in: int, fee: int) -> tuple[Decimal, int, int]:
+    """
+    Finds the uniform clearing price (currency_b per currency_a) for a batch of opposing swaps.
+    Opposing flow is matched directly and only the excess goes through the pool curve, at the
+    same average price. Returns (price, a_into_pool, b_into_pool); at most one side is non-zero.
+    """
+    with localcontext() as ctx:
+        ctx.prec = 80
+        ra, rb = Decimal(reserve_a), Decimal(reserve_b)
+        sa, sb = Decimal(total_a_in), Decimal(total_b_in)
+        f = Decimal(1) - Decimal(fee) / Decimal(10000)
+
+        # Solve total_b_in / (total_a_in - x) == out(x) / x for the amount x of A routed to the pool
+        a_into_pool = (f * rb * sa - sb * ra) / (f * (sb + rb))
+        if a_into_pool > 0:
+            b_out = a_into_pool * f * rb / (ra + a_into_pool * f)
+            return b_out / a_into_pool, int(a_into_pool), 0
+
+        b_into_pool = (f * ra * sb - sa * rb) / (f * (sa + ra))
+        if b_into_pool > 0:
+            a_out = b_into_pool * f * ra / (rb + b_into_pool * f)
+            return b_into_pool / a_out, 0, int(b_into_pool)
+
+        # Both sides are within the fee band of the pool price: match everything at the ratio of the flows
+        return sb / sa, 0, 0
+
+def fill_amount(amount_in: int, price: Decimal, sells_a: bool) -> int:
+    with localcontext() as ctx:
+        ctx.prec = 80
+        if sells_a:
+            return int(Decimal(amount_in) * price)
+        return int(Decimal(amount_in) / price)
+
+class SwapBatcher:
+    def __init__(self, settle: Callable[[int, list[SwapOrder]], Awaitable[None]], interval: float):
+        self.settle = settle
+        self.interval = interval
+        self.pending: dict[int, list[SwapOrder]] = {}
+        self.ticks: dict[int, asyncio.Task] = {}
+
+    async def submit(self, pool_id: int, user_id: int, currency_in_id: int, amount_in: int, execution_id: int | None = None) -> tuple[int, int]:
+        order = SwapOrder(user_id, currency_in_id, amount_in, execution_id)
+        self.pending.setdefault(pool_id, []).append(order)
+        if pool_id not in self.ticks:
+            # Run the tick outside the submitter's context so it never inherits an open connection
+            tick = contextvars.Context().run(asyncio.create_task, self._run_tick(pool_id))
+            tick.add_done_callback(lambda task: self._abandon(pool_id, task))
+            self.ticks[pool_id] = tick
+        return await order.future
+
+    def _abandon(self, pool_id: int, task: asyncio.Task):
+        # A tick cancelled before it started never reached its own cleanup
+        if self.ticks.get(pool_id) is not task:
+            return
+        self.ticks.pop(pool_id)
+        for order in self.pending.pop(pool_id, []):
+            if not order.future.done():
+                order.future.set_exception(TransactionError("The swap batch was cancelled before it settled."))
+
+    async def _run_tick(self, pool_id: int):
+        orders: list[SwapOrder] = []
+        try:
+            try:
+                await asyncio.sleep(self.interval)
+            finally:
+                orders = [o for o in self.pending.pop(pool_id, []) if not o.future.done()]
+                self.ticks.pop(pool_id, None)
+            if orders:
+                await self.settle(pool_id, orders)
+        except BaseException as e:
+            # A cancelled tick (e.g. on shutdown) must still answer every waiting submitter
+            error = e if isinstance(e, Exception) else TransactionError("The swap batch was cancelled before it settled.")
+            for order in orders:
+                if not order.future.done():
+                    order.future.set_exception(error)
+            if not isinstance(e, Exception):
+                raise
+
+class TransferOrder:
+    def __init__(self, source_id: int, destination_id: int, currency_id: int, amount: int):
+        self.source_id = source_id
+        self.destination_id = destination_id
+        self.currency_id = currency_id
+        self.amount = amount
+        self.applying = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class TransferBatcher:
+    """Collects transfers for up to ``window`` seconds and hands them to ``apply`` as one group commit."""
+
+    def __init__(self, apply: Callable[[list[TransferOrder]], Awaitable[None]], window: float, max_batch: int = 100):
+        self.apply = apply
+        self.window = window
+        self.max_batch = max_batch
+        self.pending: list[TransferOrder] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: set[asyncio.Task] = set()
+
+    async def submit(self, source_id: int, destination_id: int, currency_id: int, amount: int):
+        order = TransferOrder(source_id, destination_id, currency_id, amount)
+        self.pending.append(order)
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        try:
+            return await asyncio.shield(order.future)
+        except asyncio.CancelledError:
+            if not order.applying:
+                # Not part of a commit yet: drop it, like a cancelled transfer that rolls back
+                order.future.cancel()
+                raise
+        # The order is already inside a group commit that cannot leave it out; wait for the
+        # outcome so a caller only ever sees a cancellation for a transfer that did not happen
+        while not order.future.done():
+            try:
+                await asyncio.shield(order.future)
+            except asyncio.CancelledError:
+                pass
+        if order.future.cancelled() or order.future.exception() is not None:
+            raise asyncio.CancelledError()
+        asyncio.current_task().uncancel()
+        return order.future.result()
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        orders, self.pending = self.pending, []
+        if not orders:
+            return
+        # Run outside the submitter's context so the batch never inherits an open connection
+        task = contextvars.Context().run(asyncio.create_task, self._run(orders))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, orders: list[TransferOrder]):
+        orders = [o for o in orders if not o.future.done()]
+        if not orders:
+            return
+        for order in orders:
+            order.applying = True
+        try:
+            await self.apply(orders)
+        except Exception as e:
+            for order in orders:
+                if not order.future.done():
+                    order.future.set_exception(e)
@@ -0,0 +1,101 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class ResponseCache:
+    """TTL cache with single-flight loading: concurrent misses on one key share a single load."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 2):
+        self.cache = TTLCache(maxsize, ttl)
+        self.coalesced = 0
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+
+    def peek(self, key: Hashable) -> Any:
+        return self.cache.get(key)
+
+    def set(self, key: Hashable, value: Any):
+        self.cache.set(key, value)
+
+    def clear(self):
+        # Loads already in flight started before the clear and must not repopulate the cache
+        self._generation += 1
+        self._inflight.clear()
+        self.cache.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            # The load runs as its own task so a cancelled caller does not cancel the waiters
+            task = asyncio.ensure_future(loader())
+            generation = self._generation
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t, generation))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future, generation: int):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if generation == self._generation:
+            self.cache.set(key, task.result())
@@ -10,12 +10,77 @@ class Config:
 
     class Swap:
         fee: int = 30
+        batch_interval: float = 0 # seconds, 0 disables batched settlement
+
+    class Transfer:
+        batch_window: float = 0 # seconds to collect concurrent transfers into one group commit, 0 disables it
+        batch_size: int = 100 # a full batch commits without waiting for the window
+
+    class Retry:
+        attempts: int = 5 # tries per operation on deadlock (1213) or lock wait timeout (1205)
+        base_delay: float = 0.01 # seconds; backoff doubles per attempt with full jitter
+        max_delay: float = 0.5 # seconds, cap for a single backoff
+        budget: float = 2 # seconds an operation may spend retrying before giving up
 
     class Gas:
         currency_id: int = 1
         price: int = 1
+        settlement: str = "transfer" # "deferred" charges the final fee without a transfer per execution (needs Execution.single_transaction)
+        settlement_period: int = 3600 # seconds of deferred gas settled as one transfer per user
+
+    class Execution:
+        single_transaction: bool = False # write each execution row once, with its final status, in the transaction doing the work
 
     class Discord:
         token: str = ""
 
+    class Cache:
+        currency_ttl: float = 30 # seconds currency metadata is cached (supply is always read live), 0 disables the cache
+        currency_size: int = 1024
+        api_key_ttl: float = 60 # seconds
+        api_key_negative_ttl: float = 5 # seconds, caches unknown keys to absorb brute-force floods
+        api_key_size: int = 10000
+        api_key_version_interval: float = 1 # seconds between checks for keys rotated by other processes
+        data_version_interval: float = 1 # seconds between checks for writes made by other processes (shared API response cache)
+
+    class Archive:
+        path: str = "" # directory for archived transfer segments (an absolute path), empty disables the archive
+        min_age_days: int = 365 # transfers older than this are moved by tools/archive_transfers.py
+        segment_size: int = 50000 # transfers per gzip NDJSON segment
+
+    class Snapshot:
+        interval: int = 86400 # seconds between balance snapshots for point-in-time queries, 0 disables them
+
+    class Storage:
+        backend: str = "mysql" # "sqlite" runs on an embedded database file instead of MySQL
+        sqlite_path: str = "rapidwire.db"
+        sqlite_readers: int = 4 # read connections served alongside the single writer
+        sqlite_synchronous: str = "FULL" # PRAGMA synchronous; NORMAL trades the last commits on power loss for latency
+
+    class Replica:
+        max_lag: float = 2 # seconds; replicas further behind are skipped and reads go to the primary
+        lag_check_interval: float = 1 # seconds between replication lag checks per replica
+
+    class Pool:
+        adaptive: bool = False # grow the primary pool toward max_size under sustained acquire waits and shrink it back when idle
+        max_size: int = 50 # ceiling for adaptive growth; the floor is the configured pool size
+        grow_wait: float = 0.02 # seconds of mean acquire wait over one interval that triggers growth
+        idle_intervals: int = 60 # consecutive intervals with unused connections before shrinking by one
+        interval: float = 1 # seconds between sizing decisions
+
+    class Tracing:
+        enabled: bool = False # per-statement timing aggregated by SQL fingerprint, adds a Server-Timing header to API responses
+        server_timing_sites: bool = False # also names the slowest internal call sites in Server-Timing; for debugging only
+        slow_query: float = 0.5 # seconds; statements at or above this are logged, 0 disables the log
+
+    class Ledger:
+        currencies: list[int] = [] # currencies settled in memory by the ledger engine, empty disables it
+        path: str = "ledger" # directory for the write-ahead log
+        checkpoint_interval: float = 1 # seconds between lease checks, log rotation and retries of failed saves
+        rpc_host: str = "127.0.0.1" # address the owning process accepts forwarded transfers on; other processes connect to it
+        rpc_port: int = 0 # 0 picks a free port, published in ledger_owner
+
+    class Supply:
+        shards: int = 0 # rows each currency's supply changes are spread over, 0 updates currency.supply directly
+
     decimal_places: int = 3
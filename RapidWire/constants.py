@@ -18,6 +18,7 @@ CONTRACT_OP_COSTS = {
 SYSTEM_USER_ID = 0
 SECONDS_IN_A_DAY = 86400
 SECONDS_IN_AN_HOUR = 3600
+SECONDS_IN_A_MINUTE = 60
 
 # Interest Rate Scaling
 # 1000000 means 100%
@@ -26,3 +27,12 @@ SECONDS_IN_AN_HOUR = 3600
 INTEREST_RATE_SCALE = 1000000
 
 MAX_VM_MEMORY = 8192
+
+# Pool Price Candles
+# Prices are stored as integers: (currency_b per currency_a) * PRICE_SCALE
+PRICE_SCALE = 10**18
+CANDLE_RESOLUTIONS = {
+    '1m': SECONDS_IN_A_MINUTE,
+    '1h': SECONDS_IN_AN_HOUR,
+    '1d': SECONDS_IN_A_DAY,
+}
@@ -1,25 +1,38 @@
 import aiomysql
+import asyncio
 import json
 import httpx
-from time import time
+from time import perf_counter, time
 from typing import Optional
 from decimal import Decimal
 import hashlib
 import zlib
 import re
+from pathlib import Path
 
 from .config import Config
 from .vm import RapidWireVM
+from .analysis import analyze_script
+from .batching import SwapBatcher, SwapOrder, TransferBatcher, TransferOrder, clear_swap_batch, fill_amount
+from .cache import TTLCache
+from .archive import TransferArchive
+from .search import TRANSFER_INDEXES
 from .database import DatabaseConnection
+from .pool_monitor import supports_resize
+from .ledger import LedgerEngine, LedgerStore
+from .retry import retry_transaction
+from .tracing import Tracer
 from .models import (
     UserModel, CurrencyModel, ContractModel, APIKeyModel, ClaimModel,
     StakeModel, LiquidityPoolModel, LiquidityProviderModel, ContractVariableModel,
     NotificationPermissionModel, ExecutionModel, TransferModel, ContractHistoryModel,
-    AllowanceModel, AllowanceLogModel, DiscordPermissionModel
+    AllowanceModel, AllowanceLogModel, DiscordPermissionModel, PoolCandleModel,
+    BalanceSnapshotModel, GasChargeModel, DataVersionModel
 )
 from .structs import (
-    Currency, Claim, Stake, ExecutionContext, ChainContext, LiquidityPool,
-    LiquidityProvider, Transfer
+    Currency, Contract, CostAnalysis, Claim, Stake, ExecutionContext, ChainContext, LiquidityPool,
+    LiquidityProvider, Transfer, PoolCandle, Portfolio, PortfolioEntry,
+    BalanceSnapshot, HistoricalBalance, HistoricalSupply, SupplyDiscrepancy
 )
 from .exceptions import (
     UserNotFound,
@@ -32,26 +45,62 @@ from .exceptions import (
     TimeLockNotExpired,
     RequestExpired
 )
-from .constants import CONTRACT_OP_COSTS, SYSTEM_USER_ID, SECONDS_IN_A_DAY, SECONDS_IN_AN_HOUR, INTEREST_RATE_SCALE
+from .constants import CONTRACT_OP_COSTS, SYSTEM_USER_ID, SECONDS_IN_A_DAY, SECONDS_IN_AN_HOUR, INTEREST_RATE_SCALE, CANDLE_RESOLUTIONS, PRICE_SCALE
+from .metrics import REGISTRY, render_cache, render_histograms, render_samples
+
+TRANSFERS = REGISTRY.counter("rapidwire_transfers_total", "Transfers committed through RapidWire.transfer")
+SWAPS = REGISTRY.counter("rapidwire_swaps_total", "Swaps committed, by settlement mode", ("mode",))
+CONTRACT_EXECUTIONS = REGISTRY.counter("rapidwire_contract_executions_total", "Contract executions, by final status", ("status",))
+CONTRACT_GAS = REGISTRY.histogram(
+    "rapidwire_contract_gas_used", "Gas charged per top-level contract execution",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+)
+CONTRACT_INSTRUCTIONS = REGISTRY.histogram(
+    "rapidwire_contract_instructions", "VM instructions executed per contract run",
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+)
+STAKE_UPDATE_SECONDS = REGISTRY.histogram("rapidwire_update_stale_stakes_seconds", "Duration of update_stale_stakes runs")
 
+def _truncate_output(message: str) -> str:
+    # execution.output_data is varchar(127)
+    return message if len(message) <= 127 else message[:124] + "..."
 
 class ContractAPI:
     def __init__(self, rapidwire_instance: 'RapidWire', execution_context: ExecutionContext, chain_context: Optional[ChainContext] = None):
         self.core = rapidwire_instance
         self.ctx = execution_context
         self.chain_context = chain_context
+        self.httpx_client = self._discord_client()
 
+    def _discord_client(self) -> httpx.AsyncClient:
         headers = {
             "User-Agent": "DiscordBot (https://github.com/RapidWire/RapidWire, 1.0)"
         }
         if self.core.Config.Discord.token:
             headers["Authorization"] = f"Bot {self.core.Config.Discord.token}"
 
-        self.httpx_client = httpx.AsyncClient(
+        return httpx.AsyncClient(
             base_url="https://discord.com/api/v10",
             headers=headers
         )
 
+    def _after_commit(self, request, action: str):
+        # Discord writes are sent once the execution commits: a rolled back run sends nothing,
+        # and the locks the execution holds are not kept while Discord answers
+        async def send():
+            try:
+                async with self._discord_client() as client:
+                    await request(client)
+            except Exception as e:
+                print(f"Error {action}: {e}")
+
+        def start():
+            task = asyncio.create_task(send())
+            self.core.side_effects.add(task)
+            task.add_done_callback(self.core.side_effects.discard)
+
+        self.core.db.on_commit(start)
+
     async def get_balance(self, user_id: int, currency_id: int) -> int:
         balance = await self.core.get_user(user_id).get_balance(currency_id)
         return balance.amount
@@ -78,7 +127,7 @@ class ContractAPI:
         return await self.core.Transfers.get(tx_id)
 
     async def get_currency(self, currency_id: int) -> Optional[Currency]:
-        curr = await self.core.Currencies.get(currency_id=currency_id)
+        curr = await self.core.Currencies.get(currency_id=currency_id, use_cache=False)
         return curr if curr else None
 
     async def create_claim(self, claimant: int, payer: int, currency: int, amount: int, desc: Optional[str] = None) -> Claim:
@@ -162,23 +211,21 @@ class ContractAPI:
         if not await self.core.DiscordPermissions.check(guild_id, self.ctx.contract_owner_id):
             raise PermissionError("This contract is not authorized to perform Discord operations in this server.")
 
-        try:
+        async def send(client: httpx.AsyncClient):
             # Verify channel is in guild
-            resp = await self.httpx_client.get(f"/channels/{channel_id}")
+            resp = await client.get(f"/channels/{channel_id}")
             if resp.status_code != 200:
-                return False
+                return
 
             channel_data = resp.json()
             if int(channel_data.get('guild_id', 0)) != guild_id:
                 raise PermissionError("Channel does not belong to the specified guild.")
 
             payload = {"content": message}
-            resp = await self.httpx_client.post(f"/channels/{channel_id}/messages", json=payload)
+            await client.post(f"/channels/{channel_id}/messages", json=payload)
 
-            return resp.status_code in (200, 201)
-        except Exception as e:
-            print(f"Error sending message: {e}")
-            return False
+        self._after_commit(send, "sending message")
+        return True
 
     async def discord_role_add(self, guild_id: int, user_id: int, role_id: int) -> bool:
         if not self.core.Config.Discord.token:
@@ -188,14 +235,11 @@ class ContractAPI:
         if not await self.core.DiscordPermissions.check(guild_id, self.ctx.contract_owner_id):
             raise PermissionError("This contract is not authorized to perform Discord operations in this server.")
 
-        try:
-            url = f"/guilds/{guild_id}/members/{user_id}/roles/{role_id}"
-            resp = await self.httpx_client.put(url)
+        async def add(client: httpx.AsyncClient):
+            await client.put(f"/guilds/{guild_id}/members/{user_id}/roles/{role_id}")
 
-            return resp.status_code == 204
-        except Exception as e:
-            print(f"Error adding role: {e}")
-            return False
+        self._after_commit(add, "adding role")
+        return True
 
     def add_cost(self, op: str):
         cost = CONTRACT_OP_COSTS.get(op, 0)
@@ -232,44 +276,156 @@ class ContractAPI:
 
 
 class RapidWire:
-    def __init__(self, db_config: dict):
+    def __init__(self, db_config: dict, replica_configs: Optional[list[dict]] = None):
         self.pool = None
         self.db_config = db_config
+        self.replica_configs = replica_configs or []
+        self.replica_pools: list[aiomysql.Pool] = []
+        self.Config = Config
+        self.swap_batcher: Optional[SwapBatcher] = None
+        self.transfer_batcher: Optional[TransferBatcher] = None
+        self.pool_sizer: Optional[asyncio.Task] = None
+        self.ledger: Optional[LedgerEngine] = None
+        self.side_effects: set[asyncio.Task] = set()
 
     async def initialize(self):
-        self.pool = await aiomysql.create_pool(**self.db_config)
-        self.db = DatabaseConnection(self.pool)
-        self.Currencies = CurrencyModel(self.db)
+        storage_config = getattr(self.Config, 'Storage', Config.Storage)
+        sqlite = getattr(storage_config, 'backend', Config.Storage.backend) == "sqlite"
+        if sqlite:
+            from .sqlite import open_sqlite
+            # One writer connection serializes write transactions; the readers are served
+            # through the replica routing, which finds them never behind.
+            schema = Path(__file__).resolve().parent.parent / "rapid-wire.sql"
+            self.pool, readers = await open_sqlite(
+                getattr(storage_config, 'sqlite_path', Config.Storage.sqlite_path),
+                schema.read_text(encoding="utf-8"),
+                getattr(storage_config, 'sqlite_readers', Config.Storage.sqlite_readers),
+                getattr(storage_config, 'sqlite_synchronous', Config.Storage.sqlite_synchronous)
+            )
+            self.replica_pools.append(readers)
+        else:
+            self.pool = await aiomysql.create_pool(**self.db_config)
+            for replica_config in self.replica_configs:
+                try:
+                    self.replica_pools.append(await aiomysql.create_pool(**replica_config))
+                except Exception as e:
+                    print(f"Skipping read replica {replica_config.get('host')}:{replica_config.get('port')}: {e}")
+        replica_config = getattr(self.Config, 'Replica', Config.Replica)
+        tracing_config = getattr(self.Config, 'Tracing', Config.Tracing)
+        self.db = DatabaseConnection(
+            self.pool,
+            self.replica_pools,
+            getattr(replica_config, 'max_lag', Config.Replica.max_lag),
+            getattr(replica_config, 'lag_check_interval', Config.Replica.lag_check_interval),
+            Tracer(getattr(tracing_config, 'slow_query', Config.Tracing.slow_query))
+            if getattr(tracing_config, 'enabled', Config.Tracing.enabled) else None
+        )
+        pool_config = getattr(self.Config, 'Pool', Config.Pool)
+        if getattr(pool_config, 'adaptive', Config.Pool.adaptive) and not sqlite and not supports_resize(self.pool):
+            print(f"Adaptive pool sizing disabled: aiomysql {aiomysql.__version__} does not expose the pool internals it needs.")
+        elif getattr(pool_config, 'adaptive', Config.Pool.adaptive) and not sqlite:
+            self.pool_sizer = asyncio.create_task(self.db.monitor.run(
+                getattr(pool_config, 'interval', Config.Pool.interval),
+                getattr(pool_config, 'max_size', Config.Pool.max_size),
+                getattr(pool_config, 'grow_wait', Config.Pool.grow_wait),
+                getattr(pool_config, 'idle_intervals', Config.Pool.idle_intervals)
+            ))
+        cache_config = getattr(self.Config, 'Cache', Config.Cache)
+        self.Currencies = CurrencyModel(self.db, TTLCache(
+            getattr(cache_config, 'currency_size', Config.Cache.currency_size),
+            getattr(cache_config, 'currency_ttl', Config.Cache.currency_ttl)
+        ), getattr(getattr(self.Config, 'Supply', Config.Supply), 'shards', Config.Supply.shards))
         self.Contracts = ContractModel(self.db)
-        self.APIKeys = APIKeyModel(self.db)
+        self.APIKeys = APIKeyModel(
+            self.db,
+            TTLCache(getattr(cache_config, 'api_key_size', Config.Cache.api_key_size), getattr(cache_config, 'api_key_ttl', Config.Cache.api_key_ttl)),
+            TTLCache(getattr(cache_config, 'api_key_size', Config.Cache.api_key_size), getattr(cache_config, 'api_key_negative_ttl', Config.Cache.api_key_negative_ttl)),
+            getattr(cache_config, 'api_key_version_interval', Config.Cache.api_key_version_interval)
+        )
+        self.DataVersion = DataVersionModel(self.db, getattr(cache_config, 'data_version_interval', Config.Cache.data_version_interval))
         self.Claims = ClaimModel(self.db)
         self.Stakes = StakeModel(self.db)
         self.LiquidityPools = LiquidityPoolModel(self.db)
         self.LiquidityProviders = LiquidityProviderModel(self.db)
+        self.PoolCandles = PoolCandleModel(self.db)
         self.ContractVariables = ContractVariableModel(self.db)
         self.NotificationPermissions = NotificationPermissionModel(self.db)
         self.DiscordPermissions = DiscordPermissionModel(self.db)
         self.Executions = ExecutionModel(self.db)
-        self.Transfers = TransferModel(self.db)
+        archive_path = getattr(getattr(self.Config, 'Archive', Config.Archive), 'path', Config.Archive.path)
+        self.Transfers = TransferModel(self.db, TransferArchive(archive_path) if archive_path else None)
+        if not sqlite:
+            missing = {*TRANSFER_INDEXES.values(), "timestamp"} - await self.Transfers.detect_indexes()
+            if missing:
+                print(f"transfer is missing the indexes {', '.join(sorted(missing))}; searches skip those hints until tools/add_transfer_indexes.py is run.")
         self.ContractHistories = ContractHistoryModel(self.db)
+        self.BalanceSnapshots = BalanceSnapshotModel(self.db, self.Transfers)
         self.Allowances = AllowanceModel(self.db)
         self.AllowanceLogs = AllowanceLogModel(self.db)
-        self.Config = Config
+        gas_config = getattr(self.Config, 'Gas', Config.Gas)
+        self.GasCharges = GasChargeModel(self.db, getattr(gas_config, 'settlement_period', Config.Gas.settlement_period))
+        ledger_config = getattr(self.Config, 'Ledger', Config.Ledger)
+        ledger_currencies = getattr(ledger_config, 'currencies', Config.Ledger.currencies)
+        if ledger_currencies:
+            self.ledger = LedgerEngine(
+                # The lease connection is held for the process lifetime, so never take the SQLite writer
+                LedgerStore(self.db, self.Transfers, self.replica_pools[0] if sqlite else None),
+                ledger_currencies,
+                getattr(ledger_config, 'path', Config.Ledger.path),
+                getattr(ledger_config, 'checkpoint_interval', Config.Ledger.checkpoint_interval),
+                getattr(ledger_config, 'rpc_host', Config.Ledger.rpc_host),
+                getattr(ledger_config, 'rpc_port', Config.Ledger.rpc_port)
+            )
+            await self.ledger.start()
+        REGISTRY.collector("rapidwire", self._collect_metrics)
+
+    def _collect_metrics(self) -> list[str]:
+        monitor = self.db.monitor
+        pool = monitor.snapshot()
+        longest = pool["longest_held"]
+        lines = render_samples("rapidwire_db_pool_connections", "gauge", "Primary pool connections by state", [
+            ({"state": "in_use"}, pool["in_use"]),
+            ({"state": "free"}, pool["free"] or 0),
+            ({"state": "waiting"}, pool["waiting"])
+        ])
+        lines += render_samples("rapidwire_db_pool_max_size", "gauge", "Current primary pool maxsize", [({}, pool["maxsize"] or 0)])
+        lines += render_samples("rapidwire_db_pool_longest_hold_seconds", "gauge", "Age of the longest-held connection", [({}, longest["seconds"] if longest else 0)])
+        lines += render_samples("rapidwire_db_pool_resizes_total", "counter", "Adaptive pool resizes", [({}, pool["resizes"])])
+        lines += render_samples("rapidwire_db_pool_exhausted_total", "counter", "Acquires that found the pool exhausted, by call site",
+                                [({"site": site}, count) for site, count in pool["exhausted"].items()])
+        lines += render_histograms("rapidwire_db_pool_wait_seconds", "Connection acquire wait by call site",
+                                   [({"site": site}, hist) for site, hist in monitor.wait.items()])
+        lines += render_histograms("rapidwire_db_pool_hold_seconds", "Connection hold time by call site",
+                                   [({"site": site}, hist) for site, hist in monitor.hold.items()])
+        lines += render_cache("rapidwire_cache", {
+            "currency": self.Currencies.cache,
+            "currency_symbol": self.Currencies._symbols,
+            "api_key": self.APIKeys.cache,
+            "api_key_negative": self.APIKeys.negative_cache
+        })
+        return lines
 
     async def close(self):
-        if self.pool:
-            self.pool.close()
-            await self.pool.wait_closed()
+        if self.pool_sizer:
+            self.pool_sizer.cancel()
+        if self.side_effects:
+            await asyncio.wait(self.side_effects, timeout=10)
+        if self.ledger:
+            await self.ledger.close()
+        for pool in [self.pool] + self.replica_pools:
+            if pool:
+                pool.close()
+                await pool.wait_closed()
 
     def get_user(self, user_id: int) -> UserModel:
-        return UserModel(user_id, self.db)
+        return UserModel(user_id, self.db, self.ledger)
 
     async def _compound_interest(self, cursor, user_id: int, currency_id: int) -> Stake:
         stake = await self.Stakes.get(user_id, currency_id, for_update=True, cursor=cursor)
         if not stake:
             return None
 
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency or currency.hourly_interest_rate <= 0:
             return stake
 
@@ -294,6 +450,13 @@ class RapidWire:
 
     async def update_stale_stakes(self):
         """Updates stakes that haven't been updated for 3 hours or more."""
+        started = perf_counter()
+        try:
+            await self._update_stale_stakes()
+        finally:
+            STAKE_UPDATE_SECONDS.observe(perf_counter() - started)
+
+    async def _update_stale_stakes(self):
         current_time = int(time())
         # 3 hours ago
         threshold_time = current_time - (3 * SECONDS_IN_AN_HOUR)
@@ -339,8 +502,14 @@ class RapidWire:
         if input_data and "\\" in input_data:
             raise ValueError("Input data cannot contain backslashes.")
 
-        execution_id = None
         gas_currency_id = self.Config.Gas.currency_id
+        # Ledger transfers commit on their own, so a gas currency the ledger settles is
+        # charged between the phases below, never inside the execution's transaction
+        ledger_gas = self.ledger is not None and self.ledger.manages(gas_currency_id)
+        if chain_context is None and not self.db.in_transaction and self._single_transaction_executions() and not ledger_gas:
+            return await self._execute_contract_in_transaction(caller_id, contract_owner_id, input_data)
+
+        execution_id = None
         gas_price = self.Config.Gas.price
         initial_gas_deduction = 0
 
@@ -351,6 +520,8 @@ class RapidWire:
                 contract = await self.Contracts.get(contract_owner_id)
                 if not contract or not contract.script:
                     raise ContractError("Contract not found or script is empty.")
+                if chain_context is None:
+                    self._check_budget(contract)
 
                 # Create Execution Record (Pending)
                 execution_id = await self.Executions.create(cursor, caller_id, contract_owner_id, input_data, 'pending')
@@ -358,15 +529,22 @@ class RapidWire:
                 # Estimate and Deduct Gas Fee Upfront
                 # Only deduct gas for the top-level call. Recursive calls share the budget and cost tracking.
                 if chain_context is None and caller_id != SYSTEM_USER_ID and gas_price > 0:
-                    initial_gas_deduction = contract.cost * gas_price
+                    initial_gas_deduction = self._gas_estimate(contract) * gas_price
                     caller = self.get_user(caller_id)
                     balance = await caller.get_balance(gas_currency_id)
                     if balance.amount < initial_gas_deduction:
                         raise InsufficientFunds(f"Insufficient funds for estimated gas fee. Required: {initial_gas_deduction}, Available: {balance.amount}")
 
                     # Deduct now
-                    if initial_gas_deduction > 0:
+                    if initial_gas_deduction > 0 and not ledger_gas:
                         await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, initial_gas_deduction, execution_id=execution_id)
+            if initial_gas_deduction > 0 and ledger_gas:
+                try:
+                    await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, initial_gas_deduction, execution_id=execution_id)
+                except Exception as e:
+                    async with self.db as cursor:
+                        await self.Executions.update(cursor, execution_id, self._contract_failure(e)[1], 0, 'failed')
+                    raise
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during contract preparation: {err}")
         except Exception:
@@ -377,7 +555,7 @@ class RapidWire:
         if chain_context is None:
             chain_context = ChainContext(
                 total_cost=contract.cost,
-                budget=contract.max_cost if contract.max_cost > 0 else self.Config.Contract.max_cost,
+                budget=self._contract_budget(contract),
                 depth=0,
                 executing_contracts=set()
             )
@@ -400,65 +578,48 @@ class RapidWire:
             async with self.db as cursor:
                 # We need to re-fetch/attach context if necessary, but we are in the same instance
                 # Note: The previous block committed the gas deduction and execution record creation.
-
-                execution_context = ExecutionContext(
-                    caller_id=caller_id,
-                    contract_owner_id=contract_owner_id,
-                    input=input_data,
-                    execution_id=execution_id
-                )
-
-                api_handler = ContractAPI(self, execution_context, chain_context)
-
-                system_vars = {
-                    '_sender': caller_id,
-                    '_self': contract_owner_id,
-                    '_input': input_data if input_data else ""
-                }
-
-                vm = RapidWireVM(json.loads(contract.script), api_handler, system_vars)
-                await vm.run()
-                output_data = vm.output
-
-                await api_handler.close()
+                output_data = await self._run_contract(contract, caller_id, input_data, execution_id, chain_context)
 
                 await self.Executions.update(cursor, execution_id, output_data, chain_context.total_cost, 'success')
 
                 # Refund excess gas if any - ONLY AT TOP LEVEL
-                if created_context:
+                if created_context and not ledger_gas:
                     final_fee = chain_context.total_cost * gas_price
                     if caller_id != SYSTEM_USER_ID and gas_price > 0:
                         refund = initial_gas_deduction - final_fee
                         if refund > 0:
                             await self.transfer(SYSTEM_USER_ID, caller_id, gas_currency_id, refund, execution_id=execution_id)
                         elif refund < 0:
-                            additional_charge = abs(refund)
-                            await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, additional_charge, execution_id=execution_id)
-
+                            # The run has completed, so the rest is charged only up to what the caller holds
+                            balance = await self.get_user(caller_id).get_balance(gas_currency_id, for_update=True, cursor=cursor)
+                            additional_charge = min(abs(refund), balance.amount)
+                            if additional_charge > 0:
+                                await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, additional_charge, execution_id=execution_id)
+
+            if created_context and ledger_gas and caller_id != SYSTEM_USER_ID and gas_price > 0:
+                await self._settle_ledger_gas(caller_id, execution_id, initial_gas_deduction, chain_context.total_cost * gas_price)
+
+            CONTRACT_EXECUTIONS.inc(status='success')
+            if created_context:
+                CONTRACT_GAS.observe(chain_context.total_cost)
             return execution_id, output_data
 
         except (TransactionCanceledByContract, ContractError, Exception) as e:
             # Phase 3: Failure Handling (New Transaction)
+            error_status, error_message = self._contract_failure(e)
 
-            error_status = 'failed'
-            if isinstance(e, TransactionCanceledByContract):
-                error_status = 'reverted'
-
-            error_message = str(e)
-            if isinstance(e, ContractError):
-                error_message = e.message
-            elif not isinstance(e, (TransactionCanceledByContract, ContractError)):
-                error_message = f"{e.__class__.__name__}: {str(e)}"
+            CONTRACT_EXECUTIONS.inc(status=error_status)
+            if created_context:
+                CONTRACT_GAS.observe(chain_context.total_cost)
 
             try:
                 async with self.db as cursor:
-                    # Truncate error message to 127 characters to fit in the database
-                    if len(error_message) > 127:
-                        error_message = error_message[:124] + "..."
                     await self.Executions.update(cursor, execution_id, error_message, chain_context.total_cost, error_status)
 
                 # Refund excess gas (charge only for what was used up to failure) - ONLY AT TOP LEVEL
-                if created_context:
+                if created_context and ledger_gas and caller_id != SYSTEM_USER_ID and gas_price > 0:
+                    await self._settle_ledger_gas(caller_id, execution_id, initial_gas_deduction, chain_context.total_cost * gas_price)
+                elif created_context:
                     final_fee = chain_context.total_cost * gas_price
                     if caller_id != SYSTEM_USER_ID and gas_price > 0:
                         refund = initial_gas_deduction - final_fee
@@ -488,11 +649,264 @@ class RapidWire:
                 if not created_context:
                     chain_context.depth -= 1
 
+    async def _settle_ledger_gas(self, caller_id: int, execution_id: int, reserved: int, fee: int):
+        """Refunds or charges the difference between the estimate and the fee through the ledger.
+
+        Runs after the execution has committed, so a failure is only logged, and the rest of
+        a fee above the estimate is charged at most the caller's balance.
+        """
+        gas_currency_id = self.Config.Gas.currency_id
+        try:
+            if fee < reserved:
+                await self.transfer(SYSTEM_USER_ID, caller_id, gas_currency_id, reserved - fee, execution_id=execution_id)
+            elif fee > reserved:
+                balance = await self.get_user(caller_id).get_balance(gas_currency_id)
+                charge = min(fee - reserved, balance.amount)
+                if charge > 0:
+                    await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, charge, execution_id=execution_id)
+        except Exception as gas_err:
+            print(f"Error handling gas refund/charge: {gas_err}")
+
+    def _contract_budget(self, contract: Contract) -> int:
+        return contract.max_cost if contract.max_cost > 0 else self.Config.Contract.max_cost
+
+    def _check_budget(self, contract: Contract):
+        # Rejects a run that cannot finish before any row is written or locked
+        budget = self._contract_budget(contract)
+        cheapest = max(contract.cost, contract.cost_min)
+        if cheapest > budget:
+            raise ContractError(f"Execution budget exceeded: the cheapest path costs {cheapest}, the budget is {budget}.")
+
+    def _gas_estimate(self, contract: Contract) -> int:
+        # The cheapest path, which every successful run pays at least: callers only need to
+        # afford what they use, and a run that costs more pays the rest, up to the caller's
+        # balance, when it finishes
+        return max(contract.cost, contract.cost_min)
+
+    def analyze_contract(self, script: str) -> CostAnalysis:
+        """Static cost bounds of a script, as totals charged to a run including its static cost."""
+        cost = self._calculate_contract_cost(script)
+        analysis = analyze_script(json.loads(script))
+        analysis.min_cost += cost
+        # A callee's cost is only known at run time, so calls leave the worst case open
+        if analysis.max_cost is None or analysis.external_calls or cost + analysis.max_cost >= 2 ** 63:
+            analysis.max_cost = None
+        else:
+            analysis.max_cost += cost
+        return analysis
+
+    def _single_transaction_executions(self) -> bool:
+        config = getattr(self.Config, 'Execution', Config.Execution)
+        return getattr(config, 'single_transaction', Config.Execution.single_transaction)
+
+    async def _run_contract(self, contract: Contract, caller_id: int, input_data: Optional[str], execution_id: int, chain_context: ChainContext) -> Optional[str]:
+        execution_context = ExecutionContext(
+            caller_id=caller_id,
+            contract_owner_id=contract.user_id,
+            input=input_data,
+            execution_id=execution_id
+        )
+
+        api_handler = ContractAPI(self, execution_context, chain_context)
+
+        system_vars = {
+            '_sender': caller_id,
+            '_self': contract.user_id,
+            '_input': input_data if input_data else ""
+        }
+
+        vm = RapidWireVM(json.loads(contract.script), api_handler, system_vars)
+        try:
+            await vm.run()
+        finally:
+            CONTRACT_INSTRUCTIONS.observe(vm.instruction_count)
+        output_data = vm.output
+
+        await api_handler.close()
+        return output_data
+
+    @staticmethod
+    def _contract_failure(e: Exception) -> tuple[str, str]:
+        error_status = 'failed'
+        if isinstance(e, TransactionCanceledByContract):
+            error_status = 'reverted'
+
+        error_message = str(e)
+        if isinstance(e, ContractError):
+            error_message = e.message
+        elif not isinstance(e, (TransactionCanceledByContract, ContractError)):
+            error_message = f"{e.__class__.__name__}: {str(e)}"
+        return error_status, _truncate_output(error_message)
+
+    async def _execute_contract_in_transaction(self, caller_id: int, contract_owner_id: int, input_data: Optional[str]) -> tuple[int, str | None]:
+        """Top-level execute_contract with Execution.single_transaction.
+
+        The execution row, the gas fee and everything the contract does commit together,
+        so the row is inserted as 'success' and only gets its output. The gas estimate is
+        held back in the caller's locked balance while the contract runs, and the final
+        fee is charged once afterwards: a single transfer, taken after the run so the
+        transfer sequence lock is not held across it, or with deferred settlement no
+        transfer at all. A failed run rolls all of it back; a compensating transaction
+        then records the failure and charges the gas used up to it, as the three-phase
+        flow would have. Discord writes made by the contract are only sent after the
+        commit, so no HTTP request is made while the caller's balance row is locked.
+        """
+        gas_currency_id = self.Config.Gas.currency_id
+        gas_price = self.Config.Gas.price
+        deferred = self._deferred_gas()
+        chain_context = None
+        started = False
+        try:
+            async with self.db as cursor:
+                contract = await self.Contracts.get(contract_owner_id)
+                if not contract or not contract.script:
+                    raise ContractError("Contract not found or script is empty.")
+
+                chain_context = ChainContext(
+                    total_cost=contract.cost,
+                    budget=self._contract_budget(contract),
+                    depth=0,
+                    executing_contracts={contract_owner_id}
+                )
+                self._check_budget(contract)
+
+                execution_id = await self.Executions.create(cursor, caller_id, contract_owner_id, input_data, 'success')
+
+                reserved = 0
+                caller = self.get_user(caller_id)
+                if caller_id != SYSTEM_USER_ID and gas_price > 0:
+                    reserved = self._gas_estimate(contract) * gas_price
+                    balance = await caller.get_balance(gas_currency_id, for_update=True, cursor=cursor)
+                    if balance.amount < reserved:
+                        raise InsufficientFunds(f"Insufficient funds for estimated gas fee. Required: {reserved}, Available: {balance.amount}")
+                    if reserved > 0:
+                        # Held back so the contract cannot spend it; charged once the run is done
+                        await caller._update_balance(cursor, gas_currency_id, -reserved)
+
+                started = True
+                output_data = await self._run_contract(contract, caller_id, input_data, execution_id, chain_context)
+                await self.Executions.update(cursor, execution_id, output_data, chain_context.total_cost, 'success')
+
+                if caller_id != SYSTEM_USER_ID and gas_price > 0 and deferred:
+                    await self._charge_deferred_gas(cursor, caller_id, execution_id, reserved, chain_context.total_cost * gas_price)
+                elif caller_id != SYSTEM_USER_ID and gas_price > 0:
+                    if reserved > 0:
+                        await caller._update_balance(cursor, gas_currency_id, reserved)
+                    fee = chain_context.total_cost * gas_price
+                    if fee > reserved:
+                        # The run has completed, so the rest is charged only up to what the caller holds
+                        balance = await caller.get_balance(gas_currency_id, for_update=True, cursor=cursor)
+                        fee = min(fee, balance.amount)
+                    if fee > 0:
+                        await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, fee, execution_id=execution_id)
+        except Exception as e:
+            if not started:
+                # Nothing ran, so there is nothing to record, as with a failed preparation phase
+                if isinstance(e, aiomysql.Error):
+                    raise TransactionError(f"Database error during contract preparation: {e}")
+                raise
+
+            error_status, error_message = self._contract_failure(e)
+            CONTRACT_EXECUTIONS.inc(status=error_status)
+            CONTRACT_GAS.observe(chain_context.total_cost)
+
+            try:
+                async with self.db as cursor:
+                    execution_id = await self.Executions.create(
+                        cursor, caller_id, contract_owner_id, input_data, error_status, error_message, chain_context.total_cost
+                    )
+                    if caller_id != SYSTEM_USER_ID and gas_price > 0:
+                        # The upfront deduction was rolled back with the rest, so charge what was used
+                        balance = await self.get_user(caller_id).get_balance(gas_currency_id, for_update=True, cursor=cursor)
+                        charge = min(chain_context.total_cost * gas_price, balance.amount)
+                        if deferred:
+                            await self._charge_deferred_gas(cursor, caller_id, execution_id, 0, charge)
+                        elif charge > 0:
+                            await self.transfer(caller_id, SYSTEM_USER_ID, gas_currency_id, charge, execution_id=execution_id, cursor=cursor)
+            except Exception as record_err:
+                print(f"Error recording failed execution: {record_err}")
+            raise e
+
+        CONTRACT_EXECUTIONS.inc(status='success')
+        CONTRACT_GAS.observe(chain_context.total_cost)
+        return execution_id, output_data
+
+    def _deferred_gas(self) -> bool:
+        gas_config = getattr(self.Config, 'Gas', Config.Gas)
+        return getattr(gas_config, 'settlement', Config.Gas.settlement) == "deferred"
+
+    async def _charge_deferred_gas(self, cursor, caller_id: int, execution_id: int, reserved: int, fee: int):
+        """Turns the reservation into the final fee: one balance adjustment and one gas_charge row.
+
+        A fee above the reservation is charged only up to the caller's balance, since the
+        run it pays for has already completed.
+        """
+        gas_currency_id = self.Config.Gas.currency_id
+        caller = self.get_user(caller_id)
+        if fee > reserved:
+            balance = await caller.get_balance(gas_currency_id, for_update=True, cursor=cursor)
+            fee = min(fee, reserved + balance.amount)
+        if fee != reserved:
+            await caller._update_balance(cursor, gas_currency_id, reserved - fee)
+        if fee > 0:
+            await self.GasCharges.record(cursor, execution_id, caller_id, gas_currency_id, fee)
+
+    async def settle_gas_income(self) -> dict[int, int]:
+        """Settles the deferred gas of closed periods as one transfer to the system per user and currency.
+
+        The balances were charged with each execution, so only the transfer rows, with their
+        user stats, and the supply burn are written; returns the amount settled per currency.
+        """
+        now = int(time())
+        before = self.GasCharges.period_start(now)
+        async with self.db as cursor:
+            charges = await self.GasCharges.lock_unsettled(cursor, before)
+            totals: dict[int, int] = {}
+            for (user_id, currency_id), amount in sorted(charges.items()):
+                if amount:
+                    await self.Transfers.create(cursor, user_id, SYSTEM_USER_ID, currency_id, amount, timestamp=now)
+                    totals[currency_id] = totals.get(currency_id, 0) + amount
+            for currency_id, amount in sorted(totals.items()):
+                await self.Currencies.update_supply(cursor, currency_id, -amount)
+            # settled_at matches the transfers' timestamp, which is what point-in-time replay relies on
+            await self.GasCharges.mark_settled(cursor, before, now)
+        return totals
+
+    @retry_transaction
+    async def _execute_in_transaction(self, caller_id: int, contract_owner_id: int, input_data: str, action):
+        """Runs ``action(execution_id)`` with its execution row in the same transaction.
+
+        The row only commits together with the work, so 'success' is written up front as its
+        final status. Failures are left to the caller to record once this has rolled back.
+        """
+        try:
+            async with self.db as cursor:
+                execution_id = await self.Executions.create(cursor, caller_id, contract_owner_id, input_data, 'success')
+                return execution_id, await action(execution_id)
+        except aiomysql.Error as err:
+            raise TransactionError(f"Database error during execution: {err}")
+
+    async def _record_failed_execution(self, caller_id: int, contract_owner_id: int, input_data: str, error: Exception):
+        try:
+            async with self.db as cursor:
+                await self.Executions.create(cursor, caller_id, contract_owner_id, input_data, 'failed', _truncate_output(str(error)))
+        except Exception:
+            pass
+
     async def execute_transfer_from(self, caller_id: int, source_id: int, destination_id: int, currency_id: int, amount: int) -> tuple[int, Transfer]:
         input_data = f"transfer_from source:{source_id} dest:{destination_id} cur:{currency_id} amt:{amount}"
         if len(input_data) > 127:
             input_data = input_data[:127]
 
+        if not self.db.in_transaction and self._single_transaction_executions():
+            try:
+                return await self._execute_in_transaction(caller_id, SYSTEM_USER_ID, input_data, lambda execution_id: self.transfer_from(
+                    source_id, destination_id, currency_id, amount, spender_id=caller_id, execution_id=execution_id
+                ))
+            except Exception as e:
+                await self._record_failed_execution(caller_id, SYSTEM_USER_ID, input_data, e)
+                raise e
+
         execution_id = None
         try:
             async with self.db as cursor:
@@ -510,9 +924,7 @@ class RapidWire:
             return execution_id, transfer
 
         except Exception as e:
-            error_message = str(e)
-            if len(error_message) > 127:
-                error_message = error_message[:124] + "..."
+            error_message = _truncate_output(str(e))
 
             try:
                 async with self.db as cursor:
@@ -522,6 +934,7 @@ class RapidWire:
 
             raise e
 
+    @retry_transaction
     async def transfer(
         self,
         source_id: int,
@@ -536,55 +949,138 @@ class RapidWire:
         if amount <= 0:
             raise ValueError("Transfer amount must be positive.")
 
-        async def _perform_transfer(cursor):
-            # Deadlock prevention: Lock users in consistent order (by ID)
-            first_id, second_id = sorted([source_id, destination_id])
-
-            # Lock both if they are not system, or lock system too if we update it.
-
-            if first_id != SYSTEM_USER_ID:
-                await self.get_user(first_id).get_balance(currency_id, for_update=True, cursor=cursor)
-            if second_id != SYSTEM_USER_ID:
-                await self.get_user(second_id).get_balance(currency_id, for_update=True, cursor=cursor)
-
-            source = self.get_user(source_id)
-            destination = self.get_user(destination_id)
-
-            # Check funds (Lock already acquired)
-            if source_id != SYSTEM_USER_ID:
-                # Reuse cursor for balance check
-                source_balance = await source.get_balance(currency_id, cursor=cursor)
-                if source_balance.amount < amount:
-                    raise InsufficientFunds("Source user has insufficient funds.")
-
-            if source_id == SYSTEM_USER_ID:
-                await self.Currencies.update_supply(cursor, currency_id, amount)
-                await destination._update_balance(cursor, currency_id, amount)
-            elif destination_id == SYSTEM_USER_ID:
-                await source._update_balance(cursor, currency_id, -amount)
-                await self.Currencies.update_supply(cursor, currency_id, -amount)
-            else:
-                await source._update_balance(cursor, currency_id, -amount)
-                await destination._update_balance(cursor, currency_id, amount)
-
-            transfer_id = await self.Transfers.create(cursor, source_id, destination_id, currency_id, amount, execution_id)
-            return transfer_id
+        if self.ledger is not None and self.ledger.manages(currency_id):
+            if cursor is not None or self.db.in_transaction:
+                # A ledger transfer commits on its own, so it cannot be part of a contract's or any other transaction
+                raise TransactionError(f"Currency {currency_id} is settled by the ledger engine and cannot be moved inside a transaction, such as by a contract.")
+            transfer = await self.ledger.transfer(source_id, destination_id, currency_id, amount, execution_id)
+            TRANSFERS.inc()
+            return transfer
 
+        if cursor is None and execution_id is None and not self.db.in_transaction:
+            transfer_config = getattr(self.Config, 'Transfer', Config.Transfer)
+            batch_window = getattr(transfer_config, 'batch_window', Config.Transfer.batch_window)
+            if batch_window > 0:
+                # Opt-in group commit: concurrent standalone transfers share one transaction
+                if self.transfer_batcher is None:
+                    self.transfer_batcher = TransferBatcher(
+                        self._commit_transfer_batch,
+                        batch_window,
+                        getattr(transfer_config, 'batch_size', Config.Transfer.batch_size)
+                    )
+                return await self.transfer_batcher.submit(source_id, destination_id, currency_id, amount)
+        return await self._transfer_unbatched(source_id, destination_id, currency_id, amount, execution_id, cursor)
+
+    async def _transfer_unbatched(self, source_id: int, destination_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None, cursor=None) -> Transfer:
         try:
             if cursor:
-                transfer_id = await _perform_transfer(cursor)
-                transfer = await self.Transfers.get(transfer_id, cursor=cursor)
-            else:
-                async with self.db as cursor:
-                    transfer_id = await _perform_transfer(cursor)
-                    transfer = await self.Transfers.get(transfer_id, cursor=cursor)
-
-            if not transfer:
-                raise TransactionError("Failed to retrieve transfer record after creation.")
-            return transfer
+                return await self._apply_transfer(cursor, source_id, destination_id, currency_id, amount, execution_id)
+            async with self.db as cursor:
+                return await self._apply_transfer(cursor, source_id, destination_id, currency_id, amount, execution_id)
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during transfer: {err}")
 
+    async def _apply_transfer(self, cursor, source_id: int, destination_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None) -> Transfer:
+        # Deadlock prevention: Lock users in consistent order (by ID)
+        first_id, second_id = sorted([source_id, destination_id])
+
+        # Lock both if they are not system, or lock system too if we update it.
+
+        if first_id != SYSTEM_USER_ID:
+            await self.get_user(first_id).get_balance(currency_id, for_update=True, cursor=cursor)
+        if second_id != SYSTEM_USER_ID:
+            await self.get_user(second_id).get_balance(currency_id, for_update=True, cursor=cursor)
+
+        source = self.get_user(source_id)
+        destination = self.get_user(destination_id)
+
+        # Check funds (Lock already acquired)
+        if source_id != SYSTEM_USER_ID:
+            # Reuse cursor for balance check
+            source_balance = await source.get_balance(currency_id, cursor=cursor)
+            if source_balance.amount < amount:
+                raise InsufficientFunds("Source user has insufficient funds.")
+
+        if source_id == SYSTEM_USER_ID:
+            await self.Currencies.update_supply(cursor, currency_id, amount)
+            await destination._update_balance(cursor, currency_id, amount)
+        elif destination_id == SYSTEM_USER_ID:
+            await source._update_balance(cursor, currency_id, -amount)
+            await self.Currencies.update_supply(cursor, currency_id, -amount)
+        else:
+            await source._update_balance(cursor, currency_id, -amount)
+            await destination._update_balance(cursor, currency_id, amount)
+
+        transfer_id = await self.Transfers.create(cursor, source_id, destination_id, currency_id, amount, execution_id)
+        transfer = await self.Transfers.get(transfer_id, cursor=cursor)
+        if not transfer:
+            raise TransactionError("Failed to retrieve transfer record after creation.")
+        self.db.on_commit(TRANSFERS.inc)
+        return transfer
+
+    async def _lock_transfer_rows(self, cursor, orders: list[TransferOrder]):
+        # Lock every row the batch touches up front in (user_id, currency_id) order, the same
+        # order single transfers use, so batches and single transfers cannot deadlock each other.
+        balances = sorted({
+            (user_id, order.currency_id)
+            for order in orders
+            for user_id in (order.source_id, order.destination_id)
+            if user_id != SYSTEM_USER_ID
+        })
+        if balances:
+            await cursor.execute(
+                f"SELECT user_id FROM balance WHERE (user_id, currency_id) IN ({', '.join(['(%s, %s)'] * len(balances))}) "
+                "ORDER BY user_id, currency_id FOR UPDATE",
+                tuple(value for key in balances for value in key)
+            )
+        currencies = sorted({order.currency_id for order in orders if SYSTEM_USER_ID in (order.source_id, order.destination_id)})
+        # Sharded supply updates touch no currency row, and the shard rows are picked at random
+        if currencies and getattr(getattr(self.Config, 'Supply', Config.Supply), 'shards', Config.Supply.shards) <= 1:
+            await cursor.execute(
+                f"SELECT currency_id FROM currency WHERE currency_id IN ({', '.join(['%s'] * len(currencies))}) ORDER BY currency_id FOR UPDATE",
+                tuple(currencies)
+            )
+
+    async def _commit_transfer_batch(self, orders: list[TransferOrder]):
+        outcomes: list[tuple[TransferOrder, Optional[Transfer], Optional[Exception]]] = []
+        applied = False
+        try:
+            async with self.db as cursor:
+                await self._lock_transfer_rows(cursor, orders)
+                for order in orders:
+                    try:
+                        # A failed transfer only rolls back its own savepoint, the rest of the batch commits
+                        async with self.db.savepoint("transfer_batch"):
+                            transfer = await self._apply_transfer(cursor, order.source_id, order.destination_id, order.currency_id, order.amount)
+                        outcomes.append((order, transfer, None))
+                    except aiomysql.Error:
+                        raise
+                    except Exception as e:
+                        outcomes.append((order, None, e))
+                applied = True
+        except aiomysql.Error as err:
+            if applied:
+                # COMMIT itself failed and its outcome is unknown, so nothing is retried
+                raise TransactionError(f"Database error during transfer: {err}")
+            # Deadlocks and lock timeouts abort the whole transaction: retry each transfer on its own,
+            # exactly as it would have run without batching
+            results = await asyncio.gather(*(
+                self._transfer_unbatched(order.source_id, order.destination_id, order.currency_id, order.amount)
+                for order in orders
+            ), return_exceptions=True)
+            outcomes = [
+                (order, None, result) if isinstance(result, BaseException) else (order, result, None)
+                for order, result in zip(orders, results)
+            ]
+
+        for order, transfer, error in outcomes:
+            if order.future.done():
+                continue
+            if error is not None:
+                order.future.set_exception(error)
+            else:
+                order.future.set_result(transfer)
+
     async def create_currency(self, guild_id: int, name: str, symbol: str, supply: int, issuer_id: int, hourly_interest_rate: int) -> tuple[Currency, Optional[Transfer]]:
         if not re.match(r'^[a-zA-Z][a-zA-Z0-9_]*[a-zA-Z0-9]$', name) and not re.match(r'^[a-zA-Z]$', name):
              raise ValueError("Names must start with a letter, end with an alphanumeric character, and contain only alphanumeric characters and underscores.")
@@ -612,10 +1108,10 @@ class RapidWire:
                 amount=supply
             )
 
-        return await self.Currencies.get(guild_id), initial_tx
+        return await self.Currencies.get(guild_id, use_cache=False), initial_tx
 
     async def renounce_currency(self, currency_id: int, user_id: int) -> Currency:
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency not found.")
 
@@ -625,7 +1121,7 @@ class RapidWire:
         return await self.Currencies.renounce_minting(currency_id)
 
     async def mint_currency(self, currency_id: int, amount: int, minter_id: int) -> Transfer:
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency not found.")
 
@@ -641,7 +1137,7 @@ class RapidWire:
         return await self.transfer(burner_id, SYSTEM_USER_ID, currency_id, amount)
 
     async def request_delete_currency(self, currency_id: int, user_id: int) -> Currency:
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency not found.")
 
@@ -651,7 +1147,7 @@ class RapidWire:
         return await self.Currencies.request_delete(currency_id)
 
     async def finalize_delete_currency(self, currency_id: int, user_id: int) -> list[Transfer]:
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency not found.")
 
@@ -676,20 +1172,56 @@ class RapidWire:
 
         return await self.delete_currency(currency_id)
 
+    @retry_transaction
     async def delete_currency(self, currency_id: int) -> list[Transfer]:
-        holders = await self.Currencies.get_all_holders(currency_id)
+        if self.ledger is not None and self.ledger.manages(currency_id):
+            return await self._delete_ledger_currency(currency_id)
         transactions = []
+        try:
+            async with self.db as cursor:
+                # Locking the holders keeps their balances from moving until the currency is gone
+                holders = await self.Currencies.get_all_holders(currency_id, for_update=True, cursor=cursor)
+                for holder in holders:
+                    tx = await self.transfer(holder.user_id, SYSTEM_USER_ID, currency_id, holder.amount)
+                    transactions.append(tx)
 
-        for holder in holders:
-            tx = await self.transfer(holder.user_id, SYSTEM_USER_ID, currency_id, holder.amount)
-            transactions.append(tx)
-
-        await self.Currencies.delete(currency_id)
+                await self.Currencies.delete(currency_id)
+        except aiomysql.Error as err:
+            raise TransactionError(f"Database error during currency deletion: {err}")
         return transactions
 
+    async def _delete_ledger_currency(self, currency_id: int) -> list[Transfer]:
+        # Ledger transfers cannot join the deleting transaction, so the holders are emptied
+        # through the ledger first and the currency goes once a locked read finds none left
+        transactions = []
+        try:
+            while True:
+                async with self.db as cursor:
+                    holders = await self.Currencies.get_all_holders(currency_id, for_update=True, cursor=cursor)
+                    if not holders:
+                        await self.Currencies.delete(currency_id)
+                        return transactions
+                moved = len(transactions)
+                for holder in holders:
+                    # The owning process reads the in-memory balance, which may be ahead of the table
+                    balance = await self.get_user(holder.user_id).get_balance(currency_id)
+                    if balance.amount <= 0:
+                        continue
+                    try:
+                        transactions.append(await self.transfer(holder.user_id, SYSTEM_USER_ID, currency_id, balance.amount))
+                    except InsufficientFunds:
+                        # Spent by a transfer that was still being saved; the next pass takes the rest
+                        pass
+                if len(transactions) == moved:
+                    # Only transfers still being saved are left; give them time to commit
+                    await asyncio.sleep(0.05)
+        except aiomysql.Error as err:
+            raise TransactionError(f"Database error during currency deletion: {err}")
+
     async def cancel_delete_request(self, currency_id: int):
         await self.Currencies.cancel_delete_request(currency_id)
 
+    @retry_transaction
     async def pay_claim(self, claim_id: int, payer_id: int) -> Transfer:
         try:
             async with self.db as cursor:
@@ -724,11 +1256,12 @@ class RapidWire:
 
         return await self.Claims.update_status(claim_id, 'canceled')
 
+    @retry_transaction
     async def stake_deposit(self, user_id: int, currency_id: int, amount: int) -> Stake:
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
 
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency for staking not found.")
 
@@ -753,6 +1286,7 @@ class RapidWire:
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during stake deposit: {err}")
 
+    @retry_transaction
     async def stake_withdraw(self, user_id: int, currency_id: int, amount: int) -> Transfer:
         if amount <= 0:
             raise ValueError("Withdrawal amount must be positive.")
@@ -780,7 +1314,7 @@ class RapidWire:
             raise TransactionError(f"Database error during stake withdrawal: {err}")
 
     async def request_interest_rate_change(self, currency_id: int, new_rate: int, user_id: int) -> Currency:
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency not found.")
         if currency.issuer_id != user_id:
@@ -791,7 +1325,7 @@ class RapidWire:
         return await self.Currencies.request_rate_change(currency_id, new_rate)
 
     async def apply_interest_rate_change(self, currency_id: int, user_id: int) -> Currency:
-        currency = await self.Currencies.get(currency_id)
+        currency = await self.Currencies.get(currency_id, use_cache=False)
         if not currency:
             raise CurrencyNotFound("Currency not found.")
 
@@ -818,6 +1352,7 @@ class RapidWire:
             max_cost = self.Config.Contract.max_cost
         cost = self._calculate_contract_cost(script)
         script_hash = hashlib.sha256(script.encode('utf-8')).digest()
+        analysis = self.analyze_contract(script)
 
         current_contract = await self.Contracts.get(user_id)
         current_time = int(time())
@@ -868,7 +1403,7 @@ class RapidWire:
         try:
             async with self.db as cursor:
                 execution_id = await self.Executions.create(cursor, user_id, 0, 'update_contract', 'pending')
-                contract = await self.Contracts.set(user_id, script, cost, max_cost, new_locked_until)
+                contract = await self.Contracts.set(user_id, script, cost, max_cost, new_locked_until, analysis.min_cost, analysis.max_cost)
                 await self.ContractHistories.create(cursor, execution_id, user_id, script_hash, cost)
                 await self.Executions.update(cursor, execution_id, None, 0, 'success')
         except aiomysql.Error as err:
@@ -876,6 +1411,7 @@ class RapidWire:
         
         return contract
 
+    @retry_transaction
     async def approve(self, owner_id: int, spender_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None):
         try:
             async with self.db as cursor:
@@ -884,6 +1420,7 @@ class RapidWire:
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during approval: {err}")
 
+    @retry_transaction
     async def transfer_from(self, source_id: int, destination_id: int, currency_id: int, amount: int, spender_id: int, execution_id: Optional[int] = None) -> Transfer:
         try:
             async with self.db as cursor:
@@ -896,6 +1433,7 @@ class RapidWire:
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during transfer_from: {err}")
 
+    @retry_transaction
     async def create_liquidity_pool(self, currency_a_id: int, currency_b_id: int, amount_a: int, amount_b: int, user_id: int) -> LiquidityPool:
         if amount_a <= 0 or amount_b <= 0:
             raise ValueError("Amounts must be positive.")
@@ -918,6 +1456,8 @@ class RapidWire:
 
                 await user._update_balance(cursor, currency_a_id, -amount_a)
                 await user._update_balance(cursor, currency_b_id, -amount_b)
+                await self.Transfers.create(cursor, user_id, SYSTEM_USER_ID, currency_a_id, amount_a)
+                await self.Transfers.create(cursor, user_id, SYSTEM_USER_ID, currency_b_id, amount_b)
 
                 initial_shares = int((Decimal(amount_a) * Decimal(amount_b)).sqrt())
                 pool = await self.LiquidityPools.create(currency_a_id, currency_b_id, amount_a, amount_b, initial_shares)
@@ -926,6 +1466,7 @@ class RapidWire:
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during liquidity pool creation: {err}")
 
+    @retry_transaction
     async def add_liquidity(self, currency_a_id: int, currency_b_id: int, amount_a_desired: int, amount_b_desired: int, user_id: int) -> int:
         pool = await self.LiquidityPools.get_by_currency_pair(currency_a_id, currency_b_id)
         if not pool:
@@ -979,6 +1520,7 @@ class RapidWire:
         except aiomysql.Error as err:
             raise TransactionError(f"Database error while adding liquidity: {err}")
 
+    @retry_transaction
     async def remove_liquidity(self, currency_a_id: int, currency_b_id: int, shares: int, user_id: int) -> tuple[int, int]:
         pool = await self.LiquidityPools.get_by_currency_pair(currency_a_id, currency_b_id)
         if not pool:
@@ -1018,23 +1560,127 @@ class RapidWire:
     async def search_transfers(self, **kwargs) -> list[Transfer]:
         return await self.Transfers.search(**kwargs)
 
-    async def find_swap_route(self, from_currency_id: int, to_currency_id: int) -> list[LiquidityPool]:
-        all_pools = await self.LiquidityPools.get_all()
-
-        # Quick check for a direct pool
-        direct_pool = await self.LiquidityPools.get_by_currency_pair(from_currency_id, to_currency_id)
-        if direct_pool:
-            return [direct_pool]
-
+    @staticmethod
+    def _build_pool_graph(pools: list[LiquidityPool]) -> dict[int, list[tuple[int, LiquidityPool]]]:
         # Graph representation: currency_id -> list of (neighbor_currency_id, pool)
         graph: dict[int, list[tuple[int, LiquidityPool]]] = {}
-        for pool in all_pools:
+        for pool in pools:
             if pool.currency_a_id not in graph:
                 graph[pool.currency_a_id] = []
             if pool.currency_b_id not in graph:
                 graph[pool.currency_b_id] = []
             graph[pool.currency_a_id].append((pool.currency_b_id, pool))
             graph[pool.currency_b_id].append((pool.currency_a_id, pool))
+        return graph
+
+    def get_reference_prices(self, pools: list[LiquidityPool], reference_currency_id: int) -> dict[int, Decimal]:
+        # One BFS from the reference currency prices every reachable currency at
+        # the spot rate along its shortest route, so valuing N positions costs one pass.
+        graph = self._build_pool_graph([p for p in pools if p.reserve_a > 0 and p.reserve_b > 0])
+        prices = {reference_currency_id: Decimal(1)}
+        queue = [reference_currency_id]
+
+        while queue:
+            current_currency_id = queue.pop(0)
+            for neighbor_currency_id, pool in graph.get(current_currency_id, []):
+                if neighbor_currency_id in prices:
+                    continue
+                if current_currency_id == pool.currency_a_id:
+                    rate = Decimal(pool.reserve_a) / Decimal(pool.reserve_b)
+                else:
+                    rate = Decimal(pool.reserve_b) / Decimal(pool.reserve_a)
+                prices[neighbor_currency_id] = prices[current_currency_id] * rate
+                queue.append(neighbor_currency_id)
+
+        return prices
+
+    async def get_portfolio(self, user_id: int, reference_currency_id: Optional[int] = None) -> Portfolio:
+        if reference_currency_id is None:
+            reference_currency_id = self.Config.Gas.currency_id
+
+        balances = await self.get_user(user_id).get_all_balances()
+        stakes = await self.Stakes.get_for_user(user_id)
+        providers = await self.LiquidityProviders.get_for_user(user_id)
+        pools = await self.LiquidityPools.get_all()
+        pools_by_id = {pool.pool_id: pool for pool in pools}
+        prices = self.get_reference_prices(pools, reference_currency_id)
+
+        entries: list[PortfolioEntry] = []
+        for bal in balances:
+            if bal.amount > 0:
+                entries.append(PortfolioEntry(kind='balance', currency_id=bal.currency_id, amount=bal.amount))
+        for stake in stakes:
+            if stake.amount > 0:
+                entries.append(PortfolioEntry(kind='stake', currency_id=stake.currency_id, amount=stake.amount))
+        for provider in providers:
+            pool = pools_by_id.get(provider.pool_id)
+            if not pool or pool.total_shares <= 0 or provider.shares <= 0:
+                continue
+            for currency_id, reserve in ((pool.currency_a_id, pool.reserve_a), (pool.currency_b_id, pool.reserve_b)):
+                entries.append(PortfolioEntry(
+                    kind='liquidity',
+                    currency_id=currency_id,
+                    amount=provider.shares * reserve // pool.total_shares,
+                    pool_id=pool.pool_id,
+                    shares=provider.shares
+                ))
+
+        total_value = 0
+        unpriced: set[int] = set()
+        for entry in entries:
+            price = prices.get(entry.currency_id)
+            if price is None:
+                unpriced.add(entry.currency_id)
+                continue
+            entry.value = int(Decimal(entry.amount) * price)
+            total_value += entry.value
+
+        currency_ids = sorted({entry.currency_id for entry in entries} | {reference_currency_id})
+        currencies = await self.Currencies.get_many(currency_ids)
+
+        return Portfolio(
+            user_id=user_id,
+            reference_currency_id=reference_currency_id,
+            total_value=total_value,
+            unpriced_currency_ids=sorted(unpriced),
+            entries=entries,
+            currencies=currencies
+        )
+
+    async def get_balance_at(self, user_id: int, currency_id: int, timestamp: int) -> HistoricalBalance:
+        amount, snapshot_id = await self.BalanceSnapshots.balance_at(user_id, currency_id, timestamp)
+        return HistoricalBalance(user_id=user_id, currency_id=currency_id, amount=amount, timestamp=timestamp, snapshot_id=snapshot_id)
+
+    async def get_supply_at(self, currency_id: int, timestamp: int) -> HistoricalSupply:
+        circulating, snapshot_id = await self.BalanceSnapshots.circulating_at(currency_id, timestamp)
+        return HistoricalSupply(currency_id=currency_id, circulating=circulating, timestamp=timestamp, snapshot_id=snapshot_id)
+
+    async def take_balance_snapshot(self, force: bool = False) -> list[BalanceSnapshot]:
+        """Snapshots every balance unless the latest snapshot is newer than Snapshot.interval."""
+        interval = getattr(getattr(self.Config, 'Snapshot', Config.Snapshot), 'interval', Config.Snapshot.interval)
+        if not force:
+            if interval <= 0:
+                return []
+            latest = await self.BalanceSnapshots.latest_timestamp()
+            if latest is not None and int(time()) - latest < interval:
+                return []
+        return await self.BalanceSnapshots.take()
+
+    async def compact_supply_shards(self) -> int:
+        return await self.Currencies.compact_supply()
+
+    async def reconcile_supply(self) -> list[SupplyDiscrepancy]:
+        return await self.Currencies.reconcile_supply()
+
+    async def find_swap_route(self, from_currency_id: int, to_currency_id: int) -> list[LiquidityPool]:
+        all_pools = await self.LiquidityPools.get_all()
+
+        # Quick check for a direct pool
+        direct_pool = await self.LiquidityPools.get_by_currency_pair(from_currency_id, to_currency_id)
+        if direct_pool:
+            return [direct_pool]
+
+        graph = self._build_pool_graph(all_pools)
 
         # BFS to find the shortest path
         queue = [(from_currency_id, [])]
@@ -1077,6 +1723,7 @@ class RapidWire:
 
         return current_amount
 
+    @retry_transaction
     async def swap(self, from_currency_id: int, to_currency_id: int, amount: int, user_id: int, execution_id: Optional[int] = None) -> tuple[int, int]:
         # Initial route finding (optimistic)
         initial_route = await self.find_swap_route(from_currency_id, to_currency_id)
@@ -1096,6 +1743,8 @@ class RapidWire:
 
                 # Reconstruct the route with locked objects in the original order for calculation
                 locked_route = [locked_pools_map[p.pool_id] for p in initial_route]
+                if any(p.reserve_a <= 0 or p.reserve_b <= 0 for p in locked_route):
+                    raise ValueError("The liquidity pool has no liquidity.")
 
                 # Recalculate amount_out with locked values
                 amount_out = self.get_swap_rate(amount, locked_route, from_currency_id)
@@ -1109,6 +1758,8 @@ class RapidWire:
                     raise InsufficientFunds("Insufficient funds for swap.")
                 await user._update_balance(cursor, current_currency_id, -amount)
 
+                swap_timestamp = int(time())
+
                 for i, pool in enumerate(locked_route):
                     if current_currency_id == pool.currency_a_id:
                         next_currency_id = pool.currency_b_id
@@ -1120,6 +1771,7 @@ class RapidWire:
                         reserve_b_change = amount_in
 
                     await self.LiquidityPools.update_reserves(cursor, pool.pool_id, reserve_a_change, reserve_b_change, 0)
+                    await self.PoolCandles.record_trade(cursor, pool.pool_id, abs(reserve_a_change), abs(reserve_b_change), swap_timestamp)
 
                     amount_in = abs(reserve_a_change) if current_currency_id == pool.currency_b_id else abs(reserve_b_change)
                     current_currency_id = next_currency_id
@@ -1128,15 +1780,179 @@ class RapidWire:
 
                 await self.Transfers.create(cursor, user_id, SYSTEM_USER_ID, from_currency_id, amount, execution_id=execution_id)
                 await self.Transfers.create(cursor, SYSTEM_USER_ID, user_id, current_currency_id, amount_out, execution_id=execution_id)
+                self.db.on_commit(lambda: SWAPS.inc(mode='direct'))
             return amount_out, current_currency_id
         except aiomysql.Error as err:
             raise TransactionError(f"Database error during swap: {err}")
 
+    @retry_transaction
+    async def _settle_swap_batch(self, pool_id: int, orders: list[SwapOrder]):
+        # Outcomes are handed to the orders only after the commit, so a retried attempt starts clean
+        rejected: list[tuple[SwapOrder, Exception]] = []
+        fills: list[tuple[SwapOrder, int, int]] = []
+        try:
+            async with self.db as cursor:
+                pool = await self.LiquidityPools.get(pool_id, for_update=True)
+                if not pool:
+                    raise TransactionError("Liquidity pool changed or disappeared during swap.")
+
+                # Deadlock prevention: Lock balances in a consistent order
+                for user_id, currency_id in sorted({(o.user_id, o.currency_in_id) for o in orders}):
+                    await self.get_user(user_id).get_balance(currency_id, for_update=True, cursor=cursor)
+
+                accepted: list[SwapOrder] = []
+                committed: dict[tuple[int, int], int] = {}
+                for order in orders:
+                    if pool.reserve_a <= 0 or pool.reserve_b <= 0:
+                        rejected.append((order, ValueError("The liquidity pool has no liquidity.")))
+                        continue
+                    key = (order.user_id, order.currency_in_id)
+                    balance = await self.get_user(order.user_id).get_balance(order.currency_in_id, cursor=cursor)
+                    if balance.amount - committed.get(key, 0) < order.amount_in:
+                        rejected.append((order, InsufficientFunds("Insufficient funds for swap.")))
+                        continue
+                    committed[key] = committed.get(key, 0) + order.amount_in
+                    accepted.append(order)
+
+                # Orders too small to receive anything at the clearing price are rejected, not filled with 0
+                while accepted:
+                    total_a_in = sum(o.amount_in for o in accepted if o.currency_in_id == pool.currency_a_id)
+                    total_b_in = sum(o.amount_in for o in accepted if o.currency_in_id == pool.currency_b_id)
+                    price, _, _ = clear_swap_batch(pool.reserve_a, pool.reserve_b, total_a_in, total_b_in, self.Config.Swap.fee)
+                    empty = [o for o in accepted if fill_amount(o.amount_in, price, o.currency_in_id == pool.currency_a_id) <= 0]
+                    if not empty:
+                        break
+                    rejected.extend((order, ValueError("Swap amount is too small to receive any output.")) for order in empty)
+                    accepted = [o for o in accepted if o not in empty]
+
+                total_a_out = total_b_out = 0
+                for order in accepted:
+                    sells_a = order.currency_in_id == pool.currency_a_id
+                    amount_out = fill_amount(order.amount_in, price, sells_a)
+                    currency_out_id = pool.currency_b_id if sells_a else pool.currency_a_id
+                    if sells_a:
+                        total_b_out += amount_out
+                    else:
+                        total_a_out += amount_out
+
+                    user = self.get_user(order.user_id)
+                    await user._update_balance(cursor, order.currency_in_id, -order.amount_in)
+                    await user._update_balance(cursor, currency_out_id, amount_out)
+                    await self.Transfers.create(cursor, order.user_id, SYSTEM_USER_ID, order.currency_in_id, order.amount_in, execution_id=order.execution_id)
+                    await self.Transfers.create(cursor, SYSTEM_USER_ID, order.user_id, currency_out_id, amount_out, execution_id=order.execution_id)
+                    fills.append((order, amount_out, currency_out_id))
+
+                if fills:
+                    # Rounding dust from the uniform price stays in the pool
+                    await self.LiquidityPools.update_reserves(cursor, pool.pool_id, total_a_in - total_a_out, total_b_in - total_b_out, 0)
+                    await self.PoolCandles.record_trade(cursor, pool.pool_id, total_a_in + total_a_out, total_b_in + total_b_out, int(time()))
+        except aiomysql.Error as err:
+            raise TransactionError(f"Database error during batched swap: {err}")
+
+        for order, error in rejected:
+            if not order.future.done():
+                order.future.set_exception(error)
+        if fills:
+            SWAPS.inc(len(fills), mode='batched')
+        for order, amount_out, currency_out_id in fills:
+            if not order.future.done():
+                order.future.set_result((amount_out, currency_out_id))
+
+    async def get_pool_candles(self, pool_id: int, resolution: str, start_timestamp: Optional[int] = None, end_timestamp: Optional[int] = None, limit: int = 500) -> list[PoolCandle]:
+        if resolution not in CANDLE_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution. Choose from: {', '.join(CANDLE_RESOLUTIONS)}")
+        return await self.PoolCandles.get_range(pool_id, CANDLE_RESOLUTIONS[resolution], start_timestamp, end_timestamp, limit)
+
+    async def backfill_pool_candles(self, batch_size: int = 500) -> int:
+        """Rebuilds pool candles from the history of direct swaps into an empty pool_candle table.
+
+        Only swaps before the start of the run are read, and candles that live swaps create
+        meanwhile are merged rather than overwritten, so the bot may keep running.
+        """
+        cutoff = int(time())
+        if await self.PoolCandles.has_rows():
+            raise ValueError("pool_candle already has rows; candles can only be backfilled into an empty table.")
+        pools = {
+            tuple(sorted((pool.currency_a_id, pool.currency_b_id))): pool
+            for pool in await self.LiquidityPools.get_all()
+        }
+        swap_pattern = re.compile(r'^swap from:(\d+) to:(\d+) amt:(\d+)')
+
+        candles: dict[tuple[int, int, int], list[int]] = {}
+        recorded = 0
+        last_execution_id = 0
+        while True:
+            executions = await self.Executions.get_successful_swaps(last_execution_id, batch_size)
+            if not executions:
+                break
+            last_execution_id = executions[-1].execution_id
+
+            transfers_by_execution: dict[int, list[Transfer]] = {}
+            for tx in await self.Transfers.get_for_executions([e.execution_id for e in executions]):
+                transfers_by_execution.setdefault(tx.execution_id, []).append(tx)
+
+            for execution in executions:
+                match = swap_pattern.match(execution.input_data or "")
+                if not match:
+                    continue
+                from_currency_id, to_currency_id = int(match.group(1)), int(match.group(2))
+
+                # Multi-hop swaps only record their endpoints, so only direct pools can be attributed
+                pool = pools.get(tuple(sorted((from_currency_id, to_currency_id))))
+                if not pool:
+                    continue
+
+                tx_in = tx_out = None
+                for tx in transfers_by_execution.get(execution.execution_id, []):
+                    if tx.source_id == execution.caller_id and tx.dest_id == SYSTEM_USER_ID and tx.currency_id == from_currency_id:
+                        tx_in = tx
+                    elif tx.source_id == SYSTEM_USER_ID and tx.dest_id == execution.caller_id and tx.currency_id == to_currency_id:
+                        tx_out = tx
+                if not tx_in or not tx_out or tx_in.timestamp >= cutoff:
+                    continue
+
+                if pool.currency_a_id == from_currency_id:
+                    volume_a, volume_b = tx_in.amount, tx_out.amount
+                else:
+                    volume_a, volume_b = tx_out.amount, tx_in.amount
+                if volume_a <= 0 or volume_b <= 0:
+                    continue
+
+                price = volume_b * PRICE_SCALE // volume_a
+                for resolution in CANDLE_RESOLUTIONS.values():
+                    key = (pool.pool_id, resolution, tx_in.timestamp - tx_in.timestamp % resolution)
+                    candle = candles.get(key)
+                    if candle is None:
+                        candles[key] = [price, price, price, price, volume_a, volume_b, 1]
+                    else:
+                        candle[1], candle[2], candle[3] = max(candle[1], price), min(candle[2], price), price
+                        candle[4] += volume_a
+                        candle[5] += volume_b
+                        candle[6] += 1
+                recorded += 1
+
+        async with self.db as cursor:
+            await self.PoolCandles.merge_history(cursor, candles)
+        return recorded
+
     async def execute_swap(self, user_id: int, from_currency_id: int, to_currency_id: int, amount: int) -> tuple[int, int, int]:
         input_data = f"swap from:{from_currency_id} to:{to_currency_id} amt:{amount}"
         if len(input_data) > 127:
             input_data = input_data[:127]
 
+        # Batched swaps settle in the batch's own transaction, so they keep separate bookkeeping
+        batched = getattr(self.Config.Swap, 'batch_interval', 0) > 0 and amount > 0
+        if not batched and not self.db.in_transaction and self._single_transaction_executions():
+            try:
+                execution_id, (amount_out, currency_id) = await self._execute_in_transaction(
+                    user_id, SYSTEM_USER_ID, input_data,
+                    lambda execution_id: self.swap(from_currency_id, to_currency_id, amount, user_id, execution_id=execution_id)
+                )
+                return execution_id, amount_out, currency_id
+            except Exception as e:
+                await self._record_failed_execution(user_id, SYSTEM_USER_ID, input_data, e)
+                raise e
+
         execution_id = None
         try:
             async with self.db as cursor:
@@ -1145,7 +1961,18 @@ class RapidWire:
             raise TransactionError(f"Database error during execution creation: {err}")
 
         try:
-            amount_out, currency_id = await self.swap(from_currency_id, to_currency_id, amount, user_id, execution_id=execution_id)
+            batch_interval = getattr(self.Config.Swap, 'batch_interval', 0)
+            direct_pool = None
+            if batch_interval > 0 and amount > 0 and not self.db.in_transaction:
+                direct_pool = await self.LiquidityPools.get_by_currency_pair(from_currency_id, to_currency_id)
+
+            if direct_pool:
+                # Opt-in: settle together with other swaps on this pool at a uniform clearing price
+                if self.swap_batcher is None:
+                    self.swap_batcher = SwapBatcher(self._settle_swap_batch, batch_interval)
+                amount_out, currency_id = await self.swap_batcher.submit(direct_pool.pool_id, user_id, from_currency_id, amount, execution_id)
+            else:
+                amount_out, currency_id = await self.swap(from_currency_id, to_currency_id, amount, user_id, execution_id=execution_id)
 
             async with self.db as cursor:
                 await self.Executions.update(cursor, execution_id, None, 0, 'success')
@@ -1153,9 +1980,7 @@ class RapidWire:
             return execution_id, amount_out, currency_id
 
         except Exception as e:
-            error_message = str(e)
-            if len(error_message) > 127:
-                error_message = error_message[:124] + "..."
+            error_message = _truncate_output(str(e))
 
             try:
                 async with self.db as cursor:
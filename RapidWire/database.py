@@ -1,25 +1,175 @@
 import aiomysql
+import sys
+from contextlib import asynccontextmanager
 from contextvars import ContextVar
+from time import monotonic
+from typing import Optional
+
+from .pool_monitor import PoolMonitor
+from .tracing import Tracer, TracingCursor
 
 # Context variables to store per-task state
 _connection = ContextVar("connection", default=None)
 _cursor = ContextVar("cursor", default=None)
 _nesting_level = ContextVar("nesting_level", default=0)
+_on_commit = ContextVar("on_commit", default=None)
+_hold = ContextVar("hold", default=None)
+# Read-only blocks: the open replica (replica, connection, cursor, depth) and
+# one route per entered block so that exits unwind the same way
+_replica = ContextVar("replica", default=None)
+_read_routes = ContextVar("read_routes", default=())
 
-class DatabaseConnection:
+def _call_site() -> str:
+    # The first frame outside this module: the model or core method that opened the block
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    return frame.f_code.co_qualname if frame is not None else "unknown"
+
+class Replica:
     def __init__(self, pool: aiomysql.Pool):
         self.pool = pool
+        self.lag: Optional[float] = None
+        self.checked_at = float("-inf")
+
+class ReadOnlyConnection:
+    """``async with db.read as cursor``: like ``async with db``, but may be served by a replica.
+
+    Inside a transaction on the primary the block joins that transaction, so reads
+    never observe a state older than the writes they follow.
+    """
+
+    def __init__(self, db: "DatabaseConnection"):
+        self.db = db
+
+    async def __aenter__(self):
+        current = _replica.get()
+        replica = None
+        if not self.db.in_transaction:
+            replica = current[0] if current else await self.db._choose_replica()
+
+        if replica is None:
+            _read_routes.set(_read_routes.get() + ("primary",))
+            return await self.db.__aenter__()
+
+        if current:
+            _replica.set(current[:3] + (current[3] + 1,))
+        else:
+            try:
+                connection = await replica.pool.acquire()
+            except Exception:
+                # Unreachable replica: stop using it until the next lag check
+                replica.lag = None
+                _read_routes.set(_read_routes.get() + ("primary",))
+                return await self.db.__aenter__()
+            try:
+                cursor = self.db._wrap(await connection.cursor(aiomysql.DictCursor))
+            except Exception:
+                replica.pool.release(connection)
+                raise
+            _replica.set((replica, connection, cursor, 1))
+        _read_routes.set(_read_routes.get() + ("replica",))
+        return _replica.get()[2]
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        routes = _read_routes.get()
+        _read_routes.set(routes[:-1])
+        if routes[-1] == "primary":
+            return await self.db.__aexit__(exc_type, exc_val, exc_tb)
+
+        replica, connection, cursor, depth = _replica.get()
+        if depth > 1:
+            _replica.set((replica, connection, cursor, depth - 1))
+            return
+        _replica.set(None)
+        try:
+            # End the read view so the pooled connection does not keep an old snapshot
+            await connection.rollback()
+        finally:
+            await cursor.close()
+            replica.pool.release(connection)
+
+class DatabaseConnection:
+    def __init__(self, pool: aiomysql.Pool, replicas: Optional[list[aiomysql.Pool]] = None,
+                 max_replica_lag: float = 2, lag_check_interval: float = 1, tracer: Optional[Tracer] = None):
+        self.pool = pool
+        self.tracer = tracer
+        self.replicas = [Replica(replica) for replica in replicas or []]
+        self.max_replica_lag = max_replica_lag
+        self.lag_check_interval = lag_check_interval
+        self.read = ReadOnlyConnection(self)
+        self.monitor = PoolMonitor(pool)
+        self._next_replica = 0
+
+    def _wrap(self, cursor):
+        return TracingCursor(cursor, self.tracer) if self.tracer else cursor
+
+    async def _measure_lag(self, replica: Replica) -> Optional[float]:
+        try:
+            connection = await replica.pool.acquire()
+        except Exception:
+            return None
+        try:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await cursor.execute("SHOW REPLICA STATUS")
+                except aiomysql.ProgrammingError:
+                    # MySQL before 8.0.22
+                    await cursor.execute("SHOW SLAVE STATUS")
+                status = await cursor.fetchone()
+        except Exception:
+            return None
+        finally:
+            replica.pool.release(connection)
+        if not status:
+            return None
+        # NULL while replication is stopped or broken
+        return status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+
+    async def _choose_replica(self) -> Optional[Replica]:
+        # Round-robin over replicas whose last measured lag is acceptable; None means use the primary
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next_replica % len(self.replicas)]
+            self._next_replica += 1
+            if monotonic() - replica.checked_at >= self.lag_check_interval:
+                replica.checked_at = monotonic()
+                replica.lag = await self._measure_lag(replica)
+            if replica.lag is not None and replica.lag <= self.max_replica_lag:
+                return replica
+        return None
+
+    @property
+    def in_transaction(self) -> bool:
+        return _nesting_level.get() > 0
+
+    def on_commit(self, callback):
+        # Runs immediately outside a transaction, otherwise once the outermost block commits
+        callbacks = _on_commit.get()
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
 
     async def __aenter__(self):
         level = _nesting_level.get()
         if level == 0:
-            connection = await self.pool.acquire()
+            site = _call_site()
+            started = self.monitor.acquiring(site)
             try:
-                cursor = await connection.cursor(aiomysql.DictCursor)
+                connection = await self.pool.acquire()
+            except BaseException:
+                self.monitor.acquire_failed()
+                raise
+            hold = self.monitor.acquired(site, started)
+            try:
+                cursor = self._wrap(await connection.cursor(aiomysql.DictCursor))
                 _connection.set(connection)
                 _cursor.set(cursor)
+                _on_commit.set([])
+                _hold.set(hold)
             except Exception:
                 self.pool.release(connection)
+                self.monitor.released(hold, self.monitor.releasing())
                 raise
 
         _nesting_level.set(level + 1)
@@ -32,11 +182,16 @@ class DatabaseConnection:
         if level - 1 == 0:
             connection = _connection.get()
             cursor = _cursor.get()
+            callbacks = _on_commit.get() or []
+            _on_commit.set(None)
+            release_started = self.monitor.releasing()
             try:
                 if exc_type:
                     await connection.rollback()
                 else:
                     await connection.commit()
+                    for callback in callbacks:
+                        callback()
             finally:
                 if cursor:
                     await cursor.close()
@@ -44,5 +199,25 @@ class DatabaseConnection:
                 if connection:
                     self.pool.release(connection)
                     _connection.set(None)
+                self.monitor.released(_hold.get(), release_started)
+                _hold.set(None)
         elif level - 1 < 0:
             _nesting_level.set(0)
+
+    @asynccontextmanager
+    async def savepoint(self, name: str = "sp"):
+        # Partial rollback inside the open transaction; on_commit callbacks registered
+        # by the rolled-back part are dropped with it
+        cursor = _cursor.get()
+        if _nesting_level.get() == 0 or cursor is None:
+            raise RuntimeError("savepoint() requires an open transaction")
+        callbacks = _on_commit.get()
+        mark = len(callbacks)
+        await cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield cursor
+        except BaseException:
+            await cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            del callbacks[mark:]
+            raise
+        await cursor.execute(f"RELEASE SAVEPOINT {name}")
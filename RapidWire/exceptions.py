@@ -18,6 +18,10 @@ class TransactionError(RapidWireError):
     """Raised for general transaction failures."""
     pass
 
+class TransactionConflict(TransactionError):
+    """Raised when a transaction kept losing deadlocks or lock waits after all retries."""
+    pass
+
 class ContractError(RapidWireError):
     """Raised for general contract failures."""
     def __init__(self, message: str, instruction: int = None, op: str = None):
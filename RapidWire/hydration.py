@@ -0,0 +1,104 @@
+from decimal import Decimal
+from types import UnionType
+from typing import Iterable, TypeVar, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+class _Plan:
+    __slots__ = ("names", "renames", "int_fields", "bool_fields", "defaults", "needs_fixup", "name_set")
+
+    def __init__(self, cls: type[BaseModel]):
+        self.names = tuple(cls.model_fields)
+        self.name_set = frozenset(self.names)
+        self.renames = []
+        self.int_fields = []
+        self.bool_fields = []
+        self.defaults = []
+        for name, field in cls.model_fields.items():
+            if field.alias and field.alias != name:
+                self.renames.append((field.alias, name))
+            annotation = field.annotation
+            if get_origin(annotation) in (Union, UnionType):
+                members = [arg for arg in get_args(annotation) if arg is not type(None)]
+                annotation = members[0] if len(members) == 1 else None
+            if annotation is int:
+                self.int_fields.append(name)
+            elif annotation is bool:
+                self.bool_fields.append(name)
+            if field.default is not PydanticUndefined:
+                self.defaults.append((name, field.default))
+        self.needs_fixup = bool(self.renames or self.bool_fields)
+
+_plans: dict[type, _Plan] = {}
+
+def _plan(cls: type[BaseModel]) -> _Plan:
+    plan = _plans.get(cls)
+    if plan is None:
+        plan = _plans[cls] = _Plan(cls)
+    return plan
+
+def _build(cls: type[ModelT], plan: _Plan, row: dict, decimal_fields: list[str]) -> ModelT:
+    values = dict(row)
+    for name in decimal_fields:
+        values[name] = int(values[name])
+    fields_set = None
+    if plan.needs_fixup or values.keys() != plan.name_set:
+        for column, name in plan.renames:
+            if column in values:
+                values[name] = values.pop(column)
+        for name in plan.bool_fields:
+            if values.get(name) is not None:
+                values[name] = bool(values[name])
+        fields_set = plan.name_set & values.keys()
+        for name, default in plan.defaults:
+            values.setdefault(name, default)
+        # Keep field order for serialization and drop extra columns from joins
+        values = {name: values[name] for name in plan.names if name in values}
+
+    model = cls.__new__(cls)
+    object.__setattr__(model, "__dict__", values)
+    object.__setattr__(model, "__pydantic_fields_set__", set(values) if fields_set is None else set(fields_set))
+    object.__setattr__(model, "__pydantic_extra__", None)
+    object.__setattr__(model, "__pydantic_private__", None)
+    return model
+
+def _decimal_fields(plan: _Plan, row: dict) -> list[str]:
+    # DECIMAL columns are NOT NULL in our schema, so one row tells us which ones they are
+    return [name for name in plan.int_fields if type(row.get(name)) is Decimal]
+
+def hydrate(cls: type[ModelT], row: dict) -> ModelT:
+    """Builds a model from a row of our own schema without running validation.
+
+    DECIMAL columns arrive as Decimal and TINYINT flags as int; those are the only
+    conversions applied, everything else is trusted as stored. Validation still
+    happens for anything parsed from user input and at the API response boundary.
+    """
+    plan = _plan(cls)
+    return _build(cls, plan, row, _decimal_fields(plan, row))
+
+def hydrate_all(cls: type[ModelT], rows: Iterable[dict]) -> list[ModelT]:
+    rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+    if not rows:
+        return []
+    plan = _plan(cls)
+    decimal_fields = _decimal_fields(plan, rows[0])
+    if plan.needs_fixup or rows[0].keys() != plan.name_set:
+        return [_build(cls, plan, row, decimal_fields) for row in rows]
+
+    # Plain SELECT * rows: copy, convert DECIMALs and attach, with nothing else per row
+    new, setattr_ = cls.__new__, object.__setattr__
+    models = []
+    for row in rows:
+        values = dict(row)
+        for name in decimal_fields:
+            values[name] = int(values[name])
+        model = new(cls)
+        setattr_(model, "__dict__", values)
+        setattr_(model, "__pydantic_fields_set__", set(values))
+        setattr_(model, "__pydantic_extra__", None)
+        setattr_(model, "__pydantic_private__", None)
+        models.append(model)
+    return models
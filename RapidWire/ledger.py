@@ -0,0 +1,541 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import re
+import secrets
+import zlib
+from array import array
+from time import time
+from typing import Iterable, Optional
+
+import aiomysql
+
+from .constants import SYSTEM_USER_ID
+from .database import DatabaseConnection
+from .exceptions import InsufficientFunds, TransactionError
+from .models import SUPPLY_COLUMN
+from .structs import Balance, Transfer
+
+# Balances live in signed 64-bit slots; supply bounds every balance, so it is the only value checked
+INT64_MAX = 2**63 - 1
+LEASE_NAME = "rapidwire_ledger"
+
+# A WAL record: [seq, source_id, dest_id, currency_id, amount, timestamp, execution_id]; the transfer
+# id is assigned when it is saved. Records written before execution ids were logged have six fields.
+Record = list
+
+class Book:
+    """Balances of one currency: user ids map to slots of a compact int64 array."""
+    __slots__ = ("slots", "amounts", "supply")
+
+    def __init__(self, supply: int = 0):
+        self.slots: dict[int, int] = {}
+        self.amounts = array("q")
+        self.supply = supply
+
+    def get(self, user_id: int) -> int:
+        slot = self.slots.get(user_id)
+        return 0 if slot is None else self.amounts[slot]
+
+    def add(self, user_id: int, delta: int):
+        slot = self.slots.get(user_id)
+        if slot is None:
+            slot = self.slots[user_id] = len(self.amounts)
+            self.amounts.append(0)
+        self.amounts[slot] += delta
+
+def _execution_id(record: Record) -> Optional[int]:
+    return record[6] if len(record) > 6 else None
+
+def _frame(record: Record) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+class WriteAheadLog:
+    """Append-only log in numbered segments, one CRC-framed JSON record per line.
+
+    Segments are sealed by rotate() and deleted once a checkpoint covering them has
+    committed, so the log only ever holds records MySQL may not have yet.
+    """
+
+    _SEGMENT = re.compile(r"wal-(\d+)\.log")
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segments = sorted(int(m.group(1)) for m in map(self._SEGMENT.fullmatch, os.listdir(path)) if m)
+        self.current = (self.segments[-1] if self.segments else 0) + 1
+        self.file = None
+
+    def _name(self, number: int) -> str:
+        return os.path.join(self.path, f"wal-{number:08d}.log")
+
+    def read(self) -> list[Record]:
+        records = []
+        for index, number in enumerate(self.segments):
+            with open(self._name(number), "rb") as f:
+                lines = f.read().split(b"\n")
+            # The text after the last newline is a write the crash interrupted
+            for position, line in enumerate(lines[:-1]):
+                crc, _, payload = line.partition(b" ")
+                if len(crc) != 8 or int(crc, 16) != zlib.crc32(payload):
+                    if index == len(self.segments) - 1 and position == len(lines) - 2:
+                        break
+                    raise ValueError(f"Corrupt ledger WAL record in {self._name(number)} at line {position + 1}")
+                records.append(json.loads(payload))
+        return records
+
+    def open(self):
+        self.file = open(self._name(self.current), "ab")
+        self._sync_directory()
+
+    def _sync_directory(self):
+        # Make the new segment's directory entry durable before anything depends on it
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def append(self, records: list[Record]):
+        self.file.write(b"".join(_frame(record) for record in records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def rotate(self) -> int:
+        sealed = self.current
+        self.file.close()
+        self.current += 1
+        self.open()
+        return sealed
+
+    def remove(self, numbers: Iterable[int]):
+        for number in numbers:
+            try:
+                os.remove(self._name(number))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class LedgerStore:
+    """The MySQL side of the ledger: lease, owner address, initial load and checkpoints."""
+
+    def __init__(self, db: DatabaseConnection, transfers, lease_pool=None):
+        self.db = db
+        self.transfers = transfers
+        self.lease_pool = lease_pool or db.pool
+        self.lease: Optional[aiomysql.Connection] = None
+
+    async def acquire_lease(self) -> bool:
+        # A named lock on a dedicated connection: only one process may own the ledger currencies
+        connection = await self.lease_pool.acquire()
+        try:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (LEASE_NAME,))
+                acquired = (await cursor.fetchone())["acquired"] == 1
+        except Exception:
+            self.lease_pool.release(connection)
+            raise
+        if not acquired:
+            self.lease_pool.release(connection)
+            return False
+        self.lease = connection
+        return True
+
+    async def lease_alive(self) -> bool:
+        try:
+            async with self.lease.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID() AS held", (LEASE_NAME,))
+                return (await cursor.fetchone())["held"] == 1
+        except aiomysql.Error:
+            return False
+
+    async def release_lease(self):
+        if self.lease is None:
+            return
+        try:
+            async with self.lease.cursor() as cursor:
+                await cursor.execute("SELECT RELEASE_LOCK(%s)", (LEASE_NAME,))
+        finally:
+            self.lease_pool.release(self.lease)
+            self.lease = None
+
+    async def load(self, currency_ids: list[int]) -> tuple[dict[int, int], list[tuple[int, int, int]]]:
+        placeholders = ", ".join(["%s"] * len(currency_ids))
+        async with self.db as cursor:
+            await cursor.execute(
+                f"SELECT c.currency_id, {SUPPLY_COLUMN} AS supply FROM currency c WHERE c.currency_id IN ({placeholders})",
+                tuple(currency_ids)
+            )
+            supplies = {row["currency_id"]: int(row["supply"]) for row in await cursor.fetchall()}
+            await cursor.execute(f"SELECT user_id, currency_id, amount FROM balance WHERE currency_id IN ({placeholders})", tuple(currency_ids))
+            balances = [(row["user_id"], row["currency_id"], int(row["amount"])) for row in await cursor.fetchall()]
+        return supplies, balances
+
+    async def saved_seq(self) -> int:
+        async with self.db as cursor:
+            await cursor.execute("SELECT ledger_seq FROM transfer_sequence WHERE id = 1")
+            return (await cursor.fetchone())["ledger_seq"]
+
+    async def publish(self, host: str, port: int, token: str):
+        async with self.db as cursor:
+            await cursor.execute(
+                "INSERT INTO ledger_owner (id, host, port, token) VALUES (1, %s, %s, %s) ON DUPLICATE KEY UPDATE host = VALUES(host), port = VALUES(port), token = VALUES(token)",
+                (host, port, token)
+            )
+
+    async def owner(self) -> Optional[tuple[str, int, str]]:
+        async with self.db as cursor:
+            await cursor.execute("SELECT host, port, token FROM ledger_owner WHERE id = 1")
+            row = await cursor.fetchone()
+        return (row["host"], row["port"], row["token"]) if row else None
+
+    async def save(self, records: list[Record]) -> int:
+        """Writes the records in one transaction and returns the transfer id of the first.
+
+        Ids are taken under the transfer_sequence lock like any other transfer, so they
+        follow commit order. The last sequence number commits with the rows, which is
+        what lets recovery skip every record MySQL already has.
+        """
+        balances: dict[tuple[int, int], int] = {}
+        supplies: dict[int, int] = {}
+        for _, source_id, dest_id, currency_id, amount, *_ in records:
+            for user_id, delta in ((source_id, -amount), (dest_id, amount)):
+                if user_id == SYSTEM_USER_ID:
+                    supplies[currency_id] = supplies.get(currency_id, 0) - delta
+                else:
+                    balances[(user_id, currency_id)] = balances.get((user_id, currency_id), 0) + delta
+
+        async with self.db as cursor:
+            await cursor.execute("SELECT id FROM transfer_sequence WHERE id = 1 FOR UPDATE")
+            await cursor.fetchone()
+            await cursor.execute("SELECT COALESCE(MAX(transfer_id), 0) + 1 AS next_id FROM transfer")
+            first_id = (await cursor.fetchone())["next_id"]
+            await cursor.executemany(
+                "INSERT INTO transfer (transfer_id, execution_id, source_id, dest_id, currency_id, amount, timestamp) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [(first_id + offset, _execution_id(record), *record[1:6]) for offset, record in enumerate(records)]
+            )
+            await cursor.execute("UPDATE transfer_sequence SET ledger_seq = %s WHERE id = 1", (records[-1][0],))
+            changed = sorted(key for key, delta in balances.items() if delta)
+            if changed:
+                await cursor.executemany(
+                    "INSERT INTO balance (user_id, currency_id, amount) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE amount = amount + %s",
+                    [(user_id, currency_id, max(0, balances[(user_id, currency_id)]), balances[(user_id, currency_id)]) for user_id, currency_id in changed]
+                )
+                await cursor.executemany(
+                    "DELETE FROM balance WHERE user_id = %s AND currency_id = %s AND amount = 0",
+                    changed
+                )
+            # Cached currencies are not invalidated: the cache holds metadata only and supply is always read live
+            for currency_id, delta in sorted(supplies.items()):
+                if delta:
+                    await cursor.execute("UPDATE currency SET supply = supply + %s WHERE currency_id = %s", (delta, currency_id))
+            for _, source_id, dest_id, currency_id, amount, timestamp, *_ in records:
+                await self.transfers._record_user_stats(cursor, source_id, dest_id, currency_id, amount, timestamp)
+        return first_id
+
+class LedgerEngine:
+    """Authoritative in-memory balances for selected currencies.
+
+    Transfers are checked and applied in memory without awaiting and appended to the
+    write-ahead log; concurrent transfers share one fsync. Once durable they are
+    saved to the transfer and balance tables in one transaction, again shared by
+    everything that arrived meanwhile, and the transfer is acknowledged with the id
+    that transaction assigned. Ids therefore commit in order with every other
+    transfer. On startup the saved tables are loaded and the log records MySQL does
+    not have yet are replayed on top.
+
+    Only one process owns the ledger. The others forward plain transfers to it over
+    the address it publishes in ledger_owner, and read balances from the tables.
+    Every operation other than a plain transfer is refused for ledger currencies.
+
+    Transfers are acknowledged only once saved, not when they reach the log, because
+    the id they are acknowledged with must be the one MySQL stores, in commit order,
+    and the other processes read balances from the tables. Throughput comes from
+    sharing: every transfer that arrives while a save runs is checked in memory
+    without locking a row and goes out in the next fsync and transaction together.
+    """
+
+    def __init__(self, store: LedgerStore, currency_ids: Iterable[int], path: str, checkpoint_interval: float = 1, rpc_host: str = "127.0.0.1", rpc_port: int = 0):
+        self.store = store
+        self.currency_ids = frozenset(currency_ids)
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.rpc_host = rpc_host
+        self.rpc_port = rpc_port
+        self.owner = False
+        self.failed: Optional[Exception] = None
+        self.books: dict[int, Book] = {}
+        self.wal: Optional[WriteAheadLog] = None
+        self._buffer: list[tuple[Record, asyncio.Future]] = []
+        self._unsaved: list[tuple[Record, Optional[asyncio.Future]]] = []
+        self._sealed: list[int] = []
+        self._dirty = False
+        self._next_seq = 1
+        self._token = ""
+        self._peer: Optional[tuple[str, int, str]] = None
+        self._wal_lock = asyncio.Lock()
+        self._checkpoint_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._saver: Optional[asyncio.Task] = None
+        self._checkpointer: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def manages(self, currency_id: int) -> bool:
+        return currency_id in self.currency_ids
+
+    def serves(self, currency_id: int) -> bool:
+        return self.owner and self.failed is None and currency_id in self.currency_ids
+
+    async def start(self):
+        if not await self.store.acquire_lease():
+            print("Ledger engine is owned by another process; ledger transfers are forwarded to it.")
+            return
+        self.owner = True
+        self.wal = WriteAheadLog(self.path)
+        records = await asyncio.to_thread(self.wal.read)
+        self._sealed = list(self.wal.segments)
+
+        supplies, balances = await self.store.load(sorted(self.currency_ids))
+        for currency_id in self.currency_ids:
+            supply = supplies.get(currency_id, 0)
+            if supply > INT64_MAX:
+                raise ValueError(f"Currency {currency_id} supply exceeds the ledger's 64-bit range.")
+            self.books[currency_id] = Book(supply)
+        for user_id, currency_id, amount in balances:
+            self.books[currency_id].add(user_id, amount)
+
+        saved = await self.store.saved_seq()
+        self._unsaved = [(record, None) for record in records if record[0] > saved]
+        self._next_seq = max([saved] + [record[0] for record in records]) + 1
+        for record, _ in self._unsaved:
+            self._apply(record)
+
+        self.wal.open()
+        await self.checkpoint()
+        self._server = await asyncio.start_server(self._serve_peer, self.rpc_host, self.rpc_port)
+        self._token = secrets.token_hex(32)
+        await self.store.publish(self.rpc_host, self._server.sockets[0].getsockname()[1], self._token)
+        self._checkpointer = contextvars.Context().run(asyncio.create_task, self._run_checkpoints())
+
+    async def close(self):
+        if self._checkpointer:
+            self._checkpointer.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self.owner:
+            await asyncio.gather(*(task for task in (self._flusher, self._saver) if task), return_exceptions=True)
+            try:
+                # After a log failure the durable records can still be saved, but the log cannot rotate
+                await (self.checkpoint() if self.failed is None else self._save())
+            finally:
+                self._fail_unsaved(TransactionError("Ledger engine closed before the transfer was saved; it is saved when the ledger restarts."))
+                self.wal.close()
+                await self.store.release_lease()
+                self.owner = False
+
+    def _book(self, currency_id: int) -> Book:
+        book = self.books.get(currency_id)
+        if book is None:
+            # A ledger currency created after startup
+            book = self.books[currency_id] = Book()
+        return book
+
+    def _apply(self, record: Record):
+        _, source_id, dest_id, currency_id, amount = record[:5]
+        book = self._book(currency_id)
+        if source_id == SYSTEM_USER_ID:
+            book.supply += amount
+        else:
+            book.add(source_id, -amount)
+        if dest_id == SYSTEM_USER_ID:
+            book.supply -= amount
+        else:
+            book.add(dest_id, amount)
+
+    def balance(self, user_id: int, currency_id: int) -> Balance:
+        return Balance(user_id=user_id, currency_id=currency_id, amount=self._book(currency_id).get(user_id))
+
+    async def transfer(self, source_id: int, destination_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None) -> Transfer:
+        # Forwarded requests arrive as JSON, so the checks RapidWire.transfer makes are repeated here
+        if not all(type(value) is int for value in (source_id, destination_id, currency_id, amount)):
+            raise ValueError("Transfer fields must be integers.")
+        if execution_id is not None and type(execution_id) is not int:
+            raise ValueError("Execution id must be an integer.")
+        if source_id == destination_id:
+            raise ValueError("Source and destination cannot be the same.")
+        if amount <= 0:
+            raise ValueError("Transfer amount must be positive.")
+        if not self.manages(currency_id):
+            raise ValueError(f"Currency {currency_id} is not settled by the ledger engine.")
+        if self.store.db.in_transaction:
+            raise TransactionError("Ledger currencies cannot be transferred inside a database transaction.")
+        if not self.owner:
+            return await self._forward(source_id, destination_id, currency_id, amount, execution_id)
+        if self.failed is not None:
+            raise TransactionError(f"Ledger engine stopped: {self.failed}")
+
+        # From here to the append nothing awaits, so concurrent transfers apply in log order
+        book = self._book(currency_id)
+        if source_id != SYSTEM_USER_ID and book.get(source_id) < amount:
+            raise InsufficientFunds("Source user has insufficient funds.")
+        if source_id == SYSTEM_USER_ID and book.supply + amount > INT64_MAX:
+            raise TransactionError("Supply would exceed the ledger's 64-bit range.")
+        if destination_id == SYSTEM_USER_ID and book.supply < amount:
+            raise TransactionError("Supply cannot become negative.")
+
+        record = [self._next_seq, source_id, destination_id, currency_id, amount, int(time()), execution_id]
+        self._next_seq += 1
+        self._apply(record)
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((record, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = contextvars.Context().run(asyncio.create_task, self._flush())
+        transfer_id = await future
+
+        return Transfer(
+            transfer_id=transfer_id, execution_id=execution_id, source_id=source_id, dest_id=destination_id,
+            currency_id=currency_id, amount=amount, timestamp=record[5]
+        )
+
+    async def _forward(self, source_id: int, destination_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None) -> Transfer:
+        if self._peer is None:
+            self._peer = await self.store.owner()
+            if self._peer is None:
+                raise TransactionError(f"Currency {currency_id} is settled by the ledger engine, but no process owns it.")
+        host, port, token = self._peer
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            # The owner may have restarted on another address
+            self._peer = None
+            raise TransactionError(f"Ledger engine owner at {host}:{port} is unreachable: {e}")
+        try:
+            writer.write(json.dumps({"token": token, "transfer": [source_id, destination_id, currency_id, amount, execution_id]}).encode() + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+        if not line:
+            self._peer = None
+            raise TransactionError("Ledger engine owner closed the connection; the transfer may or may not have been applied.")
+        response = json.loads(line)
+        if "error" in response:
+            if response["error"] == "token":
+                self._peer = None
+            if response["error"] == "insufficient_funds":
+                raise InsufficientFunds(response["message"])
+            if response["error"] == "value":
+                raise ValueError(response["message"])
+            raise TransactionError(response["message"])
+        return Transfer(**response["transfer"])
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+            if not hmac.compare_digest(str(request.get("token", "")), self._token):
+                response = {"error": "token", "message": "Ledger engine owner rejected the request token."}
+            else:
+                try:
+                    fields = request.get("transfer")
+                    if not isinstance(fields, list) or len(fields) != 5:
+                        raise ValueError("Malformed ledger transfer request.")
+                    response = {"transfer": (await self.transfer(*fields)).model_dump()}
+                except InsufficientFunds as e:
+                    response = {"error": "insufficient_funds", "message": str(e)}
+                except ValueError as e:
+                    response = {"error": "value", "message": str(e)}
+                except Exception as e:
+                    response = {"error": "transaction", "message": str(e)}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        except (OSError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _flush(self):
+        async with self._wal_lock:
+            while self._buffer:
+                batch, self._buffer = self._buffer, []
+                try:
+                    await asyncio.to_thread(self.wal.append, [record for record, _ in batch])
+                except Exception as e:
+                    # Memory is now ahead of the log: stop serving until a restart recovers from disk
+                    self.failed = e
+                    batch, self._buffer = batch + self._buffer, []
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(TransactionError(f"Ledger write-ahead log failed: {e}"))
+                    return
+                self._dirty = True
+                self._unsaved.extend(batch)
+                if self._saver is None or self._saver.done():
+                    self._saver = contextvars.Context().run(asyncio.create_task, self._save_pending())
+
+    async def _save_pending(self):
+        # Records that became durable while a save was running go out together in the next one
+        while self._unsaved:
+            try:
+                async with self._checkpoint_lock:
+                    await self._save()
+            except Exception as e:
+                # The periodic checkpoint retries; the callers wait for their transfer ids until then
+                print(f"Ledger save failed: {e}")
+                return
+
+    async def _save(self):
+        pending, self._unsaved = self._unsaved, []
+        if not pending:
+            return
+        try:
+            first_id = await self.store.save([record for record, _ in pending])
+        except Exception:
+            self._unsaved = pending + self._unsaved
+            raise
+        for offset, (_, future) in enumerate(pending):
+            if future is not None and not future.done():
+                future.set_result(first_id + offset)
+
+    def _fail_unsaved(self, error: Exception):
+        pending, self._unsaved = self._unsaved, []
+        for _, future in pending:
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    async def checkpoint(self):
+        async with self._checkpoint_lock:
+            async with self._wal_lock:
+                # No append is in flight, so every record in the sealed segments is saved or in _unsaved
+                if not self._dirty and not self._sealed and not self._unsaved:
+                    return
+                sealed = self._sealed + [await asyncio.to_thread(self.wal.rotate)]
+                self._sealed, self._dirty = [], False
+            try:
+                await self._save()
+            except Exception:
+                self._sealed = sealed + self._sealed
+                raise
+            await asyncio.to_thread(self.wal.remove, sealed)
+
+    async def _run_checkpoints(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                if not await self.store.lease_alive():
+                    self.failed = TransactionError("Ledger lease was lost.")
+                    # Without the lease nothing more may be saved; the log keeps these for the next start
+                    self._fail_unsaved(TransactionError("Ledger lease was lost; the transfer is saved when the ledger restarts."))
+                    print("Ledger lease was lost; ledger transfers are stopped until restart.")
+                    return
+                await self.checkpoint()
+            except Exception as e:
+                print(f"Ledger checkpoint failed: {e}")
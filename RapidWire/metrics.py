@@ -0,0 +1,188 @@
+import asyncio
+from bisect import bisect_left
+from typing import Callable
+
+# Upper bounds in seconds, roughly log-spaced from a fast primary-key lookup to a stuck contract
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    """Fixed-bucket histogram; observations above the last bound land in the overflow bucket."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation; the overflow bucket reports the max seen
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        result = []
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            result.append((bound, seen))
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+class HistogramFamily:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series: dict[tuple, Histogram] = {}
+
+    def labels(self, **labels) -> Histogram:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        histogram = self.series.get(key)
+        if histogram is None:
+            histogram = self.series[key] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, histogram in self.series.items():
+            lines.extend(render_histogram(self.name, dict(zip(self.labelnames, key)), histogram))
+        return lines
+
+def render_histogram(name: str, labels: dict, histogram: Histogram) -> list[str]:
+    lines = [
+        f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {count}"
+        for bound, count in histogram.cumulative()
+    ]
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+def render_samples(name: str, kind: str, help: str, samples: list[tuple[dict, float]]) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+    return lines
+
+def render_histograms(name: str, help: str, series: list[tuple[dict, Histogram]]) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for labels, histogram in series:
+        lines.extend(render_histogram(name, labels, histogram))
+    return lines
+
+def render_cache(name: str, caches: dict) -> list[str]:
+    # caches maps a label to any object with hits/misses counters (TTLCache)
+    return (
+        render_samples(f"{name}_hits_total", "counter", "Cache hits", [({"cache": key}, cache.hits) for key, cache in caches.items()])
+        + render_samples(f"{name}_misses_total", "counter", "Cache misses", [({"cache": key}, cache.misses) for key, cache in caches.items()])
+        + render_samples(f"{name}_hit_ratio", "gauge", "Cache hit ratio since start", [({"cache": key}, cache.hit_ratio) for key, cache in caches.items()])
+    )
+
+class Registry:
+    """Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated inline; state that already lives elsewhere
+    (pool, caches) is read at scrape time by named collectors returning text lines.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Counter | HistogramFamily] = {}
+        self.collectors: dict[str, Callable[[], list[str]]] = {}
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> HistogramFamily:
+        return self.metrics.setdefault(name, HistogramFamily(name, help, labelnames, buckets))
+
+    def collector(self, name: str, collect: Callable[[], list[str]]):
+        # Keyed so that re-initializing a component replaces its collector instead of duplicating it
+        self.collectors[name] = collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        for collect in list(self.collectors.values()):
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+async def serve(registry: Registry, host: str, port: int) -> asyncio.AbstractServer:
+    """Minimal HTTP listener answering every request with the registry, for processes without a web server."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: " + CONTENT_TYPE.encode()
+                + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
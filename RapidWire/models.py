@@ -1,25 +1,38 @@
 from typing import Optional, Literal
-from time import time
+from time import time, monotonic
 import aiomysql
+import asyncio
 import secrets
 import string
 import zlib
+import random
 from decimal import Decimal
 
 from .database import DatabaseConnection
+from .cache import TTLCache
+from .archive import TransferArchive
+from .hydration import hydrate_all
+from .search import plan_transfer_search, plan_transfer_export
+from .pagination import TRANSFER_SORT_KEYS
 from .structs import (
     Balance, Currency, Contract, APIKey, Claim, Stake, LiquidityPool,
     LiquidityProvider, ContractVariable, NotificationPermission, Execution,
-    Transfer, ContractHistory, Allowance, AllowanceLog, DiscordPermission
+    Transfer, ContractHistory, Allowance, AllowanceLog, DiscordPermission, PoolCandle,
+    UserCurrencyStats, BalanceSnapshot, SupplyDiscrepancy
 )
-from .exceptions import UserNotFound, CurrencyNotFound, InsufficientFunds, DuplicateEntryError
+from .exceptions import UserNotFound, CurrencyNotFound, InsufficientFunds, DuplicateEntryError, TransactionError
+from .constants import PRICE_SCALE, CANDLE_RESOLUTIONS, SYSTEM_USER_ID
 
 class UserModel:
-    def __init__(self, user_id: int, db_connection: DatabaseConnection):
+    def __init__(self, user_id: int, db_connection: DatabaseConnection, ledger=None):
         self.user_id = user_id
         self.db = db_connection
+        self.ledger = ledger
 
     async def get_balance(self, currency_id: int, for_update: bool = False, cursor=None) -> Balance:
+        if self.ledger is not None and self.ledger.serves(currency_id):
+            # The ledger engine is authoritative; the balance table trails it until the next save
+            return self.ledger.balance(self.user_id, currency_id)
         if cursor:
             query = "SELECT * FROM balance WHERE user_id = %s AND currency_id = %s"
             if for_update:
@@ -45,12 +58,14 @@ class UserModel:
                 return Balance(**result)
 
     async def get_all_balances(self) -> list[Balance]:
-        async with self.db as cursor:
+        async with self.db.read as cursor:
             await cursor.execute("SELECT * FROM balance WHERE user_id = %s AND amount > 0", (self.user_id,))
             results = await cursor.fetchall()
-            return [Balance(**row) for row in results]
+            return hydrate_all(Balance, results)
 
     async def _update_balance(self, cursor, currency_id: int, amount_change: int):
+        if self.ledger is not None and self.ledger.manages(currency_id):
+            raise TransactionError(f"Currency {currency_id} is settled by the ledger engine and only supports plain transfers.")
         await cursor.execute(
             """
             INSERT INTO balance (user_id, currency_id, amount)
@@ -62,27 +77,124 @@ class UserModel:
         
         await cursor.execute("DELETE FROM balance WHERE user_id = %s AND currency_id = %s AND amount = 0", (self.user_id, currency_id))
 
+# currency.supply holds the compacted total; currency_supply_shard holds what changed since
+SUPPLY_COLUMN = "c.supply + COALESCE((SELECT SUM(s.delta) FROM currency_supply_shard s WHERE s.currency_id = c.currency_id), 0)"
+CURRENCY_COLUMNS = (
+    "c.currency_id, c.name, c.symbol, c.issuer, " + SUPPLY_COLUMN + " AS supply, c.minting_renounced, "
+    "c.delete_requested_at, c.hourly_interest_rate, c.new_hourly_interest_rate, c.rate_change_requested_at"
+)
+
 class CurrencyModel:
-    def __init__(self, db_connection: DatabaseConnection):
+    def __init__(self, db_connection: DatabaseConnection, cache: Optional[TTLCache] = None, supply_shards: int = 0):
         self.db = db_connection
-
-    async def get(self, currency_id: int) -> Optional[Currency]:
+        self.cache = cache or TTLCache()
+        self._symbols = TTLCache(self.cache.maxsize, self.cache.ttl)
+        self.supply_shards = supply_shards
+
+    def _remember(self, currency: Currency):
+        # Rows read inside a transaction may be uncommitted, so only committed reads are cached
+        if not self.db.in_transaction:
+            self.cache.set(currency.currency_id, currency)
+            self._symbols.set(currency.symbol, currency.currency_id)
+
+    def invalidate(self, currency_id: int):
+        def _evict():
+            currency = self.cache.pop(currency_id)
+            if currency:
+                self._symbols.pop(currency.symbol)
+        # Evict now, and again after commit in case a concurrent reader re-cached the old row
+        _evict()
+        self.db.on_commit(_evict)
+
+    async def _changed(self, cursor, currency_id: int):
+        # Metadata changes write no transfer, so other processes learn of them through data_version
+        self.invalidate(currency_id)
+        await DataVersionModel.bump(cursor)
+
+    async def _with_live_supply(self, currencies: list[Currency]) -> list[Currency]:
+        # Only metadata is served from the cache: supply moves with every mint, burn, gas charge and
+        # ledger save, in any process, so it is read by primary key each time.
+        if not currencies:
+            return []
         async with self.db as cursor:
-            await cursor.execute("SELECT * FROM currency WHERE currency_id = %s", (currency_id,))
+            placeholders = ', '.join(['%s'] * len(currencies))
+            await cursor.execute(
+                f"SELECT c.currency_id, {SUPPLY_COLUMN} AS supply FROM currency c WHERE c.currency_id IN ({placeholders})",
+                tuple(currency.currency_id for currency in currencies)
+            )
+            supplies = {row['currency_id']: int(row['supply']) for row in await cursor.fetchall()}
+        fresh = []
+        for currency in currencies:
+            if currency.currency_id not in supplies:
+                # Deleted by another process
+                self.invalidate(currency.currency_id)
+                continue
+            fresh.append(currency.model_copy(update={"supply": supplies[currency.currency_id]}))
+        return fresh
+
+    async def get(self, currency_id: int, use_cache: bool = True) -> Optional[Currency]:
+        if use_cache:
+            currency = self.cache.get(currency_id)
+            if currency:
+                fresh = await self._with_live_supply([currency])
+                return fresh[0] if fresh else None
+        async with self.db as cursor:
+            await cursor.execute(f"SELECT {CURRENCY_COLUMNS} FROM currency c WHERE c.currency_id = %s", (currency_id,))
             result = await cursor.fetchone()
-            return Currency(**result) if result else None
-    
-    async def get_by_symbol(self, symbol: str) -> Optional[Currency]:
+        if not result:
+            return None
+        currency = Currency(**result)
+        self._remember(currency)
+        return currency
+
+    async def get_by_symbol(self, symbol: str, use_cache: bool = True) -> Optional[Currency]:
+        if use_cache:
+            currency_id = self._symbols.get(symbol)
+            if currency_id is not None:
+                currency = self.cache.get(currency_id)
+                if currency and currency.symbol == symbol:
+                    fresh = await self._with_live_supply([currency])
+                    return fresh[0] if fresh else None
         async with self.db as cursor:
-            await cursor.execute("SELECT * FROM currency WHERE symbol = %s", (symbol,))
+            await cursor.execute(f"SELECT {CURRENCY_COLUMNS} FROM currency c WHERE c.symbol = %s", (symbol,))
             result = await cursor.fetchone()
-            return Currency(**result) if result else None
-
-    async def get_all_holders(self, currency_id: int) -> list[Balance]:
+        if not result:
+            return None
+        currency = Currency(**result)
+        self._remember(currency)
+        return currency
+
+    async def get_many(self, currency_ids: list[int]) -> list[Currency]:
+        cached = []
+        missing = []
+        for currency_id in currency_ids:
+            currency = self.cache.get(currency_id)
+            if currency:
+                cached.append(currency)
+            else:
+                missing.append(currency_id)
+        found = {currency.currency_id: currency for currency in await self._with_live_supply(cached)}
+        if missing:
+            async with self.db as cursor:
+                placeholders = ', '.join(['%s'] * len(missing))
+                await cursor.execute(f"SELECT {CURRENCY_COLUMNS} FROM currency c WHERE c.currency_id IN ({placeholders})", tuple(missing))
+                results = await cursor.fetchall()
+            for currency in hydrate_all(Currency, results):
+                self._remember(currency)
+                found[currency.currency_id] = currency
+        return [found[currency_id] for currency_id in currency_ids if currency_id in found]
+
+    async def get_all_holders(self, currency_id: int, for_update: bool = False, cursor=None) -> list[Balance]:
+        # Read on the primary: the holder list drives the transfers that empty the currency
+        query = "SELECT * FROM balance WHERE currency_id = %s AND amount > 0 AND user_id != 0 ORDER BY user_id"
+        if for_update:
+            query += " FOR UPDATE"
+        if cursor:
+            await cursor.execute(query, (currency_id,))
+            return hydrate_all(Balance, await cursor.fetchall())
         async with self.db as cursor:
-            await cursor.execute("SELECT * FROM balance WHERE currency_id = %s AND amount > 0 AND user_id != 0", (currency_id,))
-            results = await cursor.fetchall()
-            return [Balance(**row) for row in results]
+            await cursor.execute(query, (currency_id,))
+            return hydrate_all(Balance, await cursor.fetchall())
 
     async def create(self, guild_id: int, name: str, symbol: str, supply: int, issuer_id: int, hourly_interest_rate: int) -> Currency:
         try:
@@ -91,19 +203,71 @@ class CurrencyModel:
                     "INSERT INTO currency (currency_id, name, symbol, issuer, supply, hourly_interest_rate) VALUES (%s, %s, %s, %s, %s, %s)",
                     (guild_id, name, symbol, issuer_id, supply, hourly_interest_rate)
                 )
-            return await self.get(currency_id=guild_id)
+                await self._changed(cursor, guild_id)
+            return await self.get(currency_id=guild_id, use_cache=False)
         except aiomysql.Error as e:
             # Check for integrity error (error code 1062 for duplicate entry)
             if e.args[0] == 1062:
                 raise DuplicateEntryError("A currency already exists in this server or that symbol is taken.")
             raise e
 
+    @property
+    def sharded(self) -> bool:
+        return self.supply_shards > 1
+
     async def update_supply(self, cursor, currency_id: int, amount_change: int):
-        await cursor.execute("UPDATE currency SET supply = supply + %s WHERE currency_id = %s", (amount_change, currency_id))
+        if self.sharded:
+            # Concurrent mints, burns and gas charges land on different rows instead of queueing on the currency row.
+            # Only this row is spread: the transfer that usually comes with the change still takes transfer_sequence.
+            await cursor.execute(
+                "INSERT INTO currency_supply_shard (currency_id, shard, delta) VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE delta = delta + VALUES(delta)",
+                (currency_id, random.randrange(self.supply_shards), amount_change)
+            )
+        else:
+            await cursor.execute("UPDATE currency SET supply = supply + %s WHERE currency_id = %s", (amount_change, currency_id))
+        self.invalidate(currency_id)
+
+    async def compact_supply(self) -> int:
+        """Folds the shard deltas into currency.supply, one currency per transaction. Returns the currencies compacted."""
+        async with self.db as cursor:
+            await cursor.execute("SELECT DISTINCT currency_id FROM currency_supply_shard WHERE delta <> 0")
+            currency_ids = [row["currency_id"] for row in await cursor.fetchall()]
+        for currency_id in currency_ids:
+            async with self.db as cursor:
+                await cursor.execute(
+                    "SELECT shard, delta FROM currency_supply_shard WHERE currency_id = %s ORDER BY shard FOR UPDATE",
+                    (currency_id,)
+                )
+                delta = sum(int(row["delta"]) for row in await cursor.fetchall())
+                await cursor.execute("UPDATE currency SET supply = supply + %s WHERE currency_id = %s", (delta, currency_id))
+                # The rows stay so later updates hit an existing key instead of inserting
+                await cursor.execute("UPDATE currency_supply_shard SET delta = 0 WHERE currency_id = %s", (currency_id,))
+        return len(currency_ids)
+
+    async def reconcile_supply(self) -> list[SupplyDiscrepancy]:
+        """Currencies whose supply differs from what is held in balances, stakes, pool reserves and unsettled gas charges."""
+        async with self.db.read as cursor:
+            await cursor.execute(
+                f"""
+                SELECT c.currency_id, {SUPPLY_COLUMN} AS supply,
+                    COALESCE((SELECT SUM(b.amount) FROM balance b WHERE b.currency_id = c.currency_id AND b.user_id != 0), 0)
+                    + COALESCE((SELECT SUM(k.amount) FROM staking k WHERE k.currency_id = c.currency_id), 0)
+                    + COALESCE((SELECT SUM(p.reserve_a) FROM liquidity_pool p WHERE p.currency_a_id = c.currency_id), 0)
+                    + COALESCE((SELECT SUM(p.reserve_b) FROM liquidity_pool p WHERE p.currency_b_id = c.currency_id), 0)
+                    + COALESCE((SELECT SUM(g.amount) FROM gas_charge g WHERE g.currency_id = c.currency_id AND g.settled_at IS NULL), 0) AS held
+                FROM currency c ORDER BY c.currency_id
+                """
+            )
+            results = await cursor.fetchall()
+        return [
+            SupplyDiscrepancy(currency_id=row["currency_id"], supply=int(row["supply"]), held=int(row["held"]))
+            for row in results if int(row["supply"]) != int(row["held"])
+        ]
 
     async def renounce_minting(self, currency_id: int) -> Optional[Currency]:
         from .exceptions import RenouncedError
-        currency = await self.get(currency_id)
+        currency = await self.get(currency_id, use_cache=False)
         if not currency:
             return None
         if currency.minting_renounced:
@@ -112,23 +276,28 @@ class CurrencyModel:
         async with self.db as cursor:
             await cursor.execute("UPDATE currency SET minting_renounced = 1 WHERE currency_id = %s", (currency_id,))
             if cursor.rowcount == 0: return None
-        return await self.get(currency_id)
+            await self._changed(cursor, currency_id)
+        return await self.get(currency_id, use_cache=False)
 
     async def request_delete(self, currency_id: int) -> Optional[Currency]:
         async with self.db as cursor:
             await cursor.execute("UPDATE currency SET delete_requested_at = %s WHERE currency_id = %s", (int(time()), currency_id))
             if cursor.rowcount == 0: return None
-        return await self.get(currency_id)
+            await self._changed(cursor, currency_id)
+        return await self.get(currency_id, use_cache=False)
 
     async def cancel_delete_request(self, currency_id: int) -> Optional[Currency]:
         async with self.db as cursor:
             await cursor.execute("UPDATE currency SET delete_requested_at = NULL WHERE currency_id = %s", (currency_id,))
             if cursor.rowcount == 0: return None
-        return await self.get(currency_id)
+            await self._changed(cursor, currency_id)
+        return await self.get(currency_id, use_cache=False)
 
     async def delete(self, currency_id: int):
          async with self.db as cursor:
             await cursor.execute("DELETE FROM currency WHERE currency_id = %s", (currency_id,))
+            await cursor.execute("DELETE FROM currency_supply_shard WHERE currency_id = %s", (currency_id,))
+            await self._changed(cursor, currency_id)
 
     async def request_rate_change(self, currency_id: int, new_rate: int) -> Optional[Currency]:
         async with self.db as cursor:
@@ -137,7 +306,8 @@ class CurrencyModel:
                 (new_rate, int(time()), currency_id)
             )
             if cursor.rowcount == 0: return None
-        return await self.get(currency_id)
+            await self._changed(cursor, currency_id)
+        return await self.get(currency_id, use_cache=False)
 
     async def apply_rate_change(self, currency: Currency) -> Optional[Currency]:
         async with self.db as cursor:
@@ -146,7 +316,8 @@ class CurrencyModel:
                 (currency.new_hourly_interest_rate, currency.currency_id)
             )
             if cursor.rowcount == 0: return None
-        return await self.get(currency.currency_id)
+            await self._changed(cursor, currency.currency_id)
+        return await self.get(currency.currency_id, use_cache=False)
 
 class ContractModel:
     def __init__(self, db_connection: DatabaseConnection):
@@ -168,27 +339,52 @@ class ContractModel:
                 return Contract(**result)
             return None
 
-    async def set(self, user_id: int, script: str, cost: int, max_cost: int, locked_until: int = 0) -> Contract:
+    async def set(self, user_id: int, script: str, cost: int, max_cost: int, locked_until: int = 0, cost_min: int = 0, cost_max: Optional[int] = None) -> Contract:
         compressed_script = zlib.compress(script.encode('utf-8'))
         async with self.db as cursor:
             await cursor.execute(
                 """
-                INSERT INTO contract (user_id, script, cost, max_cost, locked_until)
-                VALUES (%s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE script = VALUES(script), cost = VALUES(cost), max_cost = VALUES(max_cost), locked_until = VALUES(locked_until)
+                INSERT INTO contract (user_id, script, cost, max_cost, locked_until, cost_min, cost_max)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE script = VALUES(script), cost = VALUES(cost), max_cost = VALUES(max_cost), locked_until = VALUES(locked_until),
+                    cost_min = VALUES(cost_min), cost_max = VALUES(cost_max)
                 """,
-                (user_id, compressed_script, cost, max_cost, locked_until)
+                (user_id, compressed_script, cost, max_cost, locked_until, cost_min, cost_max)
             )
         return await self.get(user_id)
 
 class APIKeyModel:
-    def __init__(self, db_connection: DatabaseConnection):
+    def __init__(self, db_connection: DatabaseConnection, cache: Optional[TTLCache] = None, negative_cache: Optional[TTLCache] = None, version_check_interval: float = 1):
         self.db = db_connection
+        self.cache = cache or TTLCache(10000, 60)
+        # Misses live in their own cache so a flood of bogus keys cannot evict valid ones
+        self.negative_cache = negative_cache or TTLCache(10000, 5)
+        self.version_check_interval = version_check_interval
+        self._version: Optional[int] = None
+        self._version_checked_at = 0.0
 
     def _generate_key(self, length: int = 24) -> str:
         alphabet = string.ascii_letters + string.digits
         return ''.join(secrets.choice(alphabet) for _ in range(length))
 
+    def invalidate(self):
+        self.cache.clear()
+        self.negative_cache.clear()
+
+    async def _check_version(self):
+        # Keys rotated by another process bump api_key_version; poll it at most once per interval
+        now = monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        async with self.db as cursor:
+            await cursor.execute("SELECT version FROM api_key_version WHERE id = 1")
+            result = await cursor.fetchone()
+        version = int(result['version']) if result else 0
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+
     async def get(self, user_id: int) -> Optional[APIKey]:
         async with self.db as cursor:
             await cursor.execute("SELECT * FROM api_key WHERE user_id = %s", (user_id,))
@@ -196,10 +392,22 @@ class APIKeyModel:
             return APIKey(**result) if result else None
 
     async def get_user_by_key(self, api_key: str) -> Optional[APIKey]:
+        await self._check_version()
+        key_data = self.cache.get(api_key)
+        if key_data:
+            return key_data
+        if self.negative_cache.get(api_key):
+            return None
+
         async with self.db as cursor:
             await cursor.execute("SELECT user_id, api_key FROM api_key WHERE api_key = %s", (api_key,))
             result = await cursor.fetchone()
-            return APIKey(**result) if result else None
+        if not result:
+            self.negative_cache.set(api_key, True)
+            return None
+        key_data = APIKey(**result)
+        self.cache.set(api_key, key_data)
+        return key_data
 
     async def create(self, user_id: int) -> APIKey:
         new_key = self._generate_key()
@@ -212,8 +420,47 @@ class APIKeyModel:
                 """,
                 (user_id, new_key)
             )
+            await cursor.execute(
+                "INSERT INTO api_key_version (id, version) VALUES (1, 1) ON DUPLICATE KEY UPDATE version = version + 1"
+            )
+            self.invalidate()
+            self.db.on_commit(self.invalidate)
         return APIKey(user_id=user_id, api_key=new_key)
 
+class DataVersionModel:
+    """A cheap fingerprint of the data behind the explorer reads, for caches shared across processes.
+
+    Transfers cover balances, supply, pools and candles, contract_history covers contract updates,
+    and data_version is bumped by the remaining writes (currency metadata).
+    """
+
+    def __init__(self, db_connection: DatabaseConnection, check_interval: float = 1):
+        self.db = db_connection
+        self.check_interval = check_interval
+        self._version: Optional[tuple[int, int, int]] = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    async def bump(cursor):
+        await cursor.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+    async def current(self) -> tuple[int, int, int]:
+        # Polled at most once per interval; read where the explorer reads, so a lagging replica
+        # does not report a version whose data it cannot serve yet
+        now = monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return self._version
+        self._checked_at = now
+        async with self.db.read as cursor:
+            await cursor.execute(
+                "SELECT (SELECT COALESCE(MAX(transfer_id), 0) FROM transfer) AS transfer_id, "
+                "(SELECT COALESCE(MAX(history_id), 0) FROM contract_history) AS history_id, "
+                "(SELECT COALESCE(MAX(version), 0) FROM data_version WHERE id = 1) AS version"
+            )
+            result = await cursor.fetchone()
+        self._version = (int(result['transfer_id']), int(result['history_id']), int(result['version']))
+        return self._version
+
 class ClaimModel:
     def __init__(self, db_connection: DatabaseConnection):
         self.db = db_connection
@@ -232,13 +479,13 @@ class ClaimModel:
                 (user_id, user_id, limit, offset)
             )
             results = await cursor.fetchall()
-            return [Claim(**row) for row in results]
+            return hydrate_all(Claim, results)
 
     async def get_claims_created_after(self, timestamp: int) -> list[Claim]:
         async with self.db as cursor:
             await cursor.execute("SELECT * FROM claims WHERE created_at > %s", (timestamp,))
             results = await cursor.fetchall()
-            return [Claim(**row) for row in results]
+            return hydrate_all(Claim, results)
 
     async def create(self, claimant_id: int, payer_id: int, currency_id: int, amount: int, description: Optional[str]) -> Claim:
         async with self.db as cursor:
@@ -282,13 +529,13 @@ class StakeModel:
         async with self.db as cursor:
             await cursor.execute("SELECT * FROM staking WHERE user_id = %s", (user_id,))
             results = await cursor.fetchall()
-            return [Stake(**row) for row in results]
+            return hydrate_all(Stake, results)
 
     async def get_stale_stakes(self, threshold_timestamp: int) -> list[Stake]:
         async with self.db as cursor:
             await cursor.execute("SELECT * FROM staking WHERE last_updated_at <= %s", (threshold_timestamp,))
             results = await cursor.fetchall()
-            return [Stake(**row) for row in results]
+            return hydrate_all(Stake, results)
 
     async def upsert(self, cursor, user_id: int, currency_id: int, amount_change: int, last_updated_at: int):
         await cursor.execute(
@@ -325,10 +572,10 @@ class LiquidityPoolModel:
             return LiquidityPool(**result) if result else None
 
     async def get_all(self) -> list[LiquidityPool]:
-        async with self.db as cursor:
+        async with self.db.read as cursor:
             await cursor.execute("SELECT * FROM liquidity_pool")
             results = await cursor.fetchall()
-            return [LiquidityPool(**row) for row in results]
+            return hydrate_all(LiquidityPool, results)
 
     async def get_by_currency_pair(self, currency_a_id: int, currency_b_id: int) -> Optional[LiquidityPool]:
         async with self.db as cursor:
@@ -354,6 +601,88 @@ class LiquidityPoolModel:
             (reserve_a_change, reserve_b_change, shares_change, pool_id)
         )
 
+class PoolCandleModel:
+    def __init__(self, db_connection: DatabaseConnection):
+        self.db = db_connection
+
+    async def record_trade(self, cursor, pool_id: int, volume_a: int, volume_b: int, timestamp: int):
+        if volume_a <= 0 or volume_b <= 0:
+            return
+        price = volume_b * PRICE_SCALE // volume_a
+
+        rows = []
+        params = []
+        for resolution in CANDLE_RESOLUTIONS.values():
+            rows.append("(%s, %s, %s, %s, %s, %s, %s, %s, %s, 1)")
+            params.extend([pool_id, resolution, timestamp - (timestamp % resolution), price, price, price, price, volume_a, volume_b])
+
+        await cursor.execute(
+            f"""
+            INSERT INTO pool_candle (pool_id, resolution, bucket_start, open, high, low, close, volume_a, volume_b, trade_count)
+            VALUES {', '.join(rows)}
+            ON DUPLICATE KEY UPDATE
+                high = GREATEST(high, VALUES(high)),
+                low = LEAST(low, VALUES(low)),
+                close = VALUES(close),
+                volume_a = volume_a + VALUES(volume_a),
+                volume_b = volume_b + VALUES(volume_b),
+                trade_count = trade_count + 1
+            """,
+            tuple(params)
+        )
+
+    async def has_rows(self) -> bool:
+        async with self.db as cursor:
+            await cursor.execute("SELECT 1 FROM pool_candle LIMIT 1")
+            return await cursor.fetchone() is not None
+
+    async def merge_history(self, cursor, candles: dict[tuple[int, int, int], list[int]]):
+        """Writes candles rebuilt from history: (pool_id, resolution, bucket_start) -> [open, high, low, close, volume_a, volume_b, trade_count].
+
+        A row that already exists only holds trades recorded live after the rebuilt history,
+        so it keeps its close and takes the historical open.
+        """
+        items = list(candles.items())
+        for i in range(0, len(items), 500):
+            chunk = items[i:i + 500]
+            params = []
+            for key, values in chunk:
+                params.extend([*key, *values])
+            await cursor.execute(
+                f"""
+                INSERT INTO pool_candle (pool_id, resolution, bucket_start, open, high, low, close, volume_a, volume_b, trade_count)
+                VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(chunk))}
+                ON DUPLICATE KEY UPDATE
+                    open = VALUES(open),
+                    high = GREATEST(high, VALUES(high)),
+                    low = LEAST(low, VALUES(low)),
+                    volume_a = volume_a + VALUES(volume_a),
+                    volume_b = volume_b + VALUES(volume_b),
+                    trade_count = trade_count + VALUES(trade_count)
+                """,
+                tuple(params)
+            )
+
+    async def get_range(self, pool_id: int, resolution: int, start_timestamp: Optional[int] = None, end_timestamp: Optional[int] = None, limit: int = 500) -> list[PoolCandle]:
+        conditions = ["pool_id = %s", "resolution = %s"]
+        params = [pool_id, resolution]
+        if start_timestamp is not None:
+            conditions.append("bucket_start >= %s")
+            params.append(start_timestamp - (start_timestamp % resolution))
+        if end_timestamp is not None:
+            conditions.append("bucket_start <= %s")
+            params.append(end_timestamp)
+        params.append(limit)
+
+        async with self.db.read as cursor:
+            await cursor.execute(
+                f"SELECT * FROM pool_candle WHERE {' AND '.join(conditions)} ORDER BY bucket_start DESC LIMIT %s",
+                tuple(params)
+            )
+            results = await cursor.fetchall()
+            # Newest buckets are selected first so that a bare limit returns the latest candles
+            return hydrate_all(PoolCandle, reversed(results))
+
 class LiquidityProviderModel:
     def __init__(self, db_connection: DatabaseConnection):
         self.db = db_connection
@@ -382,10 +711,10 @@ class LiquidityProviderModel:
                 return LiquidityProvider(**result) if result else None
 
     async def get_for_user(self, user_id: int) -> list[LiquidityProvider]:
-        async with self.db as cursor:
+        async with self.db.read as cursor:
             await cursor.execute("SELECT * FROM liquidity_provider WHERE user_id = %s", (user_id,))
             results = await cursor.fetchall()
-            return [LiquidityProvider(**row) for row in results]
+            return hydrate_all(LiquidityProvider, results)
 
     async def add_shares(self, cursor, pool_id: int, user_id: int, shares_change: int):
         await cursor.execute(
@@ -440,7 +769,7 @@ class ContractVariableModel:
         async with self.db as cursor:
             await cursor.execute("SELECT * FROM contract_storage WHERE user_id = %s", (user_id,))
             results = await cursor.fetchall()
-            return [ContractVariable(**row) for row in results]
+            return hydrate_all(ContractVariable, results)
 
 class NotificationPermissionModel:
     def __init__(self, db_connection: DatabaseConnection):
@@ -464,7 +793,7 @@ class NotificationPermissionModel:
         async with self.db as cursor:
             await cursor.execute("SELECT * FROM notification_permissions WHERE user_id = %s", (user_id,))
             results = await cursor.fetchall()
-            return [NotificationPermission(**row) for row in results]
+            return hydrate_all(NotificationPermission, results)
 
     async def check(self, user_id: int, allowed_user_id: int) -> bool:
         async with self.db as cursor:
@@ -481,16 +810,25 @@ class ExecutionModel:
             result = await cursor.fetchone()
             return Execution(**result) if result else None
 
-    async def create(self, cursor, caller_id: int, contract_owner_id: int, input_data: Optional[str], status: str) -> int:
+    async def create(self, cursor, caller_id: int, contract_owner_id: int, input_data: Optional[str], status: str, output_data: Optional[str] = None, cost: int = 0) -> int:
         await cursor.execute(
             """
-            INSERT INTO execution (caller_id, contract_owner_id, input_data, status, timestamp)
-            VALUES (%s, %s, %s, %s, %s)
+            INSERT INTO execution (caller_id, contract_owner_id, input_data, output_data, cost, status, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             """,
-            (caller_id, contract_owner_id, input_data, status, int(time()))
+            (caller_id, contract_owner_id, input_data, output_data, cost, status, int(time()))
         )
         return cursor.lastrowid
 
+    async def get_successful_swaps(self, after_execution_id: int, limit: int = 500) -> list[Execution]:
+        async with self.db as cursor:
+            await cursor.execute(
+                "SELECT * FROM execution WHERE execution_id > %s AND status = 'success' AND contract_owner_id = 0 AND input_data LIKE %s ORDER BY execution_id ASC LIMIT %s",
+                (after_execution_id, "swap from:%", limit)
+            )
+            results = await cursor.fetchall()
+            return hydrate_all(Execution, results)
+
     async def update(self, cursor, execution_id: int, output_data: Optional[str], cost: int, status: str):
         await cursor.execute(
             """
@@ -502,36 +840,232 @@ class ExecutionModel:
         )
 
 class TransferModel:
-    def __init__(self, db_connection: DatabaseConnection):
+    def __init__(self, db_connection: DatabaseConnection, archive: Optional[TransferArchive] = None):
         self.db = db_connection
+        self.archive = archive
+        # Indexes present on `transfer`; None trusts rapid-wire.sql (and SQLite, which ignores hints)
+        self.indexes: Optional[frozenset[str]] = None
+
+    async def detect_indexes(self) -> frozenset[str]:
+        """Reads the indexes of `transfer` so searches only hint at ones this database has."""
+        async with self.db as cursor:
+            await cursor.execute(
+                "SELECT DISTINCT index_name AS name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = 'transfer'"
+            )
+            self.indexes = frozenset(row['name'] for row in await cursor.fetchall())
+        return self.indexes
+
+    def index_hint(self, index: str) -> str:
+        return f" USE INDEX ({index})" if self.indexes is None or index in self.indexes else ""
 
     async def get(self, transfer_id: int, cursor=None) -> Optional[Transfer]:
         if cursor:
             await cursor.execute("SELECT * FROM transfer WHERE transfer_id = %s", (transfer_id,))
             result = await cursor.fetchone()
-            return Transfer(**result) if result else None
         else:
             async with self.db as cursor:
                 await cursor.execute("SELECT * FROM transfer WHERE transfer_id = %s", (transfer_id,))
                 result = await cursor.fetchone()
-                return Transfer(**result) if result else None
+        if not result and self.archive:
+            result = await asyncio.to_thread(self.archive.get, transfer_id)
+        return Transfer(**result) if result else None
+
+    def archived_upto(self) -> int:
+        """The last archived transfer_id; hot rows up to it may still await deletion and are skipped."""
+        if not self.archive:
+            return 0
+        self.archive.refresh()
+        return self.archive.last_id
+
+    async def scan_archive(self, **window) -> list[dict]:
+        # Readers that aggregate over history add the archived rows; see TransferArchive.scan for the window
+        if not self.archive or not self.archived_upto():
+            return []
+        return await asyncio.to_thread(lambda: list(self.archive.scan(**window)))
+
+    async def archived_inflow(self, user_id: int, currency_id: int, **window) -> int:
+        """Received minus sent by ``user_id`` in ``currency_id`` over the archived rows in ``window``."""
+        def total():
+            inflow = 0
+            for row in self.archive.scan(user_id=user_id, currency_id=currency_id, **window):
+                if row["dest_id"] == user_id:
+                    inflow += row["amount"]
+                if row["source_id"] == user_id:
+                    inflow -= row["amount"]
+            return inflow
+        return await asyncio.to_thread(total) if self.archived_upto() else 0
+
+    async def get_for_executions(self, execution_ids: list[int]) -> list[Transfer]:
+        if not execution_ids:
+            return []
+        archived_upto = self.archived_upto()
+        placeholders = ", ".join(["%s"] * len(execution_ids))
+        async with self.db as cursor:
+            await cursor.execute(
+                f"SELECT * FROM transfer WHERE execution_id IN ({placeholders}) AND transfer_id > %s ORDER BY transfer_id ASC",
+                tuple(execution_ids) + (archived_upto,)
+            )
+            results = await cursor.fetchall()
+        archived = await self.scan_archive(execution_ids=set(execution_ids))
+        return hydrate_all(Transfer, archived) + hydrate_all(Transfer, results)
 
-    async def create(self, cursor, source_id: int, dest_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None) -> int:
+    async def create(self, cursor, source_id: int, dest_id: int, currency_id: int, amount: int, execution_id: Optional[int] = None, timestamp: Optional[int] = None) -> int:
         await cursor.execute("SELECT id FROM transfer_sequence WHERE id = 1 FOR UPDATE")
         await cursor.fetchone()
         await cursor.execute("SELECT COALESCE(MAX(transfer_id), 0) + 1 AS next_id FROM transfer")
         res = await cursor.fetchone()
         next_id = res['next_id']
+        if timestamp is None:
+            timestamp = int(time())
 
         await cursor.execute(
             """
             INSERT INTO transfer (transfer_id, execution_id, source_id, dest_id, currency_id, amount, timestamp)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
             """,
-            (next_id, execution_id, source_id, dest_id, currency_id, amount, int(time()))
+            (next_id, execution_id, source_id, dest_id, currency_id, amount, timestamp)
         )
+        await self._record_user_stats(cursor, source_id, dest_id, currency_id, amount, timestamp)
         return next_id
 
+    async def _record_user_stats(self, cursor, source_id: int, dest_id: int, currency_id: int, amount: int, timestamp: int):
+        # The system account is on one side of every mint, burn and fee, so keeping a row for it
+        # would serialize those writes on a single hot row; its stats are computed on demand instead.
+        # Rows are written in user_id order so concurrent transfers lock them in the same order.
+        user_ids = sorted({source_id, dest_id} - {SYSTEM_USER_ID})
+        if not user_ids:
+            return
+
+        stats_rows = []
+        currency_rows = []
+        for user_id in user_ids:
+            sent = 1 if user_id == source_id else 0
+            received = 1 if user_id == dest_id else 0
+            stats_rows.extend([user_id, sent, received, timestamp, timestamp])
+            currency_rows.extend([user_id, currency_id, sent, received, amount if sent else 0, amount if received else 0])
+
+        placeholders = ", ".join(["(%s, 1, %s, %s, %s, %s)"] * len(user_ids))
+        await cursor.execute(
+            f"""
+            INSERT INTO user_stats (user_id, total_transfers, sent_count, received_count, first_transfer_timestamp, last_transfer_timestamp)
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE
+                total_transfers = total_transfers + 1,
+                sent_count = sent_count + VALUES(sent_count),
+                received_count = received_count + VALUES(received_count),
+                first_transfer_timestamp = LEAST(first_transfer_timestamp, VALUES(first_transfer_timestamp)),
+                last_transfer_timestamp = GREATEST(last_transfer_timestamp, VALUES(last_transfer_timestamp))
+            """,
+            tuple(stats_rows)
+        )
+
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(user_ids))
+        await cursor.execute(
+            f"""
+            INSERT INTO user_currency_stats (user_id, currency_id, sent_count, received_count, sent_amount, received_amount)
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE
+                sent_count = sent_count + VALUES(sent_count),
+                received_count = received_count + VALUES(received_count),
+                sent_amount = sent_amount + VALUES(sent_amount),
+                received_amount = received_amount + VALUES(received_amount)
+            """,
+            tuple(currency_rows)
+        )
+
+    async def rebuild_user_stats(self):
+        """Recomputes user_stats and user_currency_stats from the full transfer history, archive included."""
+        archived_upto = self.archived_upto()
+        stats, currency_stats = await asyncio.to_thread(self._archived_user_stats, archived_upto)
+        async with self.db as cursor:
+            # Holding the sequence lock keeps new transfers out until the rebuild commits
+            await cursor.execute("SELECT id FROM transfer_sequence WHERE id = 1 FOR UPDATE")
+            await cursor.fetchone()
+            await cursor.execute("DELETE FROM user_stats")
+            await cursor.execute("DELETE FROM user_currency_stats")
+            await cursor.execute(
+                """
+                INSERT INTO user_stats (user_id, total_transfers, sent_count, received_count, first_transfer_timestamp, last_transfer_timestamp)
+                SELECT user_id, COUNT(DISTINCT transfer_id), SUM(sent), SUM(received), MIN(timestamp), MAX(timestamp)
+                FROM (
+                    SELECT source_id AS user_id, transfer_id, 1 AS sent, 0 AS received, timestamp FROM transfer WHERE transfer_id > %s
+                    UNION ALL
+                    SELECT dest_id AS user_id, transfer_id, 0 AS sent, 1 AS received, timestamp FROM transfer WHERE transfer_id > %s
+                ) AS sides
+                WHERE user_id <> %s
+                GROUP BY user_id
+                """,
+                (archived_upto, archived_upto, SYSTEM_USER_ID)
+            )
+            await cursor.execute(
+                """
+                INSERT INTO user_currency_stats (user_id, currency_id, sent_count, received_count, sent_amount, received_amount)
+                SELECT user_id, currency_id, SUM(sent), SUM(received), SUM(sent * amount), SUM(received * amount)
+                FROM (
+                    SELECT source_id AS user_id, currency_id, 1 AS sent, 0 AS received, amount FROM transfer WHERE transfer_id > %s
+                    UNION ALL
+                    SELECT dest_id AS user_id, currency_id, 0 AS sent, 1 AS received, amount FROM transfer WHERE transfer_id > %s
+                ) AS sides
+                WHERE user_id <> %s
+                GROUP BY user_id, currency_id
+                """,
+                (archived_upto, archived_upto, SYSTEM_USER_ID)
+            )
+            # The archived history is folded in the same way live transfers update the rows
+            for i in range(0, len(stats), 500):
+                await cursor.executemany(
+                    """
+                    INSERT INTO user_stats (user_id, total_transfers, sent_count, received_count, first_transfer_timestamp, last_transfer_timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        total_transfers = total_transfers + VALUES(total_transfers),
+                        sent_count = sent_count + VALUES(sent_count),
+                        received_count = received_count + VALUES(received_count),
+                        first_transfer_timestamp = LEAST(first_transfer_timestamp, VALUES(first_transfer_timestamp)),
+                        last_transfer_timestamp = GREATEST(last_transfer_timestamp, VALUES(last_transfer_timestamp))
+                    """,
+                    stats[i:i + 500]
+                )
+            for i in range(0, len(currency_stats), 500):
+                await cursor.executemany(
+                    """
+                    INSERT INTO user_currency_stats (user_id, currency_id, sent_count, received_count, sent_amount, received_amount)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        sent_count = sent_count + VALUES(sent_count),
+                        received_count = received_count + VALUES(received_count),
+                        sent_amount = sent_amount + VALUES(sent_amount),
+                        received_amount = received_amount + VALUES(received_amount)
+                    """,
+                    currency_stats[i:i + 500]
+                )
+            await cursor.execute("SELECT COUNT(*) AS users FROM user_stats")
+            result = await cursor.fetchone()
+            return result['users']
+
+    def _archived_user_stats(self, archived_upto: int) -> tuple[list[tuple], list[tuple]]:
+        # Rows for user_stats and user_currency_stats from the archive, aggregated like the SQL above
+        stats: dict[int, list] = {}
+        currency_stats: dict[tuple[int, int], list] = {}
+        if archived_upto:
+            for row in self.archive.scan(upto_id=archived_upto):
+                for user_id in {row["source_id"], row["dest_id"]} - {SYSTEM_USER_ID}:
+                    sent = int(user_id == row["source_id"])
+                    received = int(user_id == row["dest_id"])
+                    entry = stats.setdefault(user_id, [user_id, 0, 0, 0, row["timestamp"], row["timestamp"]])
+                    entry[1] += 1
+                    entry[2] += sent
+                    entry[3] += received
+                    entry[4] = min(entry[4], row["timestamp"])
+                    entry[5] = max(entry[5], row["timestamp"])
+                    key = (user_id, row["currency_id"])
+                    entry = currency_stats.setdefault(key, [user_id, row["currency_id"], 0, 0, 0, 0])
+                    entry[2] += sent
+                    entry[3] += received
+                    entry[4] += row["amount"] * sent
+                    entry[5] += row["amount"] * received
+        return [tuple(v) for v in stats.values()], [tuple(v) for v in currency_stats.values()]
+
     async def search(
         self,
         source_id: Optional[int] = None,
@@ -546,76 +1080,303 @@ class TransferModel:
         page: int = 1,
         limit: int = 10,
         sort_by: str = "transfer_id",
-        sort_order: str = "desc"
+        sort_order: str = "desc",
+        after: Optional[str] = None
     ) -> list[Transfer]:
-        offset = (page - 1) * limit
-        conditions = []
-        params = []
-
-        base_query = "SELECT t.* FROM transfer t"
-        if input_data is not None:
-            base_query += " JOIN execution e ON t.execution_id = e.execution_id"
-            conditions.append("e.input_data = %s")
-            params.append(input_data)
-
-        if source_id is not None:
-            conditions.append("t.source_id = %s")
-            params.append(source_id)
-        if dest_id is not None:
-            conditions.append("t.dest_id = %s")
-            params.append(dest_id)
-        if currency_id is not None:
-            conditions.append("t.currency_id = %s")
-            params.append(currency_id)
-        if user_id is not None:
-            conditions.append("(t.source_id = %s OR t.dest_id = %s)")
-            params.extend([user_id, user_id])
-        if start_timestamp is not None:
-            conditions.append("t.timestamp >= %s")
-            params.append(start_timestamp)
-        if end_timestamp is not None:
-            conditions.append("t.timestamp <= %s")
-            params.append(end_timestamp)
-        if min_amount is not None:
-            conditions.append("t.amount >= %s")
-            params.append(min_amount)
-        if max_amount is not None:
-            conditions.append("t.amount <= %s")
-            params.append(max_amount)
-
-        allowed_sort_by = ["transfer_id", "timestamp", "amount"]
-        if sort_by not in allowed_sort_by:
-            sort_by = "transfer_id"
-
-        sort_order = "ASC" if sort_order.upper() == "ASC" else "DESC"
-        order_by_clause = f"ORDER BY t.{sort_by} {sort_order}"
-
-        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query, params = plan_transfer_search(
+            source_id=source_id, dest_id=dest_id, currency_id=currency_id, user_id=user_id,
+            start_timestamp=start_timestamp, end_timestamp=end_timestamp,
+            min_amount=min_amount, max_amount=max_amount, input_data=input_data,
+            page=page, limit=limit, sort_by=sort_by, sort_order=sort_order, after=after, indexes=self.indexes
+        )
 
-        query = f"{base_query} {where_clause} {order_by_clause} LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+        async with self.db.read as cursor:
+            await cursor.execute(query, params)
+            results = await cursor.fetchall()
+        transfers = hydrate_all(Transfer, results)
+
+        if not self.archive or input_data is not None:
+            return transfers
+        self.archive.refresh()
+        if not self.archive.segments:
+            return transfers
+
+        sort_by = sort_by if sort_by in TRANSFER_SORT_KEYS else "transfer_id"
+        descending = sort_order.upper() != "ASC"
+        if len(transfers) == limit:
+            # A full page whose last row sorts before everything archived is already correct
+            low, high = self.archive.bounds(sort_by)
+            last = getattr(transfers[-1], sort_by)
+            if (high < last) if descending else (low > last):
+                return transfers
+
+        # Otherwise take the first offset + limit rows of each tier and merge them,
+        # the same way the user_id search merges its two index scans.
+        offset = 0 if after is not None else (page - 1) * limit
+        filters = dict(
+            source_id=source_id, dest_id=dest_id, currency_id=currency_id, user_id=user_id,
+            start_timestamp=start_timestamp, end_timestamp=end_timestamp,
+            min_amount=min_amount, max_amount=max_amount, sort_by=sort_by, sort_order=sort_order, after=after
+        )
+        if offset:
+            query, params = plan_transfer_search(page=1, limit=offset + limit, indexes=self.indexes, **filters)
+            async with self.db.read as cursor:
+                await cursor.execute(query, params)
+                transfers = hydrate_all(Transfer, await cursor.fetchall())
+        archived = await asyncio.to_thread(self.archive.search, count=offset + limit, **filters)
+        merged = sorted(
+            transfers + hydrate_all(Transfer, archived),
+            key=lambda t: (getattr(t, sort_by), t.transfer_id), reverse=descending
+        )
+        return merged[offset:offset + limit]
 
+    async def archive_before(self, before_timestamp: int, segment_size: int = 50000) -> int:
+        """Moves transfers older than before_timestamp to the archive and returns how many were moved."""
+        # Rows up to archive.last_id are already on disk if a previous run stopped before deleting them
+        await self._delete_archived()
         async with self.db as cursor:
-            await cursor.execute(query, tuple(params))
-            results = await cursor.fetchall()
-            return [Transfer(**row) for row in results]
+            await cursor.execute("SELECT MAX(transfer_id) AS cutoff FROM transfer WHERE timestamp < %s", (before_timestamp,))
+            cutoff = (await cursor.fetchone())['cutoff']
+            await cursor.execute("SELECT MAX(transfer_id) AS newest FROM transfer")
+            newest = (await cursor.fetchone())['newest']
+        if cutoff is None:
+            return 0
+        # create() allocates ids from MAX(transfer_id), so the newest transfer always stays hot
+        cutoff = min(cutoff, newest - 1)
+
+        archived = 0
+        while True:
+            async with self.db as cursor:
+                await cursor.execute(
+                    "SELECT * FROM transfer WHERE transfer_id > %s AND transfer_id <= %s ORDER BY transfer_id ASC LIMIT %s",
+                    (self.archive.last_id, cutoff, segment_size)
+                )
+                rows = await cursor.fetchall()
+            if not rows:
+                return archived
+            for row in rows:
+                row['amount'] = int(row['amount'])
+            await asyncio.to_thread(self.archive.write_segment, rows)
+            await self._delete_archived()
+            archived += len(rows)
+
+    async def _delete_archived(self):
+        async with self.db as cursor:
+            await cursor.execute("DELETE FROM transfer WHERE transfer_id <= %s", (self.archive.last_id,))
+
+    async def export(self, after_id: Optional[int] = None, batch_size: int = 1000, **filters):
+        # Yields plain rows rather than Transfer objects; callers serialize them as they go.
+        # Each batch is a keyset query on a short-lived connection, so a slow consumer
+        # never holds a pooled connection while it reads.
+        while True:
+            query, params = plan_transfer_export(after_id=after_id, limit=batch_size, indexes=self.indexes, **filters)
+            async with self.db.read as cursor:
+                await cursor.execute(query, params)
+                rows = await cursor.fetchall()
+            for row in rows:
+                row["amount"] = int(row["amount"])
+                yield row
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1]["transfer_id"]
 
     async def get_user_stats(self, user_id: int) -> dict:
+        if user_id == SYSTEM_USER_ID:
+            return await self._scan_user_stats(user_id)
+
+        async with self.db.read as cursor:
+            await cursor.execute("SELECT * FROM user_stats WHERE user_id = %s", (user_id,))
+            result = await cursor.fetchone()
+            if not result:
+                return {
+                    "total_transfers": 0, "sent_count": 0, "received_count": 0,
+                    "first_transfer_timestamp": None, "last_transfer_timestamp": None, "currencies": []
+                }
+            await cursor.execute("SELECT * FROM user_currency_stats WHERE user_id = %s ORDER BY currency_id", (user_id,))
+            currencies = await cursor.fetchall()
+
+        stats = {key: value for key, value in result.items() if key != 'user_id'}
+        stats["currencies"] = hydrate_all(UserCurrencyStats, currencies)
+        return stats
+
+    async def _scan_user_stats(self, user_id: int) -> dict:
+        archived_upto = self.archived_upto()
         query = """
             SELECT
                 COUNT(*) as total_transfers,
+                COALESCE(SUM(source_id = %s), 0) as sent_count,
+                COALESCE(SUM(dest_id = %s), 0) as received_count,
                 MIN(timestamp) as first_transfer_timestamp,
                 MAX(timestamp) as last_transfer_timestamp
             FROM transfer
-            WHERE source_id = %s OR dest_id = %s
+            WHERE (source_id = %s OR dest_id = %s) AND transfer_id > %s
         """
-        params = (user_id, user_id)
-        async with self.db as cursor:
+        params = (user_id, user_id, user_id, user_id, archived_upto)
+        async with self.db.read as cursor:
             await cursor.execute(query, params)
             result = await cursor.fetchone()
-            if not result or result['total_transfers'] == 0:
-                return {"total_transfers": 0, "first_transfer_timestamp": None, "last_transfer_timestamp": None}
-            return result
+        stats = {key: int(value) if value is not None else None for key, value in result.items()}
+        if archived_upto:
+            archived = await asyncio.to_thread(self._archived_totals, user_id, archived_upto)
+            for key in ("total_transfers", "sent_count", "received_count"):
+                stats[key] += archived[key]
+            for key, pick in (("first_transfer_timestamp", min), ("last_transfer_timestamp", max)):
+                values = [value for value in (stats[key], archived[key]) if value is not None]
+                stats[key] = pick(values) if values else None
+        return {**stats, "currencies": []}
+
+    def _archived_totals(self, user_id: int, archived_upto: int) -> dict:
+        totals = {"total_transfers": 0, "sent_count": 0, "received_count": 0, "first_transfer_timestamp": None, "last_transfer_timestamp": None}
+        for row in self.archive.scan(user_id=user_id, upto_id=archived_upto):
+            totals["total_transfers"] += 1
+            totals["sent_count"] += row["source_id"] == user_id
+            totals["received_count"] += row["dest_id"] == user_id
+            if totals["first_transfer_timestamp"] is None or row["timestamp"] < totals["first_transfer_timestamp"]:
+                totals["first_transfer_timestamp"] = row["timestamp"]
+            if totals["last_transfer_timestamp"] is None or row["timestamp"] > totals["last_transfer_timestamp"]:
+                totals["last_transfer_timestamp"] = row["timestamp"]
+        return totals
+
+class BalanceSnapshotModel:
+    def __init__(self, db_connection: DatabaseConnection, transfers: Optional[TransferModel] = None):
+        self.db = db_connection
+        self.transfers = transfers
+
+    async def latest_timestamp(self) -> Optional[int]:
+        async with self.db as cursor:
+            await cursor.execute("SELECT MAX(timestamp) AS timestamp FROM balance_snapshot")
+            result = await cursor.fetchone()
+            return result['timestamp'] if result else None
+
+    async def take(self, batch_size: int = 1000) -> list[BalanceSnapshot]:
+        if self.db.in_transaction:
+            # START TRANSACTION below would implicitly commit the caller's transaction
+            raise RuntimeError("Balance snapshots must be taken outside a transaction.")
+        snapshots = []
+        async with self.db as cursor:
+            # One consistent read view: every transfer commits together with its balance
+            # updates, so the balances read here are exactly those after transfer_id.
+            # Unsettled deferred gas is added back: until its settlement transfer exists it
+            # is replayed from gas_charge, so entries hold balances as the transfers imply.
+            await cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            await cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            await cursor.execute("SELECT COALESCE(MAX(transfer_id), 0) AS transfer_id FROM transfer")
+            transfer_id = (await cursor.fetchone())['transfer_id']
+            timestamp = int(time())
+
+            await cursor.execute("SELECT currency_id FROM currency ORDER BY currency_id")
+            currency_ids = [row['currency_id'] for row in await cursor.fetchall()]
+            for currency_id in currency_ids:
+                await cursor.execute(
+                    "SELECT user_id, amount FROM balance WHERE currency_id = %s AND user_id <> %s AND amount > 0",
+                    (currency_id, SYSTEM_USER_ID)
+                )
+                balances = {row['user_id']: int(row['amount']) for row in await cursor.fetchall()}
+                await cursor.execute(
+                    "SELECT user_id, SUM(amount) AS amount FROM gas_charge WHERE currency_id = %s AND settled_at IS NULL GROUP BY user_id",
+                    (currency_id,)
+                )
+                for row in await cursor.fetchall():
+                    balances[row['user_id']] = balances.get(row['user_id'], 0) + int(row['amount'])
+                entries = sorted(balances.items())
+                total = sum(amount for _, amount in entries)
+                await cursor.execute(
+                    "INSERT INTO balance_snapshot (currency_id, transfer_id, timestamp, holders, total) VALUES (%s, %s, %s, %s, %s)",
+                    (currency_id, transfer_id, timestamp, len(entries), total)
+                )
+                snapshot_id = cursor.lastrowid
+                for i in range(0, len(entries), batch_size):
+                    await cursor.executemany(
+                        "INSERT INTO balance_snapshot_entry (snapshot_id, user_id, amount) VALUES (%s, %s, %s)",
+                        [(snapshot_id, user_id, amount) for user_id, amount in entries[i:i + batch_size]]
+                    )
+                snapshots.append(BalanceSnapshot(
+                    snapshot_id=snapshot_id, currency_id=currency_id, transfer_id=transfer_id,
+                    timestamp=timestamp, holders=len(entries), total=total
+                ))
+        return snapshots
+
+    async def _nearest(self, cursor, currency_id: int, timestamp: int) -> Optional[dict]:
+        await cursor.execute(
+            "SELECT * FROM balance_snapshot WHERE currency_id = %s AND timestamp <= %s ORDER BY timestamp DESC LIMIT 1",
+            (currency_id, timestamp)
+        )
+        before = await cursor.fetchone()
+        await cursor.execute(
+            "SELECT * FROM balance_snapshot WHERE currency_id = %s AND timestamp > %s ORDER BY timestamp ASC LIMIT 1",
+            (currency_id, timestamp)
+        )
+        after = await cursor.fetchone()
+        if before and after:
+            return before if timestamp - before['timestamp'] <= after['timestamp'] - timestamp else after
+        return before or after
+
+    async def _net_inflow(self, cursor, user_id: int, currency_id: int, snapshot: Optional[dict], timestamp: int) -> int:
+        # Received minus sent for the transfers separating the snapshot from `timestamp`:
+        # replayed forward from an earlier snapshot, or unwound from a later one.
+        if snapshot is None:
+            window, params = "transfer_id > 0 AND timestamp <= %s", (timestamp,)
+            archived = dict(upto_timestamp=timestamp)
+        elif snapshot['timestamp'] <= timestamp:
+            window, params = "transfer_id > %s AND timestamp <= %s", (snapshot['transfer_id'], timestamp)
+            archived = dict(after_id=snapshot['transfer_id'], upto_timestamp=timestamp)
+        else:
+            window, params = "transfer_id <= %s AND timestamp > %s", (snapshot['transfer_id'], timestamp)
+            archived = dict(upto_id=snapshot['transfer_id'], after_timestamp=timestamp)
+
+        # Archived transfers are replayed from the archive; hot rows it already holds are skipped
+        archived_upto = self.transfers.archived_upto() if self.transfers else 0
+        archived_inflow = 0
+        if archived_upto:
+            window += " AND transfer_id > %s"
+            params += (archived_upto,)
+            archived['upto_id'] = min(archived.get('upto_id', archived_upto), archived_upto)
+            archived_inflow = await self.transfers.archived_inflow(user_id, currency_id, **archived)
+
+        totals = []
+        for column, index in (("dest_id", "dest_transfer"), ("source_id", "source_transfer")):
+            hint = self.transfers.index_hint(index) if self.transfers else f" USE INDEX ({index})"
+            await cursor.execute(
+                f"SELECT COALESCE(SUM(amount), 0) AS total FROM transfer{hint} WHERE {column} = %s AND {window} AND currency_id = %s",
+                (user_id,) + params + (currency_id,)
+            )
+            totals.append(int((await cursor.fetchone())['total']))
+        inflow = totals[0] - totals[1] + archived_inflow
+        return -inflow if snapshot and snapshot['timestamp'] > timestamp else inflow
+
+    async def _pending_gas(self, cursor, user_id: Optional[int], currency_id: int, timestamp: int) -> int:
+        # Deferred gas already taken from balances at `timestamp` but not yet settled as a transfer
+        user_filter, params = ("AND user_id = %s", (user_id,)) if user_id is not None else ("", ())
+        await cursor.execute(
+            f"SELECT COALESCE(SUM(amount), 0) AS total FROM gas_charge WHERE currency_id = %s {user_filter} "
+            "AND timestamp <= %s AND (settled_at IS NULL OR settled_at > %s)",
+            (currency_id,) + params + (timestamp, timestamp)
+        )
+        return int((await cursor.fetchone())['total'])
+
+    async def balance_at(self, user_id: int, currency_id: int, timestamp: int) -> tuple[int, Optional[int]]:
+        async with self.db.read as cursor:
+            snapshot = await self._nearest(cursor, currency_id, timestamp)
+            base = 0
+            if snapshot:
+                await cursor.execute(
+                    "SELECT amount FROM balance_snapshot_entry WHERE snapshot_id = %s AND user_id = %s",
+                    (snapshot['snapshot_id'], user_id)
+                )
+                result = await cursor.fetchone()
+                base = int(result['amount']) if result else 0
+            amount = base + await self._net_inflow(cursor, user_id, currency_id, snapshot, timestamp)
+            amount -= await self._pending_gas(cursor, user_id, currency_id, timestamp)
+            return amount, snapshot['snapshot_id'] if snapshot else None
+
+    async def circulating_at(self, currency_id: int, timestamp: int) -> tuple[int, Optional[int]]:
+        # Balances held by accounts only move in or out of circulation through the system account
+        async with self.db.read as cursor:
+            snapshot = await self._nearest(cursor, currency_id, timestamp)
+            base = int(snapshot['total']) if snapshot else 0
+            amount = base - await self._net_inflow(cursor, SYSTEM_USER_ID, currency_id, snapshot, timestamp)
+            amount -= await self._pending_gas(cursor, None, currency_id, timestamp)
+            return amount, snapshot['snapshot_id'] if snapshot else None
 
 class ContractHistoryModel:
     def __init__(self, db_connection: DatabaseConnection):
@@ -637,10 +1398,10 @@ class ContractHistoryModel:
         )
 
     async def get_for_user(self, user_id: int) -> list[ContractHistory]:
-        async with self.db as cursor:
+        async with self.db.read as cursor:
             await cursor.execute("SELECT * FROM contract_history WHERE user_id = %s ORDER BY created_at DESC", (user_id,))
             results = await cursor.fetchall()
-            return [ContractHistory(**row) for row in results]
+            return hydrate_all(ContractHistory, results)
 
 class AllowanceModel:
     def __init__(self, db_connection: DatabaseConnection):
@@ -722,4 +1483,36 @@ class DiscordPermissionModel:
          async with self.db as cursor:
             await cursor.execute("SELECT * FROM discord_permissions WHERE guild_id = %s", (guild_id,))
             results = await cursor.fetchall()
-            return [DiscordPermission(**row) for row in results]
+            return hydrate_all(DiscordPermission, results)
+
+class GasChargeModel:
+    """Gas charged in deferred settlement: one row per execution instead of a transfer, settled
+    later as one transfer per user and currency for each closed period."""
+
+    def __init__(self, db_connection: DatabaseConnection, period: int = 3600):
+        self.db = db_connection
+        self.period = period
+
+    def period_start(self, timestamp: int) -> int:
+        return timestamp - timestamp % self.period
+
+    async def record(self, cursor, execution_id: int, user_id: int, currency_id: int, amount: int):
+        await cursor.execute(
+            "INSERT INTO gas_charge (execution_id, user_id, currency_id, amount, timestamp) VALUES (%s, %s, %s, %s, %s)",
+            (execution_id, user_id, currency_id, amount, int(time()))
+        )
+
+    async def lock_unsettled(self, cursor, before: int) -> dict[tuple[int, int], int]:
+        """Locks the unsettled charges made before ``before`` and returns their totals per (user_id, currency_id)."""
+        await cursor.execute(
+            "SELECT user_id, currency_id, amount FROM gas_charge WHERE settled_at IS NULL AND timestamp < %s ORDER BY execution_id FOR UPDATE",
+            (before,)
+        )
+        totals: dict[tuple[int, int], int] = {}
+        for row in await cursor.fetchall():
+            key = (row["user_id"], row["currency_id"])
+            totals[key] = totals.get(key, 0) + int(row["amount"])
+        return totals
+
+    async def mark_settled(self, cursor, before: int, settled_at: int):
+        await cursor.execute("UPDATE gas_charge SET settled_at = %s WHERE settled_at IS NULL AND timestamp < %s", (settled_at, before))
@@ -0,0 +1,32 @@
+import base64
+import json
+from typing import Optional
+
+from .structs import Transfer
+
+TRANSFER_SORT_KEYS = ("transfer_id", "timestamp", "amount")
+
+def encode_cursor(sort_by: str, sort_order: str, value: int, transfer_id: int) -> str:
+    raw = json.dumps([sort_by, sort_order, value, transfer_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(token: str) -> tuple[str, str, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        sort_by, sort_order, value, transfer_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor.")
+    if sort_by not in TRANSFER_SORT_KEYS or sort_order not in ("ASC", "DESC") \
+            or type(value) is not int or type(transfer_id) is not int:
+        raise ValueError("Invalid pagination cursor.")
+    return sort_by, sort_order, value, transfer_id
+
+def next_transfer_cursor(transfers: list[Transfer], limit: int, sort_by: str = "transfer_id", sort_order: str = "desc") -> Optional[str]:
+    # A short page means there is nothing after it
+    if not transfers or len(transfers) < limit:
+        return None
+    if sort_by not in TRANSFER_SORT_KEYS:
+        sort_by = "transfer_id"
+    sort_order = "ASC" if sort_order.upper() == "ASC" else "DESC"
+    last = transfers[-1]
+    return encode_cursor(sort_by, sort_order, getattr(last, sort_by), last.transfer_id)
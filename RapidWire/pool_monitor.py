@@ -0,0 +1,154 @@
+import asyncio
+from collections import Counter, defaultdict, deque
+from time import monotonic, time
+from typing import Optional
+
+import aiomysql
+
+from .metrics import Histogram
+
+# resize_pool relies on aiomysql.Pool internals; the releases it has been checked against
+RESIZABLE_AIOMYSQL = ("0.2.", "0.3.")
+
+class PoolMonitor:
+    """Acquire/hold/release timings per call site for one aiomysql pool.
+
+    Call sites are the ``Class.method`` that opened the outermost ``async with db``
+    block, so a slow contract execution holding connections shows up by name next
+    to the transfers waiting behind it.
+    """
+
+    def __init__(self, pool: aiomysql.Pool, max_events: int = 100):
+        self.pool = pool
+        self.wait: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.hold: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.release: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.exhausted: Counter[str] = Counter()
+        self.events: deque[dict] = deque(maxlen=max_events)
+        self.waiting = 0
+        self.resizes = 0
+        self._held: dict[object, tuple[str, float]] = {}
+        self._floor = getattr(pool, "maxsize", 0)
+        self._idle_intervals = 0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_acquires = 0
+        self._window_wait = 0.0
+        self._window_peak = len(self._held)
+
+    @property
+    def in_use(self) -> int:
+        return len(self._held)
+
+    def acquiring(self, site: str) -> float:
+        maxsize = getattr(self.pool, "maxsize", 0)
+        if maxsize and getattr(self.pool, "freesize", 1) == 0 and self.pool.size >= maxsize:
+            self.exhausted[site] += 1
+            self.events.append({
+                "timestamp": time(),
+                "site": site,
+                "waiting": self.waiting + 1,
+                "holders": dict(Counter(holder for holder, _ in self._held.values()))
+            })
+        self.waiting += 1
+        return monotonic()
+
+    def acquire_failed(self):
+        self.waiting -= 1
+
+    def acquired(self, site: str, started: float) -> object:
+        now = monotonic()
+        self.waiting -= 1
+        self.wait[site].observe(now - started)
+        self._window_acquires += 1
+        self._window_wait += now - started
+        token = object()
+        self._held[token] = (site, now)
+        self._window_peak = max(self._window_peak, len(self._held))
+        return token
+
+    def releasing(self) -> float:
+        return monotonic()
+
+    def released(self, token: object, started: float):
+        held = self._held.pop(token, None)
+        if held is None:
+            return
+        site, acquired_at = held
+        now = monotonic()
+        self.hold[site].observe(now - acquired_at)
+        self.release[site].observe(now - started)
+
+    def longest_held(self) -> Optional[dict]:
+        if not self._held:
+            return None
+        site, acquired_at = min(self._held.values(), key=lambda held: held[1])
+        return {"site": site, "seconds": monotonic() - acquired_at}
+
+    def snapshot(self) -> dict:
+        return {
+            "size": getattr(self.pool, "size", None),
+            "maxsize": getattr(self.pool, "maxsize", None),
+            "free": getattr(self.pool, "freesize", None),
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "resizes": self.resizes,
+            "longest_held": self.longest_held(),
+            "exhausted": dict(self.exhausted),
+            "recent_exhaustion": list(self.events),
+            "wait": {site: hist.to_dict() for site, hist in self.wait.items()},
+            "hold": {site: hist.to_dict() for site, hist in self.hold.items()},
+            "release": {site: hist.to_dict() for site, hist in self.release.items()},
+        }
+
+    def adjust(self, ceiling: int, grow_wait: float, idle_intervals: int) -> int:
+        """One sizing decision from the interval since the last call; returns the new maxsize."""
+        maxsize = self.pool.maxsize
+        mean_wait = self._window_wait / self._window_acquires if self._window_acquires else 0.0
+        target = maxsize
+        if mean_wait >= grow_wait and maxsize < ceiling:
+            target = min(ceiling, maxsize + max(1, maxsize // 4))
+            self._idle_intervals = 0
+        elif self._window_peak < maxsize and not self.waiting:
+            self._idle_intervals += 1
+            if self._idle_intervals >= idle_intervals and maxsize > self._floor:
+                target = maxsize - 1
+                self._idle_intervals = 0
+        else:
+            self._idle_intervals = 0
+        self._reset_window()
+        if target != maxsize:
+            target = resize_pool(self.pool, target)
+            self.resizes += target != maxsize
+        return target
+
+    async def run(self, interval: float, ceiling: int, grow_wait: float, idle_intervals: int):
+        while True:
+            await asyncio.sleep(interval)
+            self.adjust(ceiling, grow_wait, idle_intervals)
+
+def supports_resize(pool: aiomysql.Pool) -> bool:
+    """Whether resize_pool can work on ``pool``: a known aiomysql release with the expected internals."""
+    if not aiomysql.__version__.startswith(RESIZABLE_AIOMYSQL):
+        return False
+    free = getattr(pool, "_free", None)
+    return isinstance(free, deque) and free.maxlen is not None \
+        and asyncio.iscoroutinefunction(getattr(pool, "_wakeup", None)) \
+        and all(hasattr(pool, name) for name in ("size", "freesize", "minsize", "maxsize"))
+
+def resize_pool(pool: aiomysql.Pool, maxsize: int) -> int:
+    # aiomysql has no public resize: maxsize is the maxlen of the free-connection deque.
+    # Never shrink below the connections currently out, or releases would silently
+    # push idle ones off the deque without closing them.
+    in_use = pool.size - pool.freesize
+    maxsize = max(maxsize, in_use, pool.minsize, 1)
+    grew = maxsize > pool.maxsize
+    free = list(pool._free)
+    while free and in_use + len(free) > maxsize:
+        free.pop(0).close()
+    pool._free = deque(free, maxlen=maxsize)
+    if grew:
+        # Waiters retry the size check and open the new connections
+        asyncio.ensure_future(pool._wakeup())
+    return maxsize
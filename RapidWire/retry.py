@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import random
+from time import monotonic
+from typing import Optional
+
+import aiomysql
+
+from .config import Config
+from .exceptions import TransactionConflict
+from .metrics import REGISTRY
+
+# MySQL rolls back the whole transaction on a deadlock and only the statement on a lock
+# wait timeout; DatabaseConnection rolls back the rest, so either way nothing was applied.
+RETRYABLE_ERRORS = {1213: "deadlock", 1205: "lock_wait_timeout"}
+
+RETRIES = REGISTRY.counter(
+    "rapidwire_transaction_retries_total", "Transactions retried after lock contention, by operation and error",
+    ("operation", "error")
+)
+RETRIES_EXHAUSTED = REGISTRY.counter(
+    "rapidwire_transaction_retries_exhausted_total", "Operations that gave up after the retry budget, by operation",
+    ("operation",)
+)
+
+def retryable_error(error: BaseException) -> Optional[int]:
+    """The retryable MySQL error code behind ``error``, following the chain the core's wrapping leaves."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, aiomysql.Error) and error.args and error.args[0] in RETRYABLE_ERRORS:
+            return error.args[0]
+        error = error.__cause__ or error.__context__
+    return None
+
+def backoff(attempt: int, base_delay: float, max_delay: float) -> float:
+    # Full jitter: concurrent losers of the same lock spread out instead of colliding again
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+def retry_transaction(method):
+    """Re-runs a core write operation that lost a deadlock or lock wait, as a whole.
+
+    Only the outermost unit retries: when the caller already holds a transaction (or
+    passes its cursor) the error propagates to whoever owns it. The decorated method
+    must do its writes in one transaction, so a failed attempt left nothing behind;
+    on_commit callbacks of a failed attempt never ran.
+    """
+    operation = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if self.db.in_transaction or kwargs.get("cursor") is not None:
+            return await method(self, *args, **kwargs)
+
+        config = getattr(self.Config, 'Retry', Config.Retry)
+        attempts = getattr(config, 'attempts', Config.Retry.attempts)
+        base_delay = getattr(config, 'base_delay', Config.Retry.base_delay)
+        max_delay = getattr(config, 'max_delay', Config.Retry.max_delay)
+        deadline = monotonic() + getattr(config, 'budget', Config.Retry.budget)
+        attempt = 1
+        while True:
+            try:
+                return await method(self, *args, **kwargs)
+            except Exception as e:
+                code = retryable_error(e)
+                if code is None:
+                    raise
+                delay = backoff(attempt, base_delay, max_delay)
+                if attempt >= attempts or monotonic() + delay > deadline:
+                    RETRIES_EXHAUSTED.inc(operation=operation)
+                    raise TransactionConflict(f"{operation} kept conflicting with concurrent transactions: {e}") from e
+                RETRIES.inc(operation=operation, error=RETRYABLE_ERRORS[code])
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    return wrapper
@@ -0,0 +1,190 @@
+from typing import Optional
+
+from .pagination import TRANSFER_SORT_KEYS, decode_cursor
+
+# Secondary indexes on `transfer`, keyed by (equality column, sort column).
+# InnoDB appends the primary key to every secondary index, so (x, timestamp)
+# is also ordered by transfer_id within equal timestamps.
+TRANSFER_INDEXES = {
+    ("source_id", "transfer_id"): "source_transfer",
+    ("source_id", "timestamp"): "source_timestamp",
+    ("dest_id", "transfer_id"): "dest_transfer",
+    ("dest_id", "timestamp"): "dest_timestamp",
+    ("currency_id", "transfer_id"): "currency_transfer",
+    ("currency_id", "timestamp"): "currency_timestamp",
+}
+
+def choose_transfer_index(equalities: dict[str, int], sort_by: str, has_time_range: bool = False,
+                          available: Optional[frozenset[str]] = None) -> Optional[str]:
+    """The index to hint for a transfer scan; None when it is not among the ``available`` indexes."""
+    index = None
+    for column in ("source_id", "dest_id", "currency_id"):
+        if column in equalities:
+            # Sorting by amount has no index; narrow the scan with the equality column instead
+            index = TRANSFER_INDEXES.get((column, sort_by)) or TRANSFER_INDEXES[(column, "transfer_id")]
+            break
+    else:
+        if sort_by == "timestamp" or (has_time_range and sort_by != "transfer_id"):
+            index = "timestamp"
+    if index is not None and available is not None and index not in available:
+        # A hint naming a missing index fails the query (MySQL error 1176); let the optimizer choose
+        return None
+    return index
+
+def _branch(equalities: dict[str, int], extra_conditions: list[str], extra_params: list, input_data: Optional[str],
+            sort_by: str, seek: Optional[tuple[str, list]], has_time_range: bool,
+            excluded_source: Optional[int] = None, indexes: Optional[frozenset[str]] = None) -> tuple[str, list]:
+    index = choose_transfer_index(equalities, sort_by, has_time_range, indexes)
+    table = f"transfer t USE INDEX ({index})" if index else "transfer t"
+
+    query = f"SELECT t.* FROM {table}"
+    conditions = []
+    params = []
+    if input_data is not None:
+        query += " JOIN execution e ON t.execution_id = e.execution_id"
+        conditions.append("e.input_data = %s")
+        params.append(input_data)
+    for column, value in equalities.items():
+        conditions.append(f"t.{column} = %s")
+        params.append(value)
+    if excluded_source is not None:
+        # Self-transfers already appear in the source branch
+        conditions.append("t.source_id <> %s")
+        params.append(excluded_source)
+    conditions.extend(extra_conditions)
+    params.extend(extra_params)
+    if seek:
+        conditions.append(seek[0])
+        params.extend(seek[1])
+
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    return query, params
+
+def _range_conditions(start_timestamp: Optional[int], end_timestamp: Optional[int],
+                      min_amount: Optional[int], max_amount: Optional[int]) -> tuple[list[str], list]:
+    conditions = []
+    params = []
+    if start_timestamp is not None:
+        conditions.append("t.timestamp >= %s")
+        params.append(start_timestamp)
+    if end_timestamp is not None:
+        conditions.append("t.timestamp <= %s")
+        params.append(end_timestamp)
+    if min_amount is not None:
+        conditions.append("t.amount >= %s")
+        params.append(min_amount)
+    if max_amount is not None:
+        conditions.append("t.amount <= %s")
+        params.append(max_amount)
+    return conditions, params
+
+def _equalities(source_id: Optional[int], dest_id: Optional[int], currency_id: Optional[int]) -> dict[str, int]:
+    equalities = {}
+    if source_id is not None:
+        equalities["source_id"] = source_id
+    if dest_id is not None:
+        equalities["dest_id"] = dest_id
+    if currency_id is not None:
+        equalities["currency_id"] = currency_id
+    return equalities
+
+def _order_by(sort_by: str, sort_order: str, prefix: str = "") -> str:
+    # transfer_id breaks ties so that every row has a unique position for the seek predicate
+    if sort_by == "transfer_id":
+        return f"ORDER BY {prefix}transfer_id {sort_order}"
+    return f"ORDER BY {prefix}{sort_by} {sort_order}, {prefix}transfer_id {sort_order}"
+
+def plan_transfer_search(
+    source_id: Optional[int] = None,
+    dest_id: Optional[int] = None,
+    currency_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    start_timestamp: Optional[int] = None,
+    end_timestamp: Optional[int] = None,
+    min_amount: Optional[int] = None,
+    max_amount: Optional[int] = None,
+    input_data: Optional[str] = None,
+    page: int = 1,
+    limit: int = 10,
+    sort_by: str = "transfer_id",
+    sort_order: str = "desc",
+    after: Optional[str] = None,
+    indexes: Optional[frozenset[str]] = None
+) -> tuple[str, tuple]:
+    if sort_by not in TRANSFER_SORT_KEYS:
+        sort_by = "transfer_id"
+    sort_order = "ASC" if sort_order.upper() == "ASC" else "DESC"
+    offset = (page - 1) * limit
+
+    conditions, params = _range_conditions(start_timestamp, end_timestamp, min_amount, max_amount)
+    has_time_range = start_timestamp is not None or end_timestamp is not None
+
+    seek = None
+    if after is not None:
+        cursor_sort_by, cursor_sort_order, value, last_id = decode_cursor(after)
+        if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order):
+            raise ValueError("Pagination cursor does not match the requested sort order.")
+        op = ">" if sort_order == "ASC" else "<"
+        if sort_by == "transfer_id":
+            seek = (f"t.transfer_id {op} %s", [last_id])
+        else:
+            seek = (f"(t.{sort_by} {op} %s OR (t.{sort_by} = %s AND t.transfer_id {op} %s))", [value, value, last_id])
+        offset = 0
+
+    equalities = _equalities(source_id, dest_id, currency_id)
+
+    if user_id is not None and source_id is None and dest_id is None:
+        # `source_id = u OR dest_id = u` cannot use an index together with the sort, so
+        # read the top rows of each side in index order and merge them.
+        branch_limit = offset + limit
+        branches = []
+        branch_params = []
+        for column, excluded_source in (("source_id", None), ("dest_id", user_id)):
+            query, branch_args = _branch(
+                {column: user_id, **equalities}, conditions, params, input_data,
+                sort_by, seek, has_time_range, excluded_source, indexes
+            )
+            branches.append(f"SELECT * FROM ({query} {_order_by(sort_by, sort_order, 't.')} LIMIT %s) AS {column[0]}")
+            branch_params.extend(branch_args + [branch_limit])
+        query = f"{' UNION ALL '.join(branches)} {_order_by(sort_by, sort_order)} LIMIT %s OFFSET %s"
+        return query, tuple(branch_params + [limit, offset])
+
+    if user_id is not None:
+        conditions.append("(t.source_id = %s OR t.dest_id = %s)")
+        params.extend([user_id, user_id])
+    query, query_params = _branch(equalities, conditions, params, input_data, sort_by, seek, has_time_range, indexes=indexes)
+    query = f"{query} {_order_by(sort_by, sort_order, 't.')} LIMIT %s OFFSET %s"
+    return query, tuple(query_params + [limit, offset])
+
+def plan_transfer_export(
+    source_id: Optional[int] = None,
+    dest_id: Optional[int] = None,
+    currency_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    start_timestamp: Optional[int] = None,
+    end_timestamp: Optional[int] = None,
+    min_amount: Optional[int] = None,
+    max_amount: Optional[int] = None,
+    input_data: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    indexes: Optional[frozenset[str]] = None
+) -> tuple[str, tuple]:
+    # Exports always walk transfer_id upwards, so the last id a consumer has seen
+    # is a checkpoint it can resume from with `after_id`; the export itself pages the same way.
+    conditions, params = _range_conditions(start_timestamp, end_timestamp, min_amount, max_amount)
+    if user_id is not None:
+        conditions.append("(t.source_id = %s OR t.dest_id = %s)")
+        params.extend([user_id, user_id])
+    seek = ("t.transfer_id > %s", [after_id]) if after_id is not None else None
+
+    query, query_params = _branch(
+        _equalities(source_id, dest_id, currency_id), conditions, params, input_data,
+        "transfer_id", seek, has_time_range=False, indexes=indexes
+    )
+    query = f"{query} {_order_by('transfer_id', 'ASC', 't.')}"
+    if limit is not None:
+        query += " LIMIT %s"
+        query_params.append(limit)
+    return query, tuple(query_params)
@@ -0,0 +1,392 @@
+import asyncio
+import itertools
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional
+
+import aiomysql
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# SQLite integers are signed 64-bit. Larger values are refused the way MySQL refuses a value
+# outside a column's range, rather than being stored as an approximate REAL.
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+_PLACEHOLDER = re.compile(r"%s")
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\b", re.I)
+_USE_INDEX = re.compile(r"\s+(?:USE|FORCE)\s+INDEX\s*\([^)]*\)", re.I)
+_INSERT_IGNORE = re.compile(r"^\s*INSERT\s+IGNORE\b", re.I)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I)
+_VALUES_REF = re.compile(r"\bVALUES\s*\(\s*(`?\w+`?)\s*\)", re.I)
+_NO_OP = re.compile(r"^\s*(?:SET\s+(?:SESSION\s+)?TRANSACTION\b|START\s+TRANSACTION\b|BEGIN\b)", re.I)
+_SHOW_REPLICA = re.compile(r"^\s*SHOW\s+(?:REPLICA|SLAVE)\s+STATUS\b", re.I)
+
+# Statements answered without running anything: transactions are begun by the connection
+NO_OP = ""
+REPLICA_STATUS = "replica_status"
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> str:
+    """Rewrites one statement of the MySQL dialect used by the models into SQLite."""
+    if _NO_OP.match(sql):
+        return NO_OP
+    if _SHOW_REPLICA.match(sql):
+        return REPLICA_STATUS
+    sql = _FOR_UPDATE.sub("", sql)
+    sql = _USE_INDEX.sub("", sql)
+    sql = _INSERT_IGNORE.sub("INSERT OR IGNORE", sql)
+    match = _ON_DUPLICATE.search(sql)
+    if match:
+        # Unqualified columns keep meaning the existing row; VALUES(col) is the proposed one
+        update = _VALUES_REF.sub(r"excluded.\1", sql[match.end():])
+        sql = f"{sql[:match.start()]}ON CONFLICT DO UPDATE SET{update}"
+    return _PLACEHOLDER.sub("?", sql)
+
+_CREATE_TABLE = re.compile(r"CREATE TABLE `(\w+)` \((.*?)\n\)[^;]*;", re.S)
+_ALTER_TABLE = re.compile(r"ALTER TABLE `(\w+)`\s+(.*?);", re.S)
+_INSERT = re.compile(r"^INSERT INTO .*?;", re.S | re.M)
+_COMMENT = re.compile(r"\s+COMMENT\s+'(?:[^'\\]|\\.|'')*'")
+_COLUMN = re.compile(r"`(\w+)`\s+(\w+)(?:\([^)]*\))?(?:\s+UNSIGNED)?(.*)", re.I)
+_KEY = re.compile(r"ADD\s+(PRIMARY KEY|UNIQUE KEY `\w+`|KEY `\w+`)\s*\(([^)]*)\)", re.I)
+_AUTO_INCREMENT = re.compile(r"MODIFY\s+`(\w+)`.*AUTO_INCREMENT", re.I)
+_TYPES = {
+    "tinyint": "INTEGER", "smallint": "INTEGER", "int": "INTEGER", "bigint": "INTEGER", "decimal": "INTEGER",
+    "char": "TEXT", "varchar": "TEXT", "text": "TEXT", "enum": "TEXT",
+    "blob": "BLOB", "binary": "BLOB", "varbinary": "BLOB",
+}
+
+def translate_schema(dump: str) -> list[str]:
+    """Turns the phpMyAdmin dump in rapid-wire.sql into idempotent SQLite DDL."""
+    dump = "\n".join(line for line in dump.splitlines() if not line.startswith("--"))
+    primary: dict[str, str] = {}
+    auto_increment: dict[str, str] = {}
+    indexes: list[str] = []
+    for table, body in _ALTER_TABLE.findall(dump):
+        for kind, columns in _KEY.findall(body):
+            columns = columns.replace(" ", "")
+            if kind.upper() == "PRIMARY KEY":
+                primary[table] = columns
+            else:
+                unique = "UNIQUE " if kind.upper().startswith("UNIQUE") else ""
+                name = kind.split("`")[1]
+                indexes.append(f"CREATE {unique}INDEX IF NOT EXISTS `{table}_{name}` ON `{table}` ({columns})")
+        for column in _AUTO_INCREMENT.findall(body):
+            auto_increment[table] = column
+
+    statements = []
+    for table, body in _CREATE_TABLE.findall(dump):
+        definitions = []
+        for line in body.strip().splitlines():
+            line = _COMMENT.sub("", line.strip().rstrip(","))
+            column = _COLUMN.match(line)
+            if not column:
+                definitions.append(line)
+                continue
+            name, kind, rest = column.groups()
+            if auto_increment.get(table) == name:
+                definitions.append(f"`{name}` INTEGER PRIMARY KEY AUTOINCREMENT")
+            else:
+                definitions.append(f"`{name}` {_TYPES[kind.lower()]}{rest}")
+        if table in primary and table not in auto_increment:
+            definitions.append(f"PRIMARY KEY ({primary[table]})")
+        statements.append(f"CREATE TABLE IF NOT EXISTS `{table}` (\n  " + ",\n  ".join(definitions) + "\n)")
+    statements.extend(indexes)
+    statements.extend(statement.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1).rstrip(";") for statement in _INSERT.findall(dump))
+    return statements
+
+def _greatest(*values):
+    return None if None in values else max(values)
+
+def _least(*values):
+    return None if None in values else min(values)
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+def _unlock(fd: int):
+    if fcntl is None:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    os.close(fd)
+
+class _NamedLocks:
+    """GET_LOCK for SQLite: one lock file per name, so it also excludes other processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.held: dict[str, tuple[int, int]] = {}
+
+    def get(self, connection_id: int, name: str, timeout) -> int:
+        if name in self.held:
+            return int(self.held[name][0] == connection_id)
+        fd = os.open(f"{self.path}-lock-{name}", os.O_RDWR | os.O_CREAT, 0o600)
+        if not _try_lock(fd):
+            os.close(fd)
+            return 0
+        self.held[name] = (connection_id, fd)
+        return 1
+
+    def release(self, connection_id: int, name: str) -> Optional[int]:
+        holder = self.held.get(name)
+        if holder is None or holder[0] != connection_id:
+            return 0 if holder else None
+        del self.held[name]
+        _unlock(holder[1])
+        return 1
+
+    def used_by(self, name: str) -> Optional[int]:
+        holder = self.held.get(name)
+        return holder[0] if holder else None
+
+def _param(value):
+    if isinstance(value, Decimal):
+        value = int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, int) and not isinstance(value, bool) and not INT64_MIN <= value <= INT64_MAX:
+        raise aiomysql.DataError(1264, f"Out of range value {value}: the SQLite backend stores 64-bit integers.")
+    return value
+
+def _params(args) -> tuple:
+    if args is None:
+        return ()
+    if not isinstance(args, (list, tuple)):
+        args = (args,)
+    return tuple(_param(value) for value in args)
+
+def _error(e: sqlite3.Error) -> aiomysql.Error:
+    # Same codes MySQL would report, so callers' error handling works unchanged
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        if "UNIQUE" in message or "PRIMARY KEY" in message:
+            return aiomysql.IntegrityError(1062, message)
+        if "NOT NULL" in message:
+            return aiomysql.IntegrityError(1048, message)
+        return aiomysql.OperationalError(3819, message)
+    if "locked" in message or "busy" in message:
+        return aiomysql.OperationalError(1205, message)
+    if isinstance(e, sqlite3.OperationalError):
+        return aiomysql.ProgrammingError(1064, message)
+    return aiomysql.OperationalError(2013, message)
+
+class SQLiteCursor:
+    def __init__(self, connection: "SQLiteConnection", unbuffered: bool = False):
+        self.connection = connection
+        self.unbuffered = unbuffered
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+        self._names: list[str] = []
+        self._rows: list[dict] = []
+        self._cursor: Optional[sqlite3.Cursor] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _dict(self, row) -> dict:
+        return dict(zip(self._names, row))
+
+    def _run(self, sql: str, args, many: bool):
+        connection = self.connection
+        statement = translate(sql)
+        self._rows, self._cursor = [], None
+        if statement == REPLICA_STATUS:
+            # Readers share the writer's file, so they are never behind. No transaction is
+            # begun: the lag check returns the connection without ending one.
+            self._names = ["Seconds_Behind_Source"]
+            self.description = (("Seconds_Behind_Source",) + (None,) * 6,)
+            self._rows, self.rowcount = [{"Seconds_Behind_Source": 0}], 1
+            return
+        try:
+            connection._begin()
+            if statement == NO_OP:
+                self.rowcount, self.description = 0, None
+                return
+            if many:
+                cursor = connection.raw.executemany(statement, [_params(row) for row in args])
+            else:
+                cursor = connection.raw.execute(statement, _params(args))
+        except sqlite3.Error as e:
+            raise _error(e) from e
+        self.rowcount, self.lastrowid, self.description = cursor.rowcount, cursor.lastrowid, cursor.description
+        if cursor.description is None:
+            return
+        self._names = [column[0] for column in cursor.description]
+        if self.unbuffered:
+            self._cursor = cursor
+        else:
+            self._rows = [self._dict(row) for row in cursor.fetchall()]
+            self.rowcount = len(self._rows)
+
+    async def execute(self, query, args=None):
+        await self.connection._call(self._run, query, args, False)
+        return self.rowcount
+
+    async def executemany(self, query, args):
+        if not args:
+            return None
+        await self.connection._call(self._run, query, args, True)
+        return self.rowcount
+
+    async def fetchone(self) -> Optional[dict]:
+        if self._cursor is not None:
+            row = await self.connection._call(self._cursor.fetchone)
+            return None if row is None else self._dict(row)
+        return self._rows.pop(0) if self._rows else None
+
+    async def fetchmany(self, size: int = 1) -> list[dict]:
+        if self._cursor is not None:
+            return [self._dict(row) for row in await self.connection._call(self._cursor.fetchmany, size)]
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    async def fetchall(self) -> list[dict]:
+        if self._cursor is not None:
+            return [self._dict(row) for row in await self.connection._call(self._cursor.fetchall)]
+        rows, self._rows = self._rows, []
+        return rows
+
+    async def close(self):
+        self._rows, self._cursor = [], None
+
+class _CursorContext:
+    # aiomysql's connection.cursor() is both awaited and used with `async with`
+    def __init__(self, cursor: SQLiteCursor):
+        self.cursor = cursor
+
+    def __await__(self):
+        async def ready():
+            return self.cursor
+        return ready().__await__()
+
+    async def __aenter__(self):
+        return self.cursor
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.cursor.close()
+
+class SQLiteConnection:
+    """One sqlite3 connection driven by its own thread, with the aiomysql calls the models use."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, path: str, writer: bool, locks: _NamedLocks, synchronous: str = "FULL"):
+        self.id = next(self._ids)
+        self.writer = writer
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rapidwire-sqlite")
+        self._reset = False
+        self.raw = self._executor.submit(self._open, path, locks, synchronous).result()
+
+    def _open(self, path: str, locks: _NamedLocks, synchronous: str) -> sqlite3.Connection:
+        raw = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        raw.execute("PRAGMA journal_mode = WAL")
+        raw.execute(f"PRAGMA synchronous = {synchronous}")
+        raw.execute("PRAGMA busy_timeout = 5000")
+        if not self.writer:
+            raw.execute("PRAGMA query_only = 1")
+        raw.create_function("GREATEST", -1, _greatest, deterministic=True)
+        raw.create_function("LEAST", -1, _least, deterministic=True)
+        raw.create_function("CONNECTION_ID", 0, lambda: self.id)
+        raw.create_function("GET_LOCK", 2, lambda name, timeout: locks.get(self.id, name, timeout))
+        raw.create_function("RELEASE_LOCK", 1, lambda name: locks.release(self.id, name))
+        raw.create_function("IS_USED_LOCK", 1, locks.used_by)
+        return raw
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _begin(self):
+        if self._reset:
+            self._end("ROLLBACK")
+            self._reset = False
+        if not self.raw.in_transaction:
+            # The writer takes the write lock up front, so a transaction that read a row
+            # can always write it; readers get a snapshot at their first read
+            self.raw.execute("BEGIN IMMEDIATE" if self.writer else "BEGIN")
+
+    def _end(self, statement: str):
+        if self.raw.in_transaction:
+            try:
+                self.raw.execute(statement)
+            except sqlite3.Error as e:
+                raise _error(e) from e
+
+    def cursor(self, cursor_class=None) -> _CursorContext:
+        unbuffered = cursor_class is not None and issubclass(cursor_class, aiomysql.SSCursor)
+        return _CursorContext(SQLiteCursor(self, unbuffered))
+
+    async def commit(self):
+        await self._call(self._end, "COMMIT")
+
+    async def rollback(self):
+        await self._call(self._end, "ROLLBACK")
+
+    def close(self):
+        # Called on an abandoned stream: discard its read view before the connection is reused
+        self._reset = True
+
+    def _shutdown(self):
+        self._end("ROLLBACK")
+        self.raw.close()
+
+    async def shutdown(self):
+        await self._call(self._shutdown)
+        self._executor.shutdown(wait=False)
+
+class SQLitePool:
+    """Fixed set of connections with the aiomysql.Pool surface used by DatabaseConnection."""
+
+    def __init__(self, connections: list[SQLiteConnection]):
+        self.connections = connections
+        self.minsize = self.maxsize = len(connections)
+        self._free: asyncio.Queue = asyncio.Queue()
+        for connection in connections:
+            self._free.put_nowait(connection)
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return len(self.connections)
+
+    @property
+    def freesize(self) -> int:
+        return self._free.qsize()
+
+    async def acquire(self) -> SQLiteConnection:
+        if self._closed:
+            raise aiomysql.OperationalError(2006, "Pool is closed")
+        return await self._free.get()
+
+    def release(self, connection: SQLiteConnection):
+        self._free.put_nowait(connection)
+
+    def close(self):
+        self._closed = True
+
+    async def wait_closed(self):
+        for connection in self.connections:
+            await connection.shutdown()
+
+async def open_sqlite(path: str, schema: str, readers: int = 4, synchronous: str = "FULL") -> tuple[SQLitePool, SQLitePool]:
+    """Opens (creating if needed) a database file; returns the single-writer pool and the reader pool."""
+    locks = _NamedLocks(path)
+    writer = await asyncio.to_thread(SQLiteConnection, path, True, locks, synchronous)
+    await writer._call(writer.raw.executescript, ";\n".join(translate_schema(schema)) + ";")
+    reader_connections = [await asyncio.to_thread(SQLiteConnection, path, False, locks, synchronous) for _ in range(readers)]
+    return SQLitePool([writer]), SQLitePool(reader_connections)
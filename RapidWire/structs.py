@@ -29,6 +29,19 @@ class Contract(BaseModel):
     cost: int
     max_cost: int
     locked_until: int
+    cost_min: int = 0
+    cost_max: Optional[int] = None
+
+class OpCost(BaseModel):
+    count: int
+    max_cost: Optional[int]
+
+class CostAnalysis(BaseModel):
+    min_cost: int
+    max_cost: Optional[int]
+    unbounded_loops: list[str]
+    external_calls: int
+    breakdown: dict[str, OpCost]
 
 class Claim(BaseModel):
     claim_id: int
@@ -71,6 +84,40 @@ class Transfer(BaseModel):
     amount: int
     timestamp: int
 
+class BalanceSnapshot(BaseModel):
+    snapshot_id: int
+    currency_id: int
+    transfer_id: int
+    timestamp: int
+    holders: int
+    total: int
+
+class HistoricalBalance(BaseModel):
+    user_id: int
+    currency_id: int
+    amount: int
+    timestamp: int
+    snapshot_id: Optional[int] = None
+
+class HistoricalSupply(BaseModel):
+    currency_id: int
+    circulating: int
+    timestamp: int
+    snapshot_id: Optional[int] = None
+
+class SupplyDiscrepancy(BaseModel):
+    currency_id: int
+    supply: int
+    held: int
+
+class UserCurrencyStats(BaseModel):
+    user_id: int
+    currency_id: int
+    sent_count: int
+    received_count: int
+    sent_amount: int
+    received_amount: int
+
 class ContractHistory(BaseModel):
     history_id: int
     execution_id: int
@@ -113,12 +160,40 @@ class LiquidityPool(BaseModel):
     reserve_b: int
     total_shares: int
 
+class PoolCandle(BaseModel):
+    pool_id: int
+    resolution: int
+    bucket_start: int
+    open: int
+    high: int
+    low: int
+    close: int
+    volume_a: int
+    volume_b: int
+    trade_count: int
+
 class LiquidityProvider(BaseModel):
     provider_id: int
     pool_id: int
     user_id: int
     shares: int
 
+class PortfolioEntry(BaseModel):
+    kind: Literal['balance', 'stake', 'liquidity']
+    currency_id: int
+    amount: int
+    value: Optional[int] = None
+    pool_id: Optional[int] = None
+    shares: Optional[int] = None
+
+class Portfolio(BaseModel):
+    user_id: int
+    reference_currency_id: int
+    total_value: int
+    unpriced_currency_ids: list[int]
+    entries: list[PortfolioEntry]
+    currencies: list[Currency]
+
 class ContractVariable(BaseModel):
     user_id: int
     key: str
@@ -0,0 +1,127 @@
+import re
+import sys
+from collections import Counter, deque
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter, time
+
+from .metrics import Histogram
+
+_request_trace = ContextVar("request_trace", default=None)
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_GROUP = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_GROUPS = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normalizes a statement so that calls differing only in values or list lengths aggregate together."""
+    sql = _STRING.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    sql = _GROUP.sub("(?+)", sql)
+    return _GROUPS.sub("(?+), ...", sql)
+
+class QueryStats:
+    __slots__ = ("count", "errors", "rows", "duration", "sites")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.duration = Histogram()
+        self.sites: Counter[str] = Counter()
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "duration": self.duration.to_dict(),
+            "sites": dict(self.sites),
+        }
+
+class RequestTrace:
+    """Statements run on behalf of one API request, summarized as a Server-Timing header."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.duration = 0.0
+        self.sites: Counter[str] = Counter()
+
+    def server_timing(self, top: int = 0) -> str:
+        # Call-site names are internal, so they are only listed when top is asked for
+        total = (perf_counter() - self.started) * 1000
+        entries = [f'db;dur={self.duration * 1000:.1f};desc="{self.queries} queries"']
+        for index, (site, seconds) in enumerate(self.sites.most_common(top)):
+            entries.append(f'db{index};dur={seconds * 1000:.1f};desc="{site}"')
+        entries.append(f"total;dur={total:.1f}")
+        return ", ".join(entries)
+
+def start_request_trace() -> RequestTrace:
+    trace = RequestTrace()
+    _request_trace.set(trace)
+    return trace
+
+class Tracer:
+    def __init__(self, slow_threshold: float = 0.5, max_slow: int = 100):
+        self.slow_threshold = slow_threshold
+        self.stats: dict[str, QueryStats] = {}
+        self.slow_queries: deque[dict] = deque(maxlen=max_slow)
+
+    def record(self, sql: str, seconds: float, rows: int, site: str, failed: bool = False):
+        key = fingerprint(sql)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = QueryStats()
+        stats.count += 1
+        stats.errors += failed
+        stats.rows += max(rows, 0)
+        stats.duration.observe(seconds)
+        stats.sites[site] += 1
+
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.queries += 1
+            trace.duration += seconds
+            trace.sites[site] += seconds
+
+        if self.slow_threshold and seconds >= self.slow_threshold:
+            self.slow_queries.append({"timestamp": time(), "fingerprint": key, "seconds": seconds, "rows": rows, "site": site})
+            print(f"Slow query ({seconds * 1000:.0f} ms, {rows} rows) in {site}: {key}")
+
+    def snapshot(self, limit: int = 50) -> list[dict]:
+        # Most expensive fingerprints first by total time spent
+        ranked = sorted(self.stats.items(), key=lambda item: item[1].duration.sum, reverse=True)
+        return [{"fingerprint": key, **stats.to_dict()} for key, stats in ranked[:limit]]
+
+class TracingCursor:
+    """Cursor proxy timing every statement; everything else is passed through."""
+
+    def __init__(self, cursor, tracer: Tracer):
+        self._cursor = cursor
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _traced(self, method, sql, args):
+        site = sys._getframe(2).f_code.co_qualname
+        started = perf_counter()
+        try:
+            result = await method(sql, args)
+        except BaseException:
+            self._tracer.record(sql, perf_counter() - started, 0, site, failed=True)
+            raise
+        self._tracer.record(sql, perf_counter() - started, self._cursor.rowcount, site)
+        return result
+
+    async def execute(self, query, args=None):
+        return await self._traced(self._cursor.execute, query, args)
+
+    async def executemany(self, query, args):
+        return await self._traced(self._cursor.executemany, query, args)
@@ -9,6 +9,7 @@ import hashlib
 
 from RapidWire import RapidWire, exceptions, structs
 from RapidWire.constants import INTEREST_RATE_SCALE
+from RapidWire.pagination import next_transfer_cursor
 
 Rapid: RapidWire = None
 SYSTEM_USER_ID = 0
@@ -139,14 +140,39 @@ async def balance(interaction: discord.Interaction, user: Optional[User] = None,
     target_user = user or interaction.user
     await interaction.response.defer(thinking=True)
     try:
-        user_model = Rapid.get_user(target_user.id)
-        balances = await user_model.get_all_balances()
+        portfolio = await Rapid.get_portfolio(target_user.id)
 
-        if not balances:
+        if not portfolio.entries:
             await interaction.followup.send(embed=create_success_embed(f"{target_user.display_name}は資産を保有していません。", title="残高"))
             return
 
-        total_items = len(balances)
+        currencies = {c.currency_id: c for c in portfolio.currencies}
+        reference = currencies.get(portfolio.reference_currency_id)
+        reference_symbol = reference.symbol if reference else ""
+
+        # 流動性ポジションはプールごとに1件へまとめる
+        items: list[tuple[str, str]] = []
+        liquidity: dict[int, list[structs.PortfolioEntry]] = {}
+        for entry in portfolio.entries:
+            if entry.kind == 'liquidity':
+                liquidity.setdefault(entry.pool_id, []).append(entry)
+                continue
+            currency = currencies.get(entry.currency_id)
+            if not currency:
+                continue
+            label = "ステーク" if entry.kind == 'stake' else "残高"
+            value = f"`{format_amount(entry.amount)} {currency.symbol}`"
+            if entry.value is not None:
+                value += f" (≈ `{format_amount(entry.value)} {reference_symbol}`)"
+            items.append((f"{currency.name} ({currency.symbol}) - {label}", value))
+        for pool_id, legs in liquidity.items():
+            symbols = [currencies[leg.currency_id].symbol if leg.currency_id in currencies else str(leg.currency_id) for leg in legs]
+            value = " + ".join(f"`{format_amount(leg.amount)} {symbol}`" for leg, symbol in zip(legs, symbols))
+            if all(leg.value is not None for leg in legs):
+                value += f" (≈ `{format_amount(sum(leg.value for leg in legs))} {reference_symbol}`)"
+            items.append((f"LP #{pool_id} {'/'.join(symbols)}", value))
+
+        total_items = len(items)
         total_pages = (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
 
         if page < 1 or (total_pages > 0 and page > total_pages):
@@ -155,17 +181,14 @@ async def balance(interaction: discord.Interaction, user: Optional[User] = None,
 
         start_idx = (page - 1) * ITEMS_PER_PAGE
         end_idx = start_idx + ITEMS_PER_PAGE
-        current_balances = balances[start_idx:end_idx]
-
-        embed = Embed(title=f"{target_user.display_name}の保有資産 (ページ {page}/{total_pages})", color=Color.green())
-        for bal in current_balances:
-            currency = await Rapid.Currencies.get(currency_id=bal.currency_id)
-            if currency:
-                embed.add_field(
-                    name=f"{currency.name} ({currency.symbol})",
-                    value=f"`{format_amount(bal.amount)}`",
-                    inline=False
-                )
+
+        embed = Embed(
+            title=f"{target_user.display_name}の保有資産 (ページ {page}/{total_pages})",
+            description=f"評価額合計: `{format_amount(portfolio.total_value)} {reference_symbol}`",
+            color=Color.green()
+        )
+        for name, value in items[start_idx:end_idx]:
+            embed.add_field(name=name, value=value, inline=False)
         await interaction.followup.send(embed=embed)
 
     except Exception as e:
@@ -284,7 +307,8 @@ async def execute_contract(interaction: discord.Interaction, user: User, input_d
     min_amount="最小金額",
     max_amount="最大金額",
     input_data="Input Data",
-    page="ページ番号"
+    page="ページ番号",
+    cursor="続きを表示するためのカーソル (前回の結果のフッターに表示されます)"
 )
 async def history(
     interaction: discord.Interaction,
@@ -298,7 +322,8 @@ async def history(
     min_amount: Optional[float] = None,
     max_amount: Optional[float] = None,
     input_data: Optional[str] = None,
-    page: int = 1
+    page: int = 1,
+    cursor: Optional[str] = None
 ):
     await interaction.response.defer(thinking=True)
     try:
@@ -330,7 +355,8 @@ async def history(
             "source_id": source.id if source else None,
             "dest_id": destination.id if destination else None,
             "input_data": input_data,
-            "page": page
+            "page": page,
+            "after": cursor
         }
 
         target_user = user or source or destination
@@ -368,7 +394,7 @@ async def history(
             await interaction.followup.send(embed=create_success_embed(f"指定された条件の転送履歴はありません。", "転送履歴"))
             return
 
-        embed = Embed(title=f"転送履歴 (ページ {page})", color=Color.blue())
+        embed = Embed(title="転送履歴" if cursor else f"転送履歴 (ページ {page})", color=Color.blue())
         for tx in transfers:
             currency = await Rapid.Currencies.get(tx.currency_id)
             if not currency: continue
@@ -390,7 +416,11 @@ async def history(
             field_name = f"{direction_emoji} | ID: {tx.transfer_id} | <t:{tx.timestamp}:R>"
             field_value = f"`{format_amount(tx.amount)} {currency.symbol}` {direction_text}"
             embed.add_field(name=field_name, value=field_value, inline=False)
-        
+
+        next_cursor = next_transfer_cursor(transfers, 10)
+        if next_cursor:
+            embed.set_footer(text=f"次のページ: cursor={next_cursor}")
+
         await interaction.followup.send(embed=embed)
     except Exception as e:
         await interaction.followup.send(embed=create_error_embed(f"履歴の取得中にエラーが発生しました。\n```{e}```"))
@@ -718,7 +748,8 @@ async def contract_set(interaction: discord.Interaction, script: discord.Attachm
 
         fields = [
             EmbedField("計算されたコスト", f"`{contract.cost}`", False),
-            EmbedField("設定された最大コスト", f"`{contract.max_cost}`" if contract.max_cost > 0 else "無制限", False)
+            EmbedField("設定された最大コスト", f"`{contract.max_cost}`" if contract.max_cost > 0 else "無制限", False),
+            EmbedField("実行コストの範囲", f"`{contract.cost_min}` ～ " + (f"`{contract.cost_max}`" if contract.cost_max is not None else "上限なし"), False)
         ]
 
         if contract.locked_until > time():
@@ -743,7 +774,8 @@ async def contract_get(interaction: discord.Interaction, user: Optional[User] =
         fields = [
             EmbedField("ユーザー", target_user.mention, False),
             EmbedField("計算されたコスト", f"`{contract.cost}`", False),
-            EmbedField("設定された最大コスト", f"`{contract.max_cost}`" if contract.max_cost > 0 else "無制限", False)
+            EmbedField("設定された最大コスト", f"`{contract.max_cost}`" if contract.max_cost > 0 else "無制限", False),
+            EmbedField("実行コストの範囲", f"`{contract.cost_min}` ～ " + (f"`{contract.cost_max}`" if contract.cost_max is not None else "上限なし"), False)
         ]
 
         if contract.locked_until > time():
@@ -1,6 +1,7 @@
-from typing import Optional, Literal, Union
+from typing import Optional, Literal, Union, Iterator
 from pydantic import BaseModel, Field
 import httpx
+import json
 
 class RapidWireAPIError(Exception):
     def __init__(self, status_code: int, message: str, details: Optional[dict] = None):
@@ -70,6 +71,14 @@ class Transfer(BaseModel):
     amount: int
     timestamp: int
 
+class UserCurrencyStats(BaseModel):
+    user_id: int
+    currency_id: int
+    sent_count: int
+    received_count: int
+    sent_amount: int
+    received_amount: int
+
 class ContractHistory(BaseModel):
     history_id: int
     execution_id: int
@@ -93,12 +102,53 @@ class LiquidityPool(BaseModel):
     reserve_b: int
     total_shares: int
 
+class PoolCandle(BaseModel):
+    pool_id: int
+    resolution: int
+    bucket_start: int
+    open: int
+    high: int
+    low: int
+    close: int
+    volume_a: int
+    volume_b: int
+    trade_count: int
+
 class LiquidityProvider(BaseModel):
     provider_id: int
     pool_id: int
     user_id: int
     shares: int
 
+class PortfolioEntry(BaseModel):
+    kind: Literal['balance', 'stake', 'liquidity']
+    currency_id: int
+    amount: int
+    value: Optional[int] = None
+    pool_id: Optional[int] = None
+    shares: Optional[int] = None
+
+class Portfolio(BaseModel):
+    user_id: int
+    reference_currency_id: int
+    total_value: int
+    unpriced_currency_ids: list[int]
+    entries: list[PortfolioEntry]
+    currencies: list[Currency]
+
+class HistoricalBalance(BaseModel):
+    user_id: int
+    currency_id: int
+    amount: int
+    timestamp: int
+    snapshot_id: Optional[int] = None
+
+class HistoricalSupply(BaseModel):
+    currency_id: int
+    circulating: int
+    timestamp: int
+    snapshot_id: Optional[int] = None
+
 class ContractVariable(BaseModel):
     user_id: int
     key: str
@@ -181,8 +231,11 @@ class ContractScriptResponse(BaseModel):
 
 class UserStatsResponse(BaseModel):
     total_transfers: int
+    sent_count: int = 0
+    received_count: int = 0
     first_transfer_timestamp: Optional[int] = None
     last_transfer_timestamp: Optional[int] = None
+    currencies: list[UserCurrencyStats] = []
 
 class StakeResponse(BaseModel):
     currency: Currency
@@ -235,6 +288,10 @@ class ApproveRequest(BaseModel):
     currency_id: int
     amount: int = Field(..., ge=0)
 
+class TransferPage(BaseModel):
+    transfers: list[Transfer]
+    next_cursor: Optional[str] = None
+
 # --- Client ---
 
 class RapidWireClient:
@@ -294,9 +351,24 @@ class RapidWireClient:
         resp = self._request("GET", f"/stakes/{user_id}")
         return [StakeResponse(**item) for item in resp.json()]
 
-    def get_account_history(self, page: int = 1) -> list[Transfer]:
-        resp = self._request("GET", "/account/history", params={"page": page})
-        return [Transfer(**item) for item in resp.json()]
+    def get_portfolio(self, user_id: int, currency_id: Optional[int] = None) -> Portfolio:
+        params = {"currency_id": currency_id} if currency_id is not None else None
+        resp = self._request("GET", f"/portfolio/{user_id}", params=params)
+        return Portfolio(**resp.json())
+
+    def get_balance_at(self, user_id: int, currency_id: int, at: Optional[int] = None) -> HistoricalBalance:
+        params = {"at": at} if at is not None else None
+        resp = self._request("GET", f"/user/{user_id}/balance/{currency_id}", params=params)
+        return HistoricalBalance(**resp.json())
+
+    def get_account_history(self, page: int = 1, after: Optional[str] = None) -> list[Transfer]:
+        return self.get_account_history_page(page, after).transfers
+
+    def get_account_history_page(self, page: int = 1, after: Optional[str] = None) -> TransferPage:
+        params = {"page": page, "after": after}
+        params = {k: v for k, v in params.items() if v is not None}
+        resp = self._request("GET", "/account/history", params=params)
+        return self._transfer_page(resp)
 
     def get_contract_script(self, user_id: int) -> ContractScriptResponse:
         resp = self._request("GET", f"/script/{user_id}")
@@ -331,6 +403,11 @@ class RapidWireClient:
         resp = self._request("GET", f"/currency/symbol/{symbol}")
         return Currency(**resp.json())
 
+    def get_supply_at(self, currency_id: int, at: Optional[int] = None) -> HistoricalSupply:
+        params = {"at": at} if at is not None else None
+        resp = self._request("GET", f"/currency/{currency_id}/supply", params=params)
+        return HistoricalSupply(**resp.json())
+
     def transfer(self, destination_id: int, currency_id: int, amount: int) -> TransferResponse:
         request = TransferRequest(
             destination_id=destination_id,
@@ -403,7 +480,8 @@ class RapidWireClient:
                          page: int = 1,
                          limit: int = 10,
                          sort_by: Literal["transfer_id", "timestamp", "amount"] = "transfer_id",
-                         sort_order: Literal["ASC", "DESC", "asc", "desc"] = "desc"
+                         sort_order: Literal["ASC", "DESC", "asc", "desc"] = "desc",
+                         after: Optional[str] = None
                          ) -> list[Transfer]:
         params = {
             "source_id": source_id,
@@ -418,13 +496,57 @@ class RapidWireClient:
             "page": page,
             "limit": limit,
             "sort_by": sort_by,
-            "sort_order": sort_order
+            "sort_order": sort_order,
+            "after": after
         }
+        return self.search_transfers_page(**params).transfers
+
+    def search_transfers_page(self, after: Optional[str] = None, **filters) -> TransferPage:
+        params = {**filters, "after": after}
         # Filter out None values
         params = {k: v for k, v in params.items() if v is not None}
-        
+
         resp = self._request("GET", "/transfers/search", params=params)
-        return [Transfer(**item) for item in resp.json()]
+        return self._transfer_page(resp)
+
+    def iter_transfers(self, **filters) -> Iterator[Transfer]:
+        after = None
+        while True:
+            page = self.search_transfers_page(after=after, **filters)
+            yield from page.transfers
+            if not page.next_cursor:
+                return
+            after = page.next_cursor
+
+    def export_transfers(self, after_id: Optional[int] = None, max_retries: int = 3, **filters) -> Iterator[Transfer]:
+        # Streams /transfers/export as NDJSON. Rows arrive in transfer_id order, so a dropped
+        # connection resumes after the last transfer received instead of starting over.
+        retries = 0
+        while True:
+            params = {k: v for k, v in {**filters, "format": "ndjson", "after_id": after_id}.items() if v is not None}
+            try:
+                with self.client.stream("GET", "/transfers/export", params=params) as resp:
+                    if resp.is_error:
+                        resp.read()
+                        raise RapidWireAPIError(resp.status_code, resp.text)
+                    for line in resp.iter_lines():
+                        if not line:
+                            continue
+                        transfer = Transfer(**json.loads(line))
+                        after_id = transfer.transfer_id
+                        retries = 0
+                        yield transfer
+                return
+            except httpx.TransportError:
+                retries += 1
+                if retries > max_retries:
+                    raise
+
+    def _transfer_page(self, resp: httpx.Response) -> TransferPage:
+        return TransferPage(
+            transfers=[Transfer(**item) for item in resp.json()],
+            next_cursor=resp.headers.get("X-Next-Cursor")
+        )
 
     def get_transfer(self, transfer_id: int) -> Transfer:
         resp = self._request("GET", f"/transfer/{transfer_id}")
@@ -448,6 +570,25 @@ class RapidWireClient:
         resp = self._request("GET", f"/pools/{currency_a_id}/{currency_b_id}")
         return LiquidityPool(**resp.json())
 
+    def get_pool_candles(self,
+                         currency_a_id: int,
+                         currency_b_id: int,
+                         resolution: Literal["1m", "1h", "1d"] = "1h",
+                         start_timestamp: Optional[int] = None,
+                         end_timestamp: Optional[int] = None,
+                         limit: int = 500
+                         ) -> list[PoolCandle]:
+        params = {
+            "resolution": resolution,
+            "start_timestamp": start_timestamp,
+            "end_timestamp": end_timestamp,
+            "limit": limit
+        }
+        params = {k: v for k, v in params.items() if v is not None}
+
+        resp = self._request("GET", f"/pools/{currency_a_id}/{currency_b_id}/candles", params=params)
+        return [PoolCandle(**item) for item in resp.json()]
+
     def get_provider_info(self, user_id: int) -> list[LiquidityProvider]:
         resp = self._request("GET", f"/pools/provider/{user_id}")
         return [LiquidityProvider(**item) for item in resp.json()]
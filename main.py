@@ -4,6 +4,7 @@ from discord.ext import tasks
 import config
 import bot_commands
 from RapidWire import RapidWire
+from RapidWire.metrics import REGISTRY, serve as serve_metrics
 from time import time
 import asyncio
 
@@ -11,6 +12,7 @@ intents = discord.Intents.default()
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 Rapid: RapidWire = None
+metrics_server: asyncio.AbstractServer = None
 last_check_timestamp = int(time())
 
 @tasks.loop(seconds=10)
@@ -49,14 +51,48 @@ async def update_stakes_task():
     except Exception as e:
         print(f"ステーキング更新タスクでエラーが発生しました: {e}")
 
+@tasks.loop(hours=1)
+async def balance_snapshot_task():
+    try:
+        await Rapid.take_balance_snapshot()
+    except Exception as e:
+        print(f"残高スナップショットの作成中にエラーが発生しました: {e}")
+
+@tasks.loop(minutes=5)
+async def compact_supply_task():
+    try:
+        await Rapid.compact_supply_shards()
+    except Exception as e:
+        print(f"供給量シャードの集約中にエラーが発生しました: {e}")
+
+@tasks.loop(minutes=10)
+async def settle_gas_task():
+    try:
+        await Rapid.settle_gas_income()
+    except Exception as e:
+        print(f"ガス代の精算中にエラーが発生しました: {e}")
+
 @client.event
 async def on_ready():
-    await Rapid.initialize()
     Rapid.Config = config.RapidWireConfig
+    await Rapid.initialize()
     if not check_claims_and_notify.is_running():
         check_claims_and_notify.start()
     if not update_stakes_task.is_running():
         update_stakes_task.start()
+    if not balance_snapshot_task.is_running():
+        balance_snapshot_task.start()
+    if not compact_supply_task.is_running():
+        compact_supply_task.start()
+    if not settle_gas_task.is_running():
+        settle_gas_task.start()
+    global metrics_server
+    metrics_port = getattr(config.Discord, 'metrics_port', 0)
+    if metrics_port and metrics_server is None:
+        try:
+            metrics_server = await serve_metrics(REGISTRY, "127.0.0.1", metrics_port)
+        except OSError as e:
+            print(f"メトリクスサーバーを起動できませんでした: {e}")
     print(f'"{client.user}" としてログインしました')
     try:
         await tree.sync()
@@ -151,7 +187,7 @@ async def on_message(message: discord.Message):
 
 def main():
     global Rapid
-    Rapid = RapidWire(db_config=config.MySQL.to_dict())
+    Rapid = RapidWire(db_config=config.MySQL.to_dict(), replica_configs=getattr(config.MySQL, 'replica_dicts', list)())
     bot_commands.setup(tree, Rapid)
     client.run(config.Discord.token)
 
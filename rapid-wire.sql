@@ -19,6 +19,32 @@ CREATE TABLE `api_key` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `api_key_version`
+--
+
+CREATE TABLE `api_key_version` (
+  `id` tinyint UNSIGNED NOT NULL,
+  `version` bigint UNSIGNED NOT NULL DEFAULT '0' COMMENT 'APIキーが再発行されるたびに加算 (キャッシュ無効化用)'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO `api_key_version` (`id`, `version`) VALUES (1, 0);
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `data_version`
+--
+
+CREATE TABLE `data_version` (
+  `id` tinyint UNSIGNED NOT NULL,
+  `version` bigint UNSIGNED NOT NULL DEFAULT '0' COMMENT '送金を伴わない変更 (通貨の設定) のたびに加算 (共有キャッシュ無効化用)'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO `data_version` (`id`, `version`) VALUES (1, 0);
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `balance`
 --
@@ -59,7 +85,9 @@ CREATE TABLE `contract` (
   `script` blob NOT NULL,
   `cost` int UNSIGNED NOT NULL,
   `max_cost` int UNSIGNED NOT NULL DEFAULT '0',
-  `locked_until` bigint UNSIGNED NOT NULL DEFAULT '0'
+  `locked_until` bigint UNSIGNED NOT NULL DEFAULT '0',
+  `cost_min` bigint UNSIGNED NOT NULL DEFAULT '0' COMMENT '静的解析による最小コスト',
+  `cost_max` bigint UNSIGNED DEFAULT NULL COMMENT '静的解析による最大コスト、NULL は上限なし'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
@@ -254,11 +282,128 @@ CREATE TABLE `allowance_log` (
 --
 
 CREATE TABLE `transfer_sequence` (
-  `id` int UNSIGNED NOT NULL
+  `id` int UNSIGNED NOT NULL,
+  `ledger_seq` bigint UNSIGNED NOT NULL DEFAULT '0' COMMENT 'レジャーエンジンが MySQL に反映済みの最大 WAL 連番'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 INSERT INTO `transfer_sequence` (`id`) VALUES (1);
 
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `ledger_owner`
+--
+
+CREATE TABLE `ledger_owner` (
+  `id` int UNSIGNED NOT NULL,
+  `host` varchar(255) NOT NULL COMMENT 'レジャーエンジン所有プロセスの送金受付アドレス',
+  `port` int UNSIGNED NOT NULL,
+  `token` char(64) NOT NULL COMMENT '他プロセスからの送金要求の認証トークン'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `pool_candle`
+--
+
+CREATE TABLE `pool_candle` (
+  `pool_id` int UNSIGNED NOT NULL,
+  `resolution` int UNSIGNED NOT NULL COMMENT 'バケット幅 (秒)',
+  `bucket_start` bigint UNSIGNED NOT NULL,
+  `open` decimal(40, 0) NOT NULL COMMENT '価格 (currency_b / currency_a * 10^18)',
+  `high` decimal(40, 0) NOT NULL,
+  `low` decimal(40, 0) NOT NULL,
+  `close` decimal(40, 0) NOT NULL,
+  `volume_a` decimal(30, 0) NOT NULL DEFAULT '0',
+  `volume_b` decimal(30, 0) NOT NULL DEFAULT '0',
+  `trade_count` int UNSIGNED NOT NULL DEFAULT '0'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `user_stats`
+--
+
+CREATE TABLE `user_stats` (
+  `user_id` bigint UNSIGNED NOT NULL,
+  `total_transfers` bigint UNSIGNED NOT NULL DEFAULT '0' COMMENT '送金元または送金先として関わった転送数 (自己送金は1件)',
+  `sent_count` bigint UNSIGNED NOT NULL DEFAULT '0',
+  `received_count` bigint UNSIGNED NOT NULL DEFAULT '0',
+  `first_transfer_timestamp` bigint UNSIGNED DEFAULT NULL,
+  `last_transfer_timestamp` bigint UNSIGNED DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='transfer から集計したユーザー統計 (SYSTEM_USER_ID は除く)';
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `user_currency_stats`
+--
+
+CREATE TABLE `user_currency_stats` (
+  `user_id` bigint UNSIGNED NOT NULL,
+  `currency_id` bigint UNSIGNED NOT NULL,
+  `sent_count` bigint UNSIGNED NOT NULL DEFAULT '0',
+  `received_count` bigint UNSIGNED NOT NULL DEFAULT '0',
+  `sent_amount` decimal(40, 0) NOT NULL DEFAULT '0',
+  `received_amount` decimal(40, 0) NOT NULL DEFAULT '0'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `balance_snapshot`
+--
+
+CREATE TABLE `balance_snapshot` (
+  `snapshot_id` bigint UNSIGNED NOT NULL,
+  `currency_id` bigint UNSIGNED NOT NULL,
+  `transfer_id` bigint UNSIGNED NOT NULL COMMENT 'この ID までの転送が反映済み',
+  `timestamp` bigint UNSIGNED NOT NULL,
+  `holders` int UNSIGNED NOT NULL,
+  `total` decimal(40, 0) NOT NULL COMMENT 'SYSTEM_USER_ID を除く残高の合計'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `balance_snapshot_entry`
+--
+
+CREATE TABLE `balance_snapshot_entry` (
+  `snapshot_id` bigint UNSIGNED NOT NULL,
+  `user_id` bigint UNSIGNED NOT NULL,
+  `amount` decimal(24, 0) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `currency_supply_shard`
+--
+
+CREATE TABLE `currency_supply_shard` (
+  `currency_id` bigint UNSIGNED NOT NULL,
+  `shard` int UNSIGNED NOT NULL,
+  `delta` decimal(24, 0) NOT NULL DEFAULT '0' COMMENT '未集約の供給量の増減、currency.supply に加算して読む'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `gas_charge`
+--
+
+CREATE TABLE `gas_charge` (
+  `execution_id` bigint UNSIGNED NOT NULL,
+  `user_id` bigint UNSIGNED NOT NULL,
+  `currency_id` bigint UNSIGNED NOT NULL,
+  `amount` decimal(24, 0) NOT NULL COMMENT '遅延精算で徴収したガス代',
+  `timestamp` bigint UNSIGNED NOT NULL,
+  `settled_at` bigint UNSIGNED DEFAULT NULL COMMENT '精算の送金の timestamp、NULL は未精算'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 --
 -- Indexes for dumped tables
 --
@@ -270,6 +415,18 @@ ALTER TABLE `api_key`
   ADD PRIMARY KEY (`user_id`),
   ADD UNIQUE KEY `api_key` (`api_key`);
 
+--
+-- Indexes for table `api_key_version`
+--
+ALTER TABLE `api_key_version`
+  ADD PRIMARY KEY (`id`);
+
+--
+-- Indexes for table `data_version`
+--
+ALTER TABLE `data_version`
+  ADD PRIMARY KEY (`id`);
+
 --
 -- Indexes for table `balance`
 --
@@ -356,8 +513,13 @@ ALTER TABLE `execution`
 ALTER TABLE `transfer`
   ADD PRIMARY KEY (`transfer_id`),
   ADD KEY `execution_id` (`execution_id`),
-  ADD KEY `source_id` (`source_id`),
-  ADD KEY `dest_id` (`dest_id`);
+  ADD KEY `source_transfer` (`source_id`,`transfer_id`),
+  ADD KEY `source_timestamp` (`source_id`,`timestamp`),
+  ADD KEY `dest_transfer` (`dest_id`,`transfer_id`),
+  ADD KEY `dest_timestamp` (`dest_id`,`timestamp`),
+  ADD KEY `currency_transfer` (`currency_id`,`transfer_id`),
+  ADD KEY `currency_timestamp` (`currency_id`,`timestamp`),
+  ADD KEY `timestamp` (`timestamp`);
 
 --
 -- Indexes for table `contract_history`
@@ -380,6 +542,58 @@ ALTER TABLE `allowance_log`
   ADD PRIMARY KEY (`log_id`),
   ADD KEY `execution_id` (`execution_id`);
 
+--
+-- Indexes for table `pool_candle`
+--
+ALTER TABLE `pool_candle`
+  ADD PRIMARY KEY (`pool_id`, `resolution`, `bucket_start`);
+
+--
+-- Indexes for table `user_stats`
+--
+ALTER TABLE `user_stats`
+  ADD PRIMARY KEY (`user_id`);
+
+--
+-- Indexes for table `user_currency_stats`
+--
+ALTER TABLE `user_currency_stats`
+  ADD PRIMARY KEY (`user_id`, `currency_id`);
+
+--
+-- Indexes for table `balance_snapshot`
+--
+ALTER TABLE `balance_snapshot`
+  ADD PRIMARY KEY (`snapshot_id`),
+  ADD KEY `currency_timestamp` (`currency_id`, `timestamp`);
+
+--
+-- Indexes for table `balance_snapshot_entry`
+--
+ALTER TABLE `balance_snapshot_entry`
+  ADD PRIMARY KEY (`snapshot_id`, `user_id`);
+
+--
+-- Indexes for table `currency_supply_shard`
+--
+ALTER TABLE `currency_supply_shard`
+  ADD PRIMARY KEY (`currency_id`, `shard`);
+
+--
+-- Indexes for table `gas_charge`
+--
+ALTER TABLE `gas_charge`
+  ADD PRIMARY KEY (`execution_id`),
+  ADD KEY `user_pending` (`user_id`, `currency_id`, `settled_at`),
+  ADD KEY `currency_pending` (`currency_id`, `settled_at`),
+  ADD KEY `unsettled` (`settled_at`, `timestamp`);
+
+--
+-- Indexes for table `ledger_owner`
+--
+ALTER TABLE `ledger_owner`
+  ADD PRIMARY KEY (`id`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -424,4 +638,10 @@ ALTER TABLE `contract_history`
 ALTER TABLE `allowance_log`
   MODIFY `log_id` bigint UNSIGNED NOT NULL AUTO_INCREMENT;
 
+--
+-- AUTO_INCREMENT for table `balance_snapshot`
+--
+ALTER TABLE `balance_snapshot`
+  MODIFY `snapshot_id` bigint UNSIGNED NOT NULL AUTO_INCREMENT;
+
 COMMIT;
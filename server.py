@@ -1,5 +1,8 @@
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, Security, status
+import asyncio
+from fastapi import FastAPI, Depends, HTTPException, Security, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field, field_serializer
@@ -7,14 +10,20 @@ from typing import List, Optional, Literal
 from decimal import Decimal
 import httpx
 import time
+import json
+import hashlib
 from contextlib import asynccontextmanager
 
 import config
 from RapidWire import RapidWire, exceptions, structs
+from RapidWire.cache import ResponseCache
+from RapidWire.pagination import next_transfer_cursor
+from RapidWire.tracing import start_request_trace
+from RapidWire.metrics import REGISTRY, render_cache, serve as serve_metrics
 
 API_SERVER_VERSION = "1.0.1"
 
-Rapid = RapidWire(db_config=config.MySQL.to_dict())
+Rapid = RapidWire(db_config=config.MySQL.to_dict(), replica_configs=getattr(config.MySQL, 'replica_dicts', list)())
 Rapid.Config = config.RapidWireConfig
 
 @asynccontextmanager
@@ -22,8 +31,19 @@ async def lifespan(app: FastAPI):
     # Startup
     await Rapid.initialize()
     Rapid.Config = config.RapidWireConfig
+    # Metrics name internal call sites and pool state, so they are only served on loopback
+    metrics_server = None
+    metrics_port = getattr(config.APIServer, 'metrics_port', 0)
+    if metrics_port:
+        try:
+            metrics_server = await serve_metrics(REGISTRY, "127.0.0.1", metrics_port)
+        except OSError as e:
+            print(f"Could not start the metrics listener: {e}")
     yield
     # Shutdown
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
     await Rapid.close()
 
 app = FastAPI(
@@ -34,6 +54,44 @@ app = FastAPI(
 )
 
 API_KEY_HEADER = APIKeyHeader(name="API-Key", auto_error=False)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _set_next_cursor(response: Response, cursor: Optional[str]):
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+@app.middleware("http")
+async def invalidate_response_cache(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        shared_responses.clear()
+    return response
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    if not Rapid.db.tracer:
+        return await call_next(request)
+    trace = start_request_trace()
+    response = await call_next(request)
+    sites = getattr(getattr(Rapid.Config, 'Tracing', None), 'server_timing_sites', False)
+    response.headers["Server-Timing"] = trace.server_timing(top=3 if sites else 0)
+    return response
+
+REQUEST_SECONDS = REGISTRY.histogram("rapidwire_http_request_duration_seconds", "API request latency", ("method", "route", "status"))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Route templates keep the label set bounded; unknown paths share one series
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code
+    )
+    return response
 
 class DiscordUserCache:
     def __init__(self, capacity=100, ttl_seconds=86400):
@@ -79,6 +137,67 @@ class DiscordUserCache:
 
 discord_user_cache = DiscordUserCache()
 
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RESPONSE_CACHE_TTL = getattr(config.APIServer, 'cache_ttl', 2)
+
+# Records that never change once written (transfers, finished executions)
+immutable_responses = ResponseCache(getattr(config.APIServer, 'immutable_cache_size', 4096), 3600)
+# Mutable explorer reads, served from memory for a few seconds and dropped on every successful write
+shared_responses = ResponseCache(getattr(config.APIServer, 'cache_size', 1024), RESPONSE_CACHE_TTL)
+shared_version = None
+REGISTRY.collector("api_server", lambda: render_cache("rapidwire_http_cache", {
+    "immutable": immutable_responses.cache,
+    "shared": shared_responses.cache
+}))
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+async def _drop_stale_shared_responses():
+    # The bot, the ledger and the batchers write without passing through this server's middleware
+    global shared_version
+    version = await Rapid.DataVersion.current()
+    if version != shared_version:
+        shared_responses.clear()
+        shared_version = version
+
+async def cached_json(request: Request, loader, immutable=False) -> Response:
+    # `immutable` may be a predicate on the loaded payload, e.g. for executions that are still pending
+    key = f"{request.url.path}?{request.url.query}"
+
+    async def render():
+        payload = await loader()
+        body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        is_immutable = immutable(payload) if callable(immutable) else immutable
+        return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', is_immutable
+
+    if immutable is True:
+        entry = await immutable_responses.get_or_load(key, render)
+    else:
+        entry = immutable_responses.peek(key)
+        if not entry:
+            await _drop_stale_shared_responses()
+            entry = await shared_responses.get_or_load(key, render)
+        if entry[2]:
+            immutable_responses.set(key, entry)
+        elif callable(immutable):
+            # Still changing (a pending execution) without a write data_version would see; only coalesce the load
+            shared_responses.cache.pop(key)
+
+    body, etag, is_immutable = entry
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if is_immutable else f"public, max-age={int(RESPONSE_CACHE_TTL)}"
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 async def get_current_user_id(api_key: str = Security(API_KEY_HEADER)) -> int:
     if not api_key:
         raise HTTPException(
@@ -166,11 +285,16 @@ class ContractScriptResponse(BaseModel):
     cost: Optional[int] = None
     max_cost: Optional[int] = None
     locked_until: Optional[int] = None
+    cost_min: Optional[int] = None
+    cost_max: Optional[int] = None
 
 class UserStatsResponse(BaseModel):
     total_transfers: int
+    sent_count: int = 0
+    received_count: int = 0
     first_transfer_timestamp: Optional[int] = None
     last_transfer_timestamp: Optional[int] = None
+    currencies: List[structs.UserCurrencyStats] = []
 
 class StakeResponse(BaseModel):
     currency: structs.Currency
@@ -228,7 +352,10 @@ async def get_version():
     return SuccessResponse(message="RapidWire API", details={"version": API_SERVER_VERSION})
 
 @app.get("/config", response_model=ConfigResponse, tags=["Config"])
-async def get_config():
+async def get_config(request: Request):
+    return await cached_json(request, _load_config)
+
+async def _load_config() -> ConfigResponse:
     return ConfigResponse(
         contract=ConfigResponseContract(
             max_cost=Rapid.Config.Contract.max_cost,
@@ -262,6 +389,13 @@ async def get_user_stats(user_id: int):
     stats = await Rapid.Transfers.get_user_stats(user_id)
     return UserStatsResponse(**stats)
 
+@app.get("/user/{user_id}/balance/{currency_id}", response_model=structs.HistoricalBalance, tags=["Account"])
+async def get_user_balance_at(user_id: int, currency_id: int, at: Optional[int] = None):
+    if at is None:
+        balance = await Rapid.get_user(user_id).get_balance(currency_id)
+        return structs.HistoricalBalance(user_id=user_id, currency_id=currency_id, amount=balance.amount, timestamp=int(time.time()))
+    return await Rapid.get_balance_at(user_id, currency_id, at)
+
 @app.get("/balance/{user_id}", response_model=List[BalanceResponse], tags=["Account"])
 async def get_user_balance(user_id: int):
     user = Rapid.get_user(user_id)
@@ -306,16 +440,28 @@ async def get_user_stakes(user_id: int):
             )
     return response
 
+@app.get("/portfolio/{user_id}", response_model=structs.Portfolio, tags=["Account"])
+async def get_user_portfolio(user_id: int, currency_id: Optional[int] = None):
+    if currency_id is not None and not await Rapid.Currencies.get(currency_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Currency not found")
+    return await Rapid.get_portfolio(user_id, currency_id)
+
 @app.get("/account/history", response_model=List[structs.Transfer], tags=["Account"])
-async def get_my_history(user_id: int = Depends(get_current_user_id), page: int = 1):
-    return await Rapid.search_transfers(user_id=user_id, page=page)
+async def get_my_history(response: Response, user_id: int = Depends(get_current_user_id), page: int = 1, after: Optional[str] = None):
+    try:
+        transfers = await Rapid.search_transfers(user_id=user_id, page=page, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    _set_next_cursor(response, next_transfer_cursor(transfers, 10))
+    return transfers
 
 @app.get("/script/{user_id}", response_model=ContractScriptResponse, tags=["Contract"])
 async def get_contract_script(user_id: int):
     contract = await Rapid.Contracts.get(user_id)
     if not contract or not contract.script:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contract not found for this user.")
-    return ContractScriptResponse(script=contract.script, cost=contract.cost, max_cost=contract.max_cost, locked_until=contract.locked_until)
+    return ContractScriptResponse(script=contract.script, cost=contract.cost, max_cost=contract.max_cost, locked_until=contract.locked_until,
+                                  cost_min=contract.cost_min, cost_max=contract.cost_max)
 
 @app.post("/contract/execute", response_model=ContractExecutionResponse, tags=["Contract"])
 async def execute_contract(request: ContractExecutionRequest, user_id: int = Depends(get_current_user_id)):
@@ -333,6 +479,8 @@ async def execute_contract(request: ContractExecutionRequest, user_id: int = Dep
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Contract execution error: {e}")
     except exceptions.TransactionCanceledByContract as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Transaction canceled by contract: {e}")
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transaction error: {e}")
     except ValueError as e:
@@ -350,29 +498,41 @@ async def get_contract_variable(user_id: int, key: str):
     return variable
 
 @app.get("/contract/history/{user_id}", response_model=List[structs.ContractHistory], tags=["Contract"])
-async def get_contract_history(user_id: int):
-    return await Rapid.ContractHistories.get_for_user(user_id)
+async def get_contract_history(request: Request, user_id: int):
+    return await cached_json(request, lambda: Rapid.ContractHistories.get_for_user(user_id))
 
 @app.get("/executions/{execution_id}", response_model=structs.Execution, tags=["Contract"])
-async def get_execution(execution_id: int):
-    execution = await Rapid.Executions.get(execution_id)
-    if not execution:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Execution not found")
-    return execution
+async def get_execution(request: Request, execution_id: int):
+    async def load():
+        execution = await Rapid.Executions.get(execution_id)
+        if not execution:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Execution not found")
+        return execution
+    return await cached_json(request, load, immutable=lambda execution: execution.status != 'pending')
 
 @app.get("/currency/{currency_id}", response_model=structs.Currency, tags=["Currency"])
-async def get_currency_info_by_id(currency_id: int):
-    currency = await Rapid.Currencies.get(currency_id)
-    if not currency:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Currency not found")
-    return currency
+async def get_currency_info_by_id(request: Request, currency_id: int):
+    async def load():
+        currency = await Rapid.Currencies.get(currency_id)
+        if not currency:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Currency not found")
+        return currency
+    return await cached_json(request, load)
 
 @app.get("/currency/symbol/{symbol}", response_model=structs.Currency, tags=["Currency"])
-async def get_currency_info(symbol: str):
-    currency = await Rapid.Currencies.get_by_symbol(symbol.upper())
-    if not currency:
+async def get_currency_info(request: Request, symbol: str):
+    async def load():
+        currency = await Rapid.Currencies.get_by_symbol(symbol.upper())
+        if not currency:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Currency not found")
+        return currency
+    return await cached_json(request, load)
+
+@app.get("/currency/{currency_id}/supply", response_model=structs.HistoricalSupply, tags=["Currency"])
+async def get_currency_supply_at(currency_id: int, at: Optional[int] = None):
+    if not await Rapid.Currencies.get(currency_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Currency not found")
-    return currency
+    return await Rapid.get_supply_at(currency_id, int(time.time()) if at is None else at)
 
 @app.post("/currency/transfer", response_model=TransferResponse, tags=["Currency"])
 async def transfer_currency(request: TransferRequest, user_id: int = Depends(get_current_user_id)):
@@ -390,6 +550,8 @@ async def transfer_currency(request: TransferRequest, user_id: int = Depends(get
         return TransferResponse(transfer=tx)
     except exceptions.InsufficientFunds:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient funds")
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transaction error: {e}")
     except ValueError as e:
@@ -412,6 +574,8 @@ async def transfer_from_currency(request: TransferFromRequest, user_id: int = De
         return TransferFromResponse(transfer=transfer, execution_id=execution_id)
     except exceptions.InsufficientFunds:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient funds or allowance")
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transaction error: {e}")
     except ValueError as e:
@@ -426,6 +590,8 @@ async def approve_allowance(request: ApproveRequest, user_id: int = Depends(get_
     try:
         await Rapid.approve(user_id, request.spender_id, currency.currency_id, request.amount)
         return SuccessResponse(message="Allowance updated successfully.")
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transaction error: {e}")
 
@@ -481,6 +647,7 @@ async def cancel_claim(claim_id: int, user_id: int = Depends(get_current_user_id
 
 @app.get("/transfers/search", response_model=List[structs.Transfer], tags=["Transfers"])
 async def search_transfers(
+    response: Response,
     source_id: Optional[int] = None,
     dest_id: Optional[int] = None,
     user_id: Optional[int] = None,
@@ -493,7 +660,8 @@ async def search_transfers(
     page: int = 1,
     limit: int = 10,
     sort_by: Literal["transfer_id", "timestamp", "amount"] = "transfer_id",
-    sort_order: Literal["ASC", "DESC", "asc", "desc"] = "desc"
+    sort_order: Literal["ASC", "DESC", "asc", "desc"] = "desc",
+    after: Optional[str] = None
 ):
     if limit >= 20: limit = 20
     if limit <= 0: limit = 10
@@ -511,17 +679,77 @@ async def search_transfers(
         "sort_by": sort_by,
         "sort_order": sort_order,
         "min_amount": min_amount,
-        "max_amount": max_amount
+        "max_amount": max_amount,
+        "after": after
     }
 
-    return await Rapid.search_transfers(**search_params)
+    try:
+        transfers = await Rapid.search_transfers(**search_params)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    _set_next_cursor(response, next_transfer_cursor(transfers, limit, sort_by, sort_order))
+    return transfers
+
+EXPORT_BATCH_SIZE = getattr(config.APIServer, 'export_batch_size', 1000)
+EXPORT_FIELDS = list(structs.Transfer.model_fields)
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Each running export takes a connection per batch; cap them so downloads cannot crowd out writes
+export_slots = asyncio.Semaphore(getattr(config.APIServer, 'export_concurrency', 2))
+
+async def _export_chunks(rows, format: str):
+    # One chunk per batch keeps memory bounded without a send() per row
+    async with export_slots:
+        if format == "csv":
+            yield ",".join(EXPORT_FIELDS) + "\n"
+        lines = []
+        async for row in rows:
+            if format == "csv":
+                lines.append(",".join("" if row[field] is None else str(row[field]) for field in EXPORT_FIELDS))
+            else:
+                lines.append(json.dumps(row, separators=(",", ":")))
+            if len(lines) >= EXPORT_BATCH_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+@app.get("/transfers/export", tags=["Transfers"])
+async def export_transfers(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    source_id: Optional[int] = None,
+    dest_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    currency_id: Optional[int] = None,
+    start_timestamp: Optional[int] = None,
+    end_timestamp: Optional[int] = None,
+    min_amount: Optional[int] = None,
+    max_amount: Optional[int] = None,
+    input_data: Optional[str] = None,
+    after_id: Optional[int] = None,
+    caller_id: int = Depends(get_current_user_id)
+):
+    if export_slots.locked():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many exports are running.", headers={"Retry-After": "5"})
+    rows = Rapid.Transfers.export(
+        after_id=after_id, batch_size=EXPORT_BATCH_SIZE,
+        source_id=source_id, dest_id=dest_id, user_id=user_id, currency_id=currency_id,
+        start_timestamp=start_timestamp, end_timestamp=end_timestamp,
+        min_amount=min_amount, max_amount=max_amount, input_data=input_data
+    )
+    return StreamingResponse(
+        _export_chunks(rows, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=transfers.{format}"}
+    )
 
 @app.get("/transfer/{transfer_id}", response_model=structs.Transfer, tags=["Transfers"])
-async def get_transfer(transfer_id: int):
-    tx = await Rapid.Transfers.get(transfer_id)
-    if not tx:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer not found")
-    return tx
+async def get_transfer(request: Request, transfer_id: int):
+    async def load():
+        tx = await Rapid.Transfers.get(transfer_id)
+        if not tx:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer not found")
+        return tx
+    return await cached_json(request, load, immutable=True)
 
 @app.post("/pools/add_liquidity", response_model=AddLiquidityResponse, tags=["DEX"])
 async def add_liquidity(request: AddLiquidityRequest, user_id: int = Depends(get_current_user_id)):
@@ -535,6 +763,8 @@ async def add_liquidity(request: AddLiquidityRequest, user_id: int = Depends(get
         return AddLiquidityResponse(shares_minted=shares)
     except (exceptions.InsufficientFunds, ValueError) as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -550,23 +780,51 @@ async def remove_liquidity(request: RemoveLiquidityRequest, user_id: int = Depen
         return RemoveLiquidityResponse(amount_a_received=amount_a, amount_b_received=amount_b)
     except (exceptions.InsufficientFunds, ValueError) as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 @app.get("/pools", response_model=List[structs.LiquidityPool], tags=["DEX"])
-async def get_all_pools():
-    return await Rapid.LiquidityPools.get_all()
+async def get_all_pools(request: Request):
+    return await cached_json(request, Rapid.LiquidityPools.get_all)
 
 @app.get("/pools/provider/{user_id}", response_model=List[structs.LiquidityProvider], tags=["DEX"])
 async def get_provider_info(user_id: int):
     return await Rapid.LiquidityProviders.get_for_user(user_id)
 
+@app.get("/pools/{currency_a_id}/{currency_b_id}/candles", response_model=List[structs.PoolCandle], tags=["DEX"])
+async def get_pool_candles(
+    request: Request,
+    currency_a_id: int,
+    currency_b_id: int,
+    resolution: Literal["1m", "1h", "1d"] = "1h",
+    start_timestamp: Optional[int] = None,
+    end_timestamp: Optional[int] = None,
+    limit: int = 500
+):
+    if limit > 1000: limit = 1000
+    if limit <= 0: limit = 500
+
+    async def load():
+        pool = await Rapid.LiquidityPools.get_by_currency_pair(currency_a_id, currency_b_id)
+        if not pool:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Liquidity pool not found")
+
+        try:
+            return await Rapid.get_pool_candles(pool.pool_id, resolution, start_timestamp, end_timestamp, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await cached_json(request, load)
+
 @app.get("/pools/{currency_a_id}/{currency_b_id}", response_model=structs.LiquidityPool, tags=["DEX"])
-async def get_pool(currency_a_id: int, currency_b_id: int):
-    pool = await Rapid.LiquidityPools.get_by_currency_pair(currency_a_id, currency_b_id)
-    if not pool:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Liquidity pool not found")
-    return pool
+async def get_pool(request: Request, currency_a_id: int, currency_b_id: int):
+    async def load():
+        pool = await Rapid.LiquidityPools.get_by_currency_pair(currency_a_id, currency_b_id)
+        if not pool:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Liquidity pool not found")
+        return pool
+    return await cached_json(request, load)
 
 @app.post("/swap/rate", response_model=SwapRateResponse, tags=["DEX"])
 async def get_swap_rate(request: SwapRequest):
@@ -595,21 +853,25 @@ async def execute_swap(request: SwapRequest, user_id: int = Depends(get_current_
         return SwapResponse(amount_out=amount_out, currency_out_id=currency_out.currency_id, execution_id=execution_id)
     except (exceptions.InsufficientFunds, ValueError, exceptions.CurrencyNotFound) as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 @app.get("/swap/route/{currency_from_id}/{currency_to_id}", response_model=RouteResponse, tags=["DEX"])
-async def get_swap_route(currency_from_id: int, currency_to_id: int):
-    currency_from = await Rapid.Currencies.get(currency_from_id)
-    currency_to = await Rapid.Currencies.get(currency_to_id)
-    if not currency_from or not currency_to:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="One or more currencies not found")
+async def get_swap_route(request: Request, currency_from_id: int, currency_to_id: int):
+    async def load():
+        currency_from = await Rapid.Currencies.get(currency_from_id)
+        currency_to = await Rapid.Currencies.get(currency_to_id)
+        if not currency_from or not currency_to:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="One or more currencies not found")
 
-    try:
-        route = await Rapid.find_swap_route(currency_from.currency_id, currency_to.currency_id)
-        return RouteResponse(route=route)
-    except (ValueError, exceptions.CurrencyNotFound) as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        try:
+            route = await Rapid.find_swap_route(currency_from.currency_id, currency_to.currency_id)
+            return RouteResponse(route=route)
+        except (ValueError, exceptions.CurrencyNotFound) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await cached_json(request, load)
 
 @app.post("/contract/update", response_model=ContractUpdateResponse, tags=["Contract"])
 async def update_contract(request: ContractUpdateRequest, user_id: int = Depends(get_current_user_id)):
@@ -623,6 +885,8 @@ async def update_contract(request: ContractUpdateRequest, user_id: int = Depends
         return ContractUpdateResponse(contract=contract)
     except (ValueError, PermissionError) as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except exceptions.TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Transaction conflict: {e}", headers={"Retry-After": "1"})
     except exceptions.TransactionError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
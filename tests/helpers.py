@@ -0,0 +1,20 @@
+from unittest.mock import MagicMock, AsyncMock
+
+class FakePool:
+    """Stands in for an aiomysql pool that always hands out the same mocked connection."""
+
+    def __init__(self, cursor=None):
+        self.cursor = cursor or AsyncMock()
+        self.connection = MagicMock()
+        self.connection.cursor = AsyncMock(return_value=self.cursor)
+        self.connection.commit = AsyncMock()
+        self.connection.rollback = AsyncMock()
+        self.acquired = 0
+        self.released = []
+
+    async def acquire(self):
+        self.acquired += 1
+        return self.connection
+
+    def release(self, connection):
+        self.released.append(connection)
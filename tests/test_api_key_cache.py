@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import APIKeyModel
+from tests.helpers import FakePool
+
+class FakeCursor:
+    def __init__(self):
+        self.keys = {"k" * 24: 7}
+        self.version = 0
+        self.queries = []
+        self._result = None
+
+    async def execute(self, sql, params=None):
+        self.queries.append(sql)
+        if "FROM api_key_version" in sql:
+            self._result = {"version": self.version}
+        elif "FROM api_key WHERE api_key" in sql:
+            user_id = self.keys.get(params[0])
+            self._result = {"user_id": user_id, "api_key": params[0]} if user_id else None
+        elif "INTO api_key_version" in sql:
+            self.version += 1
+
+    async def fetchone(self):
+        return self._result
+
+    async def close(self):
+        pass
+
+def lookups(cursor):
+    return sum(1 for q in cursor.queries if "FROM api_key WHERE api_key" in q)
+
+class TestAPIKeyCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = FakeCursor()
+        self.model = APIKeyModel(DatabaseConnection(FakePool(self.cursor)), version_check_interval=1)
+        self.clock = patch("RapidWire.models.monotonic", return_value=100.0)
+        self.now = self.clock.start()
+        self.addCleanup(self.clock.stop)
+
+    async def test_hits_and_misses_are_cached(self):
+        for _ in range(3):
+            self.assertEqual((await self.model.get_user_by_key("k" * 24)).user_id, 7)
+            self.assertIsNone(await self.model.get_user_by_key("x" * 24))
+        self.assertEqual(lookups(self.cursor), 2)
+        self.assertEqual(len(self.cursor.queries), 3)
+
+    async def test_create_invalidates_immediately(self):
+        self.assertIsNone(await self.model.get_user_by_key("n" * 24))
+        with patch.object(self.model, "_generate_key", return_value="n" * 24):
+            self.cursor.keys["n" * 24] = 8
+            await self.model.create(8)
+        self.assertEqual((await self.model.get_user_by_key("n" * 24)).user_id, 8)
+
+    async def test_rotation_in_other_process_is_seen_after_version_check(self):
+        await self.model.get_user_by_key("k" * 24)
+        del self.cursor.keys["k" * 24]
+        self.cursor.version += 1
+
+        self.assertIsNotNone(await self.model.get_user_by_key("k" * 24))
+        self.now.return_value = 101.0
+        self.assertIsNone(await self.model.get_user_by_key("k" * 24))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import tempfile
+from time import time
+from unittest.mock import MagicMock, AsyncMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.archive import TransferArchive
+from RapidWire.config import Config
+from RapidWire.constants import SYSTEM_USER_ID
+from RapidWire.core import RapidWire
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import TransferModel
+from RapidWire.pagination import encode_cursor
+from tests.helpers import FakePool
+
+def row(transfer_id, source_id=1, amount=None):
+    return {"transfer_id": transfer_id, "execution_id": None, "source_id": source_id, "dest_id": 9,
+            "currency_id": 1, "amount": transfer_id * 7 % 10 if amount is None else amount, "timestamp": 1000 + transfer_id}
+
+class TestTransferArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.archive = TransferArchive(self.dir.name)
+        self.archive.write_segment([row(i) for i in range(1, 11)])
+        self.archive.write_segment([row(i, source_id=2) for i in range(11, 21)])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_get_and_reload(self):
+        self.assertEqual(self.archive.get(15)["source_id"], 2)
+        self.assertIsNone(self.archive.get(21))
+        reopened = TransferArchive(self.dir.name)
+        self.assertEqual(reopened.last_id, 20)
+        self.assertEqual(reopened.get(3)["amount"], 1)
+
+    def test_segments_must_be_appended_in_order(self):
+        with self.assertRaises(ValueError):
+            self.archive.write_segment([row(5)])
+
+    def test_search_orders_and_seeks(self):
+        ids = [r["transfer_id"] for r in self.archive.search(count=3)]
+        self.assertEqual(ids, [20, 19, 18])
+        ids = [r["transfer_id"] for r in self.archive.search(count=3, sort_order="asc", source_id=2)]
+        self.assertEqual(ids, [11, 12, 13])
+        after = encode_cursor("amount", "DESC", 9, 17)
+        rows = self.archive.search(count=2, sort_by="amount", after=after)
+        self.assertEqual([(r["amount"], r["transfer_id"]) for r in rows], [(9, 7), (8, 14)])
+
+    def test_search_prunes_segments(self):
+        self.archive._read = MagicMock(wraps=self.archive._read)
+        self.archive.search(count=2, start_timestamp=1015)
+        self.assertEqual(self.archive._read.call_count, 1)
+
+    def test_search_skips_segments_without_the_user(self):
+        self.archive.write_segment([row(i, source_id=3 + i) for i in range(21, 31)])
+        self.archive._read = MagicMock(wraps=self.archive._read)
+        ids = [r["transfer_id"] for r in self.archive.search(count=20, source_id=2)]
+        self.assertEqual(ids, list(range(20, 10, -1)))
+        self.assertEqual(self.archive._read.call_count, 1)
+
+        self.archive._read.reset_mock()
+        self.assertEqual(self.archive.search(count=5, user_id=10**9), [])
+        self.assertEqual(self.archive.search(count=5, currency_id=2), [])
+        self.archive._read.assert_not_called()
+
+class TestArchiveFallback(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        archive = TransferArchive(self.dir.name)
+        archive.write_segment([row(i) for i in range(1, 11)])
+        self.cursor = AsyncMock()
+        self.model = TransferModel(DatabaseConnection(FakePool(self.cursor)), archive)
+
+    async def asyncTearDown(self):
+        self.dir.cleanup()
+
+    async def test_get_falls_back_to_archive(self):
+        self.cursor.fetchone = AsyncMock(return_value=None)
+        transfer = await self.model.get(4)
+        self.assertEqual(transfer.transfer_id, 4)
+
+    async def test_full_page_newer_than_archive_skips_it(self):
+        self.cursor.fetchall = AsyncMock(return_value=[row(12), row(11)])
+        self.model.archive._read = MagicMock()
+        transfers = await self.model.search(limit=2)
+        self.assertEqual([t.transfer_id for t in transfers], [12, 11])
+        self.model.archive._read.assert_not_called()
+
+    async def test_short_page_continues_into_archive(self):
+        self.cursor.fetchall = AsyncMock(return_value=[row(11)])
+        transfers = await self.model.search(limit=3)
+        self.assertEqual([t.transfer_id for t in transfers], [11, 10, 9])
+
+    async def test_deep_page_merges_both_tiers(self):
+        # Page 2 of the hot table is empty, so the first 4 rows of each tier are merged
+        self.cursor.fetchall = AsyncMock(side_effect=[[], [row(12), row(11)]])
+        transfers = await self.model.search(page=2, limit=2)
+        self.assertEqual([t.transfer_id for t in transfers], [10, 9])
+        _, params = self.cursor.execute.await_args.args
+        self.assertEqual(params[-2:], (4, 0))
+
+    async def test_archive_job_keeps_newest_transfer_hot(self):
+        self.cursor.fetchone = AsyncMock(side_effect=[{"cutoff": 15}, {"newest": 15}])
+        self.cursor.fetchall = AsyncMock(side_effect=[[row(i) for i in range(11, 15)], []])
+
+        moved = await self.model.archive_before(2000, segment_size=100)
+
+        self.assertEqual(moved, 4)
+        self.assertEqual(self.model.archive.last_id, 14)
+        statements = [call.args for call in self.cursor.execute.await_args_list]
+        self.assertIn(("SELECT * FROM transfer WHERE transfer_id > %s AND transfer_id <= %s ORDER BY transfer_id ASC LIMIT %s", (10, 14, 100)), statements)
+        self.assertEqual(statements[-2], ("DELETE FROM transfer WHERE transfer_id <= %s", (14,)))
+
+class TestArchivedHistory(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Archive(Config.Archive):
+            path = str(Path(self.dir.name) / "archive")
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Archive": Archive})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        self.currency, _ = await self.rw.create_currency(100, "Test", "TST", 1000, 1, 0)
+        for source_id, dest_id, amount in ((1, 2, 300), (2, 3, 100), (1, 3, 50), (3, 1, 20), (2, 1, 5)):
+            await self.rw.transfer(source_id, dest_id, self.currency.currency_id, amount)
+        async with self.rw.db as cursor:
+            # Spread the history out so every point in time sees a different prefix of it
+            await cursor.execute("UPDATE transfer SET timestamp = 1000 + transfer_id * 10")
+            await cursor.execute("UPDATE transfer SET execution_id = 7 WHERE transfer_id IN (2, 6)")
+
+    async def history(self):
+        currency_id = self.currency.currency_id
+        balances = [
+            (await self.rw.get_balance_at(user_id, currency_id, timestamp)).amount
+            for user_id in (1, 2, 3) for timestamp in range(1000, 1070, 10)
+        ]
+        supply = [(await self.rw.get_supply_at(currency_id, timestamp)).circulating for timestamp in range(1000, 1070, 10)]
+        await self.rw.Transfers.rebuild_user_stats()
+        stats = [await self.rw.Transfers.get_user_stats(user_id) for user_id in (1, 2, 3, SYSTEM_USER_ID)]
+        executions = [t.transfer_id for t in await self.rw.Transfers.get_for_executions([7])]
+        return balances, supply, stats, executions
+
+    async def hot_transfers(self) -> int:
+        async with self.rw.db as cursor:
+            await cursor.execute("SELECT COUNT(*) AS n FROM transfer")
+            return (await cursor.fetchone())["n"]
+
+    async def test_archived_transfers_are_still_counted(self):
+        before = await self.history()
+        self.assertEqual(before[0][6::7], [675, 195, 130])
+        self.assertEqual(before[3], [2, 6])
+
+        moved = await self.rw.Transfers.archive_before(int(time()), segment_size=2)
+        self.assertEqual(moved, 5)
+        self.assertEqual(await self.hot_transfers(), 1)
+        self.assertEqual(await self.history(), before)
+
+        # A snapshot newer than the archive is unwound through the archived rows
+        await self.rw.take_balance_snapshot(force=True)
+        self.assertEqual(await self.history(), before)
+
+if __name__ == '__main__':
+    unittest.main()
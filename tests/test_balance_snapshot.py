@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import AsyncMock
+from decimal import Decimal
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import BalanceSnapshotModel
+from RapidWire.constants import SYSTEM_USER_ID
+from tests.helpers import FakePool
+
+def snapshot(snapshot_id, timestamp, transfer_id, total=0):
+    return {"snapshot_id": snapshot_id, "currency_id": 1, "transfer_id": transfer_id, "timestamp": timestamp, "holders": 1, "total": Decimal(total)}
+
+class TestPointInTimeBalance(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = AsyncMock()
+        self.db = DatabaseConnection(FakePool(self.cursor))
+        self.model = BalanceSnapshotModel(self.db)
+
+    def replay_params(self):
+        return [call.args[1] for call in self.cursor.execute.await_args_list if "FROM transfer" in call.args[0]]
+
+    async def test_replays_forward_from_earlier_snapshot(self):
+        self.cursor.fetchone = AsyncMock(side_effect=[
+            snapshot(1, 1000, 50), snapshot(2, 5000, 90),
+            {"amount": Decimal(100)}, {"total": Decimal(30)}, {"total": Decimal(5)}, {"total": Decimal(0)}
+        ])
+        amount, snapshot_id = await self.model.balance_at(7, 1, 2000)
+
+        self.assertEqual((amount, snapshot_id), (125, 1))
+        self.assertEqual(self.replay_params(), [(7, 50, 2000, 1), (7, 50, 2000, 1)])
+
+    async def test_unwinds_from_closer_later_snapshot(self):
+        self.cursor.fetchone = AsyncMock(side_effect=[
+            snapshot(1, 1000, 50), snapshot(2, 2100, 90),
+            {"amount": Decimal(100)}, {"total": Decimal(30)}, {"total": Decimal(5)}, {"total": Decimal(0)}
+        ])
+        amount, snapshot_id = await self.model.balance_at(7, 1, 2000)
+
+        self.assertEqual((amount, snapshot_id), (75, 2))
+        queries = [call.args[0] for call in self.cursor.execute.await_args_list if "FROM transfer" in call.args[0]]
+        self.assertTrue(all("transfer_id <= %s AND timestamp > %s" in q for q in queries))
+
+    async def test_without_snapshots_replays_full_history(self):
+        self.cursor.fetchone = AsyncMock(side_effect=[None, None, {"total": Decimal(30)}, {"total": Decimal(0)}, {"total": Decimal(0)}])
+        amount, snapshot_id = await self.model.balance_at(7, 1, 2000)
+        self.assertEqual((amount, snapshot_id), (30, None))
+
+    async def test_circulating_supply_follows_system_flows(self):
+        # 40 minted to accounts and 15 returned to the system since the snapshot
+        self.cursor.fetchone = AsyncMock(side_effect=[
+            snapshot(1, 1000, 50, total=500), None, {"total": Decimal(15)}, {"total": Decimal(40)}, {"total": Decimal(0)}
+        ])
+        circulating, _ = await self.model.circulating_at(1, 2000)
+
+        self.assertEqual(circulating, 525)
+        self.assertEqual(self.replay_params()[0][0], SYSTEM_USER_ID)
+
+    async def test_unsettled_deferred_gas_is_subtracted(self):
+        self.cursor.fetchone = AsyncMock(side_effect=[
+            snapshot(1, 1000, 50), None, {"amount": Decimal(100)}, {"total": Decimal(0)}, {"total": Decimal(0)}, {"total": Decimal(6)}
+        ])
+        amount, _ = await self.model.balance_at(7, 1, 2000)
+
+        self.assertEqual(amount, 94)
+        pending = self.cursor.execute.await_args_list[-1]
+        self.assertIn("settled_at IS NULL OR settled_at > %s", pending.args[0])
+        self.assertEqual(pending.args[1], (1, 7, 2000, 2000))
+
+    async def test_snapshot_refuses_to_run_inside_transaction(self):
+        async with self.db:
+            with self.assertRaises(RuntimeError):
+                await self.model.take()
+
+    async def test_snapshot_uses_one_consistent_read(self):
+        self.cursor.fetchone = AsyncMock(return_value={"transfer_id": 42})
+        self.cursor.fetchall = AsyncMock(side_effect=[
+            [{"currency_id": 1}],
+            [{"user_id": 7, "amount": Decimal(100)}, {"user_id": 8, "amount": Decimal(20)}],
+            [{"user_id": 8, "amount": Decimal(5)}]
+        ])
+        self.cursor.lastrowid = 3
+
+        snapshots = await self.model.take()
+
+        statements = [call.args[0] for call in self.cursor.execute.await_args_list]
+        self.assertEqual(statements[1], "START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        self.assertEqual((snapshots[0].transfer_id, snapshots[0].holders, snapshots[0].total), (42, 2, 125))
+        self.cursor.executemany.assert_awaited_once()
+        self.assertEqual(self.cursor.executemany.await_args.args[1], [(3, 7, 100), (3, 8, 25)])
+
+if __name__ == '__main__':
+    unittest.main()
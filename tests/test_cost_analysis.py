@@ -0,0 +1,184 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.analysis import analyze_script
+from RapidWire.config import Config
+from RapidWire.constants import CONTRACT_OP_COSTS
+from RapidWire.core import RapidWire
+from RapidWire.exceptions import ContractError
+from RapidWire.structs import ChainContext
+from RapidWire.vm import RapidWireVM
+
+def var(name):
+    return {'t': 'var', 'v': name}
+
+def num(value):
+    return {'t': 'int', 'v': value}
+
+def counter_loop(times, body=()):
+    return [
+        {'op': 'set', 'args': [num(0)], 'out': 'i'},
+        {'op': 'lt', 'args': [var('i'), num(times)], 'out': 'c'},
+        {'op': 'while', 'args': [var('c')], 'body': [
+            *body,
+            {'op': 'add', 'args': [var('i'), num(1)], 'out': 'i'},
+            {'op': 'lt', 'args': [var('i'), num(times)], 'out': 'c'},
+        ]},
+    ]
+
+TRANSFER = {'op': 'transfer', 'args': [num(8), num(5), num(100)]}
+CANCEL = {'op': 'cancel', 'args': [{'t': 'str', 'v': 'no'}]}
+
+class TestAnalyzeScript(unittest.IsolatedAsyncioTestCase):
+    async def run_script(self, script) -> int:
+        """The cost the VM charges for one run of ``script``."""
+        api = AsyncMock()
+        api.chain_context = ChainContext(total_cost=0, budget=10**9)
+        def add_cost(op):
+            api.chain_context.total_cost += CONTRACT_OP_COSTS.get(op, 0)
+        api.add_cost = MagicMock(side_effect=add_cost)
+        try:
+            await RapidWireVM(script, api, {'_sender': 1, '_self': 2, '_input': ''}).run()
+        except Exception:
+            pass
+        return api.chain_context.total_cost
+
+    async def test_counter_loop_is_exact(self):
+        script = counter_loop(5, [TRANSFER])
+        analysis = analyze_script(script)
+        self.assertEqual(analysis.min_cost, analysis.max_cost)
+        self.assertEqual(analysis.max_cost, await self.run_script(script))
+        self.assertEqual(analysis.unbounded_loops, [])
+        self.assertEqual((analysis.breakdown['transfer'].count, analysis.breakdown['transfer'].max_cost), (1, 50))
+        self.assertEqual(analysis.breakdown['while'].max_cost, 6)
+
+    async def test_branches_and_early_stops(self):
+        script = [
+            {'op': 'eq', 'args': [var('_input'), {'t': 'str', 'v': 'go'}], 'out': 'go'},
+            {'op': 'if', 'args': [var('go')], 'then': [TRANSFER], 'else': [CANCEL]},
+            {'op': 'output', 'args': [{'t': 'str', 'v': 'done'}]},
+        ]
+        analysis = analyze_script(script)
+        self.assertEqual((analysis.min_cost, analysis.max_cost), (2, 13))
+        self.assertEqual(await self.run_script(script), 2)
+
+    async def test_loops_without_a_bound(self):
+        script = [{'op': 'while', 'args': [var('_input')], 'body': [TRANSFER]}]
+        analysis = analyze_script(script)
+        self.assertEqual((analysis.min_cost, analysis.max_cost), (1, None))
+        self.assertEqual(analysis.unbounded_loops, ['0'])
+        self.assertIsNone(analysis.breakdown['transfer'].max_cost)
+
+        # The counter is also written inside a branch, so the count cannot be derived
+        body = [{'op': 'if', 'args': [var('_input')], 'then': [{'op': 'set', 'args': [num(0)], 'out': 'i'}]}]
+        self.assertIsNone(analyze_script(counter_loop(3, body)).max_cost)
+
+    async def test_loop_that_never_runs(self):
+        script = counter_loop(0, [TRANSFER])
+        analysis = analyze_script(script)
+        self.assertEqual((analysis.min_cost, analysis.max_cost), (3, 3))
+        self.assertEqual(await self.run_script(script), 3)
+        self.assertEqual((analysis.breakdown['transfer'].count, analysis.breakdown['transfer'].max_cost), (1, 0))
+
+class TestContractCostBounds(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Gas(Config.Gas):
+            currency_id = 100
+            price = 2
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Gas": Gas})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Gas", "GAS", 1000, 1, 0)
+        await self.rw.transfer(1, 7, 100, 100)
+
+    async def query(self, sql: str) -> list[dict]:
+        async with self.rw.db as cursor:
+            await cursor.execute(sql)
+            return await cursor.fetchall()
+
+    async def test_exact_estimate_needs_no_refund(self):
+        contract = await self.rw.set_contract(7, json.dumps(counter_loop(3, [TRANSFER])))
+        self.assertEqual(contract.cost_min, contract.cost_max)
+        self.assertGreater(contract.cost_max, contract.cost)
+
+        await self.rw.execute_contract(1, 7)
+
+        executions = await self.query("SELECT execution_id, status, cost FROM execution WHERE contract_owner_id = 7")
+        self.assertEqual([(row["status"], row["cost"]) for row in executions], [("success", contract.cost_max)])
+        gas = await self.query(f"SELECT source_id, amount FROM transfer WHERE execution_id = {executions[0]['execution_id']} AND currency_id = 100 AND (source_id = 0 OR dest_id = 0)")
+        self.assertEqual([(row["source_id"], row["amount"]) for row in gas], [(1, contract.cost_max * 2)])
+
+    async def test_callers_only_need_the_cheapest_path(self):
+        script = [{'op': 'if', 'args': [var('_input')], 'then': counter_loop(5, [TRANSFER])}]
+        contract = await self.rw.set_contract(7, json.dumps(script))
+        self.assertGreater(contract.cost_max, contract.cost_min)
+        # Enough for the path taken without input, not for the worst case
+        await self.rw.transfer(1, 9, 100, contract.cost_min * 2)
+
+        execution_id, _ = await self.rw.execute_contract(9, 7)
+        self.assertEqual((await self.rw.get_user(9).get_balance(100)).amount, 0)
+        gas = await self.query(f"SELECT source_id, amount FROM transfer WHERE execution_id = {execution_id} AND currency_id = 100 AND (source_id = 0 OR dest_id = 0)")
+        self.assertEqual([(row["source_id"], row["amount"]) for row in gas], [(9, contract.cost_min * 2)])
+
+    async def test_costlier_path_pays_the_rest_at_the_end(self):
+        script = [{'op': 'if', 'args': [var('_input')], 'then': counter_loop(2, [TRANSFER])}]
+        contract = await self.rw.set_contract(7, json.dumps(script))
+
+        execution_id, _ = await self.rw.execute_contract(1, 7, "go")
+        used = (await self.query(f"SELECT cost FROM execution WHERE execution_id = {execution_id}"))[0]["cost"]
+        self.assertGreater(used, contract.cost_min)
+        gas = await self.query(f"SELECT source_id, amount FROM transfer WHERE execution_id = {execution_id} AND currency_id = 100 AND (source_id = 0 OR dest_id = 0) ORDER BY transfer_id")
+        self.assertEqual([(row["source_id"], row["amount"]) for row in gas], [(1, contract.cost_min * 2), (1, (used - contract.cost_min) * 2)])
+
+    async def test_completed_run_is_charged_at_most_the_balance(self):
+        script = [{'op': 'if', 'args': [var('_input')], 'then': counter_loop(5, [TRANSFER])}]
+        contract = await self.rw.set_contract(7, json.dumps(script))
+        for single_transaction in (False, True):
+            with self.subTest(single_transaction=single_transaction):
+                self.rw.Config.Execution = type("Execution", (Config.Execution,), {"single_transaction": single_transaction})
+                await self.rw.transfer(1, 9, 100, contract.cost_min * 2 + 1)
+
+                execution_id, _ = await self.rw.execute_contract(9, 7, "go")
+
+                status = await self.query(f"SELECT status, cost FROM execution WHERE execution_id = {execution_id}")
+                self.assertEqual(status[0]["status"], "success")
+                self.assertGreater(status[0]["cost"], contract.cost_min + 1)
+                self.assertEqual((await self.rw.get_user(9).get_balance(100)).amount, 0)
+                gas = await self.query(f"SELECT SUM(amount) AS amount FROM transfer WHERE execution_id = {execution_id} AND currency_id = 100 AND source_id = 9")
+                self.assertEqual(gas[0]["amount"], contract.cost_min * 2 + 1)
+
+    async def test_doomed_execution_is_rejected_before_recording(self):
+        contract = await self.rw.set_contract(7, json.dumps(counter_loop(20, [TRANSFER])), max_cost=100)
+        self.assertGreater(contract.cost_min, 100)
+
+        with self.assertRaises(ContractError):
+            await self.rw.execute_contract(1, 7)
+        self.assertEqual(await self.query("SELECT execution_id FROM execution WHERE contract_owner_id = 7"), [])
+        self.assertEqual((await self.rw.get_user(1).get_balance(100)).amount, 900)
+
+    async def test_calls_to_other_contracts_leave_no_upper_bound(self):
+        script = [{'op': 'execute', 'args': [num(9), {'t': 'str', 'v': ''}], 'out': 'r'}]
+        contract = await self.rw.set_contract(7, json.dumps(script))
+        self.assertEqual(contract.cost_min, contract.cost + CONTRACT_OP_COSTS['execute'])
+        self.assertIsNone(contract.cost_max)
+        self.assertEqual(self.rw.analyze_contract(json.dumps(script)).external_calls, 1)
+
+if __name__ == '__main__':
+    unittest.main()
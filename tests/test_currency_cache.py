@@ -0,0 +1,128 @@
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.cache import TTLCache
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import CurrencyModel
+from tests.helpers import FakePool
+
+def currency_row(currency_id=1, symbol="ABC", supply=100):
+    return {
+        "currency_id": currency_id, "name": "Test", "symbol": symbol, "issuer": 9,
+        "supply": supply, "minting_renounced": 0, "delete_requested_at": None,
+        "hourly_interest_rate": 0, "new_hourly_interest_rate": None, "rate_change_requested_at": None,
+    }
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        with patch("RapidWire.cache.monotonic", return_value=100):
+            cache.set("a", 1)
+        with patch("RapidWire.cache.monotonic", return_value=109):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("RapidWire.cache.monotonic", return_value=110):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+class TestCurrencyCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = AsyncMock()
+        self.cursor.fetchone = AsyncMock(return_value=currency_row())
+        self.cursor.fetchall = AsyncMock(return_value=[{"currency_id": 1, "supply": 100}])
+        self.cursor.rowcount = 1
+        self.db = DatabaseConnection(FakePool(self.cursor))
+        self.model = CurrencyModel(self.db, TTLCache(16, 60))
+
+    async def test_get_is_served_from_cache(self):
+        await self.model.get(1)
+        await self.model.get(1)
+        await self.model.get_by_symbol("ABC")
+        statements = [call.args[0] for call in self.cursor.execute.await_args_list]
+        self.assertEqual(len(statements), 3)
+        # Cache hits only read the supply
+        self.assertTrue(all(statement.startswith("SELECT c.currency_id, c.supply") for statement in statements[1:]))
+
+    async def test_cached_currency_has_live_supply(self):
+        await self.model.get(1)
+        # Another process minted; nothing in this process invalidated the entry
+        self.cursor.fetchall = AsyncMock(return_value=[{"currency_id": 1, "supply": 175}])
+        currency = await self.model.get(1)
+        self.assertEqual((currency.symbol, currency.supply), ("ABC", 175))
+        self.assertEqual([c.supply for c in await self.model.get_many([1])], [175])
+
+        # Deleted elsewhere: the entry is dropped instead of served
+        self.cursor.fetchall = AsyncMock(return_value=[])
+        self.cursor.fetchone.return_value = None
+        self.assertIsNone(await self.model.get(1))
+        self.assertEqual(len(self.model.cache), 0)
+
+    async def test_update_supply_invalidates_after_commit(self):
+        await self.model.get(1)
+        async with self.db as cursor:
+            await self.model.update_supply(cursor, 1, 50)
+            # A concurrent reader re-caches the committed row before this transaction commits
+            self.model.cache.set(1, (await self.model.get(1, use_cache=False)))
+        self.cursor.fetchone.return_value = currency_row(supply=150)
+        self.cursor.fetchall = AsyncMock(return_value=[{"currency_id": 1, "supply": 150}])
+        self.assertEqual((await self.model.get(1)).supply, 150)
+
+    async def test_reads_inside_transaction_are_not_cached(self):
+        async with self.db:
+            await self.model.get(1)
+        # The read above happened inside the transaction
+        self.assertEqual(len(self.model.cache), 0)
+
+    async def test_mutators_invalidate_symbol_index(self):
+        await self.model.get_by_symbol("ABC")
+        await self.model.delete(1)
+        self.cursor.fetchone.return_value = None
+        self.assertIsNone(await self.model.get_by_symbol("ABC"))
+
+class TestWritesReadFreshCurrency(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Test", "TST", 10000, 1, 0)
+
+    async def test_interest_uses_a_rate_changed_by_another_process(self):
+        await self.rw.stake_deposit(1, 100, 1000)
+        self.assertEqual((await self.rw.Currencies.get(100)).hourly_interest_rate, 0)
+        # Another process applies a rate change; this process still has the old row cached
+        async with self.rw.db as cursor:
+            await cursor.execute("UPDATE currency SET hourly_interest_rate = 10000 WHERE currency_id = 100")
+            await cursor.execute("UPDATE staking SET last_updated_at = last_updated_at - 7200 WHERE user_id = 1")
+
+        await self.rw.stake_withdraw(1, 100, 1)
+        # Two hours at 1% on 1000
+        self.assertEqual((await self.rw.Stakes.get(1, 100)).amount, 1020 - 1)
+
+if __name__ == '__main__':
+    unittest.main()
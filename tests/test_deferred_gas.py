@@ -0,0 +1,139 @@
+import json
+import tempfile
+import unittest
+from time import time
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.exceptions import InsufficientFunds, TransactionCanceledByContract
+
+TRANSFER_TO_8 = {'op': 'transfer', 'args': [{'t': 'int', 'v': 8}, {'t': 'int', 'v': 5}, {'t': 'int', 'v': 100}]}
+
+class TestDeferredGas(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Gas(Config.Gas):
+            currency_id = 100
+            price = 2
+            settlement = "deferred"
+            settlement_period = 3600
+
+        class Execution(Config.Execution):
+            single_transaction = True
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Gas": Gas, "Execution": Execution})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Gas", "GAS", 1000, 1, 0)
+        await self.rw.transfer(1, 7, 100, 100)
+
+    async def balance(self, user_id: int) -> int:
+        return (await self.rw.get_user(user_id).get_balance(100)).amount
+
+    async def query(self, sql: str) -> list[dict]:
+        async with self.rw.db as cursor:
+            await cursor.execute(sql)
+            return await cursor.fetchall()
+
+    async def supply(self) -> int:
+        return (await self.rw.Currencies.get(100, use_cache=False)).supply
+
+    async def test_fee_is_charged_once_without_transfer_rows(self):
+        await self.rw.set_contract(7, json.dumps([TRANSFER_TO_8]))
+        for _ in range(3):
+            await self.rw.execute_contract(1, 7)
+
+        costs = [row["cost"] for row in await self.query("SELECT cost FROM execution WHERE status = 'success' AND contract_owner_id = 7")]
+        fee = sum(costs) * 2
+        self.assertEqual(await self.balance(1), 900 - fee)
+        self.assertEqual(await self.balance(8), 15)
+        self.assertEqual(await self.query("SELECT transfer_id FROM transfer WHERE source_id = 1 AND dest_id = 0"), [])
+        charges = await self.query("SELECT user_id, SUM(amount) AS amount, COUNT(*) AS executions FROM gas_charge WHERE settled_at IS NULL GROUP BY user_id")
+        self.assertEqual([(row["user_id"], int(row["amount"]), row["executions"]) for row in charges], [(1, fee, 3)])
+        self.assertEqual(await self.rw.reconcile_supply(), [])
+
+        # The current period stays open; once it has passed, settlement writes one transfer and burns it from the supply
+        self.assertEqual(await self.rw.settle_gas_income(), {})
+        self.assertEqual(await self.supply(), 1000)
+        with patch("RapidWire.core.time", return_value=10**10):
+            self.assertEqual(await self.rw.settle_gas_income(), {100: fee})
+        self.assertEqual(await self.supply(), 1000 - fee)
+        self.assertEqual(await self.rw.reconcile_supply(), [])
+        rows = await self.query("SELECT amount, timestamp FROM transfer WHERE source_id = 1 AND dest_id = 0")
+        self.assertEqual([(int(row["amount"]), row["timestamp"]) for row in rows], [(fee, 10**10)])
+        self.assertEqual(await self.query("SELECT execution_id FROM gas_charge WHERE settled_at IS NULL"), [])
+        self.assertEqual((await self.rw.Transfers.get_user_stats(1))["sent_count"], 2)
+        self.assertEqual(await self.balance(1), 900 - fee)
+
+    async def test_balance_at_includes_unsettled_charges(self):
+        await self.rw.set_contract(7, json.dumps([TRANSFER_TO_8]))
+        await self.rw.take_balance_snapshot(force=True)
+        await self.rw.execute_contract(1, 7)
+        now = int(time())
+        live = {user_id: await self.balance(user_id) for user_id in (1, 7, 8)}
+        circulating = sum(live.values())
+        self.assertLess(live[1], 900)
+
+        async def replayed(timestamp: int):
+            balances = {user_id: (await self.rw.get_balance_at(user_id, 100, timestamp)).amount for user_id in live}
+            return balances, (await self.rw.get_supply_at(100, timestamp)).circulating
+
+        # Replayed from the snapshot before the charge, then from one taken while it is unsettled
+        self.assertEqual(await replayed(now), (live, circulating))
+        await self.rw.take_balance_snapshot(force=True)
+        self.assertEqual(await replayed(now), (live, circulating))
+
+        with patch("RapidWire.core.time", return_value=10**10):
+            await self.rw.settle_gas_income()
+        self.assertEqual(await replayed(now), (live, circulating))
+        self.assertEqual(await replayed(10**10), (live, circulating))
+
+    async def test_failed_execution_is_charged_for_gas_used(self):
+        await self.rw.set_contract(7, json.dumps([TRANSFER_TO_8, {'op': 'cancel', 'args': [{'t': 'str', 'v': 'no'}]}]))
+        with self.assertRaises(TransactionCanceledByContract):
+            await self.rw.execute_contract(1, 7)
+
+        executions = await self.query("SELECT status, cost FROM execution WHERE contract_owner_id = 7")
+        self.assertEqual([row["status"] for row in executions], ["reverted"])
+        self.assertEqual(await self.balance(1), 900 - executions[0]["cost"] * 2)
+        self.assertEqual(await self.balance(8), 0)
+        self.assertEqual(await self.rw.reconcile_supply(), [])
+
+    async def test_estimate_must_be_covered(self):
+        await self.rw.set_contract(7, json.dumps([TRANSFER_TO_8]))
+        with self.assertRaises(InsufficientFunds):
+            await self.rw.execute_contract(9, 7)
+        self.assertEqual(await self.query("SELECT execution_id FROM execution WHERE contract_owner_id = 7"), [])
+        self.assertEqual(await self.query("SELECT execution_id FROM gas_charge"), [])
+
+    async def test_completed_run_is_charged_at_most_the_balance(self):
+        script = [{'op': 'if', 'args': [{'t': 'var', 'v': '_input'}], 'then': [TRANSFER_TO_8, TRANSFER_TO_8]}]
+        contract = await self.rw.set_contract(7, json.dumps(script))
+        await self.rw.transfer(1, 9, 100, contract.cost_min * 2)
+
+        execution_id, _ = await self.rw.execute_contract(9, 7, "go")
+
+        executions = await self.query(f"SELECT status, cost FROM execution WHERE execution_id = {execution_id}")
+        self.assertEqual(executions[0]["status"], "success")
+        self.assertGreater(executions[0]["cost"], contract.cost_min)
+        self.assertEqual(await self.balance(9), 0)
+        charges = await self.query("SELECT amount FROM gas_charge WHERE user_id = 9")
+        self.assertEqual([row["amount"] for row in charges], [contract.cost_min * 2])
+        self.assertEqual(await self.rw.reconcile_supply(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.exceptions import InsufficientFunds, TransactionCanceledByContract
+from RapidWire.sqlite import SQLiteConnection
+
+def script(*ops) -> str:
+    return json.dumps(list(ops))
+
+TRANSFER_TO_8 = {'op': 'transfer', 'args': [{'t': 'int', 'v': 8}, {'t': 'int', 'v': 5}, {'t': 'int', 'v': 100}]}
+
+class TestSingleTransactionBookkeeping(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Gas(Config.Gas):
+            currency_id = 100
+            price = 1
+
+        class Execution(Config.Execution):
+            single_transaction = True
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Gas": Gas, "Execution": Execution})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Gas", "GAS", 1000, 1, 0)
+        await self.rw.create_currency(200, "Other", "OTH", 1000, 1, 0)
+        await self.rw.transfer(1, 7, 100, 100)
+
+    async def balance(self, user_id: int, currency_id: int = 100) -> int:
+        return (await self.rw.get_user(user_id).get_balance(currency_id)).amount
+
+    async def executions(self) -> list[tuple]:
+        async with self.rw.db as cursor:
+            await cursor.execute("SELECT status, output_data, cost FROM execution WHERE input_data IS NULL OR input_data != 'update_contract' ORDER BY execution_id")
+            return [(row["status"], row["output_data"], row["cost"]) for row in await cursor.fetchall()]
+
+    def count_commits(self) -> list:
+        commits = []
+        original = SQLiteConnection.commit
+        async def commit(connection):
+            if connection is self.rw.pool.connections[0]:
+                commits.append(connection)
+            await original(connection)
+        patcher = patch.object(SQLiteConnection, "commit", commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return commits
+
+    async def test_contract_success_commits_once(self):
+        await self.rw.set_contract(7, script(TRANSFER_TO_8, {'op': 'output', 'args': [{'t': 'str', 'v': 'ok'}]}))
+        cost = (await self.rw.Contracts.get(7)).cost
+        commits = self.count_commits()
+
+        _, output = await self.rw.execute_contract(1, 7, "hi")
+
+        self.assertEqual(output, "ok")
+        self.assertEqual(len(commits), 1)
+        executions = await self.executions()
+        self.assertEqual([(status, out) for status, out, _ in executions], [("success", "ok")])
+        used = executions[0][2]
+        self.assertGreater(used, cost)
+        self.assertEqual(await self.balance(8), 5)
+        self.assertEqual(await self.balance(1), 900 - used)
+
+    async def test_gas_is_one_transfer_written_after_the_run(self):
+        await self.rw.set_contract(7, script(TRANSFER_TO_8))
+        execution_id, _ = await self.rw.execute_contract(1, 7)
+
+        transfers = await self.rw.Transfers.get_for_executions([execution_id])
+        # The contract's own transfer took the sequence first: no gas row was written before the run
+        self.assertEqual(
+            [(t.source_id, t.dest_id) for t in sorted(transfers, key=lambda t: t.transfer_id)],
+            [(7, 8), (1, 0)]
+        )
+        used = (await self.executions())[0][2]
+        self.assertEqual([t.amount for t in transfers if t.dest_id == 0], [used])
+
+    async def test_reverted_contract_is_recorded_and_charged_for_gas_used(self):
+        await self.rw.set_contract(7, script(TRANSFER_TO_8, {'op': 'cancel', 'args': [{'t': 'str', 'v': 'no'}]}))
+
+        with self.assertRaises(TransactionCanceledByContract):
+            await self.rw.execute_contract(1, 7)
+
+        executions = await self.executions()
+        self.assertEqual([(status, out) for status, out, _ in executions], [("reverted", "no")])
+        self.assertEqual(await self.balance(8), 0)
+        self.assertEqual(await self.balance(7), 100)
+        self.assertEqual(await self.balance(1), 900 - executions[0][2])
+
+    async def test_discord_writes_are_sent_after_commit(self):
+        self.rw.Config.Discord = type("Discord", (Config.Discord,), {"token": "token"})
+        self.rw.DiscordPermissions.check = AsyncMock(return_value=True)
+        role_add = {'op': 'discord_role_add', 'args': [{'t': 'int', 'v': 8}, {'t': 'int', 'v': 1}, {'t': 'int', 'v': 2}]}
+        sent = []
+        async def put(client, url):
+            sent.append((url, self.rw.db.in_transaction))
+            return httpx.Response(204)
+
+        with patch.object(httpx.AsyncClient, "put", put):
+            await self.rw.set_contract(7, script(role_add, {'op': 'cancel', 'args': [{'t': 'str', 'v': 'no'}]}))
+            with self.assertRaises(TransactionCanceledByContract):
+                await self.rw.execute_contract(1, 7)
+            await asyncio.sleep(0)
+            self.assertEqual(sent, [])
+
+            await self.rw.set_contract(7, script(role_add))
+            await self.rw.execute_contract(1, 7)
+            if self.rw.side_effects:
+                await asyncio.wait(self.rw.side_effects)
+        self.assertEqual(sent, [("/guilds/1/members/8/roles/2", False)])
+
+    async def test_swap_success_and_failure(self):
+        await self.rw.create_liquidity_pool(100, 200, 500, 500, 1)
+        commits = self.count_commits()
+
+        execution_id, amount_out, currency_id = await self.rw.execute_swap(7, 100, 200, 10)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual((currency_id, await self.balance(7, 200)), (200, amount_out))
+
+        with self.assertRaises(InsufficientFunds):
+            await self.rw.execute_swap(8, 100, 200, 10)
+        self.assertEqual([status for status, _, _ in await self.executions()], ["success", "failed"])
+        self.assertEqual((await self.rw.Executions.get(execution_id)).status, "success")
+
+    async def test_transfer_from_failure_leaves_only_the_failed_row(self):
+        await self.rw.approve(7, 9, 100, 20)
+
+        execution_id, transfer = await self.rw.execute_transfer_from(9, 7, 8, 100, 15)
+        self.assertEqual(transfer.execution_id, execution_id)
+        with self.assertRaises(Exception):
+            await self.rw.execute_transfer_from(9, 7, 8, 100, 15)
+
+        self.assertEqual([status for status, _, _ in await self.executions()], ["success", "failed"])
+        self.assertEqual(await self.balance(8), 15)
+
+if __name__ == '__main__':
+    unittest.main()
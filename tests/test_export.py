@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import AsyncMock
+from decimal import Decimal
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import TransferModel
+from RapidWire.search import plan_transfer_export
+from tests.helpers import FakePool
+
+def row(transfer_id):
+    return {"transfer_id": transfer_id, "execution_id": None, "source_id": 1, "dest_id": 2,
+            "currency_id": 1, "amount": Decimal(10**20), "timestamp": 100}
+
+def batched_pool(batches):
+    cursor = AsyncMock()
+    cursor.fetchall = AsyncMock(side_effect=batches)
+    return FakePool(cursor)
+
+class TestExportPlan(unittest.TestCase):
+    def test_walks_transfer_id_from_checkpoint(self):
+        query, params = plan_transfer_export(user_id=5, start_timestamp=10, after_id=99)
+        self.assertIn("(t.source_id = %s OR t.dest_id = %s)", query)
+        self.assertIn("t.transfer_id > %s", query)
+        self.assertTrue(query.endswith("ORDER BY t.transfer_id ASC"))
+        self.assertNotIn("LIMIT", query)
+        self.assertEqual(params, (10, 5, 5, 99))
+
+    def test_batches_are_limited(self):
+        query, params = plan_transfer_export(currency_id=1, after_id=7, limit=500)
+        self.assertTrue(query.endswith("ORDER BY t.transfer_id ASC LIMIT %s"))
+        self.assertEqual(params, (1, 7, 500))
+
+    def test_equality_uses_ordered_index(self):
+        query, params = plan_transfer_export(source_id=3)
+        self.assertIn("USE INDEX (source_transfer)", query)
+        self.assertEqual(params, (3,))
+
+class TestStreaming(unittest.IsolatedAsyncioTestCase):
+    async def test_rows_are_fetched_in_keyset_batches(self):
+        pool = batched_pool([[row(1), row(2)], [row(3)]])
+        model = TransferModel(DatabaseConnection(pool))
+
+        rows = [r async for r in model.export(batch_size=2, currency_id=1)]
+
+        self.assertEqual([r["transfer_id"] for r in rows], [1, 2, 3])
+        self.assertEqual(rows[0]["amount"], 10**20)
+        params = [call.args[1] for call in pool.cursor.execute.await_args_list]
+        self.assertEqual(params, [(1, 2), (1, 2, 2)])
+        # Every batch runs on its own short-lived connection
+        self.assertEqual(pool.acquired, 2)
+        self.assertEqual(pool.released, [pool.connection] * 2)
+
+    async def test_abandoned_export_holds_no_connection(self):
+        pool = batched_pool([[row(1), row(2)], [row(3)]])
+        stream = TransferModel(DatabaseConnection(pool)).export(batch_size=2)
+
+        await stream.__anext__()
+        self.assertEqual(pool.released, [pool.connection])
+        await stream.aclose()
+        self.assertEqual(pool.acquired, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from decimal import Decimal
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.hydration import hydrate, hydrate_all
+from RapidWire.structs import Transfer, Currency, Claim, ContractHistory
+
+class TestHydration(unittest.TestCase):
+    def assertSameAsValidated(self, cls, rows):
+        hydrated = hydrate_all(cls, rows)
+        validated = [cls(**row) for row in rows]
+        self.assertEqual(hydrated, validated)
+        self.assertEqual([m.model_dump_json() for m in hydrated], [m.model_dump_json() for m in validated])
+        return hydrated
+
+    def test_decimal_columns_become_ints(self):
+        rows = [{"transfer_id": i, "execution_id": None, "source_id": 1, "dest_id": 2,
+                 "currency_id": 1, "amount": Decimal(10**20 + i), "timestamp": 5} for i in range(3)]
+        transfers = self.assertSameAsValidated(Transfer, rows)
+        self.assertIs(type(transfers[2].amount), int)
+
+    def test_alias_and_tinyint_flag(self):
+        row = {"currency_id": 1, "name": "a", "symbol": "A", "issuer": 5, "supply": Decimal(3), "minting_renounced": 1,
+               "delete_requested_at": None, "hourly_interest_rate": 0, "new_hourly_interest_rate": None, "rate_change_requested_at": None}
+        currency = hydrate(Currency, row)
+        self.assertEqual(currency, Currency(**row))
+        self.assertEqual(currency.issuer_id, 5)
+        self.assertIs(currency.minting_renounced, True)
+
+    def test_defaults_and_extra_columns(self):
+        row = {"claim_id": 1, "claimant_id": 2, "payer_id": 3, "currency_id": 1, "amount": Decimal(9),
+               "status": "pending", "created_at": 7, "joined_column": "x"}
+        claim = hydrate(Claim, row)
+        self.assertIsNone(claim.description)
+        self.assertNotIn("joined_column", claim.model_dump())
+        self.assertSameAsValidated(Claim, [row])
+
+    def test_serializers_still_apply(self):
+        row = {"history_id": 1, "execution_id": 2, "user_id": 3, "script_hash": b"\x01\xff", "cost": 4, "created_at": 5}
+        self.assertEqual(hydrate(ContractHistory, row).model_dump()["script_hash"], "01ff")
+
+    def test_models_stay_mutable(self):
+        transfer = hydrate(Transfer, {"transfer_id": 1, "execution_id": None, "source_id": 1, "dest_id": 2,
+                                      "currency_id": 1, "amount": 3, "timestamp": 5})
+        transfer.amount = 4
+        self.assertEqual(transfer.amount, 4)
+        self.assertEqual(hydrate_all(Transfer, []), [])
+
+if __name__ == '__main__':
+    unittest.main()
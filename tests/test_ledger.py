@@ -0,0 +1,309 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.ledger import Book, LedgerEngine, WriteAheadLog
+from RapidWire.exceptions import InsufficientFunds, TransactionError
+from RapidWire.constants import SYSTEM_USER_ID
+
+class FakeDB:
+    in_transaction = False
+
+class FakeStore:
+    """MySQL as the ledger sees it: committed balances, supplies and transfer ids."""
+
+    def __init__(self, balances=None, supplies=None):
+        self.db = FakeDB()
+        self.balances = dict(balances or {})
+        self.supplies = dict(supplies or {})
+        self.transfer_ids: list[int] = []
+        self.seq = 0
+        self.saves = []
+        self.fail_save = False
+        self.leased = False
+        self.lease_available = True
+        self.published = None
+
+    async def acquire_lease(self):
+        if not self.lease_available or self.leased:
+            return False
+        self.leased = True
+        return True
+
+    async def lease_alive(self):
+        return self.leased
+
+    async def release_lease(self):
+        self.leased = False
+
+    async def load(self, currency_ids):
+        return (
+            {cid: supply for cid, supply in self.supplies.items() if cid in currency_ids},
+            [(uid, cid, amount) for (uid, cid), amount in self.balances.items() if cid in currency_ids]
+        )
+
+    async def saved_seq(self):
+        return self.seq
+
+    async def publish(self, host, port, token):
+        self.published = (host, port, token)
+
+    async def owner(self):
+        return self.published
+
+    async def save(self, records):
+        if self.fail_save:
+            raise RuntimeError("connection lost")
+        first_id = max(self.transfer_ids, default=0) + 1
+        for offset, (seq, source_id, dest_id, currency_id, amount, *_) in enumerate(records):
+            assert seq > self.seq
+            self.seq = seq
+            self.transfer_ids.append(first_id + offset)
+            for user_id, delta in ((source_id, -amount), (dest_id, amount)):
+                if user_id == SYSTEM_USER_ID:
+                    self.supplies[currency_id] = self.supplies.get(currency_id, 0) - delta
+                else:
+                    self.balances[(user_id, currency_id)] = self.balances.get((user_id, currency_id), 0) + delta
+        self.saves.append(len(records))
+        return first_id
+
+class TestWriteAheadLog(unittest.TestCase):
+    def test_torn_tail_is_ignored(self):
+        with tempfile.TemporaryDirectory() as path:
+            wal = WriteAheadLog(path)
+            wal.open()
+            wal.append([[1, 2, 3, 1, 10, 0], [2, 3, 2, 1, 5, 0]])
+            wal.file.write(b'0badc0de [3,2,3,1,')
+            wal.close()
+            self.assertEqual(WriteAheadLog(path).read(), [[1, 2, 3, 1, 10, 0], [2, 3, 2, 1, 5, 0]])
+
+    def test_corruption_before_the_tail_is_an_error(self):
+        with tempfile.TemporaryDirectory() as path:
+            wal = WriteAheadLog(path)
+            wal.open()
+            wal.append([[1, 2, 3, 1, 10, 0]])
+            wal.rotate()
+            wal.append([[2, 3, 2, 1, 5, 0]])
+            wal.close()
+            first = os.path.join(path, "wal-00000001.log")
+            data = open(first, "rb").read()
+            open(first, "wb").write(data.replace(b",10,", b",99,"))
+            with self.assertRaises(ValueError):
+                WriteAheadLog(path).read()
+
+    def test_book_slots(self):
+        book = Book()
+        book.add(7, 5)
+        book.add(9, 3)
+        book.add(7, -2)
+        self.assertEqual((book.get(7), book.get(9), book.get(8)), (3, 3, 0))
+        with self.assertRaises(OverflowError):
+            book.add(9, 2**63)
+
+class TestLedgerEngine(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = FakeStore(balances={(1, 5): 100}, supplies={5: 100})
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    async def engine(self, store=None):
+        engine = LedgerEngine(store or self.store, [5], self.dir.name, checkpoint_interval=3600)
+        await engine.start()
+        self.addAsyncCleanup(self._stop, engine)
+        return engine
+
+    async def _stop(self, engine):
+        for task in (engine._checkpointer, engine._saver):
+            if task:
+                task.cancel()
+        if engine._server:
+            engine._server.close()
+            await engine._server.wait_closed()
+        if engine.wal:
+            engine.wal.close()
+
+    async def crash(self, engine):
+        # Drop the process without a final checkpoint
+        await self._stop(engine)
+        self.store.leased = False
+
+    async def pending(self, engine, *transfers):
+        # Start transfers and let them reach the log without waiting for their ids
+        tasks = [asyncio.create_task(transfer) for transfer in transfers]
+        await asyncio.sleep(0)
+        await engine._flusher
+        return tasks
+
+    async def test_transfers_are_saved_before_they_are_acknowledged(self):
+        engine = await self.engine()
+        transfers = await asyncio.gather(*(engine.transfer(1, 2, 5, 10) for _ in range(3)))
+        await engine.transfer(SYSTEM_USER_ID, 3, 5, 7)
+        await engine.transfer(2, SYSTEM_USER_ID, 5, 4)
+        self.assertEqual([t.transfer_id for t in transfers], [1, 2, 3])
+        self.assertEqual(engine.balance(1, 5).amount, 70)
+        self.assertEqual(engine.books[5].supply, 103)
+        # The concurrent transfers shared one save
+        self.assertEqual(self.store.saves, [3, 1, 1])
+        self.assertEqual(self.store.balances, {(1, 5): 70, (2, 5): 26, (3, 5): 7})
+        self.assertEqual(self.store.supplies[5], 103)
+
+        await engine.checkpoint()
+        self.assertEqual(WriteAheadLog(self.dir.name).read(), [])
+
+    async def test_ids_follow_commit_order(self):
+        engine = await self.engine()
+        first = await engine.transfer(1, 2, 5, 1)
+        # A transfer of another currency commits in between
+        self.store.transfer_ids.append(2)
+        second = await engine.transfer(1, 2, 5, 1)
+        self.assertEqual((first.transfer_id, second.transfer_id), (1, 3))
+
+    async def test_insufficient_funds_leaves_state_untouched(self):
+        engine = await self.engine()
+        with self.assertRaises(InsufficientFunds):
+            await engine.transfer(2, 1, 5, 1)
+        with self.assertRaises(TransactionError):
+            await engine.transfer(SYSTEM_USER_ID, 2, 5, 2**63)
+        self.assertEqual(engine.balance(1, 5).amount, 100)
+        self.assertEqual(engine._unsaved, [])
+
+    async def test_recovery_replays_only_unsaved_records(self):
+        engine = await self.engine()
+        await engine.transfer(1, 2, 5, 10)
+        self.store.fail_save = True
+        tasks = await self.pending(engine, engine.transfer(1, 2, 5, 20), engine.transfer(2, 3, 5, 5))
+        await self.crash(engine)
+        for task in tasks:
+            task.cancel()
+        self.assertEqual(self.store.balances, {(1, 5): 90, (2, 5): 10})
+
+        self.store.fail_save = False
+        recovered = await self.engine()
+        self.assertEqual(recovered.balance(1, 5).amount, 70)
+        self.assertEqual(recovered.balance(2, 5).amount, 25)
+        self.assertEqual(recovered.balance(3, 5).amount, 5)
+        # Startup saves what it replayed, and new sequence numbers continue after the log
+        self.assertEqual(self.store.balances, {(1, 5): 70, (2, 5): 25, (3, 5): 5})
+        self.assertEqual(self.store.saves, [1, 2])
+        await recovered.transfer(3, 1, 5, 5)
+        self.assertEqual(self.store.seq, 4)
+
+    async def test_saved_records_left_in_the_log_are_not_replayed(self):
+        engine = await self.engine()
+        await engine.transfer(1, 2, 5, 10)
+        # Saved, but the process dies before a checkpoint removes the segment
+        await self.crash(engine)
+        self.assertEqual(len(WriteAheadLog(self.dir.name).read()), 1)
+
+        recovered = await self.engine()
+        self.assertEqual(recovered.balance(2, 5).amount, 10)
+        self.assertEqual(self.store.saves, [1])
+        self.assertEqual(WriteAheadLog(self.dir.name).read(), [])
+
+    async def test_failed_save_is_retried_by_the_checkpoint(self):
+        engine = await self.engine()
+        self.store.fail_save = True
+        (task,) = await self.pending(engine, engine.transfer(1, 2, 5, 10))
+        with self.assertRaises(RuntimeError):
+            await engine.checkpoint()
+        self.assertFalse(task.done())
+        self.store.fail_save = False
+        await engine.checkpoint()
+        self.assertEqual((await task).transfer_id, 1)
+        self.assertEqual(self.store.balances[(2, 5)], 10)
+        self.assertEqual(os.listdir(self.dir.name), ["wal-00000003.log"])
+
+    async def test_fsync_failure_stops_the_engine(self):
+        engine = await self.engine()
+        with patch("RapidWire.ledger.os.fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(TransactionError):
+                await engine.transfer(1, 2, 5, 10)
+        self.assertFalse(engine.serves(5))
+        with self.assertRaises(TransactionError):
+            await engine.transfer(1, 2, 5, 10)
+
+    async def test_lost_lease_fails_unsaved_transfers(self):
+        engine = await self.engine()
+        engine.checkpoint_interval = 0
+        self.store.fail_save = True
+        (task,) = await self.pending(engine, engine.transfer(1, 2, 5, 10))
+        self.store.leased = False
+        with self.assertRaises(TransactionError):
+            await task
+        self.assertFalse(engine.serves(5))
+
+    async def test_non_owner_forwards_transfers_to_the_owner(self):
+        owner = await self.engine()
+        with tempfile.TemporaryDirectory() as path:
+            other = LedgerEngine(self.store, [5], path)
+            await other.start()
+            self.assertFalse(other.serves(5))
+            self.assertTrue(other.manages(5))
+
+            transfer = await other.transfer(1, 2, 5, 10)
+            self.assertEqual((transfer.transfer_id, transfer.dest_id, transfer.amount), (1, 2, 10))
+            self.assertEqual(owner.balance(2, 5).amount, 10)
+            self.assertEqual(self.store.balances[(2, 5)], 10)
+            with self.assertRaises(InsufficientFunds):
+                await other.transfer(3, 1, 5, 1)
+
+            # A stale token is refused and the address is looked up again
+            other._peer = self.store.published[:2] + ("0" * 64,)
+            with self.assertRaises(TransactionError):
+                await other.transfer(1, 2, 5, 1)
+            self.assertEqual((await other.transfer(1, 2, 5, 1)).transfer_id, 2)
+            await other.close()
+
+    async def test_owner_validates_forwarded_requests(self):
+        engine = await self.engine()
+        host, port, token = self.store.published
+
+        async def request(fields):
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(json.dumps({"token": token, "transfer": fields}).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            writer.close()
+            return response
+
+        for fields in ([1, 1, 5, 10, None], [1, 2, 5, -10, None], [1, 2, 5, 0, None], [1, 2, 6, 10, None], [1, 2, 5, 1.5, None], [1, 2, 5]):
+            with self.subTest(fields=fields):
+                self.assertEqual((await request(fields))["error"], "value")
+        self.assertEqual(engine.balance(1, 5).amount, 100)
+        self.assertEqual(self.store.saves, [])
+
+        transfer = (await request([1, 2, 5, 10, 42]))["transfer"]
+        self.assertEqual((transfer["amount"], transfer["execution_id"]), (10, 42))
+
+    async def test_non_owner_without_an_owner_fails(self):
+        self.store.lease_available = False
+        engine = await self.engine()
+        with self.assertRaises(TransactionError):
+            await engine.transfer(1, 2, 5, 10)
+
+    async def test_rejects_transfers_inside_a_transaction(self):
+        engine = await self.engine()
+        self.store.db.in_transaction = True
+        with self.assertRaises(TransactionError):
+            await engine.transfer(1, 2, 5, 10)
+
+    async def test_close_checkpoints_and_releases_the_lease(self):
+        engine = await self.engine()
+        await engine.transfer(1, 2, 5, 10)
+        await engine.close()
+        self.assertEqual(self.store.balances[(2, 5)], 10)
+        self.assertEqual(WriteAheadLog(self.dir.name).read(), [])
+        self.assertFalse(self.store.leased)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire import RapidWire
+from RapidWire.core import STAKE_UPDATE_SECONDS
+from RapidWire.cache import TTLCache
+from RapidWire.metrics import Registry, render_cache, serve
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_and_histogram_exposition(self):
+        requests = self.registry.counter("app_requests_total", "Requests", ("route",))
+        requests.inc(route='/a"b')
+        requests.inc(2, route='/a"b')
+        latency = self.registry.histogram("app_latency_seconds", "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            latency.observe(value)
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE app_requests_total counter\napp_requests_total{route="/a\\"b"} 3\n', text)
+        self.assertIn('app_latency_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('app_latency_seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('app_latency_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn("app_latency_seconds_sum 5.55\napp_latency_seconds_count 3\n", text)
+
+    def test_registration_is_idempotent(self):
+        first = self.registry.counter("app_total", "Total")
+        self.assertIs(self.registry.counter("app_total", "Total"), first)
+        self.registry.collector("x", lambda: ["a 1"])
+        self.registry.collector("x", lambda: ["a 2"])
+        self.assertEqual(self.registry.render().count("a "), 1)
+
+    def test_cache_ratio(self):
+        cache = TTLCache(10, 60)
+        cache.set("k", 1)
+        cache.get("k")
+        cache.get("missing")
+        lines = render_cache("app_cache", {"currency": cache})
+        self.assertIn('app_cache_hit_ratio{cache="currency"} 0.5', lines)
+
+class TestMetricsListener(unittest.IsolatedAsyncioTestCase):
+    async def test_serves_registry_over_http(self):
+        registry = Registry()
+        registry.counter("bot_total", "Bot").inc()
+        server = await serve(registry, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        self.assertIn(b"bot_total 1\n", response)
+
+class TestCoreMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_stale_stake_updates_are_timed(self):
+        rapid = RapidWire(db_config={})
+        rapid.Stakes = MagicMock()
+        rapid.Stakes.get_stale_stakes = AsyncMock(return_value=[])
+        before = STAKE_UPDATE_SECONDS.labels().count
+
+        await rapid.update_stale_stakes()
+
+        self.assertEqual(STAKE_UPDATE_SECONDS.labels().count, before + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import AsyncMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import TransferModel
+from RapidWire.pagination import encode_cursor, decode_cursor, next_transfer_cursor
+from RapidWire.structs import Transfer
+from tests.helpers import FakePool
+
+def transfer(transfer_id, amount=10, timestamp=100):
+    return Transfer(transfer_id=transfer_id, execution_id=None, source_id=1, dest_id=2, currency_id=1, amount=amount, timestamp=timestamp)
+
+class TestCursorToken(unittest.TestCase):
+    def test_round_trip(self):
+        token = encode_cursor("amount", "DESC", 10**30, 42)
+        self.assertEqual(decode_cursor(token), ("amount", "DESC", 10**30, 42))
+
+    def test_rejects_garbage(self):
+        for token in ("", "!!!", encode_cursor("user_id", "DESC", 1, 1), "WzEsMl0"):
+            with self.assertRaises(ValueError):
+                decode_cursor(token)
+
+    def test_next_cursor_only_for_full_pages(self):
+        self.assertIsNone(next_transfer_cursor([transfer(1)], 2))
+        token = next_transfer_cursor([transfer(9, timestamp=5), transfer(8, timestamp=4)], 2, "timestamp", "desc")
+        self.assertEqual(decode_cursor(token), ("timestamp", "DESC", 4, 8))
+
+class TestKeysetSearch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = AsyncMock()
+        self.cursor.fetchall = AsyncMock(return_value=[])
+        self.model = TransferModel(DatabaseConnection(FakePool(self.cursor)))
+
+    async def test_seek_predicate_replaces_offset(self):
+        token = encode_cursor("timestamp", "DESC", 500, 77)
+        await self.model.search(source_id=3, page=500, limit=20, sort_by="timestamp", after=token)
+
+        query, params = self.cursor.execute.await_args.args
+        self.assertIn("(t.timestamp < %s OR (t.timestamp = %s AND t.transfer_id < %s))", query)
+        self.assertIn("ORDER BY t.timestamp DESC, t.transfer_id DESC", query)
+        self.assertEqual(params[-5:], (500, 500, 77, 20, 0))
+
+    async def test_transfer_id_sort_uses_single_column_seek(self):
+        token = encode_cursor("transfer_id", "ASC", 77, 77)
+        await self.model.search(sort_order="asc", after=token)
+
+        query, params = self.cursor.execute.await_args.args
+        self.assertIn("WHERE t.transfer_id > %s", query)
+        self.assertEqual(params, (77, 10, 0))
+
+    async def test_cursor_must_match_sort(self):
+        token = encode_cursor("amount", "DESC", 1, 1)
+        with self.assertRaises(ValueError):
+            await self.model.search(sort_by="timestamp", after=token)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.models import PoolCandleModel
+from RapidWire.constants import PRICE_SCALE
+
+class TestPoolCandleModel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.model = PoolCandleModel(MagicMock())
+        self.cursor = AsyncMock()
+
+    async def test_record_trade_buckets(self):
+        timestamp = 1700000123
+        await self.model.record_trade(self.cursor, 7, 200, 50, timestamp)
+
+        self.cursor.execute.assert_awaited_once()
+        _, params = self.cursor.execute.await_args.args
+        rows = [params[i:i + 9] for i in range(0, len(params), 9)]
+
+        self.assertEqual(len(rows), 3)
+        price = 50 * PRICE_SCALE // 200
+        for pool_id, resolution, bucket_start, open_, high, low, close, volume_a, volume_b in rows:
+            self.assertEqual(pool_id, 7)
+            self.assertEqual(bucket_start, timestamp - timestamp % resolution)
+            self.assertEqual((open_, high, low, close), (price, price, price, price))
+            self.assertEqual((volume_a, volume_b), (200, 50))
+        self.assertEqual([row[1] for row in rows], [60, 3600, 86400])
+
+    async def test_record_trade_skips_empty_volume(self):
+        await self.model.record_trade(self.cursor, 7, 0, 50, 1700000123)
+        self.cursor.execute.assert_not_awaited()
+
+class TestBackfillPoolCandles(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Alpha", "AAA", 10000, 1, 0)
+        await self.rw.create_currency(101, "Beta", "BBB", 10000, 1, 0)
+        self.pool = await self.rw.create_liquidity_pool(100, 101, 5000, 5000, 1)
+
+    async def candles(self) -> list:
+        async with self.rw.db as cursor:
+            await cursor.execute("SELECT * FROM pool_candle ORDER BY resolution, bucket_start")
+            return [{k: int(v) for k, v in row.items()} for row in await cursor.fetchall()]
+
+    async def test_rebuilds_live_candles_once(self):
+        for from_id, to_id, amount in ((100, 101, 100), (101, 100, 50), (100, 101, 30)):
+            await self.rw.execute_swap(1, from_id, to_id, amount)
+        live = await self.candles()
+        async with self.rw.db as cursor:
+            await cursor.execute("DELETE FROM pool_candle")
+
+        with patch("RapidWire.core.time", return_value=live[0]["bucket_start"] + 10**6):
+            self.assertEqual(await self.rw.backfill_pool_candles(batch_size=2), 3)
+            self.assertEqual(await self.candles(), live)
+            # A second run would count every swap twice
+            with self.assertRaises(ValueError):
+                await self.rw.backfill_pool_candles()
+
+    async def test_merge_keeps_the_live_close(self):
+        async with self.rw.db as cursor:
+            await self.rw.PoolCandles.record_trade(cursor, self.pool.pool_id, 100, 300, 1700000010)
+            await self.rw.PoolCandles.merge_history(cursor, {(self.pool.pool_id, 60, 1699999980): [10, 50, 5, 20, 7, 8, 2]})
+        row = next(c for c in await self.candles() if c["resolution"] == 60)
+        live_price = 3 * PRICE_SCALE
+        self.assertEqual((row["open"], row["high"], row["low"], row["close"]), (10, live_price, 5, live_price))
+        self.assertEqual((row["volume_a"], row["volume_b"], row["trade_count"]), (107, 308, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+from collections import deque
+from unittest.mock import MagicMock, AsyncMock, patch
+
+import aiomysql
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.pool_monitor import PoolMonitor, resize_pool, supports_resize
+from tests.helpers import FakePool
+
+class SizedPool(FakePool):
+    """Adds the aiomysql.Pool bookkeeping the monitor reads."""
+
+    def __init__(self, maxsize=2, free=0, used=0):
+        super().__init__()
+        self.minsize = 1
+        self._free = deque([MagicMock() for _ in range(free)], maxlen=maxsize)
+        self._used = used
+        self._wakeup = AsyncMock()
+
+    @property
+    def maxsize(self):
+        return self._free.maxlen
+
+    @property
+    def freesize(self):
+        return len(self._free)
+
+    @property
+    def size(self):
+        return self.freesize + self._used
+
+    async def acquire(self):
+        self._used += 1
+        return await super().acquire()
+
+    def release(self, connection):
+        self._used -= 1
+        super().release(connection)
+
+class Ledger:
+    def __init__(self, db):
+        self.db = db
+
+    async def post(self, inner=None):
+        async with self.db as cursor:
+            await cursor.execute("SELECT 1")
+            if inner:
+                await inner()
+
+class TestPoolMonitor(unittest.IsolatedAsyncioTestCase):
+    async def test_timings_are_keyed_by_call_site(self):
+        pool = SizedPool()
+        db = DatabaseConnection(pool)
+        ledger = Ledger(db)
+
+        async def inspect():
+            held = db.monitor.longest_held()
+            self.assertEqual(held["site"], "Ledger.post")
+            self.assertEqual(db.monitor.in_use, 1)
+
+        await ledger.post(inspect)
+        await ledger.post()
+
+        snapshot = db.monitor.snapshot()
+        self.assertEqual(snapshot["wait"]["Ledger.post"]["count"], 2)
+        self.assertEqual(snapshot["hold"]["Ledger.post"]["count"], 2)
+        self.assertEqual(snapshot["release"]["Ledger.post"]["count"], 2)
+        self.assertEqual(snapshot["in_use"], 0)
+        self.assertIsNone(snapshot["longest_held"])
+
+    async def test_exhaustion_records_holders(self):
+        pool = SizedPool(maxsize=2, used=1)
+        db = DatabaseConnection(pool)
+        monitor = db.monitor
+        monitor.acquired("RapidWire.execute_contract", monitor.acquiring("RapidWire.execute_contract"))
+        pool._used = 2
+
+        await Ledger(db).post()
+
+        self.assertEqual(monitor.exhausted, {"Ledger.post": 1})
+        self.assertEqual(monitor.events[0]["holders"], {"RapidWire.execute_contract": 1})
+
+    async def test_failed_acquire_is_not_counted_as_waiting(self):
+        pool = SizedPool()
+        pool.acquire = AsyncMock(side_effect=OSError)
+        db = DatabaseConnection(pool)
+        with self.assertRaises(OSError):
+            await Ledger(db).post()
+        self.assertEqual(db.monitor.waiting, 0)
+
+class TestAdaptiveSizing(unittest.IsolatedAsyncioTestCase):
+    async def test_grows_under_sustained_wait(self):
+        pool = SizedPool(maxsize=8)
+        monitor = PoolMonitor(pool)
+        monitor.acquired("a", monitor.acquiring("a") - 0.1)
+
+        self.assertEqual(monitor.adjust(ceiling=9, grow_wait=0.05, idle_intervals=3), 9)
+        self.assertEqual(pool.maxsize, 9)
+        await asyncio.sleep(0)
+        pool._wakeup.assert_awaited_once()
+
+    async def test_shrinks_after_idle_intervals_down_to_floor(self):
+        pool = SizedPool(maxsize=2, free=1)
+        monitor = PoolMonitor(pool)
+        resize_pool(pool, 4)
+        self.assertEqual(monitor.adjust(ceiling=10, grow_wait=0.05, idle_intervals=2), 4)
+        self.assertEqual(monitor.adjust(ceiling=10, grow_wait=0.05, idle_intervals=2), 3)
+        for _ in range(4):
+            monitor.adjust(ceiling=10, grow_wait=0.05, idle_intervals=2)
+        self.assertEqual(pool.maxsize, 2)
+
+    async def test_shrink_closes_free_connections_but_keeps_used(self):
+        pool = SizedPool(maxsize=6, free=3, used=2)
+        closed = list(pool._free)
+        self.assertEqual(resize_pool(pool, 3), 3)
+        self.assertEqual(resize_pool(pool, 1), 2)
+        self.assertEqual((pool.freesize, pool.maxsize), (0, 2))
+        for connection in closed:
+            connection.close.assert_called_once()
+
+    async def test_resize_needs_known_pool_internals(self):
+        self.assertTrue(supports_resize(aiomysql.Pool(1, 2, False, -1, None)))
+        self.assertTrue(supports_resize(SizedPool()))
+        self.assertFalse(supports_resize(FakePool()))
+        with patch("RapidWire.pool_monitor.aiomysql.__version__", "1.0.0"):
+            self.assertFalse(supports_resize(SizedPool()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from decimal import Decimal
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire import RapidWire
+from RapidWire.config import Config
+from RapidWire.structs import Balance, Stake, LiquidityPool, LiquidityProvider
+
+POOLS = [
+    # 1 B = 2 A
+    LiquidityPool(pool_id=1, currency_a_id=1, currency_b_id=2, reserve_a=2_000, reserve_b=1_000, total_shares=1_000),
+    # 1 C = 3 B
+    LiquidityPool(pool_id=2, currency_a_id=2, currency_b_id=3, reserve_a=3_000, reserve_b=1_000, total_shares=500),
+    LiquidityPool(pool_id=3, currency_a_id=4, currency_b_id=5, reserve_a=10, reserve_b=10, total_shares=10),
+]
+
+class TestReferencePrices(unittest.TestCase):
+    def test_prices_follow_shortest_route(self):
+        prices = RapidWire.__new__(RapidWire).get_reference_prices(POOLS, 1)
+        self.assertEqual(prices[1], Decimal(1))
+        self.assertEqual(prices[2], Decimal(2))
+        self.assertEqual(prices[3], Decimal(6))
+        self.assertNotIn(4, prices)
+
+    def test_empty_pools_are_ignored(self):
+        pools = [LiquidityPool(pool_id=1, currency_a_id=1, currency_b_id=2, reserve_a=0, reserve_b=0, total_shares=0)]
+        prices = RapidWire.__new__(RapidWire).get_reference_prices(pools, 1)
+        self.assertEqual(prices, {1: Decimal(1)})
+
+class TestPortfolio(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.rapid = RapidWire.__new__(RapidWire)
+        self.rapid.Config = Config
+        user = MagicMock()
+        user.get_all_balances = AsyncMock(return_value=[
+            Balance(user_id=9, currency_id=2, amount=100),
+            Balance(user_id=9, currency_id=4, amount=7),
+        ])
+        self.rapid.get_user = MagicMock(return_value=user)
+        self.rapid.Stakes = MagicMock()
+        self.rapid.Stakes.get_for_user = AsyncMock(return_value=[
+            Stake(user_id=9, currency_id=3, amount=10, last_updated_at=0),
+        ])
+        self.rapid.LiquidityProviders = MagicMock()
+        self.rapid.LiquidityProviders.get_for_user = AsyncMock(return_value=[
+            LiquidityProvider(provider_id=1, pool_id=1, user_id=9, shares=100),
+        ])
+        self.rapid.LiquidityPools = MagicMock()
+        self.rapid.LiquidityPools.get_all = AsyncMock(return_value=POOLS)
+        self.rapid.Currencies = MagicMock()
+        self.rapid.Currencies.get_many = AsyncMock(return_value=[])
+
+    async def test_values_all_positions_in_one_pass(self):
+        portfolio = await self.rapid.get_portfolio(9, 1)
+
+        entries = [(e.kind, e.currency_id, e.amount, e.value) for e in portfolio.entries]
+        self.assertEqual(entries, [
+            ('balance', 2, 100, 200),
+            ('balance', 4, 7, None),
+            ('stake', 3, 10, 60),
+            ('liquidity', 1, 200, 200),
+            ('liquidity', 2, 100, 200),
+        ])
+        self.assertEqual(portfolio.total_value, 660)
+        self.assertEqual(portfolio.unpriced_currency_ids, [4])
+
+        self.rapid.LiquidityPools.get_all.assert_awaited_once()
+        self.rapid.Currencies.get_many.assert_awaited_once_with([1, 2, 3, 4])
+
+    async def test_defaults_to_gas_currency(self):
+        portfolio = await self.rapid.get_portfolio(9)
+        self.assertEqual(portfolio.reference_currency_id, Config.Gas.currency_id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import AsyncMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.models import CurrencyModel
+from tests.helpers import FakePool
+
+class TestReplicaRouting(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.primary = FakePool()
+        self.replica = FakePool()
+        self.db = DatabaseConnection(self.primary, [self.replica], max_replica_lag=2, lag_check_interval=0)
+        self.db._measure_lag = AsyncMock(return_value=0)
+
+    async def test_reads_go_to_replica_and_release_it(self):
+        async with self.db.read as cursor:
+            self.assertIs(cursor, self.replica.cursor)
+            async with self.db.read as nested:
+                self.assertIs(nested, cursor)
+        self.assertEqual((self.replica.acquired, len(self.replica.released)), (1, 1))
+        self.replica.connection.rollback.assert_awaited_once()
+        self.replica.cursor.close.assert_awaited_once()
+        self.assertEqual(self.primary.acquired, 0)
+
+    async def test_reads_inside_transaction_stay_on_primary(self):
+        async with self.db as cursor:
+            async with self.db.read as read_cursor:
+                self.assertIs(read_cursor, cursor)
+            self.assertTrue(self.db.in_transaction)
+        self.assertEqual(self.replica.acquired, 0)
+        self.primary.connection.commit.assert_awaited_once()
+
+    async def test_lagging_or_broken_replica_falls_back_to_primary(self):
+        for lag in (5, None):
+            self.db._measure_lag = AsyncMock(return_value=lag)
+            async with self.db.read as cursor:
+                self.assertIs(cursor, self.primary.cursor)
+        self.assertEqual(self.replica.acquired, 0)
+        self.assertEqual(self.primary.acquired, 2)
+
+    async def test_unreachable_replica_falls_back_to_primary(self):
+        self.replica.acquire = AsyncMock(side_effect=OSError("connection refused"))
+        self.db.lag_check_interval = 60
+        async with self.db.read as cursor:
+            self.assertIs(cursor, self.primary.cursor)
+        self.assertIsNone(self.db.replicas[0].lag)
+        async with self.db.read as cursor:
+            self.assertIs(cursor, self.primary.cursor)
+        self.assertEqual(self.replica.acquire.await_count, 1)
+
+    async def test_lag_is_checked_at_most_once_per_interval(self):
+        self.db.lag_check_interval = 60
+        for _ in range(3):
+            async with self.db.read:
+                pass
+        self.db._measure_lag.assert_awaited_once()
+
+    async def test_without_replicas_reads_use_primary(self):
+        db = DatabaseConnection(self.primary)
+        async with db.read as cursor:
+            self.assertIs(cursor, self.primary.cursor)
+        self.primary.connection.commit.assert_awaited_once()
+
+    async def test_holders_for_deletion_are_read_on_primary(self):
+        self.primary.cursor.fetchall = AsyncMock(return_value=[])
+        await CurrencyModel(self.db).get_all_holders(7)
+        async with self.db as cursor:
+            await CurrencyModel(self.db).get_all_holders(7, for_update=True, cursor=cursor)
+        self.assertEqual(self.replica.acquired, 0)
+        query, _ = self.primary.cursor.execute.await_args.args
+        self.assertTrue(query.endswith("FOR UPDATE"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import asyncio
+import tempfile
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.cache import ResponseCache
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_misses_share_one_load(self):
+        cache = ResponseCache(ttl=60)
+        calls = 0
+        release = asyncio.Event()
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "value"
+
+        waiters = [asyncio.create_task(cache.get_or_load("k", loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(*waiters), ["value"] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(cache.coalesced, 4)
+        self.assertEqual(await cache.get_or_load("k", loader), "value")
+        self.assertEqual(calls, 1)
+
+    async def test_errors_are_not_cached(self):
+        cache = ResponseCache(ttl=60)
+
+        async def failing():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await cache.get_or_load("k", failing)
+        self.assertIsNone(cache.peek("k"))
+
+    async def test_clear_discards_loads_in_flight(self):
+        cache = ResponseCache(ttl=60)
+        release = asyncio.Event()
+
+        async def stale_loader():
+            await release.wait()
+            return "stale"
+
+        async def fresh_loader():
+            return "fresh"
+
+        pending = asyncio.create_task(cache.get_or_load("k", stale_loader))
+        await asyncio.sleep(0)
+        cache.clear()
+        release.set()
+        self.assertEqual(await pending, "stale")
+        self.assertEqual(await cache.get_or_load("k", fresh_loader), "fresh")
+
+    async def test_cancelled_caller_does_not_cancel_waiters(self):
+        cache = ResponseCache(ttl=60)
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return "value"
+
+        first = asyncio.create_task(cache.get_or_load("k", loader))
+        second = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        self.assertEqual(await second, "value")
+
+class TestDataVersion(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Cache(Config.Cache):
+            data_version_interval = 0
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Cache": Cache})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Test", "TST", 1000, 1, 0)
+
+    async def test_writes_from_any_process_change_the_version(self):
+        versions = [await self.rw.DataVersion.current()]
+        await self.rw.transfer(1, 2, 100, 5)
+        versions.append(await self.rw.DataVersion.current())
+        await self.rw.Currencies.request_rate_change(100, 7)
+        versions.append(await self.rw.DataVersion.current())
+        await self.rw.set_contract(1, "[]")
+        versions.append(await self.rw.DataVersion.current())
+        self.assertEqual(len(set(versions)), 4)
+        self.assertEqual(await self.rw.DataVersion.current(), versions[-1])
+
+if __name__ == '__main__':
+    unittest.main()
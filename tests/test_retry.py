@@ -0,0 +1,119 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+import aiomysql
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire import RapidWire
+from RapidWire.config import Config
+from RapidWire.database import DatabaseConnection
+from RapidWire.exceptions import TransactionConflict, TransactionError, InsufficientFunds
+from RapidWire.retry import RETRIES, RETRIES_EXHAUSTED, retryable_error
+from RapidWire.structs import Transfer
+from tests.helpers import FakePool
+
+class RetryConfig(Config):
+    class Retry:
+        attempts = 3
+        base_delay = 0.01
+        max_delay = 0.5
+        budget = 2
+
+def deadlock():
+    return aiomysql.OperationalError(1213, "Deadlock found when trying to get lock; try restarting transaction")
+
+def transfer(amount):
+    return Transfer(transfer_id=1, execution_id=None, source_id=1, dest_id=2, currency_id=1, amount=amount, timestamp=1)
+
+class TestRetryableError(unittest.TestCase):
+    def test_finds_code_behind_core_wrapping(self):
+        try:
+            try:
+                raise deadlock()
+            except aiomysql.Error as err:
+                raise TransactionError(f"Database error during transfer: {err}")
+        except TransactionError as e:
+            self.assertEqual(retryable_error(e), 1213)
+        self.assertEqual(retryable_error(aiomysql.OperationalError(1205, "Lock wait timeout exceeded")), 1205)
+        self.assertIsNone(retryable_error(aiomysql.IntegrityError(1062, "Duplicate entry")))
+        self.assertIsNone(retryable_error(InsufficientFunds("Source user has insufficient funds.")))
+
+@patch("RapidWire.retry.asyncio.sleep", new_callable=AsyncMock)
+class TestRetryTransaction(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = AsyncMock()
+        self.pool = FakePool(self.cursor)
+        self.rapid = RapidWire(db_config={})
+        self.rapid.Config = RetryConfig
+        self.rapid.db = DatabaseConnection(self.pool)
+        self.committed = []
+
+        attempts = []
+        async def apply(cursor, source_id, destination_id, currency_id, amount, execution_id=None):
+            attempts.append(amount)
+            self.rapid.db.on_commit(lambda: self.committed.append(amount))
+            if len(attempts) <= self.failures:
+                raise deadlock()
+            return transfer(amount)
+        self.attempts = attempts
+        self.failures = 0
+        self.rapid._apply_transfer = AsyncMock(side_effect=apply)
+
+    async def test_deadlock_is_retried_without_duplicating_side_effects(self, sleep):
+        self.failures = 2
+        before = RETRIES.get(operation="transfer", error="deadlock")
+
+        result = await self.rapid.transfer(1, 2, 1, 10)
+
+        self.assertEqual(result.amount, 10)
+        self.assertEqual(self.attempts, [10, 10, 10])
+        self.assertEqual(self.committed, [10])
+        self.assertEqual(self.pool.connection.rollback.await_count, 2)
+        self.assertEqual(sleep.await_count, 2)
+        self.assertEqual(RETRIES.get(operation="transfer", error="deadlock") - before, 2)
+
+    async def test_gives_up_with_conflict_after_attempts(self, sleep):
+        self.failures = 10
+        before = RETRIES_EXHAUSTED.get(operation="transfer")
+
+        with self.assertRaises(TransactionConflict) as raised:
+            await self.rapid.transfer(1, 2, 1, 10)
+
+        self.assertIsInstance(raised.exception, TransactionError)
+        self.assertEqual(len(self.attempts), 3)
+        self.assertEqual(self.committed, [])
+        self.assertEqual(RETRIES_EXHAUSTED.get(operation="transfer") - before, 1)
+
+    async def test_budget_bounds_total_backoff(self, sleep):
+        self.failures = 10
+        clock = [0.0]
+        async def advance(delay):
+            clock[0] += delay
+        sleep.side_effect = advance
+        with patch("RapidWire.retry.backoff", return_value=1.5), patch("RapidWire.retry.monotonic", side_effect=lambda: clock[0]):
+            with self.assertRaises(TransactionConflict):
+                await self.rapid.transfer(1, 2, 1, 10)
+        # 1.5s fits the 2s budget once; the second backoff would exceed it
+        self.assertEqual(len(self.attempts), 2)
+
+    async def test_inner_unit_leaves_retry_to_the_transaction_owner(self, sleep):
+        self.failures = 1
+        with self.assertRaises(TransactionError) as raised:
+            async with self.rapid.db as cursor:
+                await self.rapid.transfer(1, 2, 1, 10, cursor=cursor)
+        self.assertNotIsInstance(raised.exception, TransactionConflict)
+        self.assertEqual(self.attempts, [10])
+        sleep.assert_not_awaited()
+
+    async def test_other_errors_are_not_retried(self, sleep):
+        self.rapid._apply_transfer.side_effect = InsufficientFunds("Source user has insufficient funds.")
+        with self.assertRaises(InsufficientFunds):
+            await self.rapid.transfer(1, 2, 1, 10)
+        self.assertEqual(self.rapid._apply_transfer.await_count, 1)
+        sleep.assert_not_awaited()
+
+if __name__ == '__main__':
+    unittest.main()
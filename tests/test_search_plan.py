@@ -0,0 +1,139 @@
+import unittest
+import os
+import random
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.search import plan_transfer_search, choose_transfer_index
+from RapidWire.pagination import encode_cursor
+
+class TestSearchPlanner(unittest.TestCase):
+    def test_user_filter_becomes_union_of_index_scans(self):
+        query, params = plan_transfer_search(user_id=5, page=3, limit=10)
+
+        self.assertNotIn(" OR ", query)
+        self.assertEqual(query.count("UNION ALL"), 1)
+        self.assertIn("USE INDEX (source_transfer)", query)
+        self.assertIn("USE INDEX (dest_transfer)", query)
+        self.assertIn("t.source_id <> %s", query)
+        # Each side returns enough rows to fill the requested page after merging
+        self.assertEqual(params, (5, 30, 5, 5, 30, 10, 20))
+
+    def test_union_applies_filters_and_seek_to_both_sides(self):
+        token = encode_cursor("timestamp", "DESC", 100, 7)
+        query, params = plan_transfer_search(user_id=5, currency_id=2, sort_by="timestamp", after=token)
+
+        self.assertIn("USE INDEX (source_timestamp)", query)
+        self.assertIn("USE INDEX (dest_timestamp)", query)
+        self.assertEqual(query.count("t.currency_id = %s"), 2)
+        self.assertEqual(query.count("t.timestamp < %s"), 2)
+        self.assertTrue(query.endswith("ORDER BY timestamp DESC, transfer_id DESC LIMIT %s OFFSET %s"))
+        self.assertEqual(params[-2:], (10, 0))
+
+    def test_user_with_explicit_side_keeps_single_query(self):
+        query, _ = plan_transfer_search(user_id=5, source_id=6)
+        self.assertNotIn("UNION", query)
+        self.assertIn("USE INDEX (source_transfer)", query)
+
+    def test_index_choice(self):
+        self.assertEqual(choose_transfer_index({"currency_id": 1}, "timestamp"), "currency_timestamp")
+        self.assertEqual(choose_transfer_index({"currency_id": 1}, "transfer_id"), "currency_transfer")
+        self.assertEqual(choose_transfer_index({"dest_id": 1, "currency_id": 1}, "amount"), "dest_transfer")
+        self.assertEqual(choose_transfer_index({}, "timestamp"), "timestamp")
+        self.assertEqual(choose_transfer_index({}, "amount", has_time_range=True), "timestamp")
+        self.assertIsNone(choose_transfer_index({}, "transfer_id", has_time_range=True))
+        self.assertIsNone(choose_transfer_index({}, "amount"))
+
+    def test_missing_indexes_are_not_hinted(self):
+        available = frozenset({"PRIMARY", "source_transfer"})
+        self.assertEqual(choose_transfer_index({"source_id": 1}, "timestamp", available=frozenset({"source_timestamp"})), "source_timestamp")
+        self.assertIsNone(choose_transfer_index({"source_id": 1}, "timestamp", available=available))
+        self.assertIsNone(choose_transfer_index({}, "timestamp", available=available))
+
+        query, _ = plan_transfer_search(user_id=5, indexes=available)
+        self.assertIn("USE INDEX (source_transfer)", query)
+        self.assertNotIn("dest_transfer", query)
+
+MYSQL_HOST = os.environ.get("RAPIDWIRE_TEST_MYSQL_HOST")
+
+@unittest.skipUnless(MYSQL_HOST, "set RAPIDWIRE_TEST_MYSQL_HOST (and _PORT/_USER/_PASSWORD) to run EXPLAIN checks")
+class TestSearchPlanExplain(unittest.IsolatedAsyncioTestCase):
+    """Loads rapid-wire.sql into a scratch database and checks the plans MySQL picks."""
+
+    DATABASE = "rapidwire_explain_test"
+    USERS = 50
+    ROWS = 20000
+
+    async def asyncSetUp(self):
+        import aiomysql
+        self.conn = await aiomysql.connect(
+            host=MYSQL_HOST,
+            port=int(os.environ.get("RAPIDWIRE_TEST_MYSQL_PORT", 3306)),
+            user=os.environ.get("RAPIDWIRE_TEST_MYSQL_USER", "root"),
+            password=os.environ.get("RAPIDWIRE_TEST_MYSQL_PASSWORD", ""),
+            autocommit=True
+        )
+        self.cursor = await self.conn.cursor(aiomysql.DictCursor)
+        await self.cursor.execute(f"DROP DATABASE IF EXISTS {self.DATABASE}")
+        await self.cursor.execute(f"CREATE DATABASE {self.DATABASE}")
+        await self.cursor.execute(f"USE {self.DATABASE}")
+
+        schema = (parent_dir / "rapid-wire.sql").read_text(encoding="utf-8")
+        lines = [line for line in schema.splitlines() if not line.startswith("--")]
+        for statement in "\n".join(lines).split(";"):
+            if statement.strip().upper().startswith(("CREATE TABLE", "ALTER TABLE", "INSERT INTO")):
+                await self.cursor.execute(statement)
+
+        rng = random.Random(0)
+        rows = [
+            (i, None, rng.randrange(self.USERS), rng.randrange(self.USERS), rng.randrange(5), rng.randrange(1, 10**6), 1_700_000_000 + i * 7)
+            for i in range(1, self.ROWS + 1)
+        ]
+        await self.cursor.executemany("INSERT INTO transfer VALUES (%s, %s, %s, %s, %s, %s, %s)", rows)
+        await self.cursor.execute("ANALYZE TABLE transfer")
+
+    async def asyncTearDown(self):
+        await self.cursor.execute(f"DROP DATABASE IF EXISTS {self.DATABASE}")
+        self.conn.close()
+
+    async def explain(self, **filters) -> list[dict]:
+        query, params = plan_transfer_search(**filters)
+        await self.cursor.execute(f"EXPLAIN {query}", params)
+        return [row for row in await self.cursor.fetchall() if row["table"] == "t"]
+
+    async def test_plans_use_expected_indexes(self):
+        cases = [
+            ({"user_id": 3}, {"source_transfer", "dest_transfer"}),
+            ({"user_id": 3, "sort_by": "timestamp"}, {"source_timestamp", "dest_timestamp"}),
+            ({"source_id": 3}, {"source_transfer"}),
+            ({"currency_id": 2, "sort_by": "timestamp"}, {"currency_timestamp"}),
+            ({"sort_by": "timestamp"}, {"timestamp"}),
+        ]
+        for filters, expected in cases:
+            with self.subTest(filters=filters):
+                rows = await self.explain(**filters)
+                self.assertEqual({row["key"] for row in rows}, expected)
+                for row in rows:
+                    self.assertNotEqual(row["type"], "ALL")
+                    self.assertNotIn("filesort", row["Extra"] or "")
+
+    async def test_union_matches_or_query(self):
+        for user_id in range(5):
+            for sort_by in ("transfer_id", "timestamp", "amount"):
+                query, params = plan_transfer_search(user_id=user_id, sort_by=sort_by, page=2, limit=20)
+                await self.cursor.execute(query, params)
+                planned = [row["transfer_id"] for row in await self.cursor.fetchall()]
+
+                tie_break = "" if sort_by == "transfer_id" else ", transfer_id DESC"
+                await self.cursor.execute(
+                    f"SELECT transfer_id FROM transfer WHERE source_id = %s OR dest_id = %s ORDER BY {sort_by} DESC{tie_break} LIMIT 20 OFFSET 20",
+                    (user_id, user_id)
+                )
+                expected = [row["transfer_id"] for row in await self.cursor.fetchall()]
+                self.assertEqual(planned, expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from time import time
+
+import sys
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+import aiomysql
+
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.exceptions import InsufficientFunds
+from RapidWire.sqlite import _NamedLocks, open_sqlite, translate, translate_schema
+from RapidWire.constants import SYSTEM_USER_ID
+
+SCHEMA = (parent_dir / "rapid-wire.sql").read_text(encoding="utf-8")
+
+class TestTranslate(unittest.TestCase):
+    def test_mysql_only_syntax(self):
+        self.assertEqual(
+            translate("SELECT * FROM balance WHERE user_id = %s AND currency_id = %s FOR UPDATE"),
+            "SELECT * FROM balance WHERE user_id = ? AND currency_id = ?"
+        )
+        self.assertEqual(
+            translate("SELECT t.* FROM transfer t USE INDEX (source_transfer) WHERE t.source_id = %s"),
+            "SELECT t.* FROM transfer t WHERE t.source_id = ?"
+        )
+        self.assertEqual(
+            translate("INSERT INTO contract_storage (user_id, `key`, `value`) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE `value` = VALUES(`value`)"),
+            "INSERT INTO contract_storage (user_id, `key`, `value`) VALUES (?, ?, ?) ON CONFLICT DO UPDATE SET `value` = excluded.`value`"
+        )
+        self.assertEqual(translate("START TRANSACTION WITH CONSISTENT SNAPSHOT"), "")
+
+    def test_schema_has_every_table(self):
+        statements = translate_schema(SCHEMA)
+        tables = [s for s in statements if s.startswith("CREATE TABLE")]
+        self.assertEqual(len(tables), SCHEMA.count("CREATE TABLE"))
+        self.assertIn("`claim_id` INTEGER PRIMARY KEY AUTOINCREMENT", next(s for s in tables if "`claims`" in s))
+        self.assertIn("PRIMARY KEY (`user_id`,`currency_id`)", next(s for s in tables if "`balance`" in s))
+
+class TestNamedLocks(unittest.TestCase):
+    def test_lock_files_exclude_other_processes(self):
+        with tempfile.TemporaryDirectory() as path:
+            # Each instance stands for one process sharing the database file
+            first, second = _NamedLocks(f"{path}/db"), _NamedLocks(f"{path}/db")
+            self.assertEqual(first.get(1, "lease", 0), 1)
+            self.assertEqual(first.get(2, "lease", 0), 0)
+            self.assertEqual(second.get(3, "lease", 0), 0)
+            self.assertEqual(first.release(1, "lease"), 1)
+            self.assertEqual(second.get(3, "lease", 0), 1)
+            self.assertEqual(second.used_by("lease"), 3)
+            second.release(3, "lease")
+
+class TestSQLiteBackend(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        self.currency, _ = await self.rw.create_currency(100, "Test", "TST", 1000, 1, 0)
+
+    async def balance(self, user_id: int) -> int:
+        return (await self.rw.get_user(user_id).get_balance(self.currency.currency_id)).amount
+
+    async def test_transfers_balances_and_history(self):
+        self.assertEqual(await self.balance(1), 1000)
+        await self.rw.transfer(1, 2, self.currency.currency_id, 300)
+        await self.rw.transfer(2, 3, self.currency.currency_id, 100)
+        with self.assertRaises(InsufficientFunds):
+            await self.rw.transfer(3, 2, self.currency.currency_id, 101)
+
+        self.assertEqual([await self.balance(u) for u in (1, 2, 3)], [700, 200, 100])
+        transfers = await self.rw.search_transfers(user_id=2)
+        self.assertEqual([(t.source_id, t.dest_id) for t in transfers], [(2, 3), (1, 2)])
+        stats = await self.rw.Transfers.get_user_stats(2)
+        self.assertEqual((stats["sent_count"], stats["received_count"]), (1, 1))
+
+    async def test_concurrent_transfers_are_serialized(self):
+        await asyncio.gather(*(self.rw.transfer(1, 2, self.currency.currency_id, 10) for _ in range(20)))
+        self.assertEqual(await self.balance(2), 200)
+        self.assertEqual((await self.rw.Currencies.get(self.currency.currency_id)).supply, 1000)
+
+    async def test_mint_burn_and_snapshot(self):
+        await self.rw.mint_currency(self.currency.currency_id, 50, 1)
+        await self.rw.burn_currency(self.currency.currency_id, 20, 1)
+        self.assertEqual((await self.rw.Currencies.get(self.currency.currency_id)).supply, 1030)
+        snapshots = await self.rw.take_balance_snapshot(force=True)
+        self.assertEqual([(s.holders, s.total) for s in snapshots], [(1, 1030)])
+
+    async def test_duplicate_key_is_a_mysql_integrity_error(self):
+        with self.assertRaises(aiomysql.IntegrityError) as raised:
+            async with self.rw.db as cursor:
+                await cursor.execute(
+                    "INSERT INTO currency (currency_id, name, symbol, issuer, supply) VALUES (%s, %s, %s, %s, %s)",
+                    (101, "Other", "TST", 1, 0)
+                )
+        self.assertEqual(raised.exception.args[0], 1062)
+
+    async def test_delete_currency_empties_every_holder(self):
+        await self.rw.transfer(1, 2, self.currency.currency_id, 300)
+        transfers = await self.rw.delete_currency(self.currency.currency_id)
+        self.assertEqual(sorted((t.source_id, t.amount) for t in transfers), [(1, 700), (2, 300)])
+        self.assertIsNone(await self.rw.Currencies.get(self.currency.currency_id, use_cache=False))
+        self.assertEqual([await self.balance(u) for u in (1, 2)], [0, 0])
+
+    async def test_reads_use_reader_connections(self):
+        writer = self.rw.pool.connections[0]
+        async with self.rw.db.read as cursor:
+            await cursor.execute("SELECT COUNT(*) AS n FROM balance")
+            self.assertEqual((await cursor.fetchone())["n"], 1)
+            self.assertEqual(self.rw.pool.freesize, 1)
+        self.assertFalse(writer.raw.in_transaction)
+
+    async def ledger_process(self, **sections) -> RapidWire:
+        currency_id = self.currency.currency_id
+        ledger_path = str(Path(self.dir.name) / "ledger")
+
+        class Ledger(Config.Ledger):
+            currencies = [currency_id]
+            path = ledger_path
+
+        rw = RapidWire(db_config={})
+        rw.Config = type("TestConfig", (self.rw.Config,), {"Ledger": Ledger, **sections})
+        await rw.initialize()
+        self.addAsyncCleanup(rw.close)
+        return rw
+
+    async def test_ledger_saves_in_order_and_serves_other_processes(self):
+        currency_id = self.currency.currency_id
+        owner, other = await self.ledger_process(), await self.ledger_process()
+        self.assertTrue(owner.ledger.owner)
+        self.assertFalse(other.ledger.owner)
+
+        first = await owner.transfer(1, 2, currency_id, 300)
+        second = await other.transfer(2, 3, currency_id, 100)
+        self.assertGreater(second.transfer_id, first.transfer_id)
+        # Acknowledged transfers are already in the tables every process reads
+        self.assertEqual([await self.balance(u) for u in (1, 2, 3)], [700, 200, 100])
+        self.assertEqual((await other.get_user(3).get_balance(currency_id)).amount, 100)
+        self.assertEqual((await self.rw.Transfers.get(second.transfer_id)).source_id, 2)
+
+    async def test_ledger_currency_can_be_deleted(self):
+        currency_id = self.currency.currency_id
+        rw = await self.ledger_process()
+        await rw.transfer(1, 2, currency_id, 300)
+
+        transfers = await rw.delete_currency(currency_id)
+
+        self.assertEqual(sorted((t.source_id, t.amount) for t in transfers), [(1, 700), (2, 300)])
+        self.assertIsNone(await rw.Currencies.get(currency_id, use_cache=False))
+        self.assertEqual([await self.balance(u) for u in (1, 2)], [0, 0])
+
+    async def test_ledger_currency_pays_gas(self):
+        currency_id = self.currency.currency_id
+
+        class Gas(Config.Gas):
+            price = 1
+
+        Gas.currency_id = currency_id
+        rw = await self.ledger_process(Gas=Gas)
+        await rw.set_contract(7, json.dumps([{'op': 'output', 'args': [{'t': 'str', 'v': 'ok'}]}]))
+        for single_transaction in (False, True):
+            with self.subTest(single_transaction=single_transaction):
+                # Single-transaction executions fall back to the three phases for a ledger gas currency
+                rw.Config.Execution = type("Execution", (Config.Execution,), {"single_transaction": single_transaction})
+                before = await self.balance(1)
+
+                execution_id, output = await rw.execute_contract(1, 7)
+
+                self.assertEqual(output, "ok")
+                async with rw.db as cursor:
+                    await cursor.execute("SELECT cost FROM execution WHERE execution_id = %s", (execution_id,))
+                    cost = (await cursor.fetchone())["cost"]
+                    await cursor.execute("SELECT source_id, amount FROM transfer WHERE execution_id = %s", (execution_id,))
+                    gas = [(row["source_id"], row["amount"]) for row in await cursor.fetchall()]
+                self.assertEqual(gas, [(1, cost)])
+                self.assertEqual(await self.balance(1), before - cost)
+
+    async def test_out_of_range_integers_are_refused(self):
+        with self.assertRaises(aiomysql.DataError) as raised:
+            async with self.rw.db as cursor:
+                await cursor.execute("UPDATE currency SET supply = %s WHERE currency_id = %s", (2**63, self.currency.currency_id))
+        self.assertEqual(raised.exception.args[0], 1264)
+        self.assertEqual((await self.rw.Currencies.get(self.currency.currency_id, use_cache=False)).supply, 1000)
+
+    async def test_pools_swaps_and_candles(self):
+        other, _ = await self.rw.create_currency(200, "Other", "OTH", 1000, 1, 0)
+        pool = await self.rw.create_liquidity_pool(self.currency.currency_id, other.currency_id, 400, 200, 1)
+        shares = await self.rw.add_liquidity(self.currency.currency_id, other.currency_id, 100, 50, 1)
+        self.assertGreater(shares, 0)
+
+        amount_out, currency_id = await self.rw.swap(self.currency.currency_id, other.currency_id, 100, 1)
+        self.assertEqual(currency_id, other.currency_id)
+        self.assertEqual(await self.balance(1), 400)
+        self.assertEqual((await self.rw.get_user(1).get_balance(other.currency_id)).amount, 750 + amount_out)
+
+        candles = await self.rw.get_pool_candles(pool.pool_id, "1m")
+        self.assertEqual([(c.trade_count, c.volume_a) for c in candles], [(1, 100)])
+
+        await self.rw.remove_liquidity(self.currency.currency_id, other.currency_id, shares, 1)
+        pool = await self.rw.LiquidityPools.get(pool.pool_id)
+        self.assertEqual(pool.reserve_a + await self.balance(1), 1000)
+
+    async def test_staking(self):
+        await self.rw.stake_deposit(1, self.currency.currency_id, 300)
+        await self.rw.stake_withdraw(1, self.currency.currency_id, 100)
+        self.assertEqual(await self.balance(1), 800)
+        stakes = await self.rw.Stakes.get_for_user(1)
+        self.assertEqual([stake.amount for stake in stakes], [200])
+
+    async def test_contract_transfers(self):
+        await self.rw.transfer(1, 7, self.currency.currency_id, 100)
+        # Gas is paid in the test currency
+        self.rw.Config = type("TestConfig", (self.rw.Config,), {"Gas": type("Gas", (Config.Gas,), {"currency_id": self.currency.currency_id})})
+        script = [{'op': 'transfer', 'args': [{'t': 'num', 'v': '8'}, {'t': 'num', 'v': '5'}, {'t': 'num', 'v': str(self.currency.currency_id)}]}]
+        await self.rw.set_contract(7, json.dumps(script))
+        execution_id, _ = await self.rw.execute_contract(1, 7)
+        self.assertEqual([await self.balance(u) for u in (7, 8)], [95, 5])
+        transfers = await self.rw.Transfers.get_for_executions([execution_id])
+        self.assertIn((7, 8, 5), [(t.source_id, t.dest_id, t.amount) for t in transfers])
+
+    async def test_archive(self):
+        class Archive(Config.Archive):
+            path = str(Path(self.dir.name) / "archive")
+
+        rw = RapidWire(db_config={})
+        rw.Config = type("TestConfig", (self.rw.Config,), {"Archive": Archive})
+        await rw.initialize()
+        self.addAsyncCleanup(rw.close)
+        first = await rw.transfer(1, 2, self.currency.currency_id, 300)
+        await rw.transfer(2, 3, self.currency.currency_id, 100)
+
+        # The newest transfer always stays in the table
+        self.assertEqual(await rw.Transfers.archive_before(int(time()) + 1, segment_size=1), 2)
+        self.assertEqual((await rw.Transfers.get(first.transfer_id)).amount, 300)
+        transfers = await rw.search_transfers(user_id=2)
+        self.assertEqual([(t.source_id, t.dest_id) for t in transfers], [(2, 3), (1, 2)])
+
+    async def test_reopen_keeps_data(self):
+        await self.rw.transfer(1, SYSTEM_USER_ID, self.currency.currency_id, 1)
+        path = self.rw.Config.Storage.sqlite_path
+        writer, readers = await open_sqlite(path, SCHEMA, readers=1)
+        connection = await writer.acquire()
+        cursor = await connection.cursor(aiomysql.DictCursor)
+        await cursor.execute("SELECT supply FROM currency WHERE currency_id = %s", (self.currency.currency_id,))
+        self.assertEqual((await cursor.fetchone())["supply"], 999)
+        await connection.commit()
+        writer.release(connection)
+        for pool in (writer, readers):
+            pool.close()
+            await pool.wait_closed()
+
+if __name__ == '__main__':
+    unittest.main()
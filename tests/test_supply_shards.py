@@ -0,0 +1,78 @@
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.models import CurrencyModel
+
+class TestUpdateSupply(unittest.IsolatedAsyncioTestCase):
+    async def test_unsharded_updates_the_currency_row(self):
+        cursor = AsyncMock()
+        await CurrencyModel(MagicMock(), supply_shards=0).update_supply(cursor, 5, 10)
+        self.assertIn("UPDATE currency SET supply", cursor.execute.await_args.args[0])
+
+    async def test_sharded_spreads_over_shard_rows(self):
+        cursor = AsyncMock()
+        currencies = CurrencyModel(MagicMock(), supply_shards=4)
+        for _ in range(50):
+            await currencies.update_supply(cursor, 5, -3)
+        shards = {call.args[1][1] for call in cursor.execute.await_args_list}
+        self.assertTrue(shards <= {0, 1, 2, 3})
+        self.assertGreater(len(shards), 1)
+        self.assertTrue(all(call.args[0].startswith("INSERT INTO currency_supply_shard") for call in cursor.execute.await_args_list))
+
+class TestShardedSupply(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Supply(Config.Supply):
+            shards = 4
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Supply": Supply})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        self.currency, _ = await self.rw.create_currency(100, "Test", "TST", 1000, 1, 0)
+
+    async def base_supply(self) -> int:
+        async with self.rw.db as cursor:
+            await cursor.execute("SELECT supply FROM currency WHERE currency_id = %s", (100,))
+            return int((await cursor.fetchone())["supply"])
+
+    async def test_reads_sum_the_shards_and_compaction_folds_them(self):
+        await asyncio.gather(*(self.rw.mint_currency(100, 10, 1) for _ in range(20)))
+        await self.rw.burn_currency(100, 50, 1)
+
+        self.assertEqual((await self.rw.Currencies.get(100, use_cache=False)).supply, 1150)
+        self.assertEqual((await self.rw.Currencies.get_by_symbol("TST", use_cache=False)).supply, 1150)
+        self.assertEqual(await self.rw.reconcile_supply(), [])
+
+        self.assertEqual(await self.rw.compact_supply_shards(), 1)
+        self.assertEqual(await self.base_supply(), 1150)
+        self.assertEqual((await self.rw.Currencies.get(100, use_cache=False)).supply, 1150)
+        self.assertEqual(await self.rw.compact_supply_shards(), 0)
+
+    async def test_reconcile_reports_unbacked_supply(self):
+        await self.rw.stake_deposit(1, 100, 200)
+        self.assertEqual(await self.rw.reconcile_supply(), [])
+
+        async with self.rw.db as cursor:
+            await cursor.execute("UPDATE balance SET amount = amount - 7 WHERE user_id = 1 AND currency_id = 100")
+        discrepancies = await self.rw.reconcile_supply()
+        self.assertEqual([(d.currency_id, d.supply, d.held) for d in discrepancies], [(100, 1000, 993)])
+
+if __name__ == '__main__':
+    unittest.main()
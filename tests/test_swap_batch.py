@@ -0,0 +1,178 @@
+import unittest
+import asyncio
+from unittest.mock import patch
+import tempfile
+from decimal import Decimal
+
+import aiomysql
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.batching import SwapBatcher, clear_swap_batch, fill_amount
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.exceptions import TransactionError
+
+FEE = 30
+
+def single_swap_out(amount_in: int, reserve_in: int, reserve_out: int) -> int:
+    amount_in_with_fee = Decimal(amount_in) * (Decimal(1) - Decimal(FEE) / Decimal(10000))
+    return int(amount_in_with_fee * Decimal(reserve_out) / (Decimal(reserve_in) + amount_in_with_fee))
+
+class TestClearSwapBatch(unittest.TestCase):
+    def test_one_sided_matches_single_swap(self):
+        price, a_into_pool, b_into_pool = clear_swap_batch(1_000_000, 2_000_000, 10_000, 0, FEE)
+        self.assertEqual((a_into_pool, b_into_pool), (10_000, 0))
+        self.assertAlmostEqual(fill_amount(10_000, price, True), single_swap_out(10_000, 1_000_000, 2_000_000), delta=1)
+
+        price, a_into_pool, b_into_pool = clear_swap_batch(1_000_000, 2_000_000, 0, 10_000, FEE)
+        self.assertEqual((a_into_pool, b_into_pool), (0, 10_000))
+        self.assertAlmostEqual(fill_amount(10_000, price, False), single_swap_out(10_000, 2_000_000, 1_000_000), delta=1)
+
+    def test_opposing_flows_are_netted(self):
+        price, a_into_pool, b_into_pool = clear_swap_batch(1_000_000, 2_000_000, 10_000, 20_000, FEE)
+        # Perfectly opposing flow at the pool price needs no pool trade
+        self.assertEqual((a_into_pool, b_into_pool), (0, 0))
+        self.assertEqual(price, Decimal(2))
+
+    def test_pool_invariant_does_not_decrease(self):
+        reserve_a, reserve_b = 5_000_000, 3_000_000
+        orders_a = [12_345, 50_000, 7]
+        orders_b = [9_999, 1_000]
+        price, _, _ = clear_swap_batch(reserve_a, reserve_b, sum(orders_a), sum(orders_b), FEE)
+
+        b_paid = sum(fill_amount(a, price, True) for a in orders_a)
+        a_paid = sum(fill_amount(b, price, False) for b in orders_b)
+        new_a = reserve_a + sum(orders_a) - a_paid
+        new_b = reserve_b + sum(orders_b) - b_paid
+        self.assertGreaterEqual(new_a * new_b, reserve_a * reserve_b)
+
+        # Everyone trades at the same price and never worse than swapping alone after the others
+        for a in orders_a:
+            self.assertGreaterEqual(fill_amount(a, price, True), single_swap_out(a, reserve_a + sum(orders_a), reserve_b) - 1)
+
+class TestSwapBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_orders_in_one_tick_settle_together(self):
+        settled = []
+
+        async def settle(pool_id, orders):
+            settled.append((pool_id, [o.amount_in for o in orders]))
+            for order in orders:
+                order.future.set_result((order.amount_in * 2, 99))
+
+        batcher = SwapBatcher(settle, 0.01)
+        results = await asyncio.gather(
+            batcher.submit(1, 10, 5, 100),
+            batcher.submit(1, 11, 5, 200),
+            batcher.submit(2, 12, 5, 300),
+        )
+
+        self.assertEqual(results, [(200, 99), (400, 99), (600, 99)])
+        self.assertEqual(sorted(settled), [(1, [100, 200]), (2, [300])])
+
+    async def test_settlement_failure_propagates(self):
+        async def settle(pool_id, orders):
+            raise RuntimeError("boom")
+
+        batcher = SwapBatcher(settle, 0.01)
+        with self.assertRaises(RuntimeError):
+            await batcher.submit(1, 10, 5, 100)
+
+    async def test_cancelled_tick_fails_waiting_orders(self):
+        started = asyncio.Event()
+
+        async def settle(pool_id, orders):
+            started.set()
+            await asyncio.sleep(10)
+
+        batcher = SwapBatcher(settle, 0.01)
+        waiting = asyncio.create_task(batcher.submit(1, 10, 5, 100))
+        await asyncio.sleep(0)
+        tick = batcher.ticks[1]
+        await started.wait()
+        tick.cancel()
+        with self.assertRaises(TransactionError):
+            await asyncio.wait_for(waiting, 1)
+
+    async def test_cancelled_sleep_fails_waiting_orders(self):
+        async def settle(pool_id, orders):
+            self.fail("a cancelled tick must not settle")
+
+        batcher = SwapBatcher(settle, 10)
+        for delay in (0, 0.01):
+            # Cancelled before the tick starts, and while it sleeps
+            waiting = asyncio.create_task(batcher.submit(1, 10, 5, 100))
+            await asyncio.sleep(0)
+            await asyncio.sleep(delay)
+            batcher.ticks[1].cancel()
+            with self.assertRaises(TransactionError):
+                await asyncio.wait_for(waiting, 1)
+            self.assertEqual((batcher.pending, batcher.ticks), ({}, {}))
+
+class TestBatchedSwapSettlement(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = str(Path(self.dir.name) / "rapidwire.db")
+            sqlite_readers = 2
+
+        class Swap(Config.Swap):
+            batch_interval = 0.01
+
+        self.rw = RapidWire(db_config={})
+        self.rw.Config = type("TestConfig", (Config,), {"Storage": Storage, "Swap": Swap})
+        await self.rw.initialize()
+        self.addAsyncCleanup(self.rw.close)
+        await self.rw.create_currency(100, "Alpha", "AAA", 10**9, 1, 0)
+        await self.rw.create_currency(101, "Beta", "BBB", 10**6, 1, 0)
+        await self.rw.create_liquidity_pool(100, 101, 10**8, 1000, 1)
+
+    async def test_zero_fill_is_rejected_without_transfers(self):
+        tiny, full = await asyncio.gather(
+            self.rw.execute_swap(1, 100, 101, 10),
+            self.rw.execute_swap(1, 100, 101, 10**6),
+            return_exceptions=True
+        )
+        self.assertIsInstance(tiny, ValueError)
+        self.assertGreater(full[1], 0)
+        async with self.rw.db as cursor:
+            await cursor.execute("SELECT COUNT(*) AS n FROM transfer WHERE amount = 0")
+            self.assertEqual((await cursor.fetchone())["n"], 0)
+            await cursor.execute("SELECT COUNT(*) AS n FROM transfer WHERE source_id = 1 AND dest_id = 0 AND amount = 10")
+            self.assertEqual((await cursor.fetchone())["n"], 0)
+
+    async def test_drained_pool_rejects_orders(self):
+        pool = await self.rw.LiquidityPools.get_by_currency_pair(100, 101)
+        await self.rw.remove_liquidity(100, 101, pool.total_shares, 1)
+
+        with self.assertRaisesRegex(ValueError, "no liquidity"):
+            await self.rw.execute_swap(1, 100, 101, 777)
+        with self.assertRaisesRegex(ValueError, "no liquidity"):
+            await self.rw.swap(100, 101, 777, 1)
+        async with self.rw.db as cursor:
+            await cursor.execute("SELECT COUNT(*) AS n FROM transfer WHERE source_id = 1 AND dest_id = 0 AND amount = 777")
+            self.assertEqual((await cursor.fetchone())["n"], 0)
+
+    async def test_deadlocked_tick_is_retried(self):
+        real_get = self.rw.LiquidityPools.get
+        attempts = []
+
+        async def get(pool_id, for_update=False):
+            attempts.append(pool_id)
+            if len(attempts) == 1:
+                raise aiomysql.OperationalError(1213, "Deadlock found when trying to get lock")
+            return await real_get(pool_id, for_update=for_update)
+
+        with patch.object(self.rw.LiquidityPools, "get", get):
+            _, amount_out, _ = await self.rw.execute_swap(1, 100, 101, 10**6)
+        self.assertGreater(amount_out, 0)
+        self.assertEqual(len(attempts), 2)
+
+if __name__ == '__main__':
+    unittest.main()
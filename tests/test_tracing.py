@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+import asyncio
+import aiomysql
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.database import DatabaseConnection
+from RapidWire.tracing import Tracer, fingerprint, start_request_trace
+
+def mocked_pool(cursor):
+    pool = MagicMock(spec=aiomysql.Pool)
+    connection = AsyncMock()
+
+    async def acquire_side_effect():
+        return connection
+    pool.acquire.side_effect = acquire_side_effect
+
+    async def cursor_side_effect(cursor_type=None):
+        return cursor
+    connection.cursor.side_effect = cursor_side_effect
+    return pool
+
+class Ledger:
+    def __init__(self, db):
+        self.db = db
+
+    async def balance(self, user_id):
+        async with self.db as cursor:
+            await cursor.execute("SELECT amount FROM balance WHERE user_id = %s", (user_id,))
+            return await cursor.fetchone()
+
+    async def broken(self):
+        async with self.db as cursor:
+            await cursor.execute("SELECT * FROM missing")
+
+class TestFingerprint(unittest.TestCase):
+    def test_values_and_list_lengths_collapse(self):
+        self.assertEqual(
+            fingerprint("SELECT *  FROM t\n WHERE id IN (%s, %s, %s) AND name = 'a''b' LIMIT 10"),
+            "SELECT * FROM t WHERE id IN (?+) AND name = ? LIMIT ?"
+        )
+        self.assertEqual(
+            fingerprint("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"),
+            "INSERT INTO t (a, b) VALUES (?+), ..."
+        )
+        self.assertEqual(fingerprint("SELECT t1.x FROM t1"), "SELECT t1.x FROM t1")
+
+class TestTracingCursor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = AsyncMock()
+        self.cursor.rowcount = 1
+        self.tracer = Tracer(slow_threshold=0)
+        self.db = DatabaseConnection(mocked_pool(self.cursor), tracer=self.tracer)
+        self.ledger = Ledger(self.db)
+
+    async def test_statements_aggregate_per_fingerprint_and_site(self):
+        await self.ledger.balance(1)
+        await self.ledger.balance(2)
+
+        [stats] = self.tracer.snapshot()
+        self.assertEqual(stats["fingerprint"], "SELECT amount FROM balance WHERE user_id = ?")
+        self.assertEqual((stats["count"], stats["rows"]), (2, 2))
+        self.assertEqual(stats["sites"], {"Ledger.balance": 2})
+        self.cursor.execute.assert_awaited_with("SELECT amount FROM balance WHERE user_id = %s", (2,))
+
+    async def test_failures_are_counted_and_raised(self):
+        self.cursor.execute.side_effect = aiomysql.ProgrammingError("no such table")
+        with self.assertRaises(aiomysql.ProgrammingError):
+            await self.ledger.broken()
+        self.assertEqual(self.tracer.snapshot()[0]["errors"], 1)
+
+    async def test_slow_statements_are_logged(self):
+        self.tracer.slow_threshold = 0.01
+
+        async def slow_execute(query, args=None):
+            await asyncio.sleep(0.02)
+        self.cursor.execute.side_effect = slow_execute
+
+        with patch("builtins.print") as printed:
+            await self.ledger.balance(1)
+        self.assertEqual(self.tracer.slow_queries[0]["site"], "Ledger.balance")
+        self.assertIn("Slow query", printed.call_args.args[0])
+
+    async def test_request_traces_are_isolated(self):
+        async def request(count):
+            trace = start_request_trace()
+            for user_id in range(count):
+                await self.ledger.balance(user_id)
+            return trace
+
+        first, second = await asyncio.gather(request(1), request(3))
+        self.assertEqual((first.queries, second.queries), (1, 3))
+        self.assertIn('desc="3 queries"', second.server_timing())
+        self.assertNotIn("Ledger.balance", second.server_timing())
+        self.assertIn('desc="Ledger.balance"', second.server_timing(top=3))
+
+    async def test_untraced_connection_yields_raw_cursor(self):
+        db = DatabaseConnection(mocked_pool(self.cursor))
+        async with db as cursor:
+            self.assertIs(cursor, self.cursor)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import asyncio
+from unittest.mock import AsyncMock
+import aiomysql
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire import RapidWire
+from RapidWire.batching import TransferBatcher
+from RapidWire.config import Config
+from RapidWire.database import DatabaseConnection
+from RapidWire.exceptions import InsufficientFunds, TransactionError
+from RapidWire.structs import Transfer
+from tests.helpers import FakePool
+
+class BatchConfig(Config):
+    class Transfer:
+        batch_window = 0.01
+        batch_size = 100
+
+def transfer(source_id, destination_id, currency_id, amount):
+    return Transfer(transfer_id=source_id * 100 + destination_id, execution_id=None, source_id=source_id, dest_id=destination_id,
+                    currency_id=currency_id, amount=amount, timestamp=1)
+
+class TestTransferBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_submissions_share_one_apply(self):
+        batches = []
+
+        async def apply(orders):
+            batches.append(len(orders))
+            for order in orders:
+                order.future.set_result(order.amount)
+
+        batcher = TransferBatcher(apply, 0.01, max_batch=3)
+        results = await asyncio.gather(*(batcher.submit(1, 2, 1, amount) for amount in range(1, 6)))
+
+        self.assertEqual(results, [1, 2, 3, 4, 5])
+        # The first three fill a batch and commit at once, the rest wait for the window
+        self.assertEqual(batches, [3, 2])
+
+    async def test_cancelled_before_the_batch_is_dropped(self):
+        applied = []
+
+        async def apply(orders):
+            applied.extend(order.amount for order in orders)
+            for order in orders:
+                order.future.set_result(order.amount)
+
+        batcher = TransferBatcher(apply, 0.05)
+        cancelled = asyncio.create_task(batcher.submit(1, 2, 1, 7))
+        kept = asyncio.create_task(batcher.submit(1, 2, 1, 8))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await cancelled
+        self.assertEqual(await kept, 8)
+        self.assertEqual(applied, [8])
+
+    async def test_cancelled_during_the_commit_gets_the_result(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def apply(orders):
+            started.set()
+            await release.wait()
+            for order in orders:
+                order.future.set_result(order.amount)
+
+        batcher = TransferBatcher(apply, 0.01)
+        task = asyncio.create_task(batcher.submit(1, 2, 1, 7))
+        await started.wait()
+        task.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        # The transfer committed, so the caller sees it instead of a cancellation
+        self.assertEqual(await task, 7)
+
+class TestGroupCommit(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cursor = AsyncMock()
+        self.pool = FakePool(self.cursor)
+        self.rapid = RapidWire(db_config={})
+        self.rapid.Config = BatchConfig
+        self.rapid.db = DatabaseConnection(self.pool)
+
+        async def apply(cursor, source_id, destination_id, currency_id, amount, execution_id=None):
+            if amount > 100:
+                raise InsufficientFunds("Source user has insufficient funds.")
+            return transfer(source_id, destination_id, currency_id, amount)
+        self.rapid._apply_transfer = AsyncMock(side_effect=apply)
+
+    def statements(self):
+        return [call.args[0] for call in self.cursor.execute.await_args_list]
+
+    async def test_results_and_errors_are_per_request(self):
+        results = await asyncio.gather(
+            self.rapid.transfer(5, 2, 1, 10),
+            self.rapid.transfer(3, 4, 1, 500),
+            self.rapid.transfer(2, 5, 1, 20),
+            return_exceptions=True
+        )
+
+        self.assertEqual(results[0].transfer_id, 502)
+        self.assertIsInstance(results[1], InsufficientFunds)
+        self.assertEqual(results[2].transfer_id, 205)
+        self.pool.connection.commit.assert_awaited_once()
+        self.assertEqual(self.statements()[1:], [
+            "SAVEPOINT transfer_batch", "RELEASE SAVEPOINT transfer_batch",
+            "SAVEPOINT transfer_batch", "ROLLBACK TO SAVEPOINT transfer_batch",
+            "SAVEPOINT transfer_batch", "RELEASE SAVEPOINT transfer_batch",
+        ])
+
+    async def test_rows_are_locked_in_global_order(self):
+        await asyncio.gather(self.rapid.transfer(5, 2, 1, 10), self.rapid.transfer(3, 2, 1, 10), self.rapid.transfer(0, 3, 2, 10))
+
+        query, params = self.cursor.execute.await_args_list[0].args
+        self.assertIn("FOR UPDATE", query)
+        self.assertEqual(params, (2, 1, 3, 1, 3, 2, 5, 1))
+        query, params = self.cursor.execute.await_args_list[1].args
+        self.assertIn("FROM currency", query)
+        self.assertEqual(params, (2,))
+
+    async def test_database_error_retries_each_transfer_alone(self):
+        calls = []
+
+        async def apply(cursor, source_id, destination_id, currency_id, amount, execution_id=None):
+            calls.append(source_id)
+            if len(calls) == 2:
+                raise aiomysql.OperationalError(1213, "Deadlock found")
+            return transfer(source_id, destination_id, currency_id, amount)
+        self.rapid._apply_transfer = AsyncMock(side_effect=apply)
+
+        results = await asyncio.gather(self.rapid.transfer(5, 2, 1, 10), self.rapid.transfer(3, 4, 1, 10))
+
+        self.assertEqual([t.transfer_id for t in results], [502, 304])
+        self.assertEqual(self.pool.connection.commit.await_count, 2)
+        self.pool.connection.rollback.assert_awaited_once()
+
+    async def test_failed_commit_is_not_retried(self):
+        self.pool.connection.commit = AsyncMock(side_effect=aiomysql.OperationalError(2013, "Lost connection"))
+        results = await asyncio.gather(self.rapid.transfer(5, 2, 1, 10), self.rapid.transfer(3, 4, 1, 10), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, TransactionError) for result in results))
+        self.assertEqual(self.rapid._apply_transfer.await_count, 2)
+
+    async def test_transfers_inside_transactions_are_not_batched(self):
+        async with self.rapid.db:
+            await self.rapid.transfer(5, 2, 1, 10)
+        self.assertIsNone(self.rapid.transfer_batcher)
+
+class TestSavepoint(unittest.IsolatedAsyncioTestCase):
+    async def test_rollback_drops_callbacks_registered_inside(self):
+        cursor = AsyncMock()
+        db = DatabaseConnection(FakePool(cursor))
+        fired = []
+        async with db:
+            db.on_commit(lambda: fired.append("outer"))
+            with self.assertRaises(ValueError):
+                async with db.savepoint():
+                    db.on_commit(lambda: fired.append("inner"))
+                    raise ValueError
+        self.assertEqual(fired, ["outer"])
+
+    async def test_requires_transaction(self):
+        db = DatabaseConnection(FakePool(AsyncMock()))
+        with self.assertRaises(RuntimeError):
+            async with db.savepoint():
+                pass
+
+if __name__ == '__main__':
+    unittest.main()
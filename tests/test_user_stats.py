@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from RapidWire.models import TransferModel
+from RapidWire.constants import SYSTEM_USER_ID
+
+class TestUserStatsMaintenance(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.model = TransferModel(MagicMock())
+        self.cursor = AsyncMock()
+        self.cursor.fetchone = AsyncMock(side_effect=[{"id": 1}, {"next_id": 11}])
+
+    def stats_calls(self):
+        return {
+            table: call.args[1]
+            for call in self.cursor.execute.await_args_list
+            for table in ("user_stats", "user_currency_stats")
+            if f"INSERT INTO {table} " in call.args[0]
+        }
+
+    async def test_both_sides_are_counted_in_user_order(self):
+        await self.model.create(self.cursor, 9, 4, 1, 500)
+        calls = self.stats_calls()
+
+        stats = calls["user_stats"]
+        self.assertEqual(stats[0::5], (4, 9))
+        self.assertEqual(stats[1:3], (0, 1))
+        self.assertEqual(stats[6:8], (1, 0))
+        self.assertEqual(calls["user_currency_stats"], (4, 1, 0, 1, 0, 500, 9, 1, 1, 0, 500, 0))
+
+    async def test_self_transfer_is_one_row(self):
+        await self.model.create(self.cursor, 4, 4, 1, 500)
+        calls = self.stats_calls()
+        self.assertEqual(len(calls["user_stats"]), 5)
+        self.assertEqual(calls["user_currency_stats"], (4, 1, 1, 1, 500, 500))
+
+    async def test_system_account_is_skipped(self):
+        await self.model.create(self.cursor, SYSTEM_USER_ID, 4, 1, 500)
+        self.assertEqual(self.stats_calls()["user_stats"][0], 4)
+        self.assertEqual(len(self.stats_calls()["user_stats"]), 5)
+
+if __name__ == '__main__':
+    unittest.main()
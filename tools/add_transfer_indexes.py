@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+
+# Add parent directory to path to find RapidWire and config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiomysql
+import config
+
+# Brings an existing `transfer` table in line with the indexes in rapid-wire.sql
+INDEXES = {
+    "source_transfer": "(`source_id`,`transfer_id`)",
+    "source_timestamp": "(`source_id`,`timestamp`)",
+    "dest_transfer": "(`dest_id`,`transfer_id`)",
+    "dest_timestamp": "(`dest_id`,`timestamp`)",
+    "currency_transfer": "(`currency_id`,`transfer_id`)",
+    "currency_timestamp": "(`currency_id`,`timestamp`)",
+    "timestamp": "(`timestamp`)",
+}
+# Prefixes of the composite indexes above
+REDUNDANT = ["source_id", "dest_id"]
+
+async def main():
+    conn = await aiomysql.connect(**config.MySQL.to_dict())
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = 'transfer'"
+            )
+            existing = {row[0] for row in await cursor.fetchall()}
+
+            clauses = [f"ADD KEY `{name}` {columns}" for name, columns in INDEXES.items() if name not in existing]
+            clauses += [f"DROP KEY `{name}`" for name in REDUNDANT if name in existing]
+            if not clauses:
+                print("transfer indexes are already up to date.")
+                return
+
+            statement = f"ALTER TABLE `transfer` {', '.join(clauses)}"
+            print(statement)
+            await cursor.execute(statement)
+            await conn.commit()
+            print("Done.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
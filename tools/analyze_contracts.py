@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+import zlib
+
+# Add parent directory to path to find RapidWire and config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiomysql
+import config
+from RapidWire import RapidWire
+
+# Brings an existing `contract` table in line with rapid-wire.sql and stores the static
+# cost bounds of every deployed script, which set_contract only computes on update
+COLUMNS = {
+    "cost_min": "bigint UNSIGNED NOT NULL DEFAULT '0' COMMENT '静的解析による最小コスト'",
+    "cost_max": "bigint UNSIGNED DEFAULT NULL COMMENT '静的解析による最大コスト、NULL は上限なし'",
+}
+
+async def main():
+    rapid = RapidWire(db_config=config.MySQL.to_dict())
+    rapid.Config = config.RapidWireConfig
+    conn = await aiomysql.connect(**config.MySQL.to_dict())
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = 'contract'"
+            )
+            existing = {row[0] for row in await cursor.fetchall()}
+            clauses = [f"ADD COLUMN `{name}` {definition}" for name, definition in COLUMNS.items() if name not in existing]
+            if clauses:
+                statement = f"ALTER TABLE `contract` {', '.join(clauses)}"
+                print(statement)
+                await cursor.execute(statement)
+
+            await cursor.execute("SELECT user_id, script FROM contract")
+            rows = await cursor.fetchall()
+            unbounded = 0
+            for user_id, script in rows:
+                try:
+                    script = zlib.decompress(bytes(script)).decode('utf-8')
+                except zlib.error:
+                    script = bytes(script).decode('utf-8')
+                analysis = rapid.analyze_contract(script)
+                unbounded += analysis.max_cost is None
+                await cursor.execute(
+                    "UPDATE contract SET cost_min = %s, cost_max = %s WHERE user_id = %s",
+                    (analysis.min_cost, analysis.max_cost, user_id)
+                )
+            await conn.commit()
+            print(f"Analyzed {len(rows)} contracts ({unbounded} without an upper bound).")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
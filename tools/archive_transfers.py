@@ -0,0 +1,34 @@
+import argparse
+import asyncio
+import os
+import sys
+from time import time
+
+# Add parent directory to path to find RapidWire and config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from RapidWire import RapidWire
+from RapidWire.constants import SECONDS_IN_A_DAY
+
+async def main(days: int, segment_size: int):
+    rapid = RapidWire(db_config=config.MySQL.to_dict())
+    rapid.Config = config.RapidWireConfig
+    await rapid.initialize()
+    try:
+        if rapid.Transfers.archive is None:
+            print("Archive is disabled (RapidWireConfig.Archive.path is empty).")
+            return
+        before = int(time()) - days * SECONDS_IN_A_DAY
+        moved = await rapid.Transfers.archive_before(before, segment_size)
+        print(f"Archived {moved} transfers older than {days} days to {rapid.Transfers.archive.path}.")
+    finally:
+        await rapid.close()
+
+if __name__ == "__main__":
+    archive_config = config.RapidWireConfig.Archive
+    parser = argparse.ArgumentParser(description="Move old transfers from MySQL to the on-disk archive.")
+    parser.add_argument("--days", type=int, default=archive_config.min_age_days)
+    parser.add_argument("--segment-size", type=int, default=archive_config.segment_size)
+    args = parser.parse_args()
+    asyncio.run(main(args.days, args.segment_size))
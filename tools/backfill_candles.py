@@ -0,0 +1,26 @@
+import asyncio
+import os
+import sys
+
+# Add parent directory to path to find RapidWire and config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from RapidWire import RapidWire
+
+async def main():
+    rapid = RapidWire(db_config=config.MySQL.to_dict())
+    await rapid.initialize()
+    rapid.Config = config.RapidWireConfig
+    try:
+        try:
+            recorded = await rapid.backfill_pool_candles()
+        except ValueError as e:
+            print(e)
+            return
+        print(f"Recorded {recorded} historical swaps into pool candles.")
+    finally:
+        await rapid.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
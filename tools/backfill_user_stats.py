@@ -0,0 +1,22 @@
+import asyncio
+import os
+import sys
+
+# Add parent directory to path to find RapidWire and config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from RapidWire import RapidWire
+
+async def main():
+    rapid = RapidWire(db_config=config.MySQL.to_dict())
+    rapid.Config = config.RapidWireConfig
+    await rapid.initialize()
+    try:
+        users = await rapid.Transfers.rebuild_user_stats()
+        print(f"Rebuilt transfer statistics for {users} users.")
+    finally:
+        await rapid.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
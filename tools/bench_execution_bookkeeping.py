@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Add parent directory to path to find RapidWire
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RapidWire.config import Config
+from RapidWire.core import RapidWire
+from RapidWire.sqlite import SQLiteConnection, SQLiteCursor
+
+SWAPS = 200
+
+async def run(single_transaction: bool) -> tuple[float, float]:
+    """Statements (on any connection) and commits (on the writer) per execute_swap, on an embedded database."""
+    with tempfile.TemporaryDirectory() as path:
+        class Storage(Config.Storage):
+            backend = "sqlite"
+            sqlite_path = os.path.join(path, "rapidwire.db")
+
+        class Execution(Config.Execution):
+            pass
+        Execution.single_transaction = single_transaction
+
+        rapid = RapidWire(db_config={})
+        rapid.Config = type("BenchConfig", (Config,), {"Storage": Storage, "Execution": Execution})
+        await rapid.initialize()
+        try:
+            await rapid.create_currency(100, "A", "AAA", 10**9, 1, 0)
+            await rapid.create_currency(200, "B", "BBB", 10**9, 1, 0)
+            await rapid.create_liquidity_pool(100, 200, 10**8, 10**8, 1)
+            writer = rapid.pool.connections[0]
+            counts = {"statements": 0, "commits": 0}
+            execute, executemany, commit = SQLiteCursor.execute, SQLiteCursor.executemany, SQLiteConnection.commit
+
+            async def counted_execute(cursor, query, args=None):
+                # Replica lag checks are routing overhead, not bookkeeping
+                counts["statements"] += not query.startswith("SHOW")
+                return await execute(cursor, query, args)
+
+            async def counted_executemany(cursor, query, args):
+                counts["statements"] += 1
+                return await executemany(cursor, query, args)
+
+            async def counted_commit(connection):
+                counts["commits"] += connection is writer
+                await commit(connection)
+
+            with patch.object(SQLiteCursor, "execute", counted_execute), \
+                 patch.object(SQLiteCursor, "executemany", counted_executemany), \
+                 patch.object(SQLiteConnection, "commit", counted_commit):
+                for i in range(SWAPS):
+                    await rapid.execute_swap(1, 100 if i % 2 else 200, 200 if i % 2 else 100, 1000)
+            return counts["statements"] / SWAPS, counts["commits"] / SWAPS
+        finally:
+            await rapid.close()
+
+async def main():
+    print(f"{'bookkeeping':<22}{'statements':>12}{'commits':>10}   (per execute_swap, {SWAPS} swaps)")
+    for name, single in (("three transactions", False), ("single transaction", True)):
+        statements, commits = await run(single)
+        print(f"{name:<22}{statements:>12.1f}{commits:>10.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
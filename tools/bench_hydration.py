@@ -0,0 +1,38 @@
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+# Add parent directory to path to find RapidWire
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RapidWire.hydration import hydrate_all
+from RapidWire.structs import Transfer, Balance, Stake, LiquidityPool
+
+ROWS = 10000
+REPEAT = 5
+
+# Rows shaped like aiomysql DictCursor results (DECIMAL columns arrive as Decimal)
+SAMPLES = {
+    Transfer: lambda i: {"transfer_id": i, "execution_id": None, "source_id": i % 97, "dest_id": i % 89,
+                         "currency_id": 1, "amount": Decimal(1000 + i), "timestamp": 1_700_000_000 + i},
+    Balance: lambda i: {"user_id": i, "currency_id": 1, "amount": Decimal(1000 + i)},
+    Stake: lambda i: {"user_id": i, "currency_id": 1, "amount": Decimal(1000 + i), "last_updated_at": 1_700_000_000},
+    LiquidityPool: lambda i: {"pool_id": i, "currency_a_id": 1, "currency_b_id": 2, "reserve_a": Decimal(10**18 + i),
+                              "reserve_b": Decimal(10**18 - i), "total_shares": Decimal(10**18)},
+}
+
+def per_row_us(func) -> float:
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) / ROWS * 1e6
+
+def main():
+    print(f"{'model':<15}{'validated':>12}{'hydrated':>12}{'speedup':>10}   (us/row, {ROWS} rows)")
+    for cls, make in SAMPLES.items():
+        rows = [make(i) for i in range(ROWS)]
+        validated = per_row_us(lambda: [cls(**row) for row in rows])
+        hydrated = per_row_us(lambda: hydrate_all(cls, rows))
+        assert hydrate_all(cls, rows[:100]) == [cls(**row) for row in rows[:100]]
+        print(f"{cls.__name__:<15}{validated:>12.2f}{hydrated:>12.2f}{validated / hydrated:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
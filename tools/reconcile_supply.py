@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+# Add parent directory to path to find RapidWire and config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from RapidWire import RapidWire
+
+async def main() -> int:
+    rapid = RapidWire(db_config=config.MySQL.to_dict())
+    rapid.Config = config.RapidWireConfig
+    await rapid.initialize()
+    try:
+        discrepancies = await rapid.reconcile_supply()
+        for d in discrepancies:
+            print(f"Currency {d.currency_id}: supply {d.supply}, held {d.held} (difference {d.supply - d.held})")
+        print(f"{len(discrepancies)} currencies with a supply discrepancy.")
+        return 1 if discrepancies else 0
+    finally:
+        await rapid.close()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))